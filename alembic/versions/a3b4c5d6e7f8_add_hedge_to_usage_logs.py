@@ -0,0 +1,34 @@
+"""add hedge markers to llm usage logs
+
+Revision ID: a3b4c5d6e7f8
+Revises: f2a3b4c5d6e7
+Create Date: 2025-11-12 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "a3b4c5d6e7f8"
+down_revision: Union[str, None] = "f2a3b4c5d6e7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "llm_usage_logs",
+        sa.Column("hedge_role", sa.String(length=16), nullable=True),
+    )
+    op.add_column(
+        "llm_usage_logs",
+        sa.Column("hedge_won", sa.Boolean(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("llm_usage_logs", "hedge_won")
+    op.drop_column("llm_usage_logs", "hedge_role")
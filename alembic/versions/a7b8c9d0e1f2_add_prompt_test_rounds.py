@@ -0,0 +1,54 @@
+"""add prompt test round checkpoints
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2025-11-04 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "a7b8c9d0e1f2"
+down_revision: Union[str, None] = "f6a7b8c9d0e1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "prompt_test_rounds",
+        sa.Column("id", sa.Integer(), primary_key=True, nullable=False),
+        sa.Column(
+            "experiment_id",
+            sa.Integer(),
+            sa.ForeignKey("prompt_test_experiments.id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("run_index", sa.Integer(), nullable=False),
+        sa.Column("record", sa.JSON(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.UniqueConstraint(
+            "experiment_id", "run_index", name="uq_prompt_test_round_index"
+        ),
+    )
+    op.create_index(
+        "ix_prompt_test_rounds_experiment_id",
+        "prompt_test_rounds",
+        ["experiment_id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_prompt_test_rounds_experiment_id", table_name="prompt_test_rounds"
+    )
+    op.drop_table("prompt_test_rounds")
@@ -0,0 +1,40 @@
+"""add failover model to llm models
+
+Revision ID: b4c5d6e7f8a9
+Revises: a3b4c5d6e7f8
+Create Date: 2025-11-14 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "b4c5d6e7f8a9"
+down_revision: Union[str, None] = "a3b4c5d6e7f8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "llm_models",
+        sa.Column("failover_model_id", sa.Integer(), nullable=True),
+    )
+    op.create_foreign_key(
+        "llm_models_failover_model_id_fkey",
+        "llm_models",
+        "llm_models",
+        ["failover_model_id"],
+        ["id"],
+        ondelete="SET NULL",
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(
+        "llm_models_failover_model_id_fkey", "llm_models", type_="foreignkey"
+    )
+    op.drop_column("llm_models", "failover_model_id")
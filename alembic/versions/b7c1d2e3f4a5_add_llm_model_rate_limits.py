@@ -0,0 +1,34 @@
+"""add rate limits to llm models
+
+Revision ID: b7c1d2e3f4a5
+Revises: f1a2b3c4d5e6
+Create Date: 2025-10-28 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "b7c1d2e3f4a5"
+down_revision: Union[str, None] = "f1a2b3c4d5e6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "llm_models",
+        sa.Column("rate_limit_rpm", sa.Integer(), nullable=True),
+    )
+    op.add_column(
+        "llm_models",
+        sa.Column("rate_limit_tpm", sa.Integer(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("llm_models", "rate_limit_tpm")
+    op.drop_column("llm_models", "rate_limit_rpm")
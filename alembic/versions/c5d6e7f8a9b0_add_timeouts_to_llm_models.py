@@ -0,0 +1,39 @@
+"""add per-model timeouts to llm models
+
+Revision ID: c5d6e7f8a9b0
+Revises: b4c5d6e7f8a9
+Create Date: 2025-11-16 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "c5d6e7f8a9b0"
+down_revision: Union[str, None] = "b4c5d6e7f8a9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "llm_models",
+        sa.Column("timeout_connect_seconds", sa.Float(), nullable=True),
+    )
+    op.add_column(
+        "llm_models",
+        sa.Column("timeout_first_byte_seconds", sa.Float(), nullable=True),
+    )
+    op.add_column(
+        "llm_models",
+        sa.Column("timeout_total_seconds", sa.Float(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("llm_models", "timeout_total_seconds")
+    op.drop_column("llm_models", "timeout_first_byte_seconds")
+    op.drop_column("llm_models", "timeout_connect_seconds")
@@ -0,0 +1,49 @@
+"""add priority and fair share columns to jobs
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2025-11-06 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "c9d0e1f2a3b4"
+down_revision: Union[str, None] = "b8c9d0e1f2a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "jobs",
+        sa.Column("priority", sa.Integer(), nullable=False, server_default="1"),
+    )
+    op.add_column(
+        "jobs",
+        sa.Column(
+            "fair_key",
+            sa.String(length=120),
+            nullable=False,
+            server_default="default",
+        ),
+    )
+    op.add_column(
+        "jobs",
+        sa.Column("cost", sa.Float(), nullable=False, server_default="1"),
+    )
+    op.add_column(
+        "jobs",
+        sa.Column("claimed_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("jobs", "claimed_at")
+    op.drop_column("jobs", "cost")
+    op.drop_column("jobs", "fair_key")
+    op.drop_column("jobs", "priority")
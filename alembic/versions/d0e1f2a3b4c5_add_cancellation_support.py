@@ -0,0 +1,41 @@
+"""add cancelled status and job cancel requests
+
+Revision ID: d0e1f2a3b4c5
+Revises: c9d0e1f2a3b4
+Create Date: 2025-11-07 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "d0e1f2a3b4c5"
+down_revision: Union[str, None] = "c9d0e1f2a3b4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        # ALTER TYPE ... ADD VALUE 不能在事务块中执行
+        with op.get_context().autocommit_block():
+            op.execute(
+                "ALTER TYPE test_run_status ADD VALUE IF NOT EXISTS 'cancelled'"
+            )
+            op.execute(
+                "ALTER TYPE prompt_test_task_status ADD VALUE IF NOT EXISTS 'cancelled'"
+            )
+
+    op.add_column(
+        "jobs",
+        sa.Column("cancel_requested_at", sa.DateTime(timezone=True), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("jobs", "cancel_requested_at")
+    # PostgreSQL 不支持删除枚举值，保留 cancelled 取值
@@ -0,0 +1,80 @@
+"""add usage budgets and model prices
+
+Revision ID: e1f2a3b4c5d6
+Revises: d0e1f2a3b4c5
+Create Date: 2025-11-08 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = "e1f2a3b4c5d6"
+down_revision: Union[str, None] = "d0e1f2a3b4c5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    budget_scope_enum = postgresql.ENUM(
+        "model", "owner", name="budget_scope", create_type=False
+    )
+    budget_period_enum = postgresql.ENUM(
+        "daily", "monthly", "total", name="budget_period", create_type=False
+    )
+    budget_scope_enum.create(bind, checkfirst=True)
+    budget_period_enum.create(bind, checkfirst=True)
+
+    op.add_column(
+        "llm_models", sa.Column("input_price_per_1k", sa.Float(), nullable=True)
+    )
+    op.add_column(
+        "llm_models", sa.Column("output_price_per_1k", sa.Float(), nullable=True)
+    )
+
+    op.create_table(
+        "usage_budgets",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("scope", budget_scope_enum, nullable=False),
+        sa.Column("target_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "period", budget_period_enum, nullable=False, server_default="monthly"
+        ),
+        sa.Column("token_limit", sa.BigInteger(), nullable=True),
+        sa.Column("cost_limit", sa.Float(), nullable=True),
+        sa.Column("used_tokens", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("used_cost", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("period_start", sa.DateTime(timezone=True), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.func.now(),
+            nullable=False,
+        ),
+        sa.UniqueConstraint(
+            "scope", "target_id", name="uq_usage_budget_scope_target"
+        ),
+    )
+    op.create_index("ix_usage_budgets_id", "usage_budgets", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_usage_budgets_id", table_name="usage_budgets")
+    op.drop_table("usage_budgets")
+    op.drop_column("llm_models", "output_price_per_1k")
+    op.drop_column("llm_models", "input_price_per_1k")
+
+    bind = op.get_bind()
+    sa.Enum(name="budget_period").drop(bind, checkfirst=True)
+    sa.Enum(name="budget_scope").drop(bind, checkfirst=True)
@@ -0,0 +1,36 @@
+"""add cancelled job status
+
+Revision ID: e7f8a9b0c1d2
+Revises: d6e7f8a9b0c1
+Create Date: 2025-11-19 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "e7f8a9b0c1d2"
+down_revision: Union[str, None] = "d6e7f8a9b0c1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":
+        # ALTER TYPE ... ADD VALUE 不能在事务块中执行
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE job_status ADD VALUE IF NOT EXISTS 'cancelled'")
+
+    # 此前取消的排队作业以 succeeded 加取消说明记录
+    op.execute(
+        "UPDATE jobs SET status = 'cancelled' "
+        "WHERE status = 'succeeded' AND last_error = '已取消'"
+    )
+
+
+def downgrade() -> None:
+    op.execute("UPDATE jobs SET status = 'succeeded' WHERE status = 'cancelled'")
+    # PostgreSQL 不支持删除枚举值，保留 cancelled 取值
@@ -1,9 +1,14 @@
 from __future__ import annotations
 
 import json
+import math
 import time
-from typing import Any, Iterator, cast
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack
+from dataclasses import asdict
+from typing import Any, cast
 
+import anyio
 import httpx
 from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from fastapi.responses import StreamingResponse
@@ -11,32 +16,63 @@ from pydantic import BaseModel, Field, ValidationError
 from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, selectinload
-
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Send
+
+from app.core.llm_circuit_breaker import CircuitOpenError, llm_circuit_breaker
+from app.core.llm_gateway import LLMCallRequest, LLMCallResult, call_llm
+from app.core.llm_hedging import HedgePolicy, llm_hedger
+from app.core.llm_http_client import llm_client_registry
+from app.core.llm_pacing import llm_pacer
 from app.core.llm_provider_registry import (
     get_provider_defaults,
     iter_common_providers,
 )
+from app.core.llm_rate_limiter import (
+    LimitConfig,
+    RateLimitTimeout,
+    estimate_payload_tokens,
+    llm_rate_limiter,
+)
+from app.core.llm_timeouts import TimeoutConfig
 from app.core.logging_config import get_logger
+from app.core.sse import SSEParser
 from app.db.session import get_db
 from app.models.llm_provider import LLMModel, LLMProvider
 from app.models.usage import LLMUsageLog
 from app.schemas.llm_provider import (
     KnownLLMProvider,
+    LLMCircuitBreakerStatus,
     LLMModelCreate,
     LLMModelUpdate,
     LLMModelRead,
     LLMProviderCreate,
     LLMProviderRead,
     LLMProviderUpdate,
+    LLMRateLimitStatus,
     LLMUsageLogRead,
     LLMUsageMessage,
 )
-from app.services.llm_usage import list_quick_test_usage_logs
+from app.services.budget import (
+    BudgetExceededError,
+    budget_tracker,
+    estimate_payloads,
+)
+from app.services.llm_config_cache import llm_config_cache
+from app.services.llm_response_cache import (
+    CacheMode,
+    llm_response_cache,
+    resolve_cache_mode,
+)
+from app.services.llm_usage import apply_hedge_outcome, list_quick_test_usage_logs
+from app.services.usage_log_writer import usage_log_writer
 
 router = APIRouter()
 
 logger = get_logger("promptworks.api.llms")
-DEFAULT_INVOKE_TIMEOUT = 30.0
+CACHE_STATUS_HEADER = "X-PromptWorks-Cache"
+COALESCED_HEADER = "X-PromptWorks-Coalesced"
+HEDGE_HEADER = "X-PromptWorks-Hedge"
 
 
 class ChatMessage(BaseModel):
@@ -51,6 +87,17 @@ class LLMInvocationRequest(BaseModel):
     )
     model: str | None = Field(default=None, description="覆盖使用的模型名称")
     model_id: int | None = Field(default=None, description="指定已配置模型的 ID")
+    cache: CacheMode | None = Field(
+        default=None,
+        description="响应缓存模式 read/write/bypass，仅非流式调用生效，缺省使用全局配置",
+    )
+    hedge: bool | float | None = Field(
+        default=None,
+        description=(
+            "对冲请求：true 按全局配置的延迟，数字为固定延迟秒数，超过延迟仍未返回时"
+            "再发一份请求，先返回者胜出；仅非流式调用生效"
+        ),
+    )
 
 
 class LLMStreamInvocationRequest(LLMInvocationRequest):
@@ -114,11 +161,43 @@ def _serialize_provider(provider: LLMProvider) -> LLMProviderRead:
         default_model_name=provider.default_model_name,
         masked_api_key=_mask_api_key(provider.api_key),
         models=models,
+        circuit_breakers=_circuit_breakers(provider.id),
         created_at=provider.created_at,
         updated_at=provider.updated_at,
     )
 
 
+def _circuit_breakers(provider_id: int) -> list[LLMCircuitBreakerStatus]:
+    prefix = f"{provider_id}:"
+    return [
+        LLMCircuitBreakerStatus.model_validate(
+            {**asdict(item), "model_name": item.key[len(prefix) :]}
+        )
+        for item in llm_circuit_breaker.status()
+        if item.key.startswith(prefix)
+    ]
+
+
+def _ensure_failover_model(
+    db: Session, provider_id: int, failover_model_id: int | None
+) -> None:
+    """熔断时改用的模型需存在且属于其他提供者，否则无法绕开故障的提供方。"""
+
+    if failover_model_id is None:
+        return
+    failover = db.get(LLMModel, failover_model_id)
+    if failover is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="指定的等价模型不存在",
+        )
+    if failover.provider_id == provider_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="等价模型需属于其他提供者",
+        )
+
+
 def _resolve_base_url_or_400(provider: LLMProvider) -> str:
     base_url = provider.base_url or (
         defaults.base_url
@@ -188,6 +267,40 @@ def _determine_model_for_invocation(
     return model_name, target_model
 
 
+def _resolve_invocation_target(
+    db: Session, provider_id: int, payload: LLMInvocationRequest
+) -> tuple[LLMProvider, str, LLMModel | None]:
+    """解析调用所需的提供者与模型，结果缓存在进程内，配置变更时自动失效。"""
+
+    def load() -> tuple[LLMProvider, str, LLMModel | None]:
+        provider = _get_provider_or_404(db, provider_id)
+        model_name, target_model = _determine_model_for_invocation(
+            db, provider, payload
+        )
+        return provider, model_name, target_model
+
+    key = ("invoke", provider_id, payload.model_id, payload.model)
+    return llm_config_cache.resolve(db, key, load)
+
+
+def _check_budget_or_429(
+    db: Session, target_model: LLMModel | None, request_payload: dict[str, Any]
+) -> None:
+    if target_model is None:
+        return
+    try:
+        budget_tracker.check(
+            db,
+            model_id=target_model.id,
+            estimate=estimate_payloads(target_model, [request_payload]),
+        )
+    except BudgetExceededError as exc:
+        logger.warning("模型预算不足，拒绝调用: model_id=%s", target_model.id)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc)
+        ) from exc
+
+
 def _resolve_provider_defaults_for_create(
     data: dict[str, Any],
 ) -> tuple[dict[str, Any], str | None]:
@@ -306,6 +419,39 @@ def list_quick_test_history(
     return history
 
 
+@router.get("/rate-limits", response_model=list[LLMRateLimitStatus])
+def list_rate_limits() -> list[LLMRateLimitStatus]:
+    """返回各模型当前的并发占用、令牌余量、排队等待、节奏调度与对冲情况。"""
+
+    statuses: list[LLMRateLimitStatus] = []
+    hedges = {item.key: item for item in llm_hedger.status()}
+    for item in llm_rate_limiter.status():
+        status_item = LLMRateLimitStatus.model_validate(item, from_attributes=True)
+        pacing = llm_pacer.status(item.key)
+        if pacing is not None:
+            status_item = status_item.model_copy(
+                update={
+                    "pacing_interval_ms": pacing.interval_ms,
+                    "paced_requests": pacing.delayed_total,
+                    "avg_pacing_delay_ms": pacing.avg_delay_ms,
+                    "max_pacing_delay_ms": pacing.max_delay_ms,
+                    "last_pacing_delay_ms": pacing.last_delay_ms,
+                }
+            )
+        hedge = hedges.get(item.key)
+        if hedge is not None:
+            status_item = status_item.model_copy(
+                update={
+                    "hedge_calls": hedge.calls_total,
+                    "hedged_requests": hedge.hedged_total,
+                    "hedge_rate": hedge.hedge_rate,
+                    "hedge_win_rate": hedge.win_rate,
+                }
+            )
+        statuses.append(status_item)
+    return statuses
+
+
 @router.get("", response_model=list[LLMProviderRead])
 @router.get("/", response_model=list[LLMProviderRead])
 def list_llm_providers(
@@ -448,6 +594,7 @@ def create_llm_model(
 
     provider = _get_provider_or_404(db, provider_id)
     data = payload.model_dump()
+    _ensure_failover_model(db, provider.id, data.get("failover_model_id"))
 
     model = LLMModel(provider_id=provider.id, **data)
     db.add(model)
@@ -498,6 +645,25 @@ def update_llm_model(
         model.capability = update_data["capability"]
     if "quota" in update_data:
         model.quota = update_data["quota"]
+    if "rate_limit_rpm" in update_data:
+        model.rate_limit_rpm = update_data["rate_limit_rpm"]
+    if "rate_limit_tpm" in update_data:
+        model.rate_limit_tpm = update_data["rate_limit_tpm"]
+    if "input_price_per_1k" in update_data:
+        model.input_price_per_1k = update_data["input_price_per_1k"]
+    if "output_price_per_1k" in update_data:
+        model.output_price_per_1k = update_data["output_price_per_1k"]
+    for name in (
+        "timeout_connect_seconds",
+        "timeout_first_byte_seconds",
+        "timeout_total_seconds",
+        "max_choices_per_request",
+    ):
+        if name in update_data:
+            setattr(model, name, update_data[name])
+    if "failover_model_id" in update_data:
+        _ensure_failover_model(db, provider_id, update_data["failover_model_id"])
+        model.failover_model_id = update_data["failover_model_id"]
 
     db.commit()
     db.refresh(model)
@@ -581,32 +747,75 @@ def invoke_llm(
     db: Session = Depends(get_db),
     provider_id: int,
     payload: LLMInvocationRequest,
+    response: Response,
 ) -> dict[str, Any]:
     """使用兼容 OpenAI Chat Completion 的方式调用目标 LLM。"""
 
-    provider = _get_provider_or_404(db, provider_id)
-    model_name, _ = _determine_model_for_invocation(db, provider, payload)
+    provider, model_name, target_model = _resolve_invocation_target(
+        db, provider_id, payload
+    )
     base_url = _resolve_base_url_or_400(provider)
 
     request_payload: dict[str, Any] = dict(payload.parameters)
     request_payload["model"] = model_name
     request_payload["messages"] = [message.model_dump() for message in payload.messages]
 
-    headers = {
-        "Authorization": f"Bearer {provider.api_key}",
-        "Content-Type": "application/json",
-    }
-
-    url = f"{base_url}/chat/completions"
-    logger.info("调用外部 LLM 接口: provider_id=%s url=%s", provider.id, url)
+    cache_scope = llm_response_cache.scope(db, resolve_cache_mode(payload.cache))
+    cache_key = cache_scope.key_for(base_url, request_payload)
+    cached = cache_scope.lookup(cache_key)
+    if cached is not None:
+        logger.info("命中 LLM 响应缓存: provider_id=%s", provider.id)
+        db.commit()
+        response.headers[CACHE_STATUS_HEADER] = "hit"
+        # 命中缓存同样记录调用日志并标记 cache_hit，供用量看板统计节省的 token
+        _persist_invocation_usage(
+            db,
+            provider_id=provider.id,
+            model_name=model_name,
+            target_model=target_model,
+            payload=payload,
+            messages=request_payload["messages"],
+            body=cached.body,
+            latency_ms=cached.latency_ms,
+            cache_hit=True,
+        )
+        return cached.body
+
+    _check_budget_or_429(db, target_model, request_payload)
+    request = LLMCallRequest(
+        provider_id=provider.id,
+        model_name=model_name,
+        base_url=base_url,
+        api_key=provider.api_key,
+        payload=request_payload,
+        limit_config=LimitConfig.for_model(target_model),
+        timeout=TimeoutConfig.for_model(target_model),
+        source="quick_test",
+        hedge=HedgePolicy.from_option(payload.hedge),
+    )
+    logger.info("调用外部 LLM 接口: provider_id=%s url=%s", provider.id, request.url)
     logger.debug("LLM 请求参数: %s", request_payload)
     try:
-        response = httpx.post(
-            url,
-            headers=headers,
-            json=request_payload,
-            timeout=DEFAULT_INVOKE_TIMEOUT,
+        # 快速测试由用户实时等待结果，失败时直接返回而不自动重试
+        call = call_llm(request)
+    except RateLimitTimeout as exc:
+        logger.warning("等待模型调用配额超时: provider_id=%s", provider.id)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc)
+        ) from exc
+    except CircuitOpenError as exc:
+        logger.warning("模型调用已熔断: provider_id=%s", provider.id)
+        raise _circuit_open_error(exc) from exc
+    except httpx.TimeoutException as exc:
+        logger.error(
+            "调用外部 LLM 接口超时: provider_id=%s 类型=%s",
+            provider.id,
+            type(exc).__name__,
         )
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"调用外部 LLM 超时: {exc}",
+        ) from exc
     except httpx.HTTPError as exc:
         logger.error(
             "调用外部 LLM 接口出现网络异常: provider_id=%s 错误=%s",
@@ -617,226 +826,412 @@ def invoke_llm(
             status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc)
         ) from exc
 
-    if response.status_code >= 400:
+    upstream = call.response
+    if upstream.status_code >= 400:
         try:
-            error_payload = response.json()
+            error_payload = upstream.json()
         except ValueError:
-            error_payload = {"message": response.text}
+            error_payload = {"message": upstream.text}
         logger.error(
             "外部 LLM 接口返回错误: provider_id=%s 状态码=%s 响应=%s",
             provider.id,
-            response.status_code,
+            upstream.status_code,
             error_payload,
         )
-        raise HTTPException(status_code=response.status_code, detail=error_payload)
+        raise HTTPException(status_code=upstream.status_code, detail=error_payload)
 
-    elapsed = getattr(response, "elapsed", None)
-    elapsed_ms = elapsed.total_seconds() * 1000 if elapsed is not None else None
-    if elapsed_ms is not None:
-        logger.info(
-            "外部 LLM 接口调用成功: provider_id=%s 耗时 %.2fms", provider.id, elapsed_ms
-        )
-    else:
-        logger.info("外部 LLM 接口调用成功: provider_id=%s", provider.id)
+    logger.info(
+        "外部 LLM 接口调用成功: provider_id=%s 耗时 %sms", provider.id, call.latency_ms
+    )
+
+    result = upstream.json()
+    usage = result.get("usage") if isinstance(result, dict) else None
+    if isinstance(usage, dict) and isinstance(usage.get("total_tokens"), int):
+        call.record_usage(usage["total_tokens"])
+    if cache_key is not None and isinstance(result, dict):
+        # 合并的调用由领头请求负责回填缓存
+        if not call.coalesced:
+            cache_scope.store(
+                cache_key,
+                model_name=model_name,
+                body=result,
+                latency_ms=call.latency_ms,
+            )
+            cache_scope.flush()
+            db.commit()
+        response.headers[CACHE_STATUS_HEADER] = "miss"
+    if call.coalesced:
+        response.headers[COALESCED_HEADER] = "true"
+    if call.hedge is not None:
+        response.headers[HEDGE_HEADER] = call.hedge.role
+    _persist_invocation_usage(
+        db,
+        provider_id=provider.id,
+        model_name=model_name,
+        target_model=target_model,
+        payload=payload,
+        messages=request_payload["messages"],
+        body=result,
+        latency_ms=call.latency_ms,
+        call=call,
+    )
+    return result
 
-    return response.json()
 
+def _circuit_open_error(exc: CircuitOpenError) -> HTTPException:
+    headers = None
+    if exc.retry_after is not None:
+        headers = {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(exc),
+        headers=headers,
+    )
 
-@router.post(
-    "/{provider_id}/invoke/stream",
-    response_class=StreamingResponse,
-)
-def stream_invoke_llm(
+
+def _persist_invocation_usage(
+    db: Session,
     *,
-    db: Session = Depends(get_db),
     provider_id: int,
-    payload: LLMStreamInvocationRequest,
-) -> StreamingResponse:
-    """以流式方式调用目标 LLM，并转发 OpenAI 兼容的事件流。"""
+    model_name: str,
+    target_model: LLMModel | None,
+    payload: LLMInvocationRequest,
+    messages: Any,
+    body: Any,
+    latency_ms: int | None,
+    cache_hit: bool = False,
+    call: LLMCallResult | None = None,
+) -> None:
+    """记录一次非流式调用的用量；发出了对冲请求时同时记录落败一路的开销。"""
+
+    body = body if isinstance(body, dict) else {}
+    usage = body.get("usage") if isinstance(body.get("usage"), dict) else {}
+    response_text: str | None = None
+    choices = body.get("choices")
+    if isinstance(choices, list) and choices and isinstance(choices[0], dict):
+        message_obj = choices[0].get("message")
+        content = message_obj.get("content") if isinstance(message_obj, dict) else None
+        if isinstance(content, str):
+            response_text = content
+    log_entry = LLMUsageLog(
+        provider_id=provider_id,
+        model_id=target_model.id if target_model else None,
+        model_name=model_name,
+        source="quick_test",
+        messages=messages,
+        parameters=dict(payload.parameters) or None,
+        response_text=response_text,
+        temperature=payload.parameters.get("temperature"),
+        latency_ms=latency_ms,
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens"),
+        total_tokens=usage.get("total_tokens"),
+        cache_hit=cache_hit,
+        coalesced=bool(call and call.coalesced),
+    )
+    usage_logs = [log_entry]
+    hedge = call.hedge.summary() if call is not None and call.hedge else None
+    loser_log = apply_hedge_outcome(log_entry, hedge)
+    if loser_log is not None:
+        usage_logs.append(loser_log)
+    # 命中缓存与合并的调用未请求上游，由 record_usage_log 跳过
+    for item in usage_logs:
+        budget_tracker.record_usage_log(item, model=target_model)
+    try:
+        usage_log_writer.write_many(db, usage_logs)
+        db.commit()
+    except Exception:  # pragma: no cover - 防御性回滚
+        db.rollback()
+        logger.exception(
+            "保存 LLM 调用日志失败: provider_id=%s model=%s", provider_id, model_name
+        )
 
-    provider = _get_provider_or_404(db, provider_id)
-    model_name, target_model = _determine_model_for_invocation(db, provider, payload)
-    base_url = _resolve_base_url_or_400(provider)
 
-    request_payload: dict[str, Any] = dict(payload.parameters)
-    request_payload.pop("stream", None)
-    request_payload["temperature"] = payload.temperature
-    request_payload["model"] = model_name
-    request_payload["messages"] = [message.model_dump() for message in payload.messages]
-    request_payload["stream"] = True
+class _StreamUsageCollector:
+    """旁路解析转发中的事件流，提取用量与生成内容，不改动转发的字节。"""
 
-    stream_options = request_payload.get("stream_options")
-    if isinstance(stream_options, dict):
-        stream_options.setdefault("include_usage", True)
-    else:
-        request_payload["stream_options"] = {"include_usage": True}
+    def __init__(self) -> None:
+        self._parser = SSEParser()
+        self._chunks: list[str] = []
+        self.usage: dict[str, int | None] | None = None
 
-    headers = {
-        "Authorization": f"Bearer {provider.api_key}",
-        "Content-Type": "application/json",
-    }
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
 
-    url = f"{base_url}/chat/completions"
-    logger.info(
-        "启动流式 LLM 调用: provider_id=%s model=%s url=%s",
-        provider.id,
-        model_name,
-        url,
-    )
-    logger.debug("LLM 流式请求参数: %s", request_payload)
+    def feed(self, chunk: bytes) -> None:
+        for data in self._parser.feed(chunk):
+            self._handle(data)
 
-    start_time = time.perf_counter()
-    usage_summary: dict[str, int | None] | None = None
-    generated_chunks: list[str] = []
-    should_persist = True
-    request_messages = [message.model_dump() for message in payload.messages]
-    original_parameters = dict(payload.parameters)
-
-    def _process_event(lines: list[str]) -> None:
-        nonlocal usage_summary
-        if not lines:
-            return
-        data_segments: list[str] = []
-        for item in lines:
-            if item.startswith(":"):
-                continue
-            if item.startswith("data:"):
-                data_segments.append(item[5:].lstrip())
-        if not data_segments:
-            return
-        data_str = "\n".join(data_segments).strip()
-        if not data_str:
-            return
-        if data_str == "[DONE]":
+    def close(self) -> None:
+        for data in self._parser.close():
+            self._handle(data)
+
+    def _handle(self, data: str) -> None:
+        data = data.strip()
+        if not data or data == "[DONE]":
             return
         try:
-            payload_obj = json.loads(data_str)
+            payload_obj = json.loads(data)
         except json.JSONDecodeError:
-            logger.debug("忽略无法解析的流式分片: %s", data_str)
+            logger.debug("忽略无法解析的流式分片: %s", data)
+            return
+        if not isinstance(payload_obj, dict):
             return
 
         usage = payload_obj.get("usage")
         if isinstance(usage, dict):
-            usage_summary = {
+            self.usage = {
                 "prompt_tokens": usage.get("prompt_tokens"),
                 "completion_tokens": usage.get("completion_tokens"),
                 "total_tokens": usage.get("total_tokens"),
             }
 
-        for choice in payload_obj.get("choices", []):
+        for choice in payload_obj.get("choices") or []:
+            if not isinstance(choice, dict):
+                continue
             delta = choice.get("delta") or {}
             content = delta.get("content")
             if content:
-                generated_chunks.append(content)
+                self._chunks.append(content)
                 continue
             message_obj = choice.get("message")
             if isinstance(message_obj, dict):
                 content = message_obj.get("content")
                 if content:
-                    generated_chunks.append(content)
+                    self._chunks.append(content)
 
-    def _persist_usage() -> None:
-        if not should_persist:
-            return
-        summary = usage_summary or {}
-        response_text = "".join(generated_chunks)
-        if not response_text and not summary:
-            return
 
-        latency_ms = int((time.perf_counter() - start_time) * 1000)
-        log_entry = LLMUsageLog(
-            provider_id=provider.id,
-            model_id=target_model.id if target_model else None,
-            model_name=model_name,
-            source="quick_test",
-            prompt_id=payload.prompt_id,
-            prompt_version_id=payload.prompt_version_id,
-            messages=request_messages,
-            parameters=original_parameters or None,
-            response_text=response_text or None,
-            temperature=payload.temperature,
-            latency_ms=latency_ms,
-            prompt_tokens=summary.get("prompt_tokens"),
-            completion_tokens=summary.get("completion_tokens"),
-            total_tokens=summary.get("total_tokens"),
-        )
-        try:
-            db.add(log_entry)
-            db.commit()
-            logger.info(
-                "流式调用完成: provider_id=%s model=%s tokens=%s",
-                provider.id,
-                model_name,
-                summary,
-            )
-        except Exception:  # pragma: no cover - 防御性回滚
-            db.rollback()
-            logger.exception(
-                "保存 LLM 调用日志失败: provider_id=%s model=%s",
-                provider.id,
-                model_name,
-            )
+class _ProxyStreamingResponse(StreamingResponse):
+    """发送结束或客户端断开时立即关闭转发生成器，及时中断上游请求。"""
 
-    def _event_stream() -> Iterator[bytes]:
-        nonlocal should_persist
-        event_lines: list[str] = []
+    async def stream_response(self, send: Send) -> None:
         try:
-            with httpx.stream(
-                "POST",
-                url,
-                headers=headers,
-                json=request_payload,
-                timeout=DEFAULT_INVOKE_TIMEOUT,
-            ) as response:
-                if response.status_code >= 400:
-                    should_persist = False
-                    error_body = response.read()
-                    decoded = error_body.decode("utf-8", errors="ignore")
-                    try:
-                        error_payload = json.loads(decoded)
-                    except ValueError:
-                        error_payload = {"message": decoded}
-                    logger.error(
-                        "流式调用返回错误: provider_id=%s 状态码=%s 响应=%s",
-                        provider.id,
-                        response.status_code,
-                        error_payload,
-                    )
-                    raise HTTPException(
-                        status_code=response.status_code, detail=error_payload
-                    )
+            await super().stream_response(send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                with anyio.CancelScope(shield=True):
+                    await aclose()
 
-                for line in response.iter_lines():
-                    if line is None:
-                        continue
-                    if line == "":
-                        _process_event(event_lines)
-                        event_lines = []
-                        yield b"\n"
-                        continue
-                    event_lines.append(line)
-                    yield (line + "\n").encode("utf-8")
 
-                if event_lines:
-                    _process_event(event_lines)
+def _prepare_stream_request(
+    db: Session, provider_id: int, payload: LLMStreamInvocationRequest
+) -> tuple[LLMCallRequest, LLMModel | None]:
+    provider, model_name, target_model = _resolve_invocation_target(
+        db, provider_id, payload
+    )
+    base_url = _resolve_base_url_or_400(provider)
+
+    request_payload: dict[str, Any] = dict(payload.parameters)
+    request_payload.pop("stream", None)
+    request_payload["temperature"] = payload.temperature
+    request_payload["model"] = model_name
+    request_payload["messages"] = [message.model_dump() for message in payload.messages]
+    request_payload["stream"] = True
+
+    stream_options = request_payload.get("stream_options")
+    if isinstance(stream_options, dict):
+        stream_options.setdefault("include_usage", True)
+    else:
+        request_payload["stream_options"] = {"include_usage": True}
+
+    _check_budget_or_429(db, target_model, request_payload)
+    request = LLMCallRequest(
+        provider_id=provider.id,
+        model_name=model_name,
+        base_url=base_url,
+        api_key=provider.api_key,
+        payload=request_payload,
+        limit_config=LimitConfig.for_model(target_model),
+        timeout=TimeoutConfig.for_model(target_model),
+        source="quick_test",
+    )
+    return request, target_model
+
 
+def _persist_stream_usage(
+    db: Session,
+    request: LLMCallRequest,
+    target_model: LLMModel | None,
+    payload: LLMStreamInvocationRequest,
+    collector: _StreamUsageCollector,
+    latency_ms: int,
+) -> None:
+    summary = collector.usage or {}
+    response_text = collector.text
+    if not response_text and not summary:
+        return
+
+    log_entry = LLMUsageLog(
+        provider_id=request.provider_id,
+        model_id=target_model.id if target_model else None,
+        model_name=request.model_name,
+        source="quick_test",
+        prompt_id=payload.prompt_id,
+        prompt_version_id=payload.prompt_version_id,
+        messages=[message.model_dump() for message in payload.messages],
+        parameters=dict(payload.parameters) or None,
+        response_text=response_text or None,
+        temperature=payload.temperature,
+        latency_ms=latency_ms,
+        prompt_tokens=summary.get("prompt_tokens"),
+        completion_tokens=summary.get("completion_tokens"),
+        total_tokens=summary.get("total_tokens"),
+    )
+    try:
+        usage_log_writer.write(db, log_entry)
+        db.commit()
+        budget_tracker.record_usage_log(log_entry, model=target_model)
+        logger.info(
+            "流式调用完成: provider_id=%s model=%s tokens=%s",
+            request.provider_id,
+            request.model_name,
+            summary,
+        )
+    except Exception:  # pragma: no cover - 防御性回滚
+        db.rollback()
+        logger.exception(
+            "保存 LLM 调用日志失败: provider_id=%s model=%s",
+            request.provider_id,
+            request.model_name,
+        )
+
+
+@router.post(
+    "/{provider_id}/invoke/stream",
+    response_class=StreamingResponse,
+)
+async def stream_invoke_llm(
+    *,
+    db: Session = Depends(get_db),
+    provider_id: int,
+    payload: LLMStreamInvocationRequest,
+) -> StreamingResponse:
+    """以流式方式调用目标 LLM，并原样转发 OpenAI 兼容的事件流。
+
+    配置解析、预算检查与日志写入在线程池中执行，上游连接与转发运行在事件循环上，
+    每个流不再占用工作线程。上游在返回事件流之前出错时直接返回对应状态码。
+    """
+
+    request, target_model = await run_in_threadpool(
+        _prepare_stream_request, db, provider_id, payload
+    )
+    logger.info(
+        "启动流式 LLM 调用: provider_id=%s model=%s url=%s",
+        request.provider_id,
+        request.model_name,
+        request.url,
+    )
+    logger.debug("LLM 流式请求参数: %s", request.payload)
+
+    client = llm_client_registry.get_async_client(request.base_url, request.api_key)
+    start_time = time.perf_counter()
+    async with AsyncExitStack() as stack:
+        try:
+            circuit = stack.enter_context(
+                llm_circuit_breaker.guard(request.limiter_key)
+            )
+            lease = await stack.enter_async_context(
+                llm_rate_limiter.acquire_async(
+                    request.limiter_key,
+                    request.limit_config,
+                    estimated_tokens=estimate_payload_tokens(request.payload),
+                )
+            )
+            upstream = await stack.enter_async_context(
+                client.stream(
+                    "POST",
+                    request.url,
+                    headers=request.build_headers(),
+                    json=request.payload,
+                    timeout=request.timeout.to_httpx(stream=True),
+                )
+            )
+            # 流式响应的总耗时取决于输出长度，仅上报状态码
+            lease.record_outcome(upstream.status_code, None)
+            circuit.record_status(upstream.status_code)
+            error_body = (
+                await upstream.aread() if upstream.status_code >= 400 else None
+            )
+        except RateLimitTimeout as exc:
+            logger.warning(
+                "等待模型调用配额超时: provider_id=%s", request.provider_id
+            )
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc)
+            ) from exc
+        except CircuitOpenError as exc:
+            logger.warning("模型调用已熔断: provider_id=%s", request.provider_id)
+            raise _circuit_open_error(exc) from exc
         except httpx.HTTPError as exc:
-            should_persist = False
             logger.error(
                 "流式调用外部 LLM 出现异常: provider_id=%s 错误=%s",
-                provider.id,
+                request.provider_id,
                 exc,
             )
             raise HTTPException(
                 status_code=status.HTTP_502_BAD_GATEWAY, detail=str(exc)
             ) from exc
+
+        if error_body is not None:
+            decoded = error_body.decode("utf-8", errors="ignore")
+            try:
+                error_payload = json.loads(decoded)
+            except ValueError:
+                error_payload = {"message": decoded}
+            logger.error(
+                "流式调用返回错误: provider_id=%s 状态码=%s 响应=%s",
+                request.provider_id,
+                upstream.status_code,
+                error_payload,
+            )
+            raise HTTPException(
+                status_code=upstream.status_code, detail=error_payload
+            )
+        # 连接与配额交给转发生成器，在流结束或客户端断开时释放
+        upstream_scope = stack.pop_all()
+
+    async def _relay() -> AsyncIterator[bytes]:
+        collector = _StreamUsageCollector()
+        should_persist = True
+        try:
+            async for chunk in upstream.aiter_bytes():
+                collector.feed(chunk)
+                yield chunk
+        except httpx.HTTPError as exc:
+            # 响应头已经发出，只能以错误事件通知客户端
+            should_persist = False
+            logger.error(
+                "流式转发中断: provider_id=%s 错误=%s", request.provider_id, exc
+            )
+            error_event = json.dumps(
+                {"error": {"message": str(exc)}}, ensure_ascii=False
+            )
+            yield f"data: {error_event}\n\n".encode("utf-8")
         finally:
-            _persist_usage()
+            with anyio.CancelScope(shield=True):
+                collector.close()
+                total_tokens = (collector.usage or {}).get("total_tokens")
+                if total_tokens is not None:
+                    await lease.arecord_usage(total_tokens)
+                await upstream_scope.aclose()
+                if should_persist:
+                    latency_ms = int((time.perf_counter() - start_time) * 1000)
+                    await run_in_threadpool(
+                        _persist_stream_usage,
+                        db,
+                        request,
+                        target_model,
+                        payload,
+                        collector,
+                        latency_ms,
+                    )
 
     headers_extra = {
         "Cache-Control": "no-cache",
         "X-Accel-Buffering": "no",
     }
-    return StreamingResponse(
-        _event_stream(), media_type="text/event-stream", headers=headers_extra
+    return _ProxyStreamingResponse(
+        _relay(), media_type="text/event-stream", headers=headers_extra
     )
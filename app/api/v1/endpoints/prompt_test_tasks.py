@@ -7,7 +7,8 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy import func, select
 from sqlalchemy.orm import Session, selectinload
 
-from app.core.prompt_test_task_queue import enqueue_prompt_test_task
+from app.core.cancellation import cancellation_registry
+from app.core.prompt_test_task_queue import enqueue_prompt_test_task, task_queue
 from app.db.session import get_db
 from app.models.prompt_test import (
     PromptTestExperiment,
@@ -26,9 +27,13 @@ from app.schemas.prompt_test import (
     PromptTestUnitRead,
     PromptTestUnitUpdate,
 )
+from app.schemas.queue import QueuePositionRead
+from app.services.budget import BudgetExceededError
 from app.services.prompt_test_engine import (
+    PROMPT_TEST_EXPERIMENT_KIND,
     PromptTestExecutionError,
     execute_prompt_test_experiment,
+    preflight_prompt_test_task,
 )
 
 router = APIRouter(prefix="/prompt-test", tags=["prompt-test"])
@@ -82,23 +87,39 @@ def list_prompt_test_tasks(
 def create_prompt_test_task(
     *, db: Session = Depends(get_db), payload: PromptTestTaskCreate
 ) -> PromptTestTask:
-    """创建新的测试任务，可同时定义最小测试单元。"""
+    """创建新的测试任务，可同时定义最小测试单元。
 
-    task_data = payload.model_dump(exclude={"units", "auto_execute"})
-    task = PromptTestTask(**task_data)
-    db.add(task)
-    db.flush()
+    自动执行的任务在入队前预估用量，预算不足时返回 429 且不创建任务。
+    """
 
-    units_payload = payload.units or []
-    for unit_payload in units_payload:
-        unit_data = unit_payload.model_dump(exclude_none=True)
-        unit_data["task_id"] = task.id
-        unit = PromptTestUnit(**unit_data)
-        db.add(unit)
+    task_data = payload.model_dump(exclude={"units", "auto_execute", "priority"})
+    if payload.priority is not None:
+        task_data["config"] = {
+            **(task_data.get("config") or {}),
+            "priority": payload.priority.value,
+        }
+    task = PromptTestTask(**task_data)
+    units = [
+        PromptTestUnit(**unit_payload.model_dump(exclude_none=True))
+        for unit_payload in payload.units or []
+    ]
 
     if payload.auto_execute:
+        try:
+            estimate = preflight_prompt_test_task(db, task, units)
+        except BudgetExceededError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc)
+            ) from exc
+        task.config = {**(task.config or {}), "budget_estimate": estimate.as_dict()}
         task.status = PromptTestTaskStatus.READY
 
+    db.add(task)
+    db.flush()
+    for unit in units:
+        unit.task_id = task.id
+        db.add(unit)
+
     db.commit()
     db.refresh(task)
 
@@ -138,6 +159,60 @@ def update_prompt_test_task(
     return task
 
 
+@router.post(
+    "/tasks/{task_id}/resume",
+    response_model=PromptTestTaskRead,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+def resume_prompt_test_task(
+    *, db: Session = Depends(get_db), task_id: int
+) -> PromptTestTask:
+    """续跑中断或失败的测试任务，已完成的轮次不会重新调用模型。"""
+
+    task = _get_task_or_404(db, task_id)
+    if task.status not in {PromptTestTaskStatus.RUNNING, PromptTestTaskStatus.FAILED}:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="仅执行中或失败的测试任务可以续跑",
+        )
+    enqueue_prompt_test_task(task.id)
+    return task
+
+
+@router.post("/tasks/{task_id}/cancel", response_model=PromptTestTaskRead)
+def cancel_prompt_test_task(
+    *, db: Session = Depends(get_db), task_id: int
+) -> PromptTestTask:
+    """取消排队中或执行中的测试任务，执行中的实验会在当前轮次结束后停止。"""
+
+    task = _get_task_or_404(db, task_id)
+    if task.status not in {PromptTestTaskStatus.READY, PromptTestTaskStatus.RUNNING}:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="仅待执行或执行中的测试任务可以取消",
+        )
+    task.status = PromptTestTaskStatus.CANCELLED
+    task_queue.cancel(db, task.id)
+    db.commit()
+    db.refresh(task)
+    return task
+
+
+@router.get("/tasks/{task_id}/queue", response_model=QueuePositionRead)
+def get_prompt_test_task_queue_position(
+    *, db: Session = Depends(get_db), task_id: int
+) -> QueuePositionRead:
+    """查询测试任务的排队位置与预计开始时间。"""
+
+    _get_task_or_404(db, task_id)
+    estimate = task_queue.estimate(task_id)
+    if estimate is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="测试任务不在执行队列中"
+        )
+    return QueuePositionRead.from_estimate(estimate)
+
+
 @router.delete(
     "/tasks/{task_id}",
     status_code=status.HTTP_204_NO_CONTENT,
@@ -321,7 +396,7 @@ def get_prompt_test_experiment(
 def execute_existing_experiment(
     *, db: Session = Depends(get_db), experiment_id: int
 ) -> PromptTestExperiment:
-    """重新执行已存在的实验记录。"""
+    """重新执行已存在的实验记录，失败的实验从已完成的轮次继续。"""
 
     stmt = (
         select(PromptTestExperiment)
@@ -341,7 +416,7 @@ def execute_existing_experiment(
         )
 
     try:
-        execute_prompt_test_experiment(db, experiment)
+        execute_prompt_test_experiment(db, experiment, resume=True)
     except PromptTestExecutionError as exc:
         experiment.status = PromptTestExperimentStatus.FAILED
         experiment.error = str(exc)
@@ -352,4 +427,41 @@ def execute_existing_experiment(
     return experiment
 
 
+@router.post(
+    "/experiments/{experiment_id}/cancel",
+    response_model=PromptTestExperimentRead,
+)
+def cancel_prompt_test_experiment(
+    *, db: Session = Depends(get_db), experiment_id: int
+) -> PromptTestExperiment:
+    """取消执行中的实验，已完成的轮次会保留并可续跑。
+
+    实验在其他进程执行时，由执行方在下次保存检查点时读取状态并停止。
+    """
+
+    experiment = db.get(PromptTestExperiment, experiment_id)
+    if not experiment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="实验记录不存在"
+        )
+    if experiment.status not in {
+        PromptTestExperimentStatus.PENDING,
+        PromptTestExperimentStatus.RUNNING,
+    }:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="仅待执行或执行中的实验可以取消",
+        )
+
+    experiment.status = PromptTestExperimentStatus.CANCELLED
+    experiment.error = "实验已取消"
+    experiment.finished_at = datetime.now(UTC)
+    db.commit()
+    cancellation_registry.cancel(
+        PROMPT_TEST_EXPERIMENT_KIND, experiment.id, "实验已取消"
+    )
+    db.refresh(experiment)
+    return experiment
+
+
 __all__ = ["router"]
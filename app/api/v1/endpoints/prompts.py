@@ -12,10 +12,14 @@ from app.models.prompt import Prompt, PromptClass, PromptTag, PromptVersion, Med
 from app.schemas.prompt import (
     PromptCreate,
     PromptRead,
+    PromptRenderItem,
+    PromptRenderRequest,
+    PromptRenderResponse,
     PromptUpdate,
     PromptListResponse,
 )
 from app.services.attachment import attachment_service
+from app.services.prompt_template import TemplateRenderError, compile_template
 
 router = APIRouter()
 
@@ -270,6 +274,47 @@ def get_prompt(*, db: Session = Depends(get_db), prompt_id: int) -> PromptRead:
     return _convert_prompt_to_read(prompt)
 
 
+@router.post("/{prompt_id}/render", response_model=PromptRenderResponse)
+def render_prompt(
+    *, db: Session = Depends(get_db), prompt_id: int, payload: PromptRenderRequest
+) -> PromptRenderResponse:
+    """用一批用例变量渲染 Prompt 版本，模板只解析一次，逐个返回渲染结果。"""
+
+    prompt = _get_prompt_or_404(db, prompt_id)
+    version = prompt.current_version
+    if payload.version_id is not None:
+        version = next(
+            (item for item in prompt.versions if item.id == payload.version_id), None
+        )
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Prompt 版本不存在"
+        )
+
+    template = compile_template(version.content)
+    items: list[PromptRenderItem] = []
+    for index, case in enumerate(payload.cases, start=1):
+        context = {**payload.defaults, **case}
+        missing = template.missing(context)
+        if missing:
+            items.append(PromptRenderItem(index=index, missing=list(missing)))
+            continue
+        try:
+            content = template.render(context, run_index=index)
+        except TemplateRenderError as exc:
+            items.append(PromptRenderItem(index=index, error=str(exc)))
+            continue
+        items.append(PromptRenderItem(index=index, content=content))
+
+    return PromptRenderResponse(
+        prompt_id=prompt.id,
+        version_id=version.id,
+        variables=[name for name in template.variables if name != "run_index"],
+        rendered=sum(1 for item in items if item.content is not None),
+        items=items,
+    )
+
+
 @router.put("/{prompt_id}", response_model=PromptRead)
 def update_prompt(
     *, db: Session = Depends(get_db), prompt_id: int, payload: PromptUpdate
@@ -6,6 +6,8 @@ from fastapi import APIRouter
 from pydantic import BaseModel
 
 from app.__version__ import get_version, get_version_info, VERSION_HISTORY
+from app.core.llm_http_client import llm_client_registry
+from app.services.usage_log_writer import usage_log_writer
 
 
 router = APIRouter()
@@ -27,6 +29,37 @@ class HealthResponse(BaseModel):
     message: str
 
 
+class LLMClientPoolResponse(BaseModel):
+    """LLM 连接池统计响应模型"""
+
+    base_url: str
+    key_fingerprint: str
+    is_async: bool
+    http2: bool
+    requests_total: int
+    connections: int | None
+    idle_connections: int | None
+    created_at: float
+    last_used_at: float | None
+
+
+class UsageLogWriterResponse(BaseModel):
+    """调用日志写入服务统计响应模型"""
+
+    mode: str
+    running: bool
+    backlog: int
+    spilled_rows: int
+    written_total: int
+    flushes_total: int
+    failures_total: int
+    dropped_total: int
+    last_flush_ms: float | None
+    p50_flush_ms: float | None
+    p99_flush_ms: float | None
+    max_flush_ms: float | None
+
+
 @router.get("/version", response_model=VersionResponse, summary="获取版本信息")
 async def get_system_version():
     """
@@ -49,3 +82,58 @@ async def health_check():
     return HealthResponse(
         status="healthy", version=get_version(), message="PromptWorks 系统运行正常"
     )
+
+
+@router.get(
+    "/llm-client-pools",
+    response_model=list[LLMClientPoolResponse],
+    summary="获取 LLM 连接池统计",
+)
+async def list_llm_client_pools():
+    """
+    获取 LLM 连接池统计
+
+    返回各提供方长连接客户端的请求数、连接数与空闲连接数
+    """
+    return [
+        LLMClientPoolResponse(
+            base_url=item.base_url,
+            key_fingerprint=item.key_fingerprint,
+            is_async=item.is_async,
+            http2=item.http2,
+            requests_total=item.requests_total,
+            connections=item.connections,
+            idle_connections=item.idle_connections,
+            created_at=item.created_at,
+            last_used_at=item.last_used_at,
+        )
+        for item in llm_client_registry.stats()
+    ]
+
+
+@router.get(
+    "/usage-log-writer",
+    response_model=UsageLogWriterResponse,
+    summary="获取调用日志写入统计",
+)
+async def get_usage_log_writer_stats():
+    """
+    获取调用日志写入统计
+
+    返回写入模式、待写回与落盘的记录数，以及批量写入的次数与耗时分布
+    """
+    stats = usage_log_writer.stats()
+    return UsageLogWriterResponse(
+        mode=stats.mode,
+        running=stats.running,
+        backlog=stats.backlog,
+        spilled_rows=stats.spilled_rows,
+        written_total=stats.written_total,
+        flushes_total=stats.flushes_total,
+        failures_total=stats.failures_total,
+        dropped_total=stats.dropped_total,
+        last_flush_ms=stats.last_flush_ms,
+        p50_flush_ms=stats.p50_flush_ms,
+        p99_flush_ms=stats.p99_flush_ms,
+        max_flush_ms=stats.max_flush_ms,
+    )
@@ -10,9 +10,12 @@ from app.db.session import get_db
 from app.models.prompt import Prompt, PromptVersion
 from app.models.result import Result
 from app.models.test_run import TestRun, TestRunStatus
+from app.schemas.queue import QueuePositionRead
 from app.schemas.result import ResultRead
 from app.schemas.test_run import TestRunCreate, TestRunRead, TestRunUpdate
 from app.core.task_queue import enqueue_test_run, task_queue
+from app.services.budget import BudgetExceededError
+from app.services.test_run import TestRunExecutionError, preflight_test_run
 
 router = APIRouter()
 
@@ -64,8 +67,26 @@ def create_test_prompt(
         )
 
     data = payload.model_dump(by_alias=True, exclude_none=True)
+    priority = data.pop("priority", None)
+    if priority is not None:
+        data["schema"] = {**(data.get("schema") or {}), "priority": priority}
     test_run = TestRun(**data)
     test_run.prompt_version = prompt_version
+    try:
+        estimate = preflight_test_run(db, test_run)
+    except TestRunExecutionError:
+        # 模型配置问题留给执行阶段报告，与未做预估时的行为一致
+        estimate = None
+    except BudgetExceededError as exc:
+        test_run.prompt_version = None
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(exc)
+        ) from exc
+    if estimate is not None:
+        test_run.schema = {
+            **(test_run.schema or {}),
+            "budget_estimate": estimate.as_dict(),
+        }
     db.add(test_run)
     db.flush()
     db.commit()
@@ -168,6 +189,50 @@ def list_results_for_test_prompt(
     return list(db.scalars(stmt))
 
 
+@router.get("/{test_prompt_id}/queue", response_model=QueuePositionRead)
+def get_test_prompt_queue_position(
+    *, db: Session = Depends(get_db), test_prompt_id: int
+) -> QueuePositionRead:
+    """查询测试任务的排队位置与预计开始时间。"""
+
+    if not db.get(TestRun, test_prompt_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Test run 不存在"
+        )
+    estimate = task_queue.estimate(test_prompt_id)
+    if estimate is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="测试任务不在执行队列中"
+        )
+    return QueuePositionRead.from_estimate(estimate)
+
+
+@router.post("/{test_prompt_id}/cancel", response_model=TestRunRead)
+def cancel_test_prompt(
+    *, db: Session = Depends(get_db), test_prompt_id: int
+) -> TestRun:
+    """取消排队中或执行中的测试任务，已完成的轮次结果会保留。"""
+
+    test_run = db.get(TestRun, test_prompt_id)
+    if not test_run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Test run 不存在"
+        )
+
+    if test_run.status not in {TestRunStatus.PENDING, TestRunStatus.RUNNING}:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="仅排队中或执行中的测试任务可取消",
+        )
+
+    test_run.status = TestRunStatus.CANCELLED
+    task_queue.cancel(db, test_run.id)
+    db.commit()
+
+    stmt = _test_run_query().where(TestRun.id == test_run.id)
+    return db.execute(stmt).unique().scalar_one()
+
+
 @router.post("/{test_prompt_id}/retry", response_model=TestRunRead)
 def retry_test_prompt(*, db: Session = Depends(get_db), test_prompt_id: int) -> TestRun:
     """重新入队执行失败的测试任务。"""
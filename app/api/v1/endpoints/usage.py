@@ -1,12 +1,21 @@
 from __future__ import annotations
 
-from datetime import date
+from datetime import UTC, date, datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.db.session import get_db
-from app.schemas import UsageModelSummary, UsageOverview, UsageTimeseriesPoint
+from app.models.budget import UsageBudget
+from app.schemas import (
+    UsageBudgetCreate,
+    UsageBudgetRead,
+    UsageModelSummary,
+    UsageOverview,
+    UsageTimeseriesPoint,
+)
+from app.services.budget import BudgetStatus, budget_tracker, current_period_start
 from app.services.usage_dashboard import (
     ModelUsageSummary as ModelUsageSummaryEntity,
     UsageTimeseriesPoint as UsageTimeseriesPointEntity,
@@ -66,6 +75,23 @@ def _map_timeseries_point(entity: UsageTimeseriesPointEntity) -> UsageTimeseries
     )
 
 
+def _map_budget_status(entity: BudgetStatus) -> UsageBudgetRead:
+    return UsageBudgetRead(
+        id=entity.budget_id,
+        scope=entity.scope,
+        target_id=entity.target_id,
+        period=entity.period,
+        token_limit=entity.token_limit,
+        cost_limit=entity.cost_limit,
+        used_tokens=entity.used_tokens,
+        used_cost=round(entity.used_cost, 6),
+        remaining_tokens=entity.remaining_tokens,
+        remaining_cost=entity.remaining_cost,
+        exhausted=entity.exhausted,
+        period_start=entity.period_start,
+    )
+
+
 @router.get("/overview", response_model=UsageOverview | None)
 def read_usage_overview(
     *,
@@ -84,6 +110,8 @@ def read_usage_overview(
         input_tokens=overview.input_tokens,
         output_tokens=overview.output_tokens,
         call_count=overview.call_count,
+        cached_tokens=overview.cached_tokens,
+        cached_call_count=overview.cached_call_count,
     )
 
 
@@ -123,4 +151,57 @@ def read_model_usage_timeseries(
     return [_map_timeseries_point(point) for point in points]
 
 
+@router.get("/budgets", response_model=list[UsageBudgetRead])
+def list_usage_budgets(*, db: Session = Depends(get_db)) -> list[UsageBudgetRead]:
+    """列出全部用量预算及其已用量与剩余额度。"""
+
+    return [_map_budget_status(item) for item in budget_tracker.statuses(db)]
+
+
+@router.put("/budgets", response_model=UsageBudgetRead)
+def upsert_usage_budget(
+    *, db: Session = Depends(get_db), payload: UsageBudgetCreate
+) -> UsageBudgetRead:
+    """创建或更新模型、owner 的用量预算，修改重置周期时从零开始累计。"""
+
+    budget = db.scalar(
+        select(UsageBudget).where(
+            UsageBudget.scope == payload.scope,
+            UsageBudget.target_id == payload.target_id,
+        )
+    )
+    if budget is None:
+        budget = UsageBudget(scope=payload.scope, target_id=payload.target_id)
+        db.add(budget)
+    if budget.id is None or budget.period != payload.period:
+        budget.period = payload.period
+        budget.used_tokens = 0
+        budget.used_cost = 0.0
+        budget.period_start = current_period_start(payload.period, datetime.now(UTC))
+    budget.token_limit = payload.token_limit
+    budget.cost_limit = payload.cost_limit
+    db.commit()
+    budget_tracker.invalidate()
+
+    for item in budget_tracker.statuses(db):
+        if item.budget_id == budget.id:
+            return _map_budget_status(item)
+    raise HTTPException(  # pragma: no cover - 刚提交的预算总能查到
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="预算保存失败"
+    )
+
+
+@router.delete("/budgets/{budget_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_usage_budget(*, db: Session = Depends(get_db), budget_id: int) -> Response:
+    """删除用量预算，对应对象不再受限制。"""
+
+    budget = db.get(UsageBudget, budget_id)
+    if budget is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="预算不存在")
+    db.delete(budget)
+    db.commit()
+    budget_tracker.invalidate()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
 __all__ = ["router"]
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+
+logger = logging.getLogger("promptworks.cancellation")
+
+
+class OperationCancelled(BaseException):
+    """执行被主动取消。
+
+    与 asyncio.CancelledError 一样继承 BaseException，避免被重试或通用的
+    ``except Exception`` 分支当作普通失败吞掉。
+    """
+
+
+class CancellationToken:
+    """跨线程共享的协作式取消标记，取消时同步触发已登记的回调。"""
+
+    __slots__ = ("_event", "_lock", "_callbacks", "reason")
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[], None]] = []
+        self.reason: str | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str | None = None) -> bool:
+        """触发取消，返回本次调用是否为首次取消。"""
+
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:  # pragma: no cover - 回调异常不影响其他回调
+                logger.exception("执行取消回调失败")
+        return True
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """登记取消回调并返回注销函数；已取消时立即执行回调。"""
+
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+
+                def _remove() -> None:
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+
+                return _remove
+        callback()
+        return lambda: None
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise OperationCancelled(self.reason or "操作已取消")
+
+
+class CancellationRegistry:
+    """按 (类型, ID) 登记当前进程内正在执行的对象，供取消接口查找。"""
+
+    def __init__(self) -> None:
+        self._tokens: dict[tuple[str, int], CancellationToken] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, target_id: int) -> CancellationToken | None:
+        with self._lock:
+            return self._tokens.get((kind, target_id))
+
+    def cancel(self, kind: str, target_id: int, reason: str | None = None) -> bool:
+        """取消本进程内正在执行的对象，对象不在本进程执行时返回 False。"""
+
+        token = self.get(kind, target_id)
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+    @contextmanager
+    def track(
+        self,
+        kind: str,
+        target_id: int,
+        *,
+        parent: CancellationToken | None = None,
+    ) -> Iterator[CancellationToken]:
+        """在执行期间登记取消标记；父标记取消时子标记随之取消。"""
+
+        token = CancellationToken()
+        unlink: Callable[[], None] | None = None
+        if parent is not None:
+            unlink = parent.add_callback(lambda: token.cancel(parent.reason))
+        with self._lock:
+            self._tokens[(kind, target_id)] = token
+        try:
+            yield token
+        finally:
+            with self._lock:
+                if self._tokens.get((kind, target_id)) is token:
+                    del self._tokens[(kind, target_id)]
+            if unlink is not None:
+                unlink()
+
+
+cancellation_registry = CancellationRegistry()
+
+
+__all__ = [
+    "CancellationRegistry",
+    "CancellationToken",
+    "OperationCancelled",
+    "cancellation_registry",
+]
@@ -45,6 +45,115 @@ class Settings(BaseSettings):
     ALIYUN_OSS_BUCKET: str | None = None
     ALIYUN_OSS_ENDPOINT: str | None = None
 
+    # LLM 调用连接池配置
+    LLM_HTTP_MAX_CONNECTIONS: int = 100
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    LLM_HTTP2_ENABLED: bool = False
+
+    # LLM 调用限流配置
+    LLM_LIMITER_BACKEND: str = "memory"  # memory, redis
+    LLM_LIMITER_ACQUIRE_TIMEOUT: float = 300.0
+    LLM_LIMITER_LEASE_TTL: float = 600.0
+    LLM_LIMITER_DEFAULT_CONCURRENCY: int = 5
+    LLM_LIMITER_DEFAULT_COMPLETION_TOKENS: int = 256
+
+    # LLM 自适应并发（AIMD）配置
+    LLM_ADAPTIVE_CONCURRENCY_ENABLED: bool = True
+    LLM_ADAPTIVE_DECREASE_FACTOR: float = 0.5
+    LLM_ADAPTIVE_LATENCY_TOLERANCE: float = 2.0
+    LLM_ADAPTIVE_WINDOW: int = 50
+    LLM_ADAPTIVE_COOLDOWN: float = 5.0
+
+    # LLM 调用重试配置
+    LLM_RETRY_ENABLED: bool = True
+    LLM_RETRY_MAX_ATTEMPTS: int = 4
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 30.0
+    LLM_RETRY_BUDGET_PER_RUN: int = 20
+
+    # LLM 响应缓存配置
+    LLM_CACHE_DEFAULT_MODE: str = "bypass"  # read, write, bypass
+    LLM_CACHE_DETERMINISTIC_ONLY: bool = True
+    LLM_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    LLM_CACHE_MEMORY_MAX_ENTRIES: int = 512
+    LLM_CACHE_DB_MAX_BYTES: int = 256 * 1024 * 1024  # 256MB
+
+    # LLM 相同请求合并（single-flight）配置
+    LLM_SINGLE_FLIGHT_ENABLED: bool = True
+    LLM_SINGLE_FLIGHT_SOURCES: Union[str, list[str]] = [
+        "test_run",
+        "prompt_test",
+        "quick_test",
+    ]
+    LLM_SINGLE_FLIGHT_DETERMINISTIC_ONLY: bool = True
+
+    # LLM 请求节奏调度配置
+    LLM_PACING_ENABLED: bool = True
+    LLM_PACING_DEFAULT_RPM: int = 0  # 0 表示未配置 RPM 的模型不做间隔控制
+
+    # LLM 对冲请求配置，调用方需显式开启
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_DELAY_SECONDS: float = 0.0  # 固定对冲延迟，0 表示按模型近期的 p95 延迟
+    LLM_HEDGE_FALLBACK_DELAY_SECONDS: float = 2.0  # 样本不足以计算 p95 时使用的延迟
+    LLM_HEDGE_MAX_RATIO: float = 0.2  # 对冲请求占开启对冲调用数的上限
+
+    # LLM 熔断配置
+    LLM_CIRCUIT_BREAKER_ENABLED: bool = True
+    LLM_CIRCUIT_BREAKER_WINDOW: int = 20  # 统计失败率的最近调用数
+    LLM_CIRCUIT_BREAKER_MIN_CALLS: int = 10  # 窗口内至少达到该调用数才会熔断
+    LLM_CIRCUIT_BREAKER_FAILURE_RATIO: float = 0.5  # 触发熔断的失败率
+    LLM_CIRCUIT_BREAKER_OPEN_SECONDS: float = 30.0  # 熔断后放行探测请求前的冷却时间
+    LLM_CIRCUIT_BREAKER_HALF_OPEN_PROBES: int = 1  # 半开状态放行的探测请求数
+
+    # LLM 调用超时配置，模型未单独配置时使用，单位秒
+    LLM_TIMEOUT_CONNECT_SECONDS: float = 10.0
+    LLM_TIMEOUT_FIRST_BYTE_SECONDS: float = 30.0  # 流式调用等待数据块的上限
+    LLM_TIMEOUT_TOTAL_SECONDS: float = 30.0
+    LLM_RUN_DEADLINE_SECONDS: float = 0.0  # 测试任务与实验的整体截止时间，0 表示不限制
+
+    # Prompt 测试任务执行配置
+    PROMPT_TEST_RESUME_ON_STARTUP: bool = True  # 启动时续跑上次中断的任务
+    PROMPT_TEST_UNIT_CONCURRENCY: int = 4  # 单个任务内同时执行的单元数
+    PROMPT_TEST_UNIT_CONCURRENCY_PER_MODEL: int = 2  # 同一提供者/模型的单元并发上限
+    PROMPT_TEST_FAILURE_POLICY: str = "fail_fast"  # fail_fast, continue
+
+    # 持久化作业队列配置
+    JOB_QUEUE_BACKEND: str = "auto"  # auto, memory, database；auto 下 SQLite 使用进程内队列
+    JOB_WORKER_IN_PROCESS: bool = True  # API 进程是否同时运行作业工作者
+    JOB_WORKER_CONCURRENCY: int = 2
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_LEASE_SECONDS: float = 60.0  # 租约时长，超时未续约的作业会被重新认领
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF_SECONDS: float = 5.0
+
+    # 任务排队优先级与公平调度配置
+    QUEUE_INTERACTIVE_MAX_UNITS: int = 5  # 预计调用次数不超过该值的任务默认视为交互式
+    QUEUE_STARVATION_SECONDS: float = 300.0  # 每等待该时长优先级提升一级，0 表示关闭
+    QUEUE_FAIR_SHARE_WEIGHTS: Union[str, dict[str, float]] = {}  # 公平键权重，如 owner:1=2
+    QUEUE_SECONDS_PER_UNIT: float = 3.0  # 尚无执行样本时每次调用的预估秒数
+
+    # 用量预算配置
+    BUDGET_ENFORCEMENT_ENABLED: bool = True
+    BUDGET_FLUSH_INTERVAL_SECONDS: float = 5.0  # 用量增量写回数据库的最长间隔
+    BUDGET_FLUSH_TOKENS: int = 20000  # 累计未写回的 token 超过该值时立即写回
+
+    # 模型配置缓存
+    LLM_CONFIG_CACHE_ENABLED: bool = True
+    LLM_CONFIG_CACHE_CHECK_SECONDS: float = 2.0  # 检查其他进程是否修改配置的最短间隔
+
+    # 调用日志写入配置
+    USAGE_LOG_WRITE_MODE: str = "sync"  # sync 随业务事务写入，buffered 缓冲后批量写入
+    USAGE_LOG_BUFFER_SIZE: int = 10000  # 缓冲上限，写满时由写入方同步写回
+    USAGE_LOG_FLUSH_ROWS: int = 500  # 缓冲达到该行数时立即批量写回
+    USAGE_LOG_FLUSH_INTERVAL_SECONDS: float = 1.0
+    USAGE_LOG_SPILL_PATH: str = "./data/usage_log_spill.jsonl"  # 数据库不可用时的落盘文件
+
+    # 测试任务结果写入配置
+    TEST_RUN_INSERT_BATCH_SIZE: int = 500  # 结果与调用日志累计到该行数后批量写入
+    # 请求体相同的轮次按模型的 max_choices_per_request 合并为一次带 n 的请求
+    TEST_RUN_CHOICE_BATCHING_ENABLED: bool = True
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -75,6 +184,37 @@ class Settings(BaseSettings):
             "BACKEND_CORS_ORIGINS must be a list or a comma separated string"
         )
 
+    @field_validator("LLM_SINGLE_FLIGHT_SOURCES", mode="before")
+    @classmethod
+    def parse_single_flight_sources(cls, value: Any) -> list[str]:
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(",") if item.strip()]
+        if isinstance(value, (list, tuple, set)):
+            return [str(item).strip() for item in value if str(item).strip()]
+        raise TypeError(
+            "LLM_SINGLE_FLIGHT_SOURCES must be a list or a comma separated string"
+        )
+
+    @field_validator("QUEUE_FAIR_SHARE_WEIGHTS", mode="before")
+    @classmethod
+    def parse_fair_share_weights(cls, value: Any) -> dict[str, float]:
+        if value is None:
+            return {}
+        if isinstance(value, str):
+            weights: dict[str, float] = {}
+            for item in value.split(","):
+                key, sep, weight = item.rpartition("=")
+                if sep and key.strip():
+                    weights[key.strip()] = float(weight)
+            return weights
+        if isinstance(value, dict):
+            return {str(key): float(weight) for key, weight in value.items()}
+        raise TypeError(
+            "QUEUE_FAIR_SHARE_WEIGHTS must be a mapping or a comma separated string"
+        )
+
     @field_validator("FILE_STORAGE_TYPE")
     @classmethod
     def validate_storage_type(cls, value: str) -> str:
@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from enum import Enum
+from queue import Empty
+from typing import Any
+
+from app.core.config import settings
+
+
+class QueuePriority(str, Enum):
+    """任务优先级类别，交互式任务优先于普通与批量任务出队。"""
+
+    INTERACTIVE = "interactive"
+    NORMAL = "normal"
+    BULK = "bulk"
+
+    @property
+    def rank(self) -> int:
+        return _PRIORITY_ORDER.index(self)
+
+    @classmethod
+    def from_rank(cls, rank: int) -> "QueuePriority":
+        return _PRIORITY_ORDER[min(max(int(rank), 0), len(_PRIORITY_ORDER) - 1)]
+
+    @classmethod
+    def resolve(
+        cls, value: Any, *, batched: bool = False, cost: float = 1.0
+    ) -> "QueuePriority":
+        """显式指定的优先级优先；否则批量任务归为 bulk，小任务归为 interactive。"""
+
+        if value is not None:
+            try:
+                return cls(str(value).strip().lower())
+            except ValueError:
+                pass
+        if batched:
+            return cls.BULK
+        if cost <= settings.QUEUE_INTERACTIVE_MAX_UNITS:
+            return cls.INTERACTIVE
+        return cls.NORMAL
+
+
+_PRIORITY_ORDER: tuple[QueuePriority, ...] = (
+    QueuePriority.INTERACTIVE,
+    QueuePriority.NORMAL,
+    QueuePriority.BULK,
+)
+
+
+@dataclass(slots=True)
+class QueueTicket:
+    """队列中的一个待执行条目，cost 为预计调用次数，用于公平份额计费。"""
+
+    item_id: int
+    priority: QueuePriority
+    fair_key: str
+    cost: float
+    enqueued_at: float
+    sequence: int
+
+    def effective_rank(self, now: float) -> int:
+        """等待时间每超过一个饥饿阈值，优先级提升一级。"""
+
+        threshold = settings.QUEUE_STARVATION_SECONDS
+        if threshold <= 0:
+            return self.priority.rank
+        boost = int(max(now - self.enqueued_at, 0.0) // threshold)
+        return max(self.priority.rank - boost, 0)
+
+
+@dataclass(frozen=True, slots=True)
+class QueueEstimate:
+    """条目的排队位置与预计开始时间，position 为 0 表示已在执行。"""
+
+    item_id: int
+    position: int
+    priority: QueuePriority
+    fair_key: str
+    estimated_wait_seconds: float
+
+
+def fair_share_weight(fair_key: str) -> float:
+    weight = settings.QUEUE_FAIR_SHARE_WEIGHTS.get(fair_key, 1.0)
+    return weight if weight > 0 else 1.0
+
+
+class FairShareState:
+    """按公平键记录已消耗份额的虚拟时间（stride 调度）。
+
+    每次出队按 cost / weight 推进该键的虚拟时间，虚拟时间最小的键优先；
+    空闲后重新入队的键从当前全局虚拟时间起算，不能透支历史空闲期的份额。
+    """
+
+    __slots__ = ("passes", "virtual_time")
+
+    def __init__(
+        self, passes: Mapping[str, float] | None = None, virtual_time: float = 0.0
+    ) -> None:
+        self.passes: dict[str, float] = dict(passes or {})
+        self.virtual_time = virtual_time
+
+    def copy(self) -> "FairShareState":
+        return FairShareState(self.passes, self.virtual_time)
+
+    def _pass(self, fair_key: str) -> float:
+        return max(self.passes.get(fair_key, 0.0), self.virtual_time)
+
+    def select(self, tickets: Iterable[QueueTicket], now: float) -> QueueTicket | None:
+        """先按（含饥饿提升的）优先级类别，再按公平份额与入队顺序选出下一个条目。"""
+
+        best: QueueTicket | None = None
+        best_key: tuple[int, float, int] | None = None
+        for ticket in tickets:
+            key = (
+                ticket.effective_rank(now),
+                self._pass(ticket.fair_key),
+                ticket.sequence,
+            )
+            if best_key is None or key < best_key:
+                best, best_key = ticket, key
+        return best
+
+    def charge(self, ticket: QueueTicket) -> None:
+        start = self._pass(ticket.fair_key)
+        self.virtual_time = start
+        weight = fair_share_weight(ticket.fair_key)
+        self.passes[ticket.fair_key] = start + max(ticket.cost, 0.0) / weight
+        # 落后于全局虚拟时间的键与新键等价，无需继续保存
+        if len(self.passes) > 256:
+            self.passes = {
+                key: value
+                for key, value in self.passes.items()
+                if value > self.virtual_time
+            }
+
+
+def plan_dispatch(
+    tickets: Iterable[QueueTicket],
+    state: FairShareState,
+    *,
+    now: float,
+    seconds_per_unit: float,
+    busy_seconds: Iterable[float] = (),
+    slots: int = 1,
+) -> list[QueueEstimate]:
+    """模拟调度顺序，估算每个排队条目的位置与开始前的等待时间。
+
+    busy_seconds 为正在执行条目的剩余秒数，slots 为可同时执行的条目数。
+    """
+
+    pending = list(tickets)
+    simulated = state.copy()
+    free_at = sorted(busy_seconds)[: max(slots, 1)]
+    free_at += [0.0] * (max(slots, 1) - len(free_at))
+    estimates: list[QueueEstimate] = []
+    while pending:
+        free_at.sort()
+        offset = free_at[0]
+        ticket = simulated.select(pending, now + offset)
+        if ticket is None:  # pragma: no cover - pending 非空时总能选出
+            break
+        pending.remove(ticket)
+        simulated.charge(ticket)
+        estimates.append(
+            QueueEstimate(
+                item_id=ticket.item_id,
+                position=len(estimates) + 1,
+                priority=ticket.priority,
+                fair_key=ticket.fair_key,
+                estimated_wait_seconds=round(offset, 2),
+            )
+        )
+        free_at[0] = offset + max(ticket.cost, 0.0) * seconds_per_unit
+    return estimates
+
+
+class FairShareQueue:
+    """带优先级类别与公平份额的阻塞队列，接口与 queue.Queue 保持一致。
+
+    同一优先级内按公平键（owner、batch）轮转，避免单个大批量任务长期占用
+    执行线程；等待过久的低优先级条目会逐级提升，防止饥饿。
+    """
+
+    _EWMA_ALPHA = 0.2
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._tickets: list[QueueTicket] = []
+        self._state = FairShareState()
+        self._sequence = itertools.count()
+        self._running: dict[int, tuple[QueueTicket, float]] = {}
+        self._unfinished = 0
+        self._seconds_per_unit: float | None = None
+
+    def put_nowait(
+        self,
+        item_id: int,
+        *,
+        priority: QueuePriority = QueuePriority.NORMAL,
+        fair_key: str = "default",
+        cost: float = 1.0,
+    ) -> None:
+        ticket = QueueTicket(
+            item_id=item_id,
+            priority=priority,
+            fair_key=fair_key,
+            cost=max(float(cost), 0.0),
+            enqueued_at=time.time(),
+            sequence=next(self._sequence),
+        )
+        with self._cond:
+            self._tickets.append(ticket)
+            self._unfinished += 1
+            self._cond.notify()
+
+    def get(self, timeout: float | None = None) -> int:
+        """阻塞取出下一个条目，超时抛出 queue.Empty。"""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._tickets:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise Empty
+                self._cond.wait(remaining)
+            ticket = self._state.select(self._tickets, time.time())
+            assert ticket is not None
+            self._tickets.remove(ticket)
+            self._state.charge(ticket)
+            self._running[threading.get_ident()] = (ticket, time.monotonic())
+            return ticket.item_id
+
+    def task_done(self) -> None:
+        with self._cond:
+            running = self._running.pop(threading.get_ident(), None)
+            if running is not None:
+                ticket, started = running
+                if ticket.cost > 0:
+                    self._observe((time.monotonic() - started) / ticket.cost)
+            if self._unfinished <= 0:
+                raise ValueError("task_done() called too many times")
+            self._unfinished -= 1
+            if self._unfinished == 0:
+                self._cond.notify_all()
+
+    def _observe(self, seconds_per_unit: float) -> None:
+        if self._seconds_per_unit is None:
+            self._seconds_per_unit = seconds_per_unit
+        else:
+            self._seconds_per_unit += self._EWMA_ALPHA * (
+                seconds_per_unit - self._seconds_per_unit
+            )
+
+    @property
+    def unfinished_tasks(self) -> int:
+        return self._unfinished
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._tickets)
+
+    def join(self) -> None:
+        with self._cond:
+            while self._unfinished:
+                self._cond.wait()
+
+    @property
+    def seconds_per_unit(self) -> float:
+        """按已完成条目的实际耗时估算每次调用的秒数，尚无样本时使用配置值。"""
+
+        if self._seconds_per_unit is None:
+            return settings.QUEUE_SECONDS_PER_UNIT
+        return self._seconds_per_unit
+
+    def estimates(self, *, workers: int = 1) -> list[QueueEstimate]:
+        """返回执行中与排队中全部条目的预计位置，执行中的条目位于最前。"""
+
+        with self._cond:
+            seconds_per_unit = self.seconds_per_unit
+            now_mono = time.monotonic()
+            running: list[QueueEstimate] = []
+            busy: list[float] = []
+            for ticket, started in self._running.values():
+                elapsed = now_mono - started
+                busy.append(max(ticket.cost * seconds_per_unit - elapsed, 0.0))
+                running.append(
+                    QueueEstimate(
+                        item_id=ticket.item_id,
+                        position=0,
+                        priority=ticket.priority,
+                        fair_key=ticket.fair_key,
+                        estimated_wait_seconds=0.0,
+                    )
+                )
+            planned = plan_dispatch(
+                self._tickets,
+                self._state,
+                now=time.time(),
+                seconds_per_unit=seconds_per_unit,
+                busy_seconds=busy,
+                slots=workers,
+            )
+        return running + planned
+
+    def estimate(self, item_id: int, *, workers: int = 1) -> QueueEstimate | None:
+        for item in self.estimates(workers=workers):
+            if item.item_id == item_id:
+                return item
+        return None
+
+
+__all__ = [
+    "FairShareQueue",
+    "FairShareState",
+    "QueueEstimate",
+    "QueuePriority",
+    "QueueTicket",
+    "fair_share_weight",
+    "plan_dispatch",
+]
@@ -0,0 +1,543 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.cancellation import cancellation_registry
+from app.core.config import settings
+from app.core.fair_queue import (
+    FairShareState,
+    QueueEstimate,
+    QueuePriority,
+    QueueTicket,
+    fair_share_weight,
+    plan_dispatch,
+)
+from app.db import session as db_session
+from app.models.job import Job, JobStatus
+
+
+logger = logging.getLogger("promptworks.job_queue")
+
+JobHandler = Callable[[int], None]
+
+_handlers: dict[str, JobHandler] = {}
+
+
+def register_job_handler(kind: str, handler: JobHandler) -> None:
+    """登记某类作业的执行函数，参数为作业关联的业务对象 ID。"""
+
+    _handlers[kind] = handler
+
+
+def registered_job_kinds() -> list[str]:
+    return sorted(_handlers)
+
+
+def durable_queue_enabled() -> bool:
+    """是否使用数据库持久化队列；auto 模式下 SQLite 回退为进程内队列。
+
+    auto 模式以会话工厂实际绑定的数据库为准，而不是配置中的连接串。
+    """
+
+    backend = settings.JOB_QUEUE_BACKEND.strip().lower()
+    if backend == "database":
+        return True
+    if backend == "memory":
+        return False
+    bind = db_session.SessionLocal.kw.get("bind")
+    dialect = getattr(bind, "dialect", None)
+    return dialect is not None and dialect.name != "sqlite"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _utcnow() -> datetime:
+    return datetime.now(UTC)
+
+
+def submit_job(
+    kind: str,
+    target_id: int,
+    *,
+    session: Session | None = None,
+    max_attempts: int | None = None,
+    priority: QueuePriority = QueuePriority.NORMAL,
+    fair_key: str = "default",
+    cost: float = 1.0,
+) -> int:
+    """写入一条待执行作业；未传入会话时使用独立事务立即提交。"""
+
+    own_session = session is None
+    db = session or db_session.SessionLocal()
+    try:
+        job = Job(
+            kind=kind,
+            target_id=target_id,
+            status=JobStatus.QUEUED,
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+            priority=priority.rank,
+            fair_key=fair_key,
+            cost=max(float(cost), 0.0),
+            available_at=_utcnow(),
+        )
+        db.add(job)
+        if own_session:
+            db.commit()
+        else:
+            db.flush()
+        return job.id
+    finally:
+        if own_session:
+            db.close()
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    # SQLite 读回的时间不带时区，统一按 UTC 处理
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value
+
+
+def _job_ticket(job: Job) -> QueueTicket:
+    enqueued = _as_utc(job.created_at) or _utcnow()
+    return QueueTicket(
+        item_id=job.id,
+        priority=QueuePriority.from_rank(job.priority),
+        fair_key=job.fair_key,
+        cost=job.cost,
+        enqueued_at=enqueued.timestamp(),
+        sequence=job.id,
+    )
+
+
+def _running_share(session: Session, now: datetime) -> FairShareState:
+    """以各公平键在执行中作业的 cost 之和作为已占用份额。"""
+
+    rows = session.execute(
+        select(Job.fair_key, func.sum(Job.cost))
+        .where(Job.status == JobStatus.RUNNING, Job.lease_expires_at >= now)
+        .group_by(Job.fair_key)
+    )
+    return FairShareState(
+        {key: float(total or 0.0) / fair_share_weight(key) for key, total in rows}
+    )
+
+
+def claim_jobs(
+    session: Session,
+    *,
+    worker_id: str,
+    kinds: Sequence[str],
+    limit: int,
+    lease_seconds: float,
+) -> list[Job]:
+    """认领可执行的作业并写入租约。
+
+    PostgreSQL 下通过 FOR UPDATE SKIP LOCKED 保证多个工作进程不会认领到
+    同一作业；租约过期的 RUNNING 作业视为所属进程已失联，可被重新认领，
+    已用尽 max_attempts 的直接标记为 FAILED，避免反复拖垮工作进程的作业被
+    无限次认领。
+    候选窗口同时包含最高优先级与等待最久的作业，再按优先级类别、饥饿
+    提升与公平份额挑选，未选中的候选在提交后释放行锁。
+    """
+
+    if limit <= 0 or not kinds:
+        return []
+    now = _utcnow()
+    window = max(limit * 4, 32)
+    candidates = (
+        select(Job)
+        .where(
+            Job.kind.in_(list(kinds)),
+            or_(
+                and_(Job.status == JobStatus.QUEUED, Job.available_at <= now),
+                and_(
+                    Job.status == JobStatus.RUNNING,
+                    Job.lease_expires_at.is_not(None),
+                    Job.lease_expires_at < now,
+                ),
+            ),
+        )
+        .limit(window)
+        .with_for_update(skip_locked=True)
+    )
+    pool: dict[int, Job] = {}
+    for order in (
+        (Job.priority, Job.available_at, Job.id),
+        (Job.created_at, Job.id),
+    ):
+        for job in session.scalars(candidates.order_by(*order)):
+            pool.setdefault(job.id, job)
+
+    for job in list(pool.values()):
+        if job.status == JobStatus.RUNNING and job.attempts >= job.max_attempts:
+            logger.error(
+                "作业 %s 的租约已过期（原工作进程 %s），已达到最大尝试次数 %s，标记为失败",
+                job.id,
+                job.locked_by,
+                job.max_attempts,
+            )
+            job.status = JobStatus.FAILED
+            job.last_error = "工作进程失联，租约已过期"
+            job.locked_by = None
+            job.lease_expires_at = None
+            job.finished_at = now
+            del pool[job.id]
+
+    state = _running_share(session, now)
+    tickets = {job_id: _job_ticket(job) for job_id, job in pool.items()}
+    jobs: list[Job] = []
+    while tickets and len(jobs) < limit:
+        ticket = state.select(tickets.values(), now.timestamp())
+        if ticket is None:  # pragma: no cover - tickets 非空时总能选出
+            break
+        del tickets[ticket.item_id]
+        state.charge(ticket)
+        jobs.append(pool[ticket.item_id])
+
+    for job in jobs:
+        if job.status == JobStatus.RUNNING:
+            logger.warning(
+                "作业 %s 的租约已过期（原工作进程 %s），由 %s 重新认领",
+                job.id,
+                job.locked_by,
+                worker_id,
+            )
+        job.status = JobStatus.RUNNING
+        job.locked_by = worker_id
+        job.attempts += 1
+        job.claimed_at = now
+        job.heartbeat_at = now
+        job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+    session.commit()
+    return jobs
+
+
+def estimate_job(
+    session: Session, kind: str, target_id: int
+) -> QueueEstimate | None:
+    """估算某个业务对象对应作业的排队位置与预计开始等待时间。
+
+    执行槽位按单个工作进程的并发数估算，多工作进程部署时结果偏保守。
+    """
+
+    now = _utcnow()
+    seconds_per_unit = settings.QUEUE_SECONDS_PER_UNIT
+    running = list(
+        session.scalars(select(Job).where(Job.status == JobStatus.RUNNING))
+    )
+    for job in running:
+        if job.kind == kind and job.target_id == target_id:
+            return QueueEstimate(
+                item_id=job.id,
+                position=0,
+                priority=QueuePriority.from_rank(job.priority),
+                fair_key=job.fair_key,
+                estimated_wait_seconds=0.0,
+            )
+    busy = []
+    for job in running:
+        started = _as_utc(job.claimed_at) or now
+        elapsed = (now - started).total_seconds()
+        busy.append(max(job.cost * seconds_per_unit - elapsed, 0.0))
+    queued = list(
+        session.scalars(select(Job).where(Job.status == JobStatus.QUEUED))
+    )
+    target = next(
+        (job for job in queued if job.kind == kind and job.target_id == target_id),
+        None,
+    )
+    if target is None:
+        return None
+    for item in plan_dispatch(
+        [_job_ticket(job) for job in queued],
+        _running_share(session, now),
+        now=now.timestamp(),
+        seconds_per_unit=seconds_per_unit,
+        busy_seconds=busy,
+        slots=settings.JOB_WORKER_CONCURRENCY,
+    ):
+        if item.item_id == target.id:
+            return item
+    return None  # pragma: no cover - 目标作业必然出现在调度计划中
+
+
+def extend_leases(
+    session: Session,
+    *,
+    worker_id: str,
+    job_ids: Iterable[int],
+    lease_seconds: float,
+) -> int:
+    """为仍由当前进程持有的作业续约，返回成功续约的数量。"""
+
+    ids = list(job_ids)
+    if not ids:
+        return 0
+    now = _utcnow()
+    result = session.execute(
+        update(Job)
+        .where(
+            Job.id.in_(ids),
+            Job.locked_by == worker_id,
+            Job.status == JobStatus.RUNNING,
+        )
+        .values(
+            heartbeat_at=now,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+        )
+    )
+    session.commit()
+    return int(result.rowcount or 0)
+
+
+def request_job_cancel(session: Session, kind: str, target_id: int) -> int:
+    """请求取消业务对象对应的作业，返回受影响的作业数。
+
+    排队中的作业直接结束；执行中的作业记录取消请求，由持有租约的工作
+    进程在下次心跳时读取并中断执行。调用方负责提交事务。
+    """
+
+    now = _utcnow()
+    queued = session.execute(
+        update(Job)
+        .where(
+            Job.kind == kind,
+            Job.target_id == target_id,
+            Job.status == JobStatus.QUEUED,
+        )
+        .values(
+            status=JobStatus.CANCELLED,
+            last_error="已取消",
+            finished_at=now,
+        )
+    )
+    running = session.execute(
+        update(Job)
+        .where(
+            Job.kind == kind,
+            Job.target_id == target_id,
+            Job.status == JobStatus.RUNNING,
+        )
+        .values(cancel_requested_at=now)
+    )
+    return int(queued.rowcount or 0) + int(running.rowcount or 0)
+
+
+def finish_job(
+    session: Session,
+    job_id: int,
+    *,
+    worker_id: str,
+    error: str | None = None,
+) -> JobStatus | None:
+    """记录作业执行结果；失败且仍有剩余次数时按指数退避重新排队。
+
+    租约已被其他进程接管时不做修改并返回 None。
+    """
+
+    job = session.get(Job, job_id, with_for_update=True)
+    if job is None or job.locked_by != worker_id or job.status != JobStatus.RUNNING:
+        # 未做任何修改，结束事务以释放行锁
+        session.commit()
+        return None
+    now = _utcnow()
+    job.locked_by = None
+    job.lease_expires_at = None
+    if error is None:
+        # 收到取消请求后正常返回的作业按已取消结束，不计为成功
+        if job.cancel_requested_at is not None:
+            job.status = JobStatus.CANCELLED
+            job.last_error = "已取消"
+        else:
+            job.status = JobStatus.SUCCEEDED
+            job.last_error = None
+        job.finished_at = now
+    elif job.attempts < job.max_attempts:
+        backoff = settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** max(job.attempts - 1, 0)
+        job.status = JobStatus.QUEUED
+        job.last_error = error
+        job.available_at = now + timedelta(seconds=backoff)
+    else:
+        job.status = JobStatus.FAILED
+        job.last_error = error
+        job.finished_at = now
+    session.commit()
+    return job.status
+
+
+class JobWorker:
+    """从持久化队列认领并执行作业的工作者，可嵌入 API 进程或独立运行。"""
+
+    def __init__(
+        self,
+        *,
+        worker_id: str | None = None,
+        kinds: Sequence[str] | None = None,
+        concurrency: int | None = None,
+        poll_interval: float | None = None,
+        lease_seconds: float | None = None,
+    ) -> None:
+        self.worker_id = worker_id or default_worker_id()
+        self.kinds = list(kinds) if kinds else None
+        self.concurrency = max(1, concurrency or settings.JOB_WORKER_CONCURRENCY)
+        self.poll_interval = poll_interval or settings.JOB_POLL_INTERVAL_SECONDS
+        self.lease_seconds = lease_seconds or settings.JOB_LEASE_SECONDS
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _claim(self, limit: int) -> list[tuple[int, str, int]]:
+        session = db_session.SessionLocal()
+        try:
+            jobs = claim_jobs(
+                session,
+                worker_id=self.worker_id,
+                kinds=self.kinds or registered_job_kinds(),
+                limit=limit,
+                lease_seconds=self.lease_seconds,
+            )
+            return [(job.id, job.kind, job.target_id) for job in jobs]
+        finally:
+            session.close()
+
+    def _heartbeat(self, job_ids: Iterable[int]) -> None:
+        ids = list(job_ids)
+        session = db_session.SessionLocal()
+        try:
+            extend_leases(
+                session,
+                worker_id=self.worker_id,
+                job_ids=ids,
+                lease_seconds=self.lease_seconds,
+            )
+            cancelled = session.execute(
+                select(Job.kind, Job.target_id).where(
+                    Job.id.in_(ids), Job.cancel_requested_at.is_not(None)
+                )
+            ).all()
+        finally:
+            session.close()
+        # 其他进程发起的取消请求随心跳送达本进程的执行线程
+        for kind, target_id in cancelled:
+            if cancellation_registry.cancel(kind, target_id, "已取消"):
+                logger.info("作业 %s #%s 收到取消请求，正在中断执行", kind, target_id)
+
+    def _execute(self, job_id: int, kind: str, target_id: int) -> None:
+        error: str | None = None
+        handler = _handlers.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f"未登记的作业类型: {kind}")
+            handler(target_id)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            logger.exception("作业 %s（%s #%s）执行失败", job_id, kind, target_id)
+        session = db_session.SessionLocal()
+        try:
+            status = finish_job(session, job_id, worker_id=self.worker_id, error=error)
+        finally:
+            session.close()
+        if status is None:
+            logger.warning("作业 %s 的租约已被其他工作进程接管，结果未写回", job_id)
+
+    def run_once(self) -> int:
+        """同步认领并执行一批作业，返回执行数量。"""
+
+        claimed = self._claim(self.concurrency)
+        for job_id, kind, target_id in claimed:
+            self._execute(job_id, kind, target_id)
+        return len(claimed)
+
+    def run_forever(self) -> None:
+        """持续轮询执行作业，直到调用 stop。"""
+
+        logger.info(
+            "作业工作者 %s 启动，并发 %s，租约 %s 秒",
+            self.worker_id,
+            self.concurrency,
+            self.lease_seconds,
+        )
+        # 取消请求随心跳送达，因此心跳间隔不超过 5 秒
+        heartbeat_every = max(min(self.lease_seconds / 3, 5.0), 0.1)
+        active: dict[Future[None], int] = {}
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="job-worker"
+        ) as executor:
+            next_heartbeat = _utcnow() + timedelta(seconds=heartbeat_every)
+            while True:
+                # 停止时不再认领新作业，但继续为在途作业续约直到其写回结果
+                stopping = self._stop.is_set()
+                if stopping and not active:
+                    break
+                free = self.concurrency - len(active)
+                if free > 0 and not stopping:
+                    try:
+                        claimed = self._claim(free)
+                    except Exception:  # pragma: no cover - 数据库暂不可用时重试
+                        logger.exception("认领作业失败，稍后重试")
+                        claimed = []
+                    for job_id, kind, target_id in claimed:
+                        future = executor.submit(self._execute, job_id, kind, target_id)
+                        active[future] = job_id
+
+                if active and _utcnow() >= next_heartbeat:
+                    try:
+                        self._heartbeat(active.values())
+                    except Exception:  # pragma: no cover - 心跳失败等待下次重试
+                        logger.exception("作业租约续约失败")
+                    next_heartbeat = _utcnow() + timedelta(seconds=heartbeat_every)
+
+                if active:
+                    done, _ = wait(
+                        active,
+                        timeout=min(self.poll_interval, heartbeat_every),
+                        return_when=FIRST_COMPLETED,
+                    )
+                    for future in done:
+                        active.pop(future, None)
+                else:
+                    self._stop.wait(self.poll_interval)
+        logger.info("作业工作者 %s 已停止", self.worker_id)
+
+    def start(self) -> "JobWorker":
+        """在后台线程中运行工作者。"""
+
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self.run_forever, name="job-worker-loop", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+
+__all__ = [
+    "JobWorker",
+    "claim_jobs",
+    "default_worker_id",
+    "durable_queue_enabled",
+    "estimate_job",
+    "extend_leases",
+    "finish_job",
+    "register_job_handler",
+    "registered_job_kinds",
+    "request_job_cancel",
+    "submit_job",
+]
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from app.core.config import settings
+
+
+logger = logging.getLogger("promptworks.llm_adaptive_concurrency")
+
+# 视为提供方过载的状态码，529 为部分厂商的 overloaded 扩展
+OVERLOAD_STATUS_CODES = frozenset({429, 503, 529})
+# 计算 p95 前至少需要的样本数
+_MIN_LATENCY_SAMPLES = 10
+# 基线 p95 向上漂移的速率，避免长期负载变化后持续误判
+_BASELINE_DRIFT = 0.01
+
+
+@dataclass(slots=True)
+class _AdaptiveState:
+    limit: float
+    ceiling: int
+    latencies: deque[float]
+    baseline_p95_ms: float | None = None
+    successes_total: int = 0
+    decreases_total: int = 0
+    last_decrease_at: float = 0.0
+    last_decrease_reason: str | None = None
+    updated_at: float = field(default_factory=time.time)
+
+
+@dataclass(slots=True)
+class AdaptiveLimitStatus:
+    key: str
+    limit: int
+    ceiling: int
+    p95_latency_ms: float | None
+    baseline_p95_ms: float | None
+    successes_total: int
+    decreases_total: int
+    last_decrease_reason: str | None
+    last_decrease_at: float | None
+
+
+def _p95(samples: deque[float]) -> float | None:
+    if len(samples) < _MIN_LATENCY_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    index = max(0, math.ceil(len(ordered) * 0.95) - 1)
+    return ordered[index]
+
+
+class AdaptiveConcurrencyController:
+    """按模型维护 AIMD 并发上限：健康时线性增加，过载或延迟恶化时成倍削减。"""
+
+    def __init__(
+        self,
+        *,
+        decrease_factor: float | None = None,
+        latency_tolerance: float | None = None,
+        window: int | None = None,
+        cooldown: float | None = None,
+    ) -> None:
+        self._decrease_factor = decrease_factor or settings.LLM_ADAPTIVE_DECREASE_FACTOR
+        self._latency_tolerance = (
+            latency_tolerance or settings.LLM_ADAPTIVE_LATENCY_TOLERANCE
+        )
+        self._window = window or settings.LLM_ADAPTIVE_WINDOW
+        self._cooldown = settings.LLM_ADAPTIVE_COOLDOWN if cooldown is None else cooldown
+        self._states: dict[str, _AdaptiveState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key: str, ceiling: int) -> _AdaptiveState:
+        ceiling = max(1, ceiling)
+        state = self._states.get(key)
+        if state is None:
+            state = _AdaptiveState(
+                limit=float(ceiling),
+                ceiling=ceiling,
+                latencies=deque(maxlen=self._window),
+            )
+            self._states[key] = state
+        elif state.ceiling != ceiling:
+            # 配置的并发上限始终是硬上限
+            state.ceiling = ceiling
+            state.limit = min(state.limit, float(ceiling))
+        return state
+
+    def current_limit(self, key: str, ceiling: int) -> int:
+        """返回当前生效的并发上限，不会超过模型配置的 concurrency_limit。"""
+
+        with self._lock:
+            state = self._state(key, ceiling)
+            return max(1, int(state.limit))
+
+    def record(
+        self,
+        key: str,
+        ceiling: int,
+        *,
+        status_code: int | None,
+        latency_ms: float | None,
+    ) -> None:
+        """记录一次调用结果并据此调整并发上限。"""
+
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(key, ceiling)
+            state.updated_at = time.time()
+            if status_code in OVERLOAD_STATUS_CODES:
+                self._decrease(state, key, now, f"HTTP {status_code}")
+                return
+            if status_code is None or status_code >= 400:
+                return
+
+            state.successes_total += 1
+            healthy = True
+            if latency_ms is not None and latency_ms >= 0:
+                baseline = state.baseline_p95_ms
+                if baseline is not None:
+                    healthy = latency_ms <= baseline * self._latency_tolerance
+                state.latencies.append(float(latency_ms))
+                p95 = _p95(state.latencies)
+                if p95 is not None:
+                    if state.baseline_p95_ms is None or p95 < state.baseline_p95_ms:
+                        state.baseline_p95_ms = p95
+                    elif p95 > state.baseline_p95_ms * self._latency_tolerance:
+                        if self._decrease(state, key, now, f"p95 延迟 {p95:.0f}ms"):
+                            # 削减后重新采样，避免同一批慢请求反复触发
+                            state.latencies.clear()
+                        return
+                    else:
+                        state.baseline_p95_ms += (
+                            p95 - state.baseline_p95_ms
+                        ) * _BASELINE_DRIFT
+
+            if not healthy:
+                return
+            # 每完成约 limit 次健康的成功调用提升 1 个并发
+            state.limit = min(float(state.ceiling), state.limit + 1.0 / state.limit)
+
+    def _decrease(
+        self, state: _AdaptiveState, key: str, now: float, reason: str
+    ) -> bool:
+        if state.last_decrease_at and now - state.last_decrease_at < self._cooldown:
+            return False
+        previous = state.limit
+        state.limit = max(1.0, state.limit * self._decrease_factor)
+        state.decreases_total += 1
+        state.last_decrease_at = now
+        state.last_decrease_reason = reason
+        logger.warning(
+            "下调模型并发上限: key=%s %.1f -> %.1f 原因=%s",
+            key,
+            previous,
+            state.limit,
+            reason,
+        )
+        return True
+
+    def reset(self, key: str | None = None) -> None:
+        """清除自适应状态，下次调用时从配置上限重新开始。"""
+
+        with self._lock:
+            if key is None:
+                self._states.clear()
+            else:
+                self._states.pop(key, None)
+
+    def status(self, key: str) -> AdaptiveLimitStatus | None:
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return None
+            elapsed = time.monotonic() - state.last_decrease_at
+            return AdaptiveLimitStatus(
+                key=key,
+                limit=max(1, int(state.limit)),
+                ceiling=state.ceiling,
+                p95_latency_ms=_p95(state.latencies),
+                baseline_p95_ms=state.baseline_p95_ms,
+                successes_total=state.successes_total,
+                decreases_total=state.decreases_total,
+                last_decrease_reason=state.last_decrease_reason,
+                last_decrease_at=time.time() - elapsed
+                if state.last_decrease_at
+                else None,
+            )
+
+
+adaptive_concurrency = AdaptiveConcurrencyController()
+
+
+__all__ = [
+    "AdaptiveConcurrencyController",
+    "AdaptiveLimitStatus",
+    "OVERLOAD_STATUS_CODES",
+    "adaptive_concurrency",
+]
@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import httpx
+
+from app.core.config import settings
+
+
+logger = logging.getLogger("promptworks.llm_circuit_breaker")
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+def is_failure_status(status_code: int) -> bool:
+    """服务端错误与请求超时视为提供方故障，429 等客户端错误不计入。"""
+
+    return status_code == 408 or status_code >= 500
+
+
+class CircuitOpenError(Exception):
+    """熔断器未放行调用时抛出，retry_after 为距离下一次探测的秒数。"""
+
+    def __init__(self, key: str, retry_after: float | None) -> None:
+        if retry_after is None:
+            message = f"模型 {key} 已熔断，正在探测是否恢复，请稍后重试"
+        else:
+            message = f"模型 {key} 已熔断，请在 {retry_after:.0f} 秒后重试"
+        super().__init__(message)
+        self.key = key
+        self.retry_after = retry_after
+
+
+class CircuitTicket:
+    """一次获准的调用，调用方据此上报结果；探测调用结束前占用半开名额。"""
+
+    __slots__ = ("_breaker", "key", "probe", "settled")
+
+    def __init__(
+        self, breaker: CircuitBreaker | None, key: str, *, probe: bool = False
+    ) -> None:
+        self._breaker = breaker
+        self.key = key
+        self.probe = probe
+        self.settled = breaker is None
+
+    def record_status(self, status_code: int) -> None:
+        if self._breaker is not None:
+            self._breaker.record(
+                self,
+                failure=is_failure_status(status_code),
+                reason=f"HTTP {status_code}",
+            )
+
+
+@dataclass(slots=True)
+class _CircuitState:
+    # 最近调用是否失败，True 表示失败
+    outcomes: deque[bool]
+    state: str = CIRCUIT_CLOSED
+    opened_at: float = 0.0
+    probes_in_flight: int = 0
+    probe_successes: int = 0
+    calls_total: int = 0
+    failures_total: int = 0
+    timeouts_total: int = 0
+    opened_total: int = 0
+    rejected_total: int = 0
+    last_failure_reason: str | None = None
+    changed_at: float = field(default_factory=time.time)
+
+
+@dataclass(frozen=True, slots=True)
+class CircuitStatus:
+    key: str
+    state: str
+    health_score: float
+    failure_rate: float
+    window_calls: int
+    calls_total: int
+    failures_total: int
+    timeouts_total: int
+    opened_total: int
+    rejected_total: int
+    retry_after_seconds: float | None
+    last_failure_reason: str | None
+    changed_at: float
+
+
+def _failure_rate(outcomes: deque[bool]) -> float:
+    if not outcomes:
+        return 0.0
+    return sum(outcomes) / len(outcomes)
+
+
+class CircuitBreaker:
+    """按模型统计最近调用的失败率，失败过多时熔断，冷却后放行探测请求。
+
+    关闭状态下窗口内调用数达到 min_calls 且失败率达到 failure_ratio 时打开；
+    打开期间的调用立即以 CircuitOpenError 失败，不再等待上游超时；经过
+    open_seconds 后进入半开状态，最多放行 half_open_probes 个探测请求，全部
+    成功则关闭，任一失败则重新打开。
+    """
+
+    def __init__(
+        self,
+        *,
+        window: int | None = None,
+        min_calls: int | None = None,
+        failure_ratio: float | None = None,
+        open_seconds: float | None = None,
+        half_open_probes: int | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._window = window or settings.LLM_CIRCUIT_BREAKER_WINDOW
+        self._min_calls = min_calls or settings.LLM_CIRCUIT_BREAKER_MIN_CALLS
+        self._failure_ratio = (
+            failure_ratio or settings.LLM_CIRCUIT_BREAKER_FAILURE_RATIO
+        )
+        self._open_seconds = (
+            settings.LLM_CIRCUIT_BREAKER_OPEN_SECONDS
+            if open_seconds is None
+            else open_seconds
+        )
+        self._half_open_probes = max(
+            1, half_open_probes or settings.LLM_CIRCUIT_BREAKER_HALF_OPEN_PROBES
+        )
+        self._clock = clock
+        self._states: dict[str, _CircuitState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key: str) -> _CircuitState:
+        state = self._states.get(key)
+        if state is None:
+            state = _CircuitState(outcomes=deque(maxlen=self._window))
+            self._states[key] = state
+        return state
+
+    def _transition(self, state: _CircuitState, key: str, target: str) -> None:
+        previous = state.state
+        state.state = target
+        state.changed_at = time.time()
+        state.probe_successes = 0
+        if target == CIRCUIT_OPEN:
+            state.opened_at = self._clock()
+            state.opened_total += 1
+            logger.warning(
+                "模型调用熔断: key=%s %s -> open 失败率=%.0f%% 原因=%s",
+                key,
+                previous,
+                _failure_rate(state.outcomes) * 100,
+                state.last_failure_reason,
+            )
+        elif target == CIRCUIT_CLOSED:
+            state.outcomes.clear()
+            logger.info("模型调用恢复: key=%s %s -> closed", key, previous)
+        else:
+            logger.info("熔断冷却结束，放行探测请求: key=%s", key)
+
+    def admit(self, key: str) -> CircuitTicket:
+        """判断是否放行一次调用，未放行时抛出 CircuitOpenError。"""
+
+        if not settings.LLM_CIRCUIT_BREAKER_ENABLED:
+            return CircuitTicket(None, key)
+        with self._lock:
+            state = self._state(key)
+            if state.state == CIRCUIT_OPEN:
+                remaining = state.opened_at + self._open_seconds - self._clock()
+                if remaining > 0:
+                    state.rejected_total += 1
+                    raise CircuitOpenError(key, remaining)
+                self._transition(state, key, CIRCUIT_HALF_OPEN)
+            if state.state == CIRCUIT_HALF_OPEN:
+                if state.probes_in_flight >= self._half_open_probes:
+                    state.rejected_total += 1
+                    raise CircuitOpenError(key, None)
+                state.probes_in_flight += 1
+                return CircuitTicket(self, key, probe=True)
+            return CircuitTicket(self, key)
+
+    def record(
+        self,
+        ticket: CircuitTicket,
+        *,
+        failure: bool,
+        reason: str | None = None,
+        timeout: bool = False,
+    ) -> None:
+        """上报一次调用结果，同一凭证只计一次。"""
+
+        if ticket.settled:
+            return
+        ticket.settled = True
+        with self._lock:
+            state = self._state(ticket.key)
+            state.calls_total += 1
+            if failure:
+                state.failures_total += 1
+                state.timeouts_total += int(timeout)
+                state.last_failure_reason = reason
+            if ticket.probe:
+                state.probes_in_flight = max(0, state.probes_in_flight - 1)
+                if state.state != CIRCUIT_HALF_OPEN:
+                    return
+                if failure:
+                    self._transition(state, ticket.key, CIRCUIT_OPEN)
+                    return
+                state.probe_successes += 1
+                if state.probe_successes >= self._half_open_probes:
+                    self._transition(state, ticket.key, CIRCUIT_CLOSED)
+                return
+            # 熔断前已放行的调用迟到的结果不影响打开与半开状态
+            if state.state != CIRCUIT_CLOSED:
+                return
+            state.outcomes.append(failure)
+            if (
+                len(state.outcomes) >= self._min_calls
+                and _failure_rate(state.outcomes) >= self._failure_ratio
+            ):
+                self._transition(state, ticket.key, CIRCUIT_OPEN)
+
+    def release(self, ticket: CircuitTicket) -> None:
+        """调用未产生结果（取消或本地排队超时）时归还探测名额，不计入统计。"""
+
+        if ticket.settled:
+            return
+        ticket.settled = True
+        if ticket.probe:
+            with self._lock:
+                state = self._state(ticket.key)
+                state.probes_in_flight = max(0, state.probes_in_flight - 1)
+
+    @contextmanager
+    def guard(self, key: str) -> Iterator[CircuitTicket]:
+        """包裹一次上游请求：连接异常与超时自动计为失败，响应状态由调用方上报。"""
+
+        ticket = self.admit(key)
+        try:
+            yield ticket
+        except httpx.TransportError as exc:
+            self.record(
+                ticket,
+                failure=True,
+                reason=type(exc).__name__,
+                timeout=isinstance(exc, httpx.TimeoutException),
+            )
+            raise
+        finally:
+            self.release(ticket)
+
+    def status(self) -> list[CircuitStatus]:
+        now = self._clock()
+        with self._lock:
+            statuses: list[CircuitStatus] = []
+            for key, state in self._states.items():
+                failure_rate = _failure_rate(state.outcomes)
+                retry_after = None
+                if state.state == CIRCUIT_OPEN:
+                    retry_after = max(0.0, state.opened_at + self._open_seconds - now)
+                statuses.append(
+                    CircuitStatus(
+                        key=key,
+                        state=state.state,
+                        health_score=0.0
+                        if state.state == CIRCUIT_OPEN
+                        else round(1.0 - failure_rate, 4),
+                        failure_rate=round(failure_rate, 4),
+                        window_calls=len(state.outcomes),
+                        calls_total=state.calls_total,
+                        failures_total=state.failures_total,
+                        timeouts_total=state.timeouts_total,
+                        opened_total=state.opened_total,
+                        rejected_total=state.rejected_total,
+                        retry_after_seconds=retry_after,
+                        last_failure_reason=state.last_failure_reason,
+                        changed_at=state.changed_at,
+                    )
+                )
+            return statuses
+
+    def reset(self, key: str | None = None) -> None:
+        with self._lock:
+            if key is None:
+                self._states.clear()
+            else:
+                self._states.pop(key, None)
+
+
+llm_circuit_breaker = CircuitBreaker()
+
+
+__all__ = [
+    "CIRCUIT_CLOSED",
+    "CIRCUIT_HALF_OPEN",
+    "CIRCUIT_OPEN",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "CircuitStatus",
+    "CircuitTicket",
+    "is_failure_status",
+    "llm_circuit_breaker",
+]
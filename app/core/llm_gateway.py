@@ -0,0 +1,619 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field, replace
+from typing import Any
+
+import httpx
+
+from app.core.cancellation import CancellationToken
+from app.core.llm_circuit_breaker import CircuitOpenError, llm_circuit_breaker
+from app.core.llm_hedging import (
+    HEDGE_ROLE_BACKUP,
+    HEDGE_ROLE_PRIMARY,
+    HedgePolicy,
+    HedgeRace,
+    llm_hedger,
+)
+from app.core.llm_http_client import (
+    cancellable_io,
+    llm_client_registry,
+    response_elapsed_ms,
+)
+from app.core.llm_pacing import llm_pacer
+from app.core.llm_rate_limiter import (
+    LimitConfig,
+    LimiterLease,
+    build_limiter_key,
+    estimate_payload_token_split,
+    estimate_payload_tokens,
+    llm_rate_limiter,
+)
+from app.core.llm_retry import (
+    RetryBudget,
+    RetryPolicy,
+    RetryStats,
+    asend_with_retry,
+    send_with_retry,
+)
+from app.core.llm_single_flight import SingleFlightGroup, single_flight_key
+from app.core.llm_timeouts import Deadline, DeadlineExceeded, TimeoutConfig
+
+
+logger = logging.getLogger("promptworks.llm_gateway")
+
+
+@dataclass(slots=True)
+class LLMCallRequest:
+    """一次 Chat Completion 调用所需的全部上下文。"""
+
+    provider_id: int | None
+    model_name: str
+    base_url: str
+    api_key: str | None
+    payload: dict[str, Any]
+    limit_config: LimitConfig
+    timeout: TimeoutConfig
+    headers: Mapping[str, str] = field(default_factory=dict)
+    source: str | None = None
+    # 以流式方式请求并在本地拼装为完整响应，用于测量首字延迟
+    stream: bool = False
+    # 同步调用在发送前与流式读取过程中检查，取消后中断请求并释放配额
+    cancel_token: CancellationToken | None = None
+    # 超过对冲延迟仍未返回时再发一份请求，先成功返回的一路胜出
+    hedge: HedgePolicy | None = None
+    # 对冲请求的目标，为空时发往同一提供者与模型
+    hedge_backup: LLMCallRequest | None = None
+    # 目标模型熔断时改用的等价模型
+    failover: LLMCallRequest | None = None
+    # 所属运行的截止时间，每次发送时按剩余时间收紧超时
+    deadline: Deadline | None = None
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url.rstrip('/')}/chat/completions"
+
+    @property
+    def limiter_key(self) -> str:
+        return build_limiter_key(self.provider_id, self.model_name)
+
+    def effective_timeout(self) -> TimeoutConfig:
+        """返回本次发送使用的超时，截止时间已过时抛出 DeadlineExceeded。"""
+
+        if self.deadline is None:
+            return self.timeout
+        return self.timeout.within(self.deadline.check())
+
+    def build_headers(self) -> dict[str, str]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        headers.update(self.headers)
+        return headers
+
+    def wire_payload(self) -> dict[str, Any]:
+        if not self.stream:
+            return self.payload
+        return {
+            **self.payload,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+
+
+@dataclass(slots=True)
+class HedgeOutcome:
+    """发出了对冲请求的调用中，胜出一路与落败一路的信息。"""
+
+    role: str
+    loser: LLMCallRequest
+    loser_latency_ms: int
+    # 落败一路恰好也已完成时的结果，被取消时为空
+    loser_result: LLMCallResult | None = None
+
+    @property
+    def loser_role(self) -> str:
+        if self.role == HEDGE_ROLE_PRIMARY:
+            return HEDGE_ROLE_BACKUP
+        return HEDGE_ROLE_PRIMARY
+
+    def loser_tokens(self) -> tuple[int | None, int | None, int | None]:
+        """返回落败一路的 (prompt, completion, total) token 数。
+
+        已完成时取响应中的 usage；被取消时上游通常已按输入计费，按请求内容
+        预估输入 token。
+        """
+
+        if self.loser_result is not None:
+            try:
+                body = self.loser_result.response.json()
+            except ValueError:
+                body = None
+            usage = body.get("usage") if isinstance(body, Mapping) else None
+            if isinstance(usage, Mapping):
+                return (
+                    usage.get("prompt_tokens"),
+                    usage.get("completion_tokens"),
+                    usage.get("total_tokens"),
+                )
+        prompt_tokens, _ = estimate_payload_token_split(self.loser.payload)
+        return prompt_tokens, None, prompt_tokens
+
+    def summary(self) -> dict[str, Any]:
+        """可序列化的对冲结果，供写入调用日志与测试记录。"""
+
+        prompt_tokens, completion_tokens, total_tokens = self.loser_tokens()
+        return {
+            "role": self.role,
+            "loser_role": self.loser_role,
+            "loser_latency_ms": self.loser_latency_ms,
+            "loser_prompt_tokens": prompt_tokens,
+            "loser_completion_tokens": completion_tokens,
+            "loser_total_tokens": total_tokens,
+        }
+
+
+@dataclass(slots=True)
+class LLMCallResult:
+    response: httpx.Response
+    latency_ms: int
+    retry: RetryStats
+    lease: LimiterLease | None = None
+    coalesced: bool = False
+    pacing_delay_ms: float = 0.0
+    ttft_ms: float | None = None
+    hedge: HedgeOutcome | None = None
+    # 目标模型熔断，结果由 failover 指定的模型返回
+    failed_over: bool = False
+
+    def record_usage(self, total_tokens: int | None) -> None:
+        """将实际 token 用量回写限流器，修正 TPM 预估。"""
+
+        if self.lease is not None:
+            self.lease.record_usage(total_tokens)
+
+    async def arecord_usage(self, total_tokens: int | None) -> None:
+        if self.lease is not None:
+            await self.lease.arecord_usage(total_tokens)
+
+    def shared(self) -> "LLMCallResult":
+        """合并调用方拿到的副本：共享响应，但不重复计入重试与限流用量。"""
+
+        return LLMCallResult(
+            response=self.response,
+            latency_ms=self.latency_ms,
+            retry=RetryStats(),
+            coalesced=True,
+            ttft_ms=self.ttft_ms,
+            failed_over=self.failed_over,
+        )
+
+
+def _check_total_timeout(
+    started: float, timeout: TimeoutConfig, request: httpx.Request
+) -> None:
+    """流式读取期间检查总耗时，超过总超时时按读取超时中断。"""
+
+    if time.perf_counter() - started > timeout.total:
+        raise httpx.ReadTimeout(
+            f"调用总耗时超过 {timeout.total:g} 秒", request=request
+        )
+
+
+def _elapsed_ms(response: httpx.Response, started: float) -> float:
+    elapsed = response_elapsed_ms(response)
+    if elapsed is None:
+        elapsed = (time.perf_counter() - started) * 1000
+    return max(elapsed, 0.0)
+
+
+class _StreamAssembler:
+    """把 SSE 增量块拼装成与非流式接口一致的 chat.completion 响应体。"""
+
+    def __init__(self, started: float) -> None:
+        self._started = started
+        self._choices: dict[int, dict[str, Any]] = {}
+        self._body: dict[str, Any] = {"object": "chat.completion"}
+        self.ttft_ms: float | None = None
+
+    def feed(self, line: str) -> None:
+        if not line.startswith("data:"):
+            return
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            return
+        try:
+            chunk = json.loads(data)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(chunk, Mapping):
+            return
+        for key in ("id", "model", "created"):
+            if key in chunk and key not in self._body:
+                self._body[key] = chunk[key]
+        if isinstance(chunk.get("usage"), Mapping):
+            self._body["usage"] = dict(chunk["usage"])
+        for item in chunk.get("choices") or []:
+            if not isinstance(item, Mapping):
+                continue
+            choice = self._choices.setdefault(
+                int(item.get("index") or 0),
+                {"role": "assistant", "content": [], "finish_reason": None},
+            )
+            delta = item.get("delta")
+            if isinstance(delta, Mapping):
+                if isinstance(delta.get("role"), str):
+                    choice["role"] = delta["role"]
+                content = delta.get("content")
+                if isinstance(content, str) and content:
+                    if self.ttft_ms is None:
+                        self.ttft_ms = (time.perf_counter() - self._started) * 1000
+                    choice["content"].append(content)
+            if item.get("finish_reason") is not None:
+                choice["finish_reason"] = item["finish_reason"]
+
+    def build(self, request: httpx.Request) -> httpx.Response:
+        self._body["choices"] = [
+            {
+                "index": index,
+                "message": {
+                    "role": choice["role"],
+                    "content": "".join(choice["content"]),
+                },
+                "finish_reason": choice["finish_reason"],
+            }
+            for index, choice in sorted(self._choices.items())
+        ]
+        return httpx.Response(200, json=self._body, request=request)
+
+
+_inflight_calls: SingleFlightGroup[LLMCallResult] = SingleFlightGroup()
+
+
+def _flight_key(request: LLMCallRequest) -> str | None:
+    return single_flight_key(
+        request.source, request.limiter_key, request.base_url, request.payload
+    )
+
+
+def _flight_options(request: LLMCallRequest) -> dict[str, Any]:
+    """等待方最多等到自己的截止时间；与领头调用截止时间相关的失败不共享。"""
+
+    deadline = request.deadline
+
+    def _shareable(exc: BaseException) -> bool:
+        if isinstance(exc, DeadlineExceeded):
+            return False
+        return deadline is None or not isinstance(exc, httpx.TimeoutException)
+
+    return {
+        "timeout": deadline.check() if deadline is not None else None,
+        "shareable": _shareable,
+    }
+
+
+def call_llm(
+    request: LLMCallRequest,
+    *,
+    retry_policy: RetryPolicy | None = None,
+    retry_budget: RetryBudget | None = None,
+) -> LLMCallResult:
+    """在限流与重试保护下同步调用 LLM，相同的在途请求合并为一次上游调用。
+
+    同步路径不做节奏调度，避免在工作线程中等待；需要均匀发送的调用方
+    应在分发时通过 llm_pacer 推迟提交。请求携带的取消标记被触发时抛出
+    OperationCancelled；异步路径直接取消协程即可中断请求。设置了 hedge 的
+    请求超过对冲延迟仍未返回时再发一份请求，结果的 hedge 字段记录落败一路。
+
+    目标模型熔断时抛出 CircuitOpenError 而不再等待上游超时；请求设置了
+    failover 时改由该模型完成调用，结果的 failed_over 为 True。每次发送按
+    deadline 的剩余时间收紧超时，截止时间已过时抛出 DeadlineExceeded，不再重试。
+    合并到在途调用的请求最多等到自己的截止时间，领头调用因其截止时间失败时
+    重新发起，而不沿用对方的超时结果。
+    """
+
+    key = _flight_key(request)
+    if key is None:
+        return _call_llm(request, retry_policy=retry_policy, retry_budget=retry_budget)
+    try:
+        result, coalesced = _inflight_calls.do(
+            key,
+            lambda: _call_llm(
+                request, retry_policy=retry_policy, retry_budget=retry_budget
+            ),
+            **_flight_options(request),
+        )
+    except TimeoutError:
+        if request.deadline is None:
+            raise
+        raise DeadlineExceeded(request.deadline.seconds) from None
+    return result.shared() if coalesced else result
+
+
+def _hedge_attempts(request: LLMCallRequest) -> dict[str, LLMCallRequest]:
+    primary = replace(request, hedge=None, hedge_backup=None)
+    backup = request.hedge_backup
+    return {
+        HEDGE_ROLE_PRIMARY: primary,
+        HEDGE_ROLE_BACKUP: replace(backup, hedge=None, hedge_backup=None)
+        if backup is not None
+        else primary,
+    }
+
+
+def _hedged_result(
+    race: HedgeRace[LLMCallResult], attempts: Mapping[str, LLMCallRequest]
+) -> LLMCallResult:
+    result = race.result
+    if race.hedged:
+        result.hedge = HedgeOutcome(
+            role=race.role,
+            loser=attempts[race.loser_role],
+            loser_latency_ms=int(race.loser_elapsed_ms),
+            loser_result=race.loser_result,
+        )
+    return result
+
+
+def _failover_request(request: LLMCallRequest) -> LLMCallRequest:
+    assert request.failover is not None
+    failover = replace(
+        request.failover,
+        cancel_token=request.cancel_token,
+        deadline=request.deadline,
+        failover=None,
+    )
+    logger.warning(
+        "模型调用已熔断，改用等价模型: %s -> %s",
+        request.limiter_key,
+        failover.limiter_key,
+    )
+    return failover
+
+
+def _call_llm(
+    request: LLMCallRequest,
+    *,
+    retry_policy: RetryPolicy | None,
+    retry_budget: RetryBudget | None,
+) -> LLMCallResult:
+
+    if request.hedge is not None:
+        attempts = _hedge_attempts(request)
+        race = llm_hedger.run(
+            request.limiter_key,
+            request.hedge,
+            lambda role, token: _call_llm(
+                replace(attempts[role], cancel_token=token),
+                retry_policy=retry_policy,
+                retry_budget=retry_budget,
+            ),
+            cancel_token=request.cancel_token,
+        )
+        return _hedged_result(race, attempts)
+
+    if request.failover is not None:
+        try:
+            return _call_llm(
+                replace(request, failover=None),
+                retry_policy=retry_policy,
+                retry_budget=retry_budget,
+            )
+        except CircuitOpenError:
+            failover = _failover_request(request)
+        result = _call_llm(
+            failover, retry_policy=retry_policy, retry_budget=retry_budget
+        )
+        result.failed_over = True
+        return result
+
+    client = llm_client_registry.get_client(request.base_url, request.api_key)
+    estimated_tokens = estimate_payload_tokens(request.payload)
+    last: dict[str, Any] = {}
+
+    def _check_cancelled() -> None:
+        if request.cancel_token is not None:
+            request.cancel_token.raise_if_cancelled()
+
+    def _send() -> httpx.Response:
+        _check_cancelled()
+        with (
+            llm_circuit_breaker.guard(request.limiter_key) as circuit,
+            cancellable_io(request.cancel_token),
+        ):
+            with llm_rate_limiter.acquire(
+                request.limiter_key,
+                request.limit_config,
+                estimated_tokens=estimated_tokens,
+            ) as lease:
+                timeout = request.effective_timeout()
+                started = time.perf_counter()
+                ttft_ms: float | None = None
+                if request.stream:
+                    with client.stream(
+                        "POST",
+                        request.url,
+                        headers=request.build_headers(),
+                        json=request.wire_payload(),
+                        timeout=timeout.to_httpx(stream=True),
+                    ) as response:
+                        if response.status_code >= 400:
+                            response.read()
+                        else:
+                            assembler = _StreamAssembler(started)
+                            for line in response.iter_lines():
+                                # 退出 stream 上下文会关闭连接，上游随之停止生成
+                                _check_cancelled()
+                                _check_total_timeout(
+                                    started, timeout, response.request
+                                )
+                                assembler.feed(line)
+                            ttft_ms = assembler.ttft_ms
+                            response = assembler.build(response.request)
+                    latency_ms = (time.perf_counter() - started) * 1000
+                else:
+                    response = client.post(
+                        request.url,
+                        headers=request.build_headers(),
+                        json=request.payload,
+                        timeout=timeout.to_httpx(stream=False),
+                    )
+                    latency_ms = _elapsed_ms(response, started)
+                lease.record_outcome(response.status_code, latency_ms)
+                circuit.record_status(response.status_code)
+        last.update(lease=lease, latency_ms=latency_ms, ttft_ms=ttft_ms)
+        return response
+
+    response, stats = send_with_retry(
+        _send, policy=retry_policy or RetryPolicy(status_rules={}), budget=retry_budget
+    )
+    if response.status_code < 400:
+        llm_hedger.observe(request.limiter_key, last["latency_ms"])
+    return LLMCallResult(
+        response=response,
+        latency_ms=int(last["latency_ms"]),
+        retry=stats,
+        lease=last["lease"],
+        ttft_ms=last["ttft_ms"],
+    )
+
+
+async def acall_llm(
+    request: LLMCallRequest,
+    *,
+    retry_policy: RetryPolicy | None = None,
+    retry_budget: RetryBudget | None = None,
+) -> LLMCallResult:
+    """call_llm 的异步版本，按节奏调度等待开始时间，等待配额与退避期间不占用线程。"""
+
+    key = _flight_key(request)
+    if key is None:
+        return await _acall_llm(
+            request, retry_policy=retry_policy, retry_budget=retry_budget
+        )
+    try:
+        result, coalesced = await _inflight_calls.ado(
+            key,
+            lambda: _acall_llm(
+                request, retry_policy=retry_policy, retry_budget=retry_budget
+            ),
+            **_flight_options(request),
+        )
+    except TimeoutError:
+        if request.deadline is None:
+            raise
+        raise DeadlineExceeded(request.deadline.seconds) from None
+    return result.shared() if coalesced else result
+
+
+async def _acall_llm(
+    request: LLMCallRequest,
+    *,
+    retry_policy: RetryPolicy | None,
+    retry_budget: RetryBudget | None,
+) -> LLMCallResult:
+
+    if request.hedge is not None:
+        attempts = _hedge_attempts(request)
+        race = await llm_hedger.arun(
+            request.limiter_key,
+            request.hedge,
+            lambda role: _acall_llm(
+                attempts[role], retry_policy=retry_policy, retry_budget=retry_budget
+            ),
+        )
+        return _hedged_result(race, attempts)
+
+    if request.failover is not None:
+        try:
+            return await _acall_llm(
+                replace(request, failover=None),
+                retry_policy=retry_policy,
+                retry_budget=retry_budget,
+            )
+        except CircuitOpenError:
+            failover = _failover_request(request)
+        result = await _acall_llm(
+            failover, retry_policy=retry_policy, retry_budget=retry_budget
+        )
+        result.failed_over = True
+        return result
+
+    delay = llm_pacer.reserve(request.limiter_key, request.limit_config.rpm)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    client = llm_client_registry.get_async_client(request.base_url, request.api_key)
+    estimated_tokens = estimate_payload_tokens(request.payload)
+    last: dict[str, Any] = {}
+
+    async def _send() -> httpx.Response:
+        with llm_circuit_breaker.guard(request.limiter_key) as circuit:
+            async with llm_rate_limiter.acquire_async(
+                request.limiter_key,
+                request.limit_config,
+                estimated_tokens=estimated_tokens,
+            ) as lease:
+                timeout = request.effective_timeout()
+                started = time.perf_counter()
+                ttft_ms: float | None = None
+                if request.stream:
+                    async with client.stream(
+                        "POST",
+                        request.url,
+                        headers=request.build_headers(),
+                        json=request.wire_payload(),
+                        timeout=timeout.to_httpx(stream=True),
+                    ) as response:
+                        if response.status_code >= 400:
+                            await response.aread()
+                        else:
+                            assembler = _StreamAssembler(started)
+                            async for line in response.aiter_lines():
+                                _check_total_timeout(
+                                    started, timeout, response.request
+                                )
+                                assembler.feed(line)
+                            ttft_ms = assembler.ttft_ms
+                            response = assembler.build(response.request)
+                    latency_ms = (time.perf_counter() - started) * 1000
+                else:
+                    response = await client.post(
+                        request.url,
+                        headers=request.build_headers(),
+                        json=request.payload,
+                        timeout=timeout.to_httpx(stream=False),
+                    )
+                    latency_ms = _elapsed_ms(response, started)
+                lease.record_outcome(response.status_code, latency_ms)
+                circuit.record_status(response.status_code)
+        last.update(lease=lease, latency_ms=latency_ms, ttft_ms=ttft_ms)
+        return response
+
+    response, stats = await asend_with_retry(
+        _send, policy=retry_policy or RetryPolicy(status_rules={}), budget=retry_budget
+    )
+    if response.status_code < 400:
+        llm_hedger.observe(request.limiter_key, last["latency_ms"])
+    return LLMCallResult(
+        response=response,
+        latency_ms=int(last["latency_ms"]),
+        retry=stats,
+        lease=last["lease"],
+        pacing_delay_ms=delay * 1000,
+        ttft_ms=last["ttft_ms"],
+    )
+
+
+__all__ = [
+    "HedgeOutcome",
+    "LLMCallRequest",
+    "LLMCallResult",
+    "acall_llm",
+    "call_llm",
+]
@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Generic, TypeVar
+
+from app.core.cancellation import CancellationToken
+from app.core.config import settings
+
+
+logger = logging.getLogger("promptworks.llm_hedging")
+
+HEDGE_ROLE_PRIMARY = "primary"
+HEDGE_ROLE_BACKUP = "backup"
+# 计算 p95 前至少需要的样本数
+_MIN_LATENCY_SAMPLES = 20
+_LATENCY_WINDOW = 200
+
+_R = TypeVar("_R")
+
+
+def _default_delay() -> float | None:
+    delay = settings.LLM_HEDGE_DELAY_SECONDS
+    return float(delay) if delay > 0 else None
+
+
+@dataclass(frozen=True, slots=True)
+class HedgePolicy:
+    """对冲请求的触发条件，delay_seconds 为空时按模型近期的 p95 延迟触发。"""
+
+    delay_seconds: float | None = None
+
+    @classmethod
+    def from_option(cls, option: Any) -> HedgePolicy | None:
+        """解析调用方传入的 hedge 选项。
+
+        True 使用配置的默认延迟，数字为固定延迟秒数，映射可通过 delay_seconds
+        指定延迟；False、空值或总开关关闭时返回 None。
+        """
+
+        if not settings.LLM_HEDGE_ENABLED or option is None or option is False:
+            return None
+        if option is True:
+            return cls(delay_seconds=_default_delay())
+        if isinstance(option, (int, float)):
+            return cls(delay_seconds=max(float(option), 0.0))
+        if isinstance(option, Mapping):
+            if option.get("enabled") is False:
+                return None
+            delay = option.get("delay_seconds")
+            if isinstance(delay, (int, float)) and not isinstance(delay, bool):
+                return cls(delay_seconds=max(float(delay), 0.0))
+            return cls(delay_seconds=_default_delay())
+        return None
+
+
+@dataclass(slots=True)
+class HedgeRace(Generic[_R]):
+    """一次对冲调用的结果。"""
+
+    result: _R
+    # 返回结果的一路
+    role: str
+    # 是否发出了对冲请求
+    hedged: bool
+    # 落败一路恰好也已完成时的结果
+    loser_result: _R | None = None
+    # 落败一路从发出到被放弃的耗时
+    loser_elapsed_ms: float = 0.0
+
+    @property
+    def loser_role(self) -> str:
+        if self.role == HEDGE_ROLE_PRIMARY:
+            return HEDGE_ROLE_BACKUP
+        return HEDGE_ROLE_PRIMARY
+
+
+@dataclass(slots=True)
+class _HedgeState:
+    latencies: deque[float] = field(
+        default_factory=lambda: deque(maxlen=_LATENCY_WINDOW)
+    )
+    calls_total: int = 0
+    hedged_total: int = 0
+    backup_wins_total: int = 0
+    throttled_total: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class HedgeStatus:
+    key: str
+    calls_total: int
+    hedged_total: int
+    backup_wins_total: int
+    throttled_total: int
+    hedge_rate: float
+    win_rate: float
+    p95_latency_ms: float | None
+
+
+def _p95(samples: deque[float]) -> float | None:
+    if len(samples) < _MIN_LATENCY_SAMPLES:
+        return None
+    ordered = sorted(samples)
+    index = max(0, math.ceil(len(ordered) * 0.95) - 1)
+    return ordered[index]
+
+
+def _first_success(futures: Mapping[Any, str], done: set[Any]) -> Any | None:
+    """按主请求优先的顺序返回已完成且未抛出异常的一路。"""
+
+    for future in sorted(done, key=lambda item: futures[item] != HEDGE_ROLE_PRIMARY):
+        if not future.cancelled() and future.exception() is None:
+            return future
+    return None
+
+
+def _primary_error(futures: Mapping[Any, str]) -> BaseException:
+    for future, role in futures.items():
+        if role == HEDGE_ROLE_PRIMARY:
+            return future.exception()
+    raise RuntimeError("缺少主请求")  # pragma: no cover - 防御性
+
+
+class LLMHedger:
+    """按模型统计调用延迟，并在调用超过对冲延迟仍未返回时发出第二份请求。
+
+    先成功返回的一路胜出，另一路被取消：异步调用直接取消协程；同步调用通过
+    取消标记中断尚未发出或正在流式读取的请求，已发出的非流式请求无法从线程中
+    中断，其结果会被丢弃。对冲请求数受 LLM_HEDGE_MAX_RATIO 限制。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._states: dict[str, _HedgeState] = {}
+
+    def _state(self, key: str) -> _HedgeState:
+        state = self._states.get(key)
+        if state is None:
+            state = _HedgeState()
+            self._states[key] = state
+        return state
+
+    def observe(self, key: str, latency_ms: float) -> None:
+        """记录一次成功调用的耗时，用于计算按 p95 触发的对冲延迟。"""
+
+        with self._lock:
+            self._state(key).latencies.append(max(float(latency_ms), 0.0))
+
+    def delay_for(self, key: str, policy: HedgePolicy) -> float:
+        if policy.delay_seconds is not None:
+            return policy.delay_seconds
+        with self._lock:
+            p95 = _p95(self._state(key).latencies)
+        if p95 is None:
+            return max(settings.LLM_HEDGE_FALLBACK_DELAY_SECONDS, 0.0)
+        return p95 / 1000
+
+    def _begin(self, key: str) -> None:
+        with self._lock:
+            self._state(key).calls_total += 1
+
+    def _allow_hedge(self, key: str) -> bool:
+        with self._lock:
+            state = self._state(key)
+            limit = max(1.0, settings.LLM_HEDGE_MAX_RATIO * state.calls_total)
+            if state.hedged_total >= limit:
+                state.throttled_total += 1
+                return False
+            state.hedged_total += 1
+            return True
+
+    def _finish(self, key: str, race: HedgeRace[Any]) -> None:
+        if race.hedged and race.role == HEDGE_ROLE_BACKUP:
+            with self._lock:
+                self._state(key).backup_wins_total += 1
+        if race.hedged:
+            logger.debug(
+                "对冲调用完成: key=%s winner=%s loser_elapsed_ms=%.0f",
+                key,
+                race.role,
+                race.loser_elapsed_ms,
+            )
+
+    def run(
+        self,
+        key: str,
+        policy: HedgePolicy,
+        attempt: Callable[[str, CancellationToken], _R],
+        *,
+        cancel_token: CancellationToken | None = None,
+    ) -> HedgeRace[_R]:
+        """在线程中执行 attempt(role, token)，必要时发出对冲请求并返回先成功的一路。
+
+        两路都失败时抛出主请求的异常；cancel_token 被触发时两路一并取消。
+        """
+
+        delay = self.delay_for(key, policy)
+        self._begin(key)
+        tokens = {
+            HEDGE_ROLE_PRIMARY: CancellationToken(),
+            HEDGE_ROLE_BACKUP: CancellationToken(),
+        }
+        unlink: Callable[[], None] | None = None
+        if cancel_token is not None:
+
+            def _cancel_all() -> None:
+                for token in tokens.values():
+                    token.cancel(cancel_token.reason)
+
+            unlink = cancel_token.add_callback(_cancel_all)
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="llm-hedge")
+        futures: dict[Future[_R], str] = {}
+        started: dict[str, float] = {}
+
+        def _submit(role: str) -> None:
+            started[role] = time.perf_counter()
+            futures[executor.submit(attempt, role, tokens[role])] = role
+
+        try:
+            _submit(HEDGE_ROLE_PRIMARY)
+            done, pending = wait(futures, timeout=delay)
+            if not done and self._allow_hedge(key):
+                _submit(HEDGE_ROLE_BACKUP)
+                pending = set(futures)
+            winner = _first_success(futures, done)
+            while winner is None and pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                winner = _first_success(futures, done)
+            if winner is None:
+                raise _primary_error(futures)
+            race = HedgeRace(
+                result=winner.result(), role=futures[winner], hedged=len(futures) > 1
+            )
+            if race.hedged:
+                loser = next(item for item in futures if item is not winner)
+                tokens[race.loser_role].cancel("对冲请求已由另一路返回")
+                loser.cancel()
+                race.loser_elapsed_ms = (
+                    time.perf_counter() - started[race.loser_role]
+                ) * 1000
+                if loser.done() and not loser.cancelled() and loser.exception() is None:
+                    race.loser_result = loser.result()
+            self._finish(key, race)
+            return race
+        finally:
+            if unlink is not None:
+                unlink()
+            # 不等待落败一路，其持有的配额在请求结束后自行释放
+            executor.shutdown(wait=False)
+
+    async def arun(
+        self,
+        key: str,
+        policy: HedgePolicy,
+        attempt: Callable[[str], Awaitable[_R]],
+    ) -> HedgeRace[_R]:
+        """run 的异步版本，落败一路的协程会被取消并等待其释放连接与配额。"""
+
+        delay = self.delay_for(key, policy)
+        self._begin(key)
+        tasks: dict[asyncio.Task[_R], str] = {}
+        started: dict[str, float] = {}
+
+        def _spawn(role: str) -> None:
+            started[role] = time.perf_counter()
+            tasks[asyncio.ensure_future(attempt(role))] = role
+
+        try:
+            _spawn(HEDGE_ROLE_PRIMARY)
+            done, pending = await asyncio.wait(set(tasks), timeout=delay)
+            if not done and self._allow_hedge(key):
+                _spawn(HEDGE_ROLE_BACKUP)
+                pending = set(tasks)
+            winner = _first_success(tasks, done)
+            while winner is None and pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = _first_success(tasks, done)
+            if winner is None:
+                raise _primary_error(tasks)
+            race = HedgeRace(
+                result=winner.result(), role=tasks[winner], hedged=len(tasks) > 1
+            )
+            if race.hedged:
+                loser = next(item for item in tasks if item is not winner)
+                race.loser_elapsed_ms = (
+                    time.perf_counter() - started[race.loser_role]
+                ) * 1000
+                if loser.done() and not loser.cancelled() and loser.exception() is None:
+                    race.loser_result = loser.result()
+            self._finish(key, race)
+            return race
+        finally:
+            leftovers = [task for task in tasks if not task.done()]
+            for task in leftovers:
+                task.cancel()
+            if leftovers:
+                await asyncio.gather(*leftovers, return_exceptions=True)
+
+    def status(self) -> list[HedgeStatus]:
+        with self._lock:
+            items = list(self._states.items())
+            return [
+                HedgeStatus(
+                    key=key,
+                    calls_total=state.calls_total,
+                    hedged_total=state.hedged_total,
+                    backup_wins_total=state.backup_wins_total,
+                    throttled_total=state.throttled_total,
+                    hedge_rate=state.hedged_total / state.calls_total
+                    if state.calls_total
+                    else 0.0,
+                    win_rate=state.backup_wins_total / state.hedged_total
+                    if state.hedged_total
+                    else 0.0,
+                    p95_latency_ms=_p95(state.latencies),
+                )
+                for key, state in items
+                if state.calls_total
+            ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._states.clear()
+
+
+llm_hedger = LLMHedger()
+
+
+__all__ = [
+    "HEDGE_ROLE_BACKUP",
+    "HEDGE_ROLE_PRIMARY",
+    "HedgePolicy",
+    "HedgeRace",
+    "HedgeStatus",
+    "LLMHedger",
+    "llm_hedger",
+]
@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import threading
+import time
+import typing
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+import httpcore
+import httpx
+
+from app.core.cancellation import CancellationToken
+from app.core.config import settings
+
+
+logger = logging.getLogger("promptworks.llm_http_client")
+
+# 同步读取按该间隔分段等待，以便在阻塞读取期间及时响应取消
+CANCEL_POLL_INTERVAL = 0.2
+
+_active_cancel_token: ContextVar[CancellationToken | None] = ContextVar(
+    "llm_active_cancel_token", default=None
+)
+
+
+@contextmanager
+def cancellable_io(token: CancellationToken | None) -> Iterator[None]:
+    """在当前线程内把同步请求的网络读取绑定到取消标记，取消后立即中断等待。"""
+
+    reset = _active_cancel_token.set(token)
+    try:
+        yield
+    finally:
+        _active_cancel_token.reset(reset)
+
+
+class _CancellableStream(httpcore.NetworkStream):
+    """分段读取套接字，等待上游响应期间检查取消标记。
+
+    取消时抛出 OperationCancelled，httpcore 会随之关闭这条连接，
+    上游不再继续生成，限流租约与调度槽位也随调用栈退出而释放。
+    """
+
+    def __init__(self, stream: httpcore.NetworkStream) -> None:
+        self._stream = stream
+
+    def read(self, max_bytes: int, timeout: float | None = None) -> bytes:
+        token = _active_cancel_token.get()
+        if token is None:
+            return self._stream.read(max_bytes, timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            token.raise_if_cancelled()
+            wait = CANCEL_POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.monotonic(), 0.0))
+            try:
+                return self._stream.read(max_bytes, wait)
+            except httpcore.ReadTimeout:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+
+    def write(self, buffer: bytes, timeout: float | None = None) -> None:
+        self._stream.write(buffer, timeout)
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def start_tls(
+        self,
+        ssl_context: typing.Any,
+        server_hostname: str | None = None,
+        timeout: float | None = None,
+    ) -> httpcore.NetworkStream:
+        return _CancellableStream(
+            self._stream.start_tls(ssl_context, server_hostname, timeout)
+        )
+
+    def get_extra_info(self, info: str) -> typing.Any:
+        return self._stream.get_extra_info(info)
+
+
+class _CancellableBackend(httpcore.NetworkBackend):
+    def __init__(self, backend: httpcore.NetworkBackend) -> None:
+        self._backend = backend
+
+    def connect_tcp(self, *args: typing.Any, **kwargs: typing.Any):
+        return _CancellableStream(self._backend.connect_tcp(*args, **kwargs))
+
+    def connect_unix_socket(self, *args: typing.Any, **kwargs: typing.Any):
+        return _CancellableStream(self._backend.connect_unix_socket(*args, **kwargs))
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+
+def _fingerprint(api_key: str | None) -> str:
+    """对密钥做不可逆摘要，避免明文出现在连接池索引与统计信息中。"""
+
+    raw = (api_key or "").encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:12]
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+@dataclass(slots=True)
+class _ClientEntry:
+    client: httpx.Client | httpx.AsyncClient
+    base_url: str
+    key_fingerprint: str
+    http2: bool
+    is_async: bool
+    created_at: float = field(default_factory=time.time)
+    requests_total: int = 0
+    last_used_at: float | None = None
+    loop: asyncio.AbstractEventLoop | None = None
+
+
+@dataclass(slots=True)
+class LLMClientPoolStats:
+    base_url: str
+    key_fingerprint: str
+    is_async: bool
+    http2: bool
+    requests_total: int
+    connections: int | None
+    idle_connections: int | None
+    created_at: float
+    last_used_at: float | None
+
+
+def response_elapsed_ms(response: httpx.Response) -> float | None:
+    """读取 httpx 记录的请求耗时，响应尚未关闭或未记录时返回 None。"""
+
+    try:
+        elapsed = response.elapsed
+    except (AttributeError, RuntimeError):
+        return None
+    if elapsed is None:
+        return None
+    return elapsed.total_seconds() * 1000
+
+
+class LLMClientRegistry:
+    """按 base_url 与密钥复用 httpx 客户端，避免每次调用都重新握手。"""
+
+    def __init__(
+        self,
+        *,
+        max_connections: int | None = None,
+        max_keepalive_connections: int | None = None,
+        keepalive_expiry: float | None = None,
+        http2: bool | None = None,
+    ) -> None:
+        self._limits = httpx.Limits(
+            max_connections=max_connections or settings.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=max_keepalive_connections
+            or settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=keepalive_expiry
+            if keepalive_expiry is not None
+            else settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+        requested_http2 = settings.LLM_HTTP2_ENABLED if http2 is None else http2
+        if requested_http2 and not _http2_available():
+            logger.warning("未安装 h2 依赖，LLM 客户端将回退为 HTTP/1.1")
+            requested_http2 = False
+        self._http2 = requested_http2
+        self._transport: httpx.BaseTransport | httpx.AsyncBaseTransport | None = None
+        self._sync_clients: dict[tuple[str, str], _ClientEntry] = {}
+        self._async_clients: dict[tuple[int, str, str], _ClientEntry] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return self._limits
+
+    @property
+    def http2(self) -> bool:
+        return self._http2
+
+    def use_transport(
+        self, transport: httpx.BaseTransport | httpx.AsyncBaseTransport | None
+    ) -> None:
+        """替换底层传输层，主要用于测试与离线压测，传入 None 恢复默认网络传输。"""
+
+        self.close()
+        with self._lock:
+            self._transport = transport
+
+    def get_client(self, base_url: str, api_key: str | None) -> httpx.Client:
+        """返回与提供方绑定的长连接同步客户端。"""
+
+        key = (base_url.rstrip("/"), _fingerprint(api_key))
+        with self._lock:
+            entry = self._sync_clients.get(key)
+            if entry is None or entry.client.is_closed:
+                client = httpx.Client(
+                    limits=self._limits,
+                    http2=self._http2,
+                    transport=self._transport  # type: ignore[arg-type]
+                    or self._build_sync_transport(),
+                    event_hooks={"request": [self._build_sync_hook(key)]},
+                )
+                entry = _ClientEntry(
+                    client=client,
+                    base_url=key[0],
+                    key_fingerprint=key[1],
+                    http2=self._http2,
+                    is_async=False,
+                )
+                self._sync_clients[key] = entry
+                logger.info("创建 LLM 连接池: base_url=%s http2=%s", key[0], self._http2)
+        return entry.client  # type: ignore[return-value]
+
+    def get_async_client(self, base_url: str, api_key: str | None) -> httpx.AsyncClient:
+        """返回绑定当前事件循环的异步客户端，不同事件循环之间互不共享连接。"""
+
+        loop = asyncio.get_running_loop()
+        key = (id(loop), base_url.rstrip("/"), _fingerprint(api_key))
+        with self._lock:
+            entry = self._async_clients.get(key)
+            if entry is None or entry.client.is_closed or entry.loop is not loop:
+                client = httpx.AsyncClient(
+                    limits=self._limits,
+                    http2=self._http2,
+                    transport=self._transport,  # type: ignore[arg-type]
+                    event_hooks={"request": [self._build_async_hook(key)]},
+                )
+                entry = _ClientEntry(
+                    client=client,
+                    base_url=key[1],
+                    key_fingerprint=key[2],
+                    http2=self._http2,
+                    is_async=True,
+                    loop=loop,
+                )
+                self._async_clients[key] = entry
+        return entry.client  # type: ignore[return-value]
+
+    def _build_sync_transport(self) -> httpx.HTTPTransport:
+        transport = httpx.HTTPTransport(limits=self._limits, http2=self._http2)
+        # httpx 未公开网络后端参数，这里包装连接池的后端以支持读取期间取消
+        pool = getattr(transport, "_pool", None)
+        backend = getattr(pool, "_network_backend", None)
+        if isinstance(backend, httpcore.NetworkBackend):
+            pool._network_backend = _CancellableBackend(backend)  # type: ignore
+        return transport
+
+    def _touch(self, entry: _ClientEntry | None) -> None:
+        if entry is None:
+            return
+        entry.requests_total += 1
+        entry.last_used_at = time.time()
+
+    def _build_sync_hook(self, key: tuple[str, str]):
+        def _hook(_: httpx.Request) -> None:
+            self._touch(self._sync_clients.get(key))
+
+        return _hook
+
+    def _build_async_hook(self, key: tuple[int, str, str]):
+        async def _hook(_: httpx.Request) -> None:
+            self._touch(self._async_clients.get(key))
+
+        return _hook
+
+    def stats(self) -> list[LLMClientPoolStats]:
+        """汇总各连接池的请求数与连接占用情况。"""
+
+        with self._lock:
+            entries = list(self._sync_clients.values()) + list(
+                self._async_clients.values()
+            )
+        return [self._describe(entry) for entry in entries]
+
+    @staticmethod
+    def _describe(entry: _ClientEntry) -> LLMClientPoolStats:
+        connections: int | None = None
+        idle_connections: int | None = None
+        # httpcore 未公开连接池统计接口，这里尽力读取，读取失败时返回空值
+        pool = getattr(getattr(entry.client, "_transport", None), "_pool", None)
+        raw_connections = getattr(pool, "connections", None)
+        if isinstance(raw_connections, list):
+            connections = len(raw_connections)
+            idle_connections = sum(
+                1
+                for conn in raw_connections
+                if callable(getattr(conn, "is_idle", None)) and conn.is_idle()
+            )
+        return LLMClientPoolStats(
+            base_url=entry.base_url,
+            key_fingerprint=entry.key_fingerprint,
+            is_async=entry.is_async,
+            http2=entry.http2,
+            requests_total=entry.requests_total,
+            connections=connections,
+            idle_connections=idle_connections,
+            created_at=entry.created_at,
+            last_used_at=entry.last_used_at,
+        )
+
+    def close(self) -> None:
+        """关闭全部同步客户端，并丢弃无法在当前线程关闭的异步客户端。"""
+
+        with self._lock:
+            sync_entries = list(self._sync_clients.values())
+            self._sync_clients.clear()
+            stale_async = [
+                key
+                for key, entry in self._async_clients.items()
+                if entry.loop is None or entry.loop.is_closed()
+            ]
+            for key in stale_async:
+                self._async_clients.pop(key, None)
+        for entry in sync_entries:
+            try:
+                entry.client.close()  # type: ignore[union-attr]
+            except Exception:  # pragma: no cover - 关闭失败不影响退出流程
+                logger.exception("关闭 LLM 连接池失败: base_url=%s", entry.base_url)
+
+    async def aclose_current_loop(self) -> None:
+        """关闭属于当前事件循环的异步客户端，应在事件循环退出前调用。"""
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            keys = [
+                key
+                for key, entry in self._async_clients.items()
+                if entry.loop is loop
+            ]
+            entries = [self._async_clients.pop(key) for key in keys]
+        for entry in entries:
+            try:
+                await entry.client.aclose()  # type: ignore[union-attr]
+            except Exception:  # pragma: no cover - 关闭失败不影响退出流程
+                logger.exception("关闭异步 LLM 连接池失败: base_url=%s", entry.base_url)
+
+    async def aclose(self) -> None:
+        """应用关闭时释放全部连接。"""
+
+        await self.aclose_current_loop()
+        self.close()
+
+
+llm_client_registry = LLMClientRegistry()
+
+
+__all__ = [
+    "LLMClientPoolStats",
+    "LLMClientRegistry",
+    "cancellable_io",
+    "llm_client_registry",
+    "response_elapsed_ms",
+]
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+
+from app.core.config import settings
+
+
+@dataclass(slots=True)
+class _PacingState:
+    next_start: float = 0.0
+    requests_total: int = 0
+    delayed_total: int = 0
+    delay_ms_total: float = 0.0
+    max_delay_ms: float = 0.0
+    last_delay_ms: float = 0.0
+    updated_at: float = field(default_factory=time.time)
+
+
+@dataclass(slots=True)
+class PacingStatus:
+    key: str
+    interval_ms: float | None
+    requests_total: int
+    delayed_total: int
+    avg_delay_ms: float
+    max_delay_ms: float
+    last_delay_ms: float
+
+
+class PacingScheduler:
+    """按模型的 RPM 配置均匀安排请求的开始时间。
+
+    调度器只负责分配时间槽并返回需要等待的秒数，等待方式由调用方决定：
+    异步路径使用 asyncio.sleep，线程池路径由分发线程推迟提交。
+    有余量时分配到的时间槽即为当前时刻，不引入任何延迟。
+    """
+
+    def __init__(self) -> None:
+        self._states: dict[str, _PacingState] = {}
+        self._intervals: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def interval_for(rpm: int | None) -> float | None:
+        rate = rpm or settings.LLM_PACING_DEFAULT_RPM
+        if not settings.LLM_PACING_ENABLED or not rate or rate <= 0:
+            return None
+        return 60.0 / rate
+
+    def reserve(self, key: str, rpm: int | None) -> float:
+        """为一次请求预留开始时间槽，返回距离该时间槽的秒数。"""
+
+        interval = self.interval_for(rpm)
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = _PacingState()
+                self._states[key] = state
+            state.requests_total += 1
+            state.updated_at = time.time()
+            if interval is None:
+                self._intervals.pop(key, None)
+                state.last_delay_ms = 0.0
+                return 0.0
+            self._intervals[key] = interval
+            start = max(now, state.next_start)
+            state.next_start = start + interval
+            delay = start - now
+            delay_ms = delay * 1000
+            state.last_delay_ms = delay_ms
+            if delay > 0:
+                state.delayed_total += 1
+                state.delay_ms_total += delay_ms
+                state.max_delay_ms = max(state.max_delay_ms, delay_ms)
+            return delay
+
+    def reset(self, key: str | None = None) -> None:
+        with self._lock:
+            if key is None:
+                self._states.clear()
+                self._intervals.clear()
+            else:
+                self._states.pop(key, None)
+                self._intervals.pop(key, None)
+
+    def status(self, key: str) -> PacingStatus | None:
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                return None
+            interval = self._intervals.get(key)
+            return PacingStatus(
+                key=key,
+                interval_ms=interval * 1000 if interval is not None else None,
+                requests_total=state.requests_total,
+                delayed_total=state.delayed_total,
+                avg_delay_ms=state.delay_ms_total / state.requests_total
+                if state.requests_total
+                else 0.0,
+                max_delay_ms=state.max_delay_ms,
+                last_delay_ms=state.last_delay_ms,
+            )
+
+
+llm_pacer = PacingScheduler()
+
+
+__all__ = ["PacingScheduler", "PacingStatus", "llm_pacer"]
@@ -0,0 +1,819 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator, Callable, Iterator, Mapping
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Protocol, TypeVar
+
+from app.core.config import settings
+from app.core.llm_adaptive_concurrency import (
+    AdaptiveConcurrencyController,
+    adaptive_concurrency,
+)
+
+
+logger = logging.getLogger("promptworks.llm_rate_limiter")
+
+# 单次等待的最长间隔：跨进程后端无法主动唤醒本进程，需要定期重试
+_MAX_WAIT_SLICE = 0.5
+
+# 调用进行期间每隔租约有效期的该比例续期一次，留出两次失败重试的余量
+_LEASE_RENEW_FRACTION = 1 / 3
+
+_T = TypeVar("_T")
+
+
+class RateLimitTimeout(Exception):
+    """在限定时间内未能获取调用配额。"""
+
+    def __init__(self, key: str, waited: float) -> None:
+        super().__init__(f"等待模型调用配额超时: {key}，已等待 {waited:.1f}s")
+        self.key = key
+        self.waited = waited
+
+
+@dataclass(frozen=True, slots=True)
+class LimitConfig:
+    """单个模型的限流配置，rpm 与 tpm 为空表示不限制。"""
+
+    concurrency: int
+    rpm: int | None = None
+    tpm: int | None = None
+
+    @classmethod
+    def for_model(cls, model: Any | None) -> "LimitConfig":
+        """根据模型配置生成限流参数，未登记的模型使用默认并发上限。"""
+
+        if model is None:
+            return cls(concurrency=settings.LLM_LIMITER_DEFAULT_CONCURRENCY)
+        concurrency = getattr(model, "concurrency_limit", None)
+        return cls(
+            concurrency=concurrency or settings.LLM_LIMITER_DEFAULT_CONCURRENCY,
+            rpm=getattr(model, "rate_limit_rpm", None),
+            tpm=getattr(model, "rate_limit_tpm", None),
+        )
+
+
+@dataclass(slots=True)
+class BackendSnapshot:
+    in_flight: int
+    rpm_available: float | None
+    tpm_available: float | None
+
+
+class LimiterBackend(Protocol):
+    """限流状态的存储后端，需保证 try_acquire 的原子性。
+
+    blocking 为 True 的后端会进行网络往返，异步路径将其调用放到线程中执行。
+    """
+
+    blocking: bool
+
+    def try_acquire(
+        self, key: str, config: LimitConfig, cost: int
+    ) -> tuple[str | None, float]:
+        """尝试占用一个并发槽位并扣减令牌，返回租约 ID 或建议等待秒数。"""
+
+    def release(self, key: str, lease_id: str) -> None:
+        """释放租约占用的并发槽位。"""
+
+    def renew(self, key: str, lease_id: str) -> None:
+        """延长租约有效期，调用仍在进行时避免并发槽位被回收。"""
+
+    def adjust_tokens(self, key: str, config: LimitConfig, delta: int) -> None:
+        """按实际用量修正令牌桶，delta 为正表示补扣，为负表示返还。"""
+
+    def snapshot(self, key: str, config: LimitConfig) -> BackendSnapshot:
+        """读取当前占用情况。"""
+
+
+@dataclass(slots=True)
+class _Bucket:
+    capacity: float
+    tokens: float
+    updated_at: float
+
+    def refill(self, capacity: float, now: float) -> None:
+        # 配置变更后按新容量继续计算
+        if capacity != self.capacity:
+            self.tokens = min(self.tokens, capacity)
+            self.capacity = capacity
+        elapsed = max(0.0, now - self.updated_at)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.capacity / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, cost: float) -> float:
+        missing = cost - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing * 60.0 / self.capacity
+
+
+@dataclass(slots=True)
+class _MemoryState:
+    leases: dict[str, float] = field(default_factory=dict)
+    rpm: _Bucket | None = None
+    tpm: _Bucket | None = None
+
+
+class InMemoryLimiterBackend:
+    """进程内限流后端，适用于单进程部署与测试。"""
+
+    # 只持有进程内锁，可直接在事件循环中调用
+    blocking = False
+
+    def __init__(self, *, lease_ttl: float | None = None) -> None:
+        self._lease_ttl = lease_ttl or settings.LLM_LIMITER_LEASE_TTL
+        self._states: dict[str, _MemoryState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, key: str) -> _MemoryState:
+        state = self._states.get(key)
+        if state is None:
+            state = _MemoryState()
+            self._states[key] = state
+        return state
+
+    @staticmethod
+    def _bucket(
+        bucket: _Bucket | None, capacity: int | None, now: float
+    ) -> _Bucket | None:
+        if not capacity:
+            return None
+        if bucket is None:
+            return _Bucket(capacity=float(capacity), tokens=float(capacity), updated_at=now)
+        bucket.refill(float(capacity), now)
+        return bucket
+
+    def try_acquire(
+        self, key: str, config: LimitConfig, cost: int
+    ) -> tuple[str | None, float]:
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(key)
+            expired = [lease for lease, expiry in state.leases.items() if expiry <= now]
+            for lease in expired:
+                state.leases.pop(lease, None)
+            if len(state.leases) >= max(1, config.concurrency):
+                return None, 0.0
+
+            state.rpm = self._bucket(state.rpm, config.rpm, now)
+            state.tpm = self._bucket(state.tpm, config.tpm, now)
+            wait = 0.0
+            if state.rpm is not None:
+                wait = max(wait, state.rpm.wait_time(1))
+            token_cost = 0.0
+            if state.tpm is not None:
+                # 单次请求超过桶容量时按满桶放行，避免永久阻塞
+                token_cost = float(min(max(cost, 0), state.tpm.capacity))
+                wait = max(wait, state.tpm.wait_time(token_cost))
+            if wait > 0:
+                return None, wait
+
+            if state.rpm is not None:
+                state.rpm.tokens -= 1
+            if state.tpm is not None:
+                state.tpm.tokens -= token_cost
+            lease_id = uuid.uuid4().hex
+            state.leases[lease_id] = now + self._lease_ttl
+            return lease_id, 0.0
+
+    def release(self, key: str, lease_id: str) -> None:
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                state.leases.pop(lease_id, None)
+
+    def renew(self, key: str, lease_id: str) -> None:
+        with self._lock:
+            state = self._states.get(key)
+            # 已释放或已过期回收的租约不再复活
+            if state is not None and lease_id in state.leases:
+                state.leases[lease_id] = time.monotonic() + self._lease_ttl
+
+    def adjust_tokens(self, key: str, config: LimitConfig, delta: int) -> None:
+        if not config.tpm or not delta:
+            return
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(key)
+            state.tpm = self._bucket(state.tpm, config.tpm, now)
+            if state.tpm is not None:
+                # 允许透支为负值，后续请求需等待令牌回补
+                state.tpm.tokens = min(state.tpm.capacity, state.tpm.tokens - delta)
+
+    def snapshot(self, key: str, config: LimitConfig) -> BackendSnapshot:
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(key)
+            state.rpm = self._bucket(state.rpm, config.rpm, now)
+            state.tpm = self._bucket(state.tpm, config.tpm, now)
+            in_flight = sum(1 for expiry in state.leases.values() if expiry > now)
+            return BackendSnapshot(
+                in_flight=in_flight,
+                rpm_available=state.rpm.tokens if state.rpm else None,
+                tpm_available=state.tpm.tokens if state.tpm else None,
+            )
+
+
+_REDIS_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local concurrency = tonumber(ARGV[2])
+local rpm = tonumber(ARGV[3])
+local tpm = tonumber(ARGV[4])
+local cost = tonumber(ARGV[5])
+local lease_id = ARGV[6]
+local lease_ttl = tonumber(ARGV[7])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= concurrency then
+  return {0, '0'}
+end
+
+local function refill(key, capacity)
+  local data = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(data[1])
+  local ts = tonumber(data[2])
+  if tokens == nil then
+    tokens = capacity
+  end
+  if ts == nil then
+    ts = now
+  end
+  tokens = math.min(capacity, tokens + math.max(0, now - ts) * capacity / 60.0)
+  return tokens
+end
+
+local wait = 0
+local rpm_tokens = nil
+local tpm_tokens = nil
+if rpm > 0 then
+  rpm_tokens = refill(KEYS[2], rpm)
+  if rpm_tokens < 1 then
+    wait = math.max(wait, (1 - rpm_tokens) * 60.0 / rpm)
+  end
+end
+if tpm > 0 then
+  cost = math.min(cost, tpm)
+  tpm_tokens = refill(KEYS[3], tpm)
+  if tpm_tokens < cost then
+    wait = math.max(wait, (cost - tpm_tokens) * 60.0 / tpm)
+  end
+end
+if wait > 0 then
+  return {0, tostring(wait)}
+end
+
+if rpm_tokens ~= nil then
+  redis.call('HSET', KEYS[2], 'tokens', rpm_tokens - 1, 'ts', now)
+  redis.call('EXPIRE', KEYS[2], 120)
+end
+if tpm_tokens ~= nil then
+  redis.call('HSET', KEYS[3], 'tokens', tpm_tokens - cost, 'ts', now)
+  redis.call('EXPIRE', KEYS[3], 120)
+end
+redis.call('ZADD', KEYS[1], now + lease_ttl, lease_id)
+redis.call('EXPIRE', KEYS[1], math.ceil(lease_ttl))
+return {1, '0'}
+"""
+
+
+class RedisLimiterBackend:
+    """基于 Redis 的限流后端，供多进程、多节点共享同一份配额。"""
+
+    blocking = True
+
+    def __init__(
+        self,
+        client: Any | None = None,
+        *,
+        prefix: str = "promptworks:llm-limit",
+        lease_ttl: float | None = None,
+    ) -> None:
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(settings.REDIS_URL)
+        self._client = client
+        self._prefix = prefix
+        self._lease_ttl = lease_ttl or settings.LLM_LIMITER_LEASE_TTL
+        self._acquire = client.register_script(_REDIS_ACQUIRE_SCRIPT)
+
+    def _keys(self, key: str) -> tuple[str, str, str]:
+        base = f"{self._prefix}:{key}"
+        return f"{base}:leases", f"{base}:rpm", f"{base}:tpm"
+
+    @staticmethod
+    def _now() -> float:
+        # 多节点之间使用墙上时钟对齐令牌桶
+        return time.time()
+
+    def try_acquire(
+        self, key: str, config: LimitConfig, cost: int
+    ) -> tuple[str | None, float]:
+        lease_id = uuid.uuid4().hex
+        granted, wait = self._acquire(
+            keys=list(self._keys(key)),
+            args=[
+                self._now(),
+                max(1, config.concurrency),
+                config.rpm or 0,
+                config.tpm or 0,
+                max(cost, 0),
+                lease_id,
+                self._lease_ttl,
+            ],
+        )
+        if int(granted) == 1:
+            return lease_id, 0.0
+        return None, float(wait)
+
+    def release(self, key: str, lease_id: str) -> None:
+        self._client.zrem(self._keys(key)[0], lease_id)
+
+    def renew(self, key: str, lease_id: str) -> None:
+        leases_key = self._keys(key)[0]
+        # XX 仅更新已存在的成员，已释放或已过期回收的租约不再复活
+        expires_at = self._now() + self._lease_ttl
+        self._client.zadd(leases_key, {lease_id: expires_at}, xx=True)
+        self._client.expire(leases_key, math.ceil(self._lease_ttl))
+
+    def adjust_tokens(self, key: str, config: LimitConfig, delta: int) -> None:
+        if not config.tpm or not delta:
+            return
+        self._client.hincrbyfloat(self._keys(key)[2], "tokens", -delta)
+
+    def snapshot(self, key: str, config: LimitConfig) -> BackendSnapshot:
+        leases_key, rpm_key, tpm_key = self._keys(key)
+        now = self._now()
+        self._client.zremrangebyscore(leases_key, "-inf", now)
+        in_flight = int(self._client.zcard(leases_key))
+
+        def _available(bucket_key: str, capacity: int | None) -> float | None:
+            if not capacity:
+                return None
+            tokens, ts = self._client.hmget(bucket_key, "tokens", "ts")
+            if tokens is None:
+                return float(capacity)
+            elapsed = max(0.0, now - float(ts or now))
+            return min(float(capacity), float(tokens) + elapsed * capacity / 60.0)
+
+        return BackendSnapshot(
+            in_flight=in_flight,
+            rpm_available=_available(rpm_key, config.rpm),
+            tpm_available=_available(tpm_key, config.tpm),
+        )
+
+
+@dataclass(slots=True)
+class _KeyStats:
+    config: LimitConfig
+    waiting: int = 0
+    acquired_total: int = 0
+    timeouts_total: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+    last_wait_seconds: float = 0.0
+
+
+@dataclass(slots=True)
+class LimiterStatus:
+    key: str
+    concurrency_limit: int
+    effective_concurrency: int
+    rpm_limit: int | None
+    tpm_limit: int | None
+    in_flight: int
+    waiting: int
+    rpm_available: float | None
+    tpm_available: float | None
+    acquired_total: int
+    timeouts_total: int
+    avg_wait_ms: float
+    max_wait_ms: float
+    last_wait_ms: float
+    p95_latency_ms: float | None = None
+    adaptive_decreases: int = 0
+    last_decrease_reason: str | None = None
+
+
+class LimiterLease:
+    """一次调用持有的配额，退出时自动释放并发槽位。"""
+
+    def __init__(
+        self,
+        limiter: "LLMRateLimiter",
+        key: str,
+        config: LimitConfig,
+        lease_id: str,
+        estimated_tokens: int,
+        waited: float,
+    ) -> None:
+        self._limiter = limiter
+        self.key = key
+        self.config = config
+        self.lease_id = lease_id
+        self.estimated_tokens = estimated_tokens
+        self.waited = waited
+        self._released = False
+
+    def record_usage(self, actual_tokens: int | None) -> None:
+        """用实际 token 用量修正预估值，使 TPM 统计贴近真实消耗。"""
+
+        if actual_tokens is None:
+            return
+        delta = int(actual_tokens) - self.estimated_tokens
+        if delta:
+            self._limiter.backend.adjust_tokens(self.key, self.config, delta)
+            self.estimated_tokens = int(actual_tokens)
+
+    async def arecord_usage(self, actual_tokens: int | None) -> None:
+        """record_usage 的异步版本，阻塞后端的调用不占用事件循环。"""
+
+        if actual_tokens is None:
+            return
+        delta = int(actual_tokens) - self.estimated_tokens
+        if delta:
+            await self._limiter._call_backend(
+                self._limiter.backend.adjust_tokens, self.key, self.config, delta
+            )
+            self.estimated_tokens = int(actual_tokens)
+
+    def record_outcome(self, status_code: int | None, latency_ms: float | None) -> None:
+        """上报本次调用的状态码与耗时，供自适应并发控制调整上限。"""
+
+        controller = self._limiter.controller
+        if controller is None:
+            return
+        controller.record(
+            self.key,
+            self.config.concurrency,
+            status_code=status_code,
+            latency_ms=latency_ms,
+        )
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._limiter._release(self.key, self.lease_id)
+
+    async def arelease(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        await self._limiter._arelease(self.key, self.lease_id)
+
+
+class LLMRateLimiter:
+    """进程级的模型调用限流器，所有 LLM 调用在发出请求前都需获取租约。"""
+
+    def __init__(
+        self,
+        backend: LimiterBackend | None = None,
+        *,
+        controller: AdaptiveConcurrencyController | None = None,
+    ) -> None:
+        self.backend: LimiterBackend = backend or InMemoryLimiterBackend()
+        self.controller = controller
+        self._stats: dict[str, _KeyStats] = {}
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._async_waiters: dict[str, list[tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        # 持有中的租约 lease_id -> key，由后台线程定期续期
+        self._active_leases: dict[str, str] = {}
+        self._renewer: threading.Thread | None = None
+
+    def _renew_interval(self) -> float:
+        lease_ttl = getattr(self.backend, "_lease_ttl", None)
+        return (lease_ttl or settings.LLM_LIMITER_LEASE_TTL) * _LEASE_RENEW_FRACTION
+
+    def _track_lease(self, lease: LimiterLease) -> LimiterLease:
+        if getattr(self.backend, "renew", None) is None:
+            return lease
+        with self._lock:
+            self._active_leases[lease.lease_id] = lease.key
+            if self._renewer is None:
+                self._renewer = threading.Thread(
+                    target=self._renew_loop, name="llm-lease-renewer", daemon=True
+                )
+                self._renewer.start()
+        return lease
+
+    def _untrack_lease(self, lease_id: str) -> None:
+        with self._lock:
+            self._active_leases.pop(lease_id, None)
+
+    def _renew_loop(self) -> None:
+        """流式输出或长时间重试可能超过租约有效期，调用期间持续续期。"""
+
+        while True:
+            time.sleep(self._renew_interval())
+            with self._lock:
+                if not self._active_leases:
+                    # 无持有中的租约时退出，下次获取租约时重新启动
+                    self._renewer = None
+                    return
+                leases = list(self._active_leases.items())
+            for lease_id, key in leases:
+                try:
+                    self.backend.renew(key, lease_id)
+                except Exception:  # pragma: no cover - 续期失败时等待下一轮重试
+                    logger.exception("续期模型调用配额失败: key=%s", key)
+
+    def _key_stats(self, key: str, config: LimitConfig) -> _KeyStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = _KeyStats(config=config)
+            self._stats[key] = stats
+        else:
+            stats.config = config
+        return stats
+
+    def _effective_config(self, key: str, config: LimitConfig) -> LimitConfig:
+        if self.controller is None:
+            return config
+        limit = self.controller.current_limit(key, config.concurrency)
+        if limit == config.concurrency:
+            return config
+        return LimitConfig(concurrency=limit, rpm=config.rpm, tpm=config.tpm)
+
+    def _record_acquired(self, key: str, waited: float) -> None:
+        with self._lock:
+            stats = self._stats[key]
+            stats.acquired_total += 1
+            stats.wait_seconds_total += waited
+            stats.wait_seconds_max = max(stats.wait_seconds_max, waited)
+            stats.last_wait_seconds = waited
+
+    async def _call_backend(self, func: Callable[..., _T], *args: Any) -> _T:
+        """在事件循环中调用后端，阻塞后端放到线程中执行。"""
+
+        if not getattr(self.backend, "blocking", True):
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def _release(self, key: str, lease_id: str) -> None:
+        self._untrack_lease(lease_id)
+        try:
+            self.backend.release(key, lease_id)
+        except Exception:  # pragma: no cover - 后端异常时依赖租约过期兜底
+            logger.exception("释放模型调用配额失败: key=%s", key)
+        self._notify_released(key)
+
+    async def _arelease(self, key: str, lease_id: str) -> None:
+        self._untrack_lease(lease_id)
+        if not getattr(self.backend, "blocking", True):
+            self._release(key, lease_id)
+            return
+        try:
+            # 调用方被取消时仍需完成释放，否则槽位要等到租约过期才归还
+            await asyncio.shield(asyncio.to_thread(self.backend.release, key, lease_id))
+        except Exception:  # pragma: no cover - 后端异常时依赖租约过期兜底
+            logger.exception("释放模型调用配额失败: key=%s", key)
+        finally:
+            self._notify_released(key)
+
+    def _notify_released(self, key: str) -> None:
+        with self._condition:
+            self._condition.notify_all()
+            waiters = list(self._async_waiters.get(key, []))
+        for loop, event in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(event.set)
+
+    @contextmanager
+    def acquire(
+        self,
+        key: str,
+        config: LimitConfig,
+        *,
+        estimated_tokens: int = 0,
+        timeout: float | None = None,
+    ) -> Iterator[LimiterLease]:
+        """阻塞获取配额，供线程池中的同步调用使用。"""
+
+        lease = self._acquire_blocking(key, config, estimated_tokens, timeout)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    def _acquire_blocking(
+        self,
+        key: str,
+        config: LimitConfig,
+        estimated_tokens: int,
+        timeout: float | None,
+    ) -> LimiterLease:
+        limit_timeout = settings.LLM_LIMITER_ACQUIRE_TIMEOUT if timeout is None else timeout
+        started = time.monotonic()
+        with self._condition:
+            stats = self._key_stats(key, config)
+            stats.waiting += 1
+        try:
+            while True:
+                lease_id, wait_hint = self.backend.try_acquire(
+                    key, self._effective_config(key, config), estimated_tokens
+                )
+                waited = time.monotonic() - started
+                if lease_id is not None:
+                    self._record_acquired(key, waited)
+                    lease = LimiterLease(
+                        self, key, config, lease_id, estimated_tokens, waited
+                    )
+                    return self._track_lease(lease)
+                remaining = limit_timeout - waited
+                if remaining <= 0:
+                    with self._lock:
+                        self._stats[key].timeouts_total += 1
+                    raise RateLimitTimeout(key, waited)
+                slice_seconds = min(wait_hint or _MAX_WAIT_SLICE, _MAX_WAIT_SLICE, remaining)
+                with self._condition:
+                    self._condition.wait(timeout=slice_seconds)
+        finally:
+            with self._condition:
+                self._stats[key].waiting -= 1
+
+    @asynccontextmanager
+    async def acquire_async(
+        self,
+        key: str,
+        config: LimitConfig,
+        *,
+        estimated_tokens: int = 0,
+        timeout: float | None = None,
+    ) -> AsyncIterator[LimiterLease]:
+        """在事件循环中等待配额，等待期间不占用线程。"""
+
+        lease = await self._acquire_waiting(key, config, estimated_tokens, timeout)
+        try:
+            yield lease
+        finally:
+            await lease.arelease()
+
+    async def _acquire_waiting(
+        self,
+        key: str,
+        config: LimitConfig,
+        estimated_tokens: int,
+        timeout: float | None,
+    ) -> LimiterLease:
+        limit_timeout = settings.LLM_LIMITER_ACQUIRE_TIMEOUT if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = (loop, event)
+        started = time.monotonic()
+        with self._condition:
+            stats = self._key_stats(key, config)
+            stats.waiting += 1
+            self._async_waiters.setdefault(key, []).append(waiter)
+        try:
+            while True:
+                event.clear()
+                lease_id, wait_hint = await self._call_backend(
+                    self.backend.try_acquire,
+                    key,
+                    self._effective_config(key, config),
+                    estimated_tokens,
+                )
+                waited = time.monotonic() - started
+                if lease_id is not None:
+                    self._record_acquired(key, waited)
+                    lease = LimiterLease(
+                        self, key, config, lease_id, estimated_tokens, waited
+                    )
+                    return self._track_lease(lease)
+                remaining = limit_timeout - waited
+                if remaining <= 0:
+                    with self._lock:
+                        self._stats[key].timeouts_total += 1
+                    raise RateLimitTimeout(key, waited)
+                slice_seconds = min(wait_hint or _MAX_WAIT_SLICE, _MAX_WAIT_SLICE, remaining)
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=slice_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._condition:
+                self._stats[key].waiting -= 1
+                waiters = self._async_waiters.get(key, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+
+    def status(self) -> list[LimiterStatus]:
+        """返回所有已使用过的模型键的占用与等待统计。"""
+
+        with self._lock:
+            items = [(key, stats) for key, stats in self._stats.items()]
+        result: list[LimiterStatus] = []
+        for key, stats in items:
+            config = stats.config
+            try:
+                snapshot = self.backend.snapshot(key, config)
+            except Exception:  # pragma: no cover - 后端不可用时仅返回本地统计
+                logger.exception("读取限流状态失败: key=%s", key)
+                snapshot = BackendSnapshot(in_flight=0, rpm_available=None, tpm_available=None)
+            acquired = stats.acquired_total
+            adaptive = self.controller.status(key) if self.controller else None
+            result.append(
+                LimiterStatus(
+                    key=key,
+                    concurrency_limit=config.concurrency,
+                    effective_concurrency=adaptive.limit
+                    if adaptive
+                    else config.concurrency,
+                    rpm_limit=config.rpm,
+                    tpm_limit=config.tpm,
+                    in_flight=snapshot.in_flight,
+                    waiting=stats.waiting,
+                    rpm_available=snapshot.rpm_available,
+                    tpm_available=snapshot.tpm_available,
+                    acquired_total=acquired,
+                    timeouts_total=stats.timeouts_total,
+                    avg_wait_ms=(stats.wait_seconds_total / acquired * 1000)
+                    if acquired
+                    else 0.0,
+                    max_wait_ms=stats.wait_seconds_max * 1000,
+                    last_wait_ms=stats.last_wait_seconds * 1000,
+                    p95_latency_ms=adaptive.p95_latency_ms if adaptive else None,
+                    adaptive_decreases=adaptive.decreases_total if adaptive else 0,
+                    last_decrease_reason=adaptive.last_decrease_reason
+                    if adaptive
+                    else None,
+                )
+            )
+        return result
+
+
+def build_limiter_key(provider_id: int | None, model_name: str) -> str:
+    return f"{provider_id if provider_id is not None else '-'}:{model_name}"
+
+
+def estimate_payload_tokens(payload: Mapping[str, Any]) -> int:
+    """粗略估算一次请求的 token 消耗：按约 4 字符 1 token 估算输入，加上输出上限。"""
+
+    prompt_tokens, completion_tokens = estimate_payload_token_split(payload)
+    return prompt_tokens + completion_tokens
+
+
+def estimate_payload_token_split(payload: Mapping[str, Any]) -> tuple[int, int]:
+    """分别估算请求的输入与输出 token，供按输入输出单价计算费用。"""
+
+    messages = payload.get("messages")
+    try:
+        serialized = json.dumps(messages, ensure_ascii=False) if messages else ""
+    except (TypeError, ValueError):
+        serialized = str(messages)
+    prompt_tokens = len(serialized) // 4 + 1
+    max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens")
+    completion_tokens = (
+        int(max_tokens)
+        if isinstance(max_tokens, (int, float)) and max_tokens > 0
+        else settings.LLM_LIMITER_DEFAULT_COMPLETION_TOKENS
+    )
+    choices = payload.get("n")
+    if isinstance(choices, int) and choices > 1:
+        completion_tokens *= choices
+    return prompt_tokens, completion_tokens
+
+
+def _build_default_backend() -> LimiterBackend:
+    if settings.LLM_LIMITER_BACKEND == "redis":
+        try:
+            return RedisLimiterBackend()
+        except Exception:  # pragma: no cover - Redis 不可用时回退本地限流
+            logger.exception("初始化 Redis 限流后端失败，回退为进程内限流")
+    return InMemoryLimiterBackend()
+
+
+llm_rate_limiter = LLMRateLimiter(
+    _build_default_backend(),
+    controller=adaptive_concurrency
+    if settings.LLM_ADAPTIVE_CONCURRENCY_ENABLED
+    else None,
+)
+
+
+__all__ = [
+    "BackendSnapshot",
+    "InMemoryLimiterBackend",
+    "LLMRateLimiter",
+    "LimitConfig",
+    "LimiterBackend",
+    "LimiterLease",
+    "LimiterStatus",
+    "RateLimitTimeout",
+    "RedisLimiterBackend",
+    "build_limiter_key",
+    "estimate_payload_token_split",
+    "estimate_payload_tokens",
+    "llm_rate_limiter",
+]
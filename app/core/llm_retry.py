@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from collections.abc import Awaitable, Callable, Mapping
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from app.core.config import settings
+
+
+logger = logging.getLogger("promptworks.llm_retry")
+
+# 提供方用于提示重试时间的响应头，按优先级排列
+_RESET_HEADERS = (
+    "x-ratelimit-reset-requests",
+    "x-ratelimit-reset-tokens",
+    "x-ratelimit-reset",
+)
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+@dataclass(frozen=True, slots=True)
+class RetryRule:
+    """单类错误的重试规则，max_attempts 含首次请求。"""
+
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+
+
+@dataclass(frozen=True, slots=True)
+class RetryPolicy:
+    """按状态码区分的重试策略，transport_rule 用于超时与连接异常。"""
+
+    status_rules: Mapping[int, RetryRule]
+    transport_rule: RetryRule | None = None
+    honor_retry_after: bool = True
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        if not settings.LLM_RETRY_ENABLED:
+            return cls(status_rules={})
+        throttled = RetryRule(
+            max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+        )
+        # 服务端错误可能由请求本身触发，重试次数更保守
+        server_error = RetryRule(
+            max_attempts=min(3, settings.LLM_RETRY_MAX_ATTEMPTS),
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+        )
+        return cls(
+            status_rules={
+                408: server_error,
+                429: throttled,
+                500: server_error,
+                502: server_error,
+                503: throttled,
+                504: server_error,
+                529: throttled,
+            },
+            transport_rule=server_error,
+        )
+
+
+class RetryBudget:
+    """一次运行内所有请求共享的重试额度，避免故障期间重试放大流量。"""
+
+    def __init__(self, limit: int | None = None) -> None:
+        self.limit = settings.LLM_RETRY_BUDGET_PER_RUN if limit is None else limit
+        self.retries = 0
+        self.backoff_ms = 0.0
+        self._lock = threading.Lock()
+
+    def try_consume(self, backoff_seconds: float) -> bool:
+        with self._lock:
+            if self.retries >= self.limit:
+                return False
+            self.retries += 1
+            self.backoff_ms += backoff_seconds * 1000
+            return True
+
+
+@dataclass(slots=True)
+class RetryStats:
+    attempts: int = 0
+    retries: int = 0
+    backoff_ms: float = 0.0
+    reasons: list[str] = field(default_factory=list)
+
+
+def _parse_duration(value: str) -> float | None:
+    text = value.strip().lower()
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(text)
+    if not parts or "".join(number + unit for number, unit in parts) != text:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_retry_after(headers: Mapping[str, str] | httpx.Headers) -> float | None:
+    """解析 Retry-After 及 x-ratelimit-reset-* 响应头，返回建议等待秒数。"""
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        seconds = _parse_duration(retry_after)
+        if seconds is not None:
+            return max(0.0, seconds)
+        try:
+            moment = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            moment = None
+        if moment is not None:
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=UTC)
+            return max(0.0, (moment - datetime.now(UTC)).total_seconds())
+
+    delays = [
+        seconds
+        for name in _RESET_HEADERS
+        if (raw := headers.get(name)) and (seconds := _parse_duration(raw)) is not None
+    ]
+    if delays:
+        return max(0.0, max(delays))
+    return None
+
+
+def compute_backoff(
+    rule: RetryRule,
+    retry_index: int,
+    *,
+    retry_after: float | None = None,
+    rng: random.Random | None = None,
+) -> float:
+    """计算第 retry_index 次重试前的等待时间：优先遵循服务端提示，否则使用全抖动指数退避。"""
+
+    if retry_after is not None:
+        return min(retry_after, rule.max_delay)
+    ceiling = min(rule.max_delay, rule.base_delay * (2**retry_index))
+    return (rng or random).uniform(0, ceiling)
+
+
+class _RetryState:
+    def __init__(self, policy: RetryPolicy, budget: RetryBudget | None) -> None:
+        self.policy = policy
+        self.budget = budget
+        self.stats = RetryStats()
+
+    def next_delay(
+        self, *, response: httpx.Response | None, error: Exception | None
+    ) -> float | None:
+        """返回下一次重试前的等待秒数，不应重试时返回 None。"""
+
+        if response is not None:
+            rule = self.policy.status_rules.get(response.status_code)
+            reason = f"HTTP {response.status_code}"
+        else:
+            rule = self.policy.transport_rule
+            reason = type(error).__name__
+        if rule is None or self.stats.attempts >= rule.max_attempts:
+            return None
+        retry_after = None
+        if response is not None and self.policy.honor_retry_after:
+            retry_after = parse_retry_after(response.headers)
+        delay = compute_backoff(rule, self.stats.retries, retry_after=retry_after)
+        if self.budget is not None and not self.budget.try_consume(delay):
+            logger.warning("重试额度已用尽，放弃重试: 原因=%s", reason)
+            return None
+        self.stats.retries += 1
+        self.stats.backoff_ms += delay * 1000
+        self.stats.reasons.append(reason)
+        logger.info(
+            "LLM 调用将在 %.2fs 后重试: 第 %s 次 原因=%s",
+            delay,
+            self.stats.retries,
+            reason,
+        )
+        return delay
+
+
+def send_with_retry(
+    send: Callable[[], httpx.Response],
+    *,
+    policy: RetryPolicy,
+    budget: RetryBudget | None = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> tuple[httpx.Response, RetryStats]:
+    """按策略重复执行 send，直至成功、遇到不可重试错误或用尽次数。"""
+
+    state = _RetryState(policy, budget)
+    while True:
+        state.stats.attempts += 1
+        try:
+            response = send()
+        except httpx.TransportError as exc:
+            delay = state.next_delay(response=None, error=exc)
+            if delay is None:
+                raise
+        else:
+            delay = state.next_delay(response=response, error=None)
+            if delay is None:
+                return response, state.stats
+            response.close()
+        sleep(delay)
+
+
+async def asend_with_retry(
+    send: Callable[[], Awaitable[httpx.Response]],
+    *,
+    policy: RetryPolicy,
+    budget: RetryBudget | None = None,
+) -> tuple[httpx.Response, RetryStats]:
+    """send_with_retry 的异步版本，退避期间不阻塞事件循环。"""
+
+    state = _RetryState(policy, budget)
+    while True:
+        state.stats.attempts += 1
+        try:
+            response = await send()
+        except httpx.TransportError as exc:
+            delay = state.next_delay(response=None, error=exc)
+            if delay is None:
+                raise
+        else:
+            delay = state.next_delay(response=response, error=None)
+            if delay is None:
+                return response, state.stats
+            await response.aclose()
+        await asyncio.sleep(delay)
+
+
+__all__ = [
+    "RetryBudget",
+    "RetryPolicy",
+    "RetryRule",
+    "RetryStats",
+    "asend_with_retry",
+    "compute_backoff",
+    "parse_retry_after",
+    "send_with_retry",
+]
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from collections.abc import Awaitable, Callable, Mapping
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Generic, TypeVar
+
+from app.core.config import settings
+
+
+logger = logging.getLogger("promptworks.llm_single_flight")
+
+_T = TypeVar("_T")
+
+# 不影响生成结果的请求字段，不参与请求指纹计算
+_NON_SEMANTIC_KEYS = frozenset({"stream", "stream_options", "user", "metadata"})
+
+
+def canonical_request_digest(base_url: str, payload: Mapping[str, Any]) -> str:
+    """对 (base_url, model, messages, 参数) 做规范化序列化后取 SHA-256。"""
+
+    parameters = {
+        key: value
+        for key, value in payload.items()
+        if key not in {"model", "messages"} and key not in _NON_SEMANTIC_KEYS
+    }
+    canonical = json.dumps(
+        {
+            "base_url": base_url.rstrip("/").lower(),
+            "model": payload.get("model"),
+            "messages": payload.get("messages"),
+            "parameters": parameters,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_deterministic_payload(payload: Mapping[str, Any]) -> bool:
+    """temperature 为 0 或指定了 seed 的请求才视为可复现。"""
+
+    if payload.get("seed") is not None:
+        return True
+    temperature = payload.get("temperature")
+    return isinstance(temperature, (int, float)) and float(temperature) == 0.0
+
+
+class _LeaderAborted(Exception):
+    """领头调用被取消，等待方需要自行重新发起。"""
+
+
+class SingleFlightGroup(Generic[_T]):
+    """相同键的并发调用只执行一次，其余调用方等待并共享同一结果。
+
+    共享状态使用 concurrent.futures.Future，因此线程池中的同步调用与
+    不同事件循环中的异步调用可以合并到同一次上游请求。
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[str, Future[_T]] = {}
+        self._lock = threading.Lock()
+        self.coalesced_total = 0
+
+    def _join(self, key: str) -> tuple[Future[_T], bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced_total += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _finish(self, key: str, future: Future[_T]) -> None:
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def _settle_error(
+        self,
+        key: str,
+        future: Future[_T],
+        exc: BaseException,
+        shareable: Callable[[BaseException], bool] | None,
+    ) -> None:
+        self._finish(key, future)
+        # 领头调用被取消或失败原因只与其自身相关时，等待方应自行重新发起
+        if isinstance(exc, Exception) and (shareable is None or shareable(exc)):
+            future.set_exception(exc)
+        else:
+            future.set_exception(_LeaderAborted())
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], _T],
+        *,
+        timeout: float | None = None,
+        shareable: Callable[[BaseException], bool] | None = None,
+    ) -> tuple[_T, bool]:
+        """执行或等待 fn，返回 (结果, 是否为合并的调用)。
+
+        timeout 限制等待方的等待时长，超时抛出 TimeoutError；shareable 判定
+        领头调用的异常能否交给等待方，返回 False 时等待方重新发起调用。
+        """
+
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return future.result(timeout), True
+                except _LeaderAborted:
+                    continue
+                except FutureTimeoutError:
+                    raise TimeoutError("等待合并的在途调用超时") from None
+            try:
+                result = fn()
+            except BaseException as exc:
+                self._settle_error(key, future, exc, shareable)
+                raise
+            self._finish(key, future)
+            future.set_result(result)
+            return result, False
+
+    async def ado(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[_T]],
+        *,
+        timeout: float | None = None,
+        shareable: Callable[[BaseException], bool] | None = None,
+    ) -> tuple[_T, bool]:
+        """do 的异步版本，等待期间不阻塞事件循环。"""
+
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    # shield 避免等待超时时连带取消共享的 Future
+                    waiter = asyncio.shield(asyncio.wrap_future(future))
+                    return await asyncio.wait_for(waiter, timeout), True
+                except _LeaderAborted:
+                    continue
+                except asyncio.TimeoutError:
+                    raise TimeoutError("等待合并的在途调用超时") from None
+            try:
+                result = await fn()
+            except BaseException as exc:
+                self._settle_error(key, future, exc, shareable)
+                raise
+            self._finish(key, future)
+            future.set_result(result)
+            return result, False
+
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+def single_flight_key(
+    source: str | None,
+    limiter_key: str,
+    base_url: str,
+    payload: Mapping[str, Any],
+) -> str | None:
+    """返回可合并请求的键，当前来源未启用或请求不可复现时返回 None。"""
+
+    if not settings.LLM_SINGLE_FLIGHT_ENABLED or source is None:
+        return None
+    if source not in settings.LLM_SINGLE_FLIGHT_SOURCES:
+        return None
+    # 非确定性请求的每次调用都应独立采样，合并会抹掉结果方差
+    if settings.LLM_SINGLE_FLIGHT_DETERMINISTIC_ONLY and not is_deterministic_payload(
+        payload
+    ):
+        return None
+    return f"{limiter_key}:{canonical_request_digest(base_url, payload)}"
+
+
+__all__ = [
+    "SingleFlightGroup",
+    "canonical_request_digest",
+    "is_deterministic_payload",
+    "single_flight_key",
+]
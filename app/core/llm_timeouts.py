@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+from app.core.config import settings
+
+
+class DeadlineExceeded(Exception):
+    """剩余时间不足以完成下一项工作时抛出，该工作不会被发出。"""
+
+    def __init__(self, seconds: float) -> None:
+        super().__init__(f"已超过 {seconds:g} 秒的运行截止时间，剩余工作不再执行")
+        self.seconds = seconds
+
+
+@dataclass(frozen=True, slots=True)
+class TimeoutConfig:
+    """单次调用的超时，单位秒。
+
+    first_byte 为流式调用等待首个数据块以及数据块之间的上限；非流式响应在生成
+    完成后才返回首个字节，读取阶段按 total 控制。
+    """
+
+    connect: float
+    first_byte: float
+    total: float
+
+    @classmethod
+    def for_model(cls, model: Any | None) -> TimeoutConfig:
+        """根据模型配置生成超时，未配置的阶段使用全局默认值。"""
+
+        def _option(name: str, default: float) -> float:
+            value = getattr(model, name, None) if model is not None else None
+            return float(value) if value else default
+
+        return cls(
+            connect=_option(
+                "timeout_connect_seconds", settings.LLM_TIMEOUT_CONNECT_SECONDS
+            ),
+            first_byte=_option(
+                "timeout_first_byte_seconds", settings.LLM_TIMEOUT_FIRST_BYTE_SECONDS
+            ),
+            total=_option("timeout_total_seconds", settings.LLM_TIMEOUT_TOTAL_SECONDS),
+        )
+
+    def within(self, remaining: float) -> TimeoutConfig:
+        """按剩余时间收紧各阶段的超时。"""
+
+        return TimeoutConfig(
+            connect=min(self.connect, remaining),
+            first_byte=min(self.first_byte, remaining),
+            total=min(self.total, remaining),
+        )
+
+    def to_httpx(self, *, stream: bool) -> httpx.Timeout:
+        read = min(self.first_byte, self.total) if stream else self.total
+        return httpx.Timeout(
+            self.total, connect=min(self.connect, self.total), read=read
+        )
+
+
+class Deadline:
+    """一次测试任务或实验的整体截止时间。
+
+    传入各次调用后按剩余时间收紧超时；同时记录已完成工作的平均耗时，剩余
+    时间不足以完成下一项时直接跳过，而不是发出注定超时的请求。
+    """
+
+    def __init__(
+        self, seconds: float, *, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        self.seconds = seconds
+        self._clock = clock
+        self._expires_at = clock() + seconds
+        self._lock = threading.Lock()
+        self._observed = 0
+        self._observed_seconds = 0.0
+
+    @classmethod
+    def from_option(cls, option: Any) -> Deadline | None:
+        """解析 deadline_seconds 选项，未提供时使用 LLM_RUN_DEADLINE_SECONDS。"""
+
+        if isinstance(option, bool) or not isinstance(option, (int, float)):
+            option = settings.LLM_RUN_DEADLINE_SECONDS
+        return cls(float(option)) if option > 0 else None
+
+    def remaining(self) -> float:
+        return max(0.0, self._expires_at - self._clock())
+
+    def check(self) -> float:
+        """返回剩余秒数，截止时间已过时抛出 DeadlineExceeded。"""
+
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(self.seconds)
+        return remaining
+
+    def observe(self, seconds: float) -> None:
+        """记录一项已完成工作的耗时。"""
+
+        with self._lock:
+            self._observed += 1
+            self._observed_seconds += max(seconds, 0.0)
+
+    def has_room(self) -> bool:
+        """按已完成工作的平均耗时估计剩余时间能否再完成一项。"""
+
+        remaining = self.remaining()
+        with self._lock:
+            expected = (
+                self._observed_seconds / self._observed if self._observed else 0.0
+            )
+        return remaining > 0 and remaining >= expected
+
+    def ensure_room(self) -> None:
+        """剩余时间不足以完成下一项工作时抛出 DeadlineExceeded。"""
+
+        if not self.has_room():
+            raise DeadlineExceeded(self.seconds)
+
+
+__all__ = ["Deadline", "DeadlineExceeded", "TimeoutConfig"]
@@ -3,12 +3,28 @@ from __future__ import annotations
 import logging
 import threading
 import time
+from collections import deque
+from collections.abc import Callable, Mapping
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from datetime import UTC, datetime
-from queue import Empty, Queue
+from enum import Enum
+from queue import Empty
+from typing import Any
 
 from sqlalchemy import func, select
-from sqlalchemy.orm import selectinload
-
+from sqlalchemy.orm import Session, selectinload
+
+from app.core.cancellation import CancellationToken, cancellation_registry
+from app.core.config import settings
+from app.core.fair_queue import FairShareQueue, QueueEstimate, QueuePriority
+from app.core.job_queue import (
+    durable_queue_enabled,
+    estimate_job,
+    register_job_handler,
+    request_job_cancel,
+    submit_job,
+)
 from app.db import session as db_session
 from app.models.prompt_test import (
     PromptTestExperiment,
@@ -18,22 +34,76 @@ from app.models.prompt_test import (
     PromptTestUnit,
 )
 from app.services.prompt_test_engine import (
+    PROMPT_TEST_EXPERIMENT_KIND,
     PromptTestExecutionError,
     execute_prompt_test_experiment,
 )
 
 logger = logging.getLogger("promptworks.prompt_test_queue")
 
+PROMPT_TEST_TASK_JOB = "prompt_test_task"
+
+
+class UnitFailurePolicy(str, Enum):
+    """单元失败后的处理策略。"""
+
+    FAIL_FAST = "fail_fast"
+    CONTINUE = "continue"
+
+    @classmethod
+    def resolve(cls, config: Any) -> "UnitFailurePolicy":
+        """任务配置中的 failure_policy 优先，其次使用全局配置。"""
+
+        candidates = [settings.PROMPT_TEST_FAILURE_POLICY]
+        if isinstance(config, Mapping):
+            candidates.insert(0, config.get("failure_policy"))
+        for candidate in candidates:
+            try:
+                return cls(str(candidate).strip().lower())
+            except ValueError:
+                continue
+        return cls.FAIL_FAST
+
+
+@dataclass(frozen=True, slots=True)
+class _UnitSpec:
+    unit_id: int
+    slot_key: str
+
+
+def _unit_slot_key(unit: PromptTestUnit) -> str:
+    extra = unit.extra if isinstance(unit.extra, Mapping) else {}
+    provider = unit.llm_provider_id or extra.get("provider_key") or ""
+    return f"{provider}:{unit.model_name}"
+
+
+def _summarize_failures(failures: list[str]) -> str:
+    if len(failures) == 1:
+        return failures[0]
+    return f"{len(failures)} 个最小测试单元执行失败，首个错误: {failures[0]}"
+
 
 class PromptTestTaskQueue:
-    """Prompt 测试任务的串行执行队列。"""
+    """Prompt 测试任务的执行队列，任务串行出队，任务内的单元并发执行。
+
+    出队顺序按优先级类别与 owner 之间的公平份额决定；启用持久化队列时
+    入队改为写入作业表，由任意工作进程认领执行。
+    """
 
     def __init__(self) -> None:
-        self._queue: Queue[int] = Queue()
-        self._worker = threading.Thread(
-            target=self._worker_loop, name="prompt-test-task-queue", daemon=True
-        )
-        self._worker.start()
+        self._queue = FairShareQueue()
+        self._worker: threading.Thread | None = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        """首次入队时才启动进程内执行线程，持久化队列模式下不会启动。"""
+
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._worker_loop, name="prompt-test-task-queue", daemon=True
+                )
+                self._worker.start()
 
     @staticmethod
     def _update_task_last_error(task: PromptTestTask, message: str | None) -> None:
@@ -48,11 +118,134 @@ class PromptTestTaskQueue:
             cleaned.pop("last_error", None)
             task.config = cleaned
 
+    @staticmethod
+    def _latest_experiment(
+        session: Session, unit_id: int
+    ) -> PromptTestExperiment | None:
+        return session.scalar(
+            select(PromptTestExperiment)
+            .where(PromptTestExperiment.unit_id == unit_id)
+            .order_by(PromptTestExperiment.sequence.desc())
+            .limit(1)
+        )
+
+    @staticmethod
+    def _create_experiment(session: Session, unit_id: int) -> PromptTestExperiment:
+        sequence = (
+            session.scalar(
+                select(func.max(PromptTestExperiment.sequence)).where(
+                    PromptTestExperiment.unit_id == unit_id
+                )
+            )
+            or 0
+        ) + 1
+        experiment = PromptTestExperiment(
+            unit_id=unit_id,
+            sequence=sequence,
+            status=PromptTestExperimentStatus.PENDING,
+        )
+        session.add(experiment)
+        session.flush()
+        return experiment
+
+    @staticmethod
+    def _describe(task_id: int) -> tuple[QueuePriority, str, float]:
+        """读取任务的优先级、公平键与预计调用次数（各单元轮次之和）。"""
+
+        session = db_session.SessionLocal()
+        try:
+            task = session.get(PromptTestTask, task_id)
+            if task is None:
+                return QueuePriority.NORMAL, "owner:anonymous", 1.0
+            config = task.config if isinstance(task.config, Mapping) else {}
+            rounds = session.scalar(
+                select(func.sum(PromptTestUnit.rounds)).where(
+                    PromptTestUnit.task_id == task_id
+                )
+            )
+            cost = float(max(rounds or 1, 1))
+            batch_id = config.get("batch_id")
+            priority = QueuePriority.resolve(
+                config.get("priority"), batched=bool(batch_id), cost=cost
+            )
+            if task.owner_id is not None:
+                fair_key = f"owner:{task.owner_id}"
+            elif batch_id:
+                fair_key = f"batch:{batch_id}"
+            else:
+                fair_key = "owner:anonymous"
+            return priority, fair_key, cost
+        finally:
+            session.close()
+
     def enqueue(self, task_id: int) -> None:
-        """将任务加入待执行队列。"""
+        """将任务按优先级与公平份额加入待执行队列。"""
+
+        priority, fair_key, cost = self._describe(task_id)
+        if durable_queue_enabled():
+            job_id = submit_job(
+                PROMPT_TEST_TASK_JOB,
+                task_id,
+                priority=priority,
+                fair_key=fair_key,
+                cost=cost,
+            )
+            logger.info("Prompt 测试任务 %s 已写入持久化队列（作业 %s）", task_id, job_id)
+            return
+
+        self._ensure_worker()
+        self._queue.put_nowait(task_id, priority=priority, fair_key=fair_key, cost=cost)
+        logger.info(
+            "Prompt 测试任务 %s 已加入执行队列（优先级 %s，公平键 %s）",
+            task_id,
+            priority.value,
+            fair_key,
+        )
+
+    def estimate(self, task_id: int) -> QueueEstimate | None:
+        """返回任务的排队位置与预计等待时间，不在队列中时返回 None。"""
+
+        if durable_queue_enabled():
+            session = db_session.SessionLocal()
+            try:
+                return estimate_job(session, PROMPT_TEST_TASK_JOB, task_id)
+            finally:
+                session.close()
+        return self._queue.estimate(task_id)
+
+    def cancel(self, session: Session, task_id: int) -> None:
+        """撤回排队中的作业并中断本进程内的执行，调用方负责提交事务。
+
+        任务取消会随父标记传递给执行中的全部实验。
+        """
+
+        if durable_queue_enabled():
+            request_job_cancel(session, PROMPT_TEST_TASK_JOB, task_id)
+        if cancellation_registry.cancel(
+            PROMPT_TEST_TASK_JOB, task_id, "Prompt 测试任务已取消"
+        ):
+            logger.info("已通知执行中的 Prompt 测试任务 %s 取消", task_id)
 
-        self._queue.put_nowait(task_id)
-        logger.info("Prompt 测试任务 %s 已加入执行队列", task_id)
+    def resume_interrupted(self) -> list[int]:
+        """将上次进程退出时仍处于执行中的任务重新入队，从检查点继续执行。"""
+
+        session = db_session.SessionLocal()
+        try:
+            task_ids = list(
+                session.scalars(
+                    select(PromptTestTask.id).where(
+                        PromptTestTask.status == PromptTestTaskStatus.RUNNING,
+                        PromptTestTask.is_deleted.is_(False),
+                    )
+                )
+            )
+        finally:
+            session.close()
+        for task_id in task_ids:
+            self.enqueue(task_id)
+        if task_ids:
+            logger.info("已恢复 %s 个中断的 Prompt 测试任务", len(task_ids))
+        return task_ids
 
     def wait_for_idle(self, timeout: float | None = None) -> bool:
         """等待队列清空，便于测试或调试。"""
@@ -98,6 +291,9 @@ class PromptTestTaskQueue:
             if task.is_deleted:
                 logger.info("Prompt 测试任务 %s 已被标记删除，跳过执行", task_id)
                 return
+            if task.status == PromptTestTaskStatus.CANCELLED:
+                logger.info("Prompt 测试任务 %s 已取消，跳过执行", task_id)
+                return
 
             if not task.units:
                 task.status = PromptTestTaskStatus.COMPLETED
@@ -108,64 +304,49 @@ class PromptTestTaskQueue:
                 )
                 return
 
+            # 执行中或失败的任务再次入队时视为续跑，沿用各单元最近一次实验
+            resuming = task.status in {
+                PromptTestTaskStatus.RUNNING,
+                PromptTestTaskStatus.FAILED,
+            }
+            policy = UnitFailurePolicy.resolve(task.config)
+            units = [
+                _UnitSpec(unit.id, _unit_slot_key(unit))
+                for unit in task.units
+                if isinstance(unit, PromptTestUnit)
+            ]
             task.status = PromptTestTaskStatus.RUNNING
             self._update_task_last_error(task, None)
             session.commit()
 
-            for unit in task.units:
-                if not isinstance(unit, PromptTestUnit):
-                    continue
-
-                sequence = (
-                    session.scalar(
-                        select(func.max(PromptTestExperiment.sequence)).where(
-                            PromptTestExperiment.unit_id == unit.id
-                        )
-                    )
-                    or 0
-                ) + 1
-
-                experiment = PromptTestExperiment(
-                    unit_id=unit.id,
-                    sequence=sequence,
-                    status=PromptTestExperimentStatus.PENDING,
+            with cancellation_registry.track(PROMPT_TEST_TASK_JOB, task_id) as token:
+                failures, skipped = self._run_units(
+                    task_id, units, resuming, policy, token
                 )
-                session.add(experiment)
-                session.flush()
-
-                try:
-                    execute_prompt_test_experiment(session, experiment)
-                except PromptTestExecutionError as exc:
-                    session.refresh(experiment)
-                    experiment.status = PromptTestExperimentStatus.FAILED
-                    experiment.error = str(exc)
-                    experiment.finished_at = datetime.now(UTC)
-                    task.status = PromptTestTaskStatus.FAILED
-                    self._update_task_last_error(task, str(exc))
-                    session.commit()
-                    logger.warning(
-                        "Prompt 测试任务 %s 的最小单元 %s 执行失败: %s",
-                        task_id,
-                        unit.id,
-                        exc,
-                    )
-                    return
-                except Exception as exc:  # pragma: no cover - 防御性兜底
-                    session.refresh(experiment)
-                    experiment.status = PromptTestExperimentStatus.FAILED
-                    experiment.error = "执行测试任务失败"
-                    experiment.finished_at = datetime.now(UTC)
-                    task.status = PromptTestTaskStatus.FAILED
-                    self._update_task_last_error(task, "执行测试任务失败")
-                    session.commit()
-                    logger.exception(
-                        "Prompt 测试任务 %s 的最小单元 %s 执行出现未知异常",
-                        task_id,
-                        unit.id,
-                    )
-                    return
 
+            session.expire_all()
+            task = session.get(PromptTestTask, task_id)
+            if task is None:  # pragma: no cover - 执行期间被物理删除
+                return
+            if token.cancelled:
+                task.status = PromptTestTaskStatus.CANCELLED
+                self._update_task_last_error(task, None)
                 session.commit()
+                logger.info(
+                    "Prompt 测试任务 %s 已取消，%s 个单元未执行", task_id, skipped
+                )
+                return
+            if failures:
+                task.status = PromptTestTaskStatus.FAILED
+                self._update_task_last_error(task, _summarize_failures(failures))
+                session.commit()
+                logger.warning(
+                    "Prompt 测试任务 %s 有 %s 个最小单元失败，%s 个单元未执行",
+                    task_id,
+                    len(failures),
+                    skipped,
+                )
+                return
 
             task.status = PromptTestTaskStatus.COMPLETED
             self._update_task_last_error(task, None)
@@ -174,8 +355,170 @@ class PromptTestTaskQueue:
         finally:
             session.close()
 
+    def _run_units(
+        self,
+        task_id: int,
+        units: list[_UnitSpec],
+        resuming: bool,
+        policy: UnitFailurePolicy,
+        cancel_token: CancellationToken | None = None,
+    ) -> tuple[list[str], int]:
+        """并发执行任务下的全部单元，返回 (失败信息列表, 未执行的单元数)。
+
+        总并发与同一模型的并发分别受配置约束。分发在当前线程完成，
+        工作线程不会因等待模型配额而空占。任务被取消后停止分发，执行中
+        的单元随父标记一起取消。
+        """
+
+        limit = max(1, min(settings.PROMPT_TEST_UNIT_CONCURRENCY, len(units) or 1))
+        per_model = max(1, settings.PROMPT_TEST_UNIT_CONCURRENCY_PER_MODEL)
+        pending = deque(units)
+        active: dict[str, int] = {}
+        in_flight: dict[Future[str | None], _UnitSpec] = {}
+        failures: list[str] = []
+        stopped = False
+        cancelled: Future[None] = Future()
+        unregister: Callable[[], None] = lambda: None
+        if cancel_token is not None:
+            unregister = cancel_token.add_callback(lambda: cancelled.set_result(None))
+
+        with ThreadPoolExecutor(
+            max_workers=limit, thread_name_prefix="prompt-test-unit"
+        ) as executor:
+            while in_flight or (pending and not stopped):
+                if cancelled.done():
+                    stopped = True
+                if not stopped:
+                    for spec in list(pending):
+                        if len(in_flight) >= limit:
+                            break
+                        if active.get(spec.slot_key, 0) >= per_model:
+                            continue
+                        pending.remove(spec)
+                        active[spec.slot_key] = active.get(spec.slot_key, 0) + 1
+                        future = executor.submit(
+                            self._execute_unit,
+                            task_id,
+                            spec.unit_id,
+                            resuming,
+                            cancel_token,
+                        )
+                        in_flight[future] = spec
+                if not in_flight:
+                    break
+                # 取消后只等待执行中的单元收尾，避免已完成的取消信号反复唤醒
+                waiting: list[Future[Any]] = list(in_flight)
+                if not cancelled.done():
+                    waiting.append(cancelled)
+                done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+                done.discard(cancelled)
+                for future in done:
+                    spec = in_flight.pop(future)
+                    active[spec.slot_key] -= 1
+                    error = future.result()
+                    if error is None:
+                        continue
+                    failures.append(error)
+                    if policy is UnitFailurePolicy.FAIL_FAST and not stopped:
+                        stopped = True
+                        logger.info(
+                            "Prompt 测试任务 %s 按 fail_fast 策略停止调度剩余 %s 个单元",
+                            task_id,
+                            len(pending),
+                        )
+        unregister()
+
+        return failures, len(pending) if stopped else 0
+
+    def _execute_unit(
+        self,
+        task_id: int,
+        unit_id: int,
+        resuming: bool,
+        cancel_token: CancellationToken | None = None,
+    ) -> str | None:
+        """在独立会话与事务中执行单个单元，失败时返回错误信息。
+
+        实验执行期间在取消登记表中登记，可单独取消，也随任务一起取消。
+        """
+
+        session = db_session.SessionLocal()
+        try:
+            latest = self._latest_experiment(session, unit_id) if resuming else None
+            if (
+                latest is not None
+                and latest.status == PromptTestExperimentStatus.COMPLETED
+            ):
+                return None
+            resume_experiment = (
+                latest is not None
+                and latest.status != PromptTestExperimentStatus.CANCELLED
+            )
+            experiment = (
+                latest
+                if resume_experiment
+                else self._create_experiment(session, unit_id)
+            )
+
+            try:
+                with cancellation_registry.track(
+                    PROMPT_TEST_EXPERIMENT_KIND, experiment.id, parent=cancel_token
+                ):
+                    if resume_experiment:
+                        logger.info(
+                            "Prompt 测试任务 %s 的最小单元 %s 从实验 %s 的检查点续跑",
+                            task_id,
+                            unit_id,
+                            experiment.id,
+                        )
+                        execute_prompt_test_experiment(
+                            session, experiment, resume=True
+                        )
+                    else:
+                        execute_prompt_test_experiment(session, experiment)
+            except PromptTestExecutionError as exc:
+                session.refresh(experiment)
+                experiment.status = PromptTestExperimentStatus.FAILED
+                experiment.error = str(exc)
+                experiment.finished_at = datetime.now(UTC)
+                session.commit()
+                logger.warning(
+                    "Prompt 测试任务 %s 的最小单元 %s 执行失败: %s",
+                    task_id,
+                    unit_id,
+                    exc,
+                )
+                return str(exc)
+            except Exception:  # pragma: no cover - 防御性兜底
+                session.refresh(experiment)
+                experiment.status = PromptTestExperimentStatus.FAILED
+                experiment.error = "执行测试任务失败"
+                experiment.finished_at = datetime.now(UTC)
+                session.commit()
+                logger.exception(
+                    "Prompt 测试任务 %s 的最小单元 %s 执行出现未知异常",
+                    task_id,
+                    unit_id,
+                )
+                return "执行测试任务失败"
+
+            session.commit()
+            if experiment.status == PromptTestExperimentStatus.FAILED:
+                # 轮次失败时已完成的轮次均已落库，任务保持失败状态以便续跑
+                logger.warning(
+                    "Prompt 测试任务 %s 的最小单元 %s 执行失败: %s",
+                    task_id,
+                    unit_id,
+                    experiment.error,
+                )
+                return experiment.error or "执行测试任务失败"
+            return None
+        finally:
+            session.close()
+
 
 task_queue = PromptTestTaskQueue()
+register_job_handler(PROMPT_TEST_TASK_JOB, task_queue._execute_task)
 
 
 def enqueue_prompt_test_task(task_id: int) -> None:
@@ -184,4 +527,9 @@ def enqueue_prompt_test_task(task_id: int) -> None:
     task_queue.enqueue(task_id)
 
 
-__all__ = ["enqueue_prompt_test_task", "task_queue"]
+__all__ = [
+    "PROMPT_TEST_TASK_JOB",
+    "UnitFailurePolicy",
+    "enqueue_prompt_test_task",
+    "task_queue",
+]
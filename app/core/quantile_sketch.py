@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import math
+
+
+class QuantileSketch:
+    """相对误差有界的增量分位数草图（DDSketch 思路）。
+
+    数值按对数刻度落入桶中，每个桶只保存计数，因此内存与样本数量无关，
+    仅取决于数值跨度；桶数超过上限时合并最低的桶，保证尾部分位数精度。
+    估算的分位数与真实值的相对误差不超过 relative_accuracy。
+    """
+
+    __slots__ = (
+        "relative_accuracy",
+        "max_buckets",
+        "_gamma",
+        "_log_gamma",
+        "_buckets",
+        "_zero_count",
+        "count",
+        "total",
+        "min",
+        "max",
+    )
+
+    def __init__(
+        self, relative_accuracy: float = 0.01, *, max_buckets: int = 2048
+    ) -> None:
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy 必须位于 (0, 1) 区间")
+        if max_buckets < 1:
+            raise ValueError("max_buckets 必须为正整数")
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: dict[int, int] = {}
+        self._zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        """记录一个非负样本，负数按 0 处理。"""
+
+        value = max(float(value), 0.0)
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= 0:
+            self._zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        if len(self._buckets) > self.max_buckets:
+            self._collapse()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """合并另一份相同精度的草图。"""
+
+        if other._gamma != self._gamma:
+            raise ValueError("只能合并相对误差相同的草图")
+        for index, bucket_count in other._buckets.items():
+            self._buckets[index] = self._buckets.get(index, 0) + bucket_count
+        self._zero_count += other._zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        while len(self._buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        lowest, second = sorted(self._buckets)[:2]
+        self._buckets[second] += self._buckets.pop(lowest)
+
+    @property
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q: float) -> float | None:
+        """按最近秩法返回分位数估计，q 取值 [0, 1]；没有样本时返回 None。"""
+
+        if not self.count:
+            return None
+        q = min(max(q, 0.0), 1.0)
+        rank = max(math.ceil(q * self.count) - 1, 0)
+        # 两端的秩直接返回精确的极值
+        if rank == 0:
+            return self.min
+        if rank >= self.count - 1:
+            return self.max
+        seen = self._zero_count
+        if seen > rank:
+            return 0.0
+        estimate = self.max
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen > rank:
+                estimate = 2 * self._gamma**index / (self._gamma + 1)
+                break
+        return min(max(estimate, self.min), self.max)
+
+    def __len__(self) -> int:
+        return self.count
+
+
+__all__ = ["QuantileSketch"]
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+_LINE_ENDS = (b"\n", b"\r")
+
+
+class SSEParser:
+    """增量解析 Server-Sent Events 字节流。
+
+    按任意边界切分的字节块依次喂入，返回已完整接收的事件 data 字段；
+    行尾兼容 ``\\n``、``\\r\\n`` 与 ``\\r``，注释行与 data 以外的字段会被忽略。
+    """
+
+    def __init__(self) -> None:
+        self._remainder = b""
+        self._data: list[str] = []
+
+    def feed(self, chunk: bytes) -> list[str]:
+        if not chunk:
+            return []
+        buffer = self._remainder + chunk if self._remainder else chunk
+        lines = buffer.splitlines(keepends=True)
+        # 末行未结束或以 \r 结尾（其后可能紧跟 \n）时留待下一块
+        if lines and (
+            not lines[-1].endswith(_LINE_ENDS) or lines[-1].endswith(b"\r")
+        ):
+            self._remainder = lines.pop()
+        else:
+            self._remainder = b""
+        events: list[str] = []
+        for line in lines:
+            self._handle_line(line.rstrip(b"\r\n"), events)
+        return events
+
+    def close(self) -> list[str]:
+        """流结束时处理残留内容，未以空行结束的最后一个事件同样返回。"""
+
+        events: list[str] = []
+        if self._remainder:
+            self._handle_line(self._remainder.rstrip(b"\r\n"), events)
+            self._remainder = b""
+        self._dispatch(events)
+        return events
+
+    def _handle_line(self, raw: bytes, events: list[str]) -> None:
+        if not raw:
+            self._dispatch(events)
+            return
+        line = raw.decode("utf-8", errors="replace")
+        if line.startswith(":"):
+            return
+        field, _, value = line.partition(":")
+        if field == "data":
+            self._data.append(value[1:] if value.startswith(" ") else value)
+
+    def _dispatch(self, events: list[str]) -> None:
+        if self._data:
+            events.append("\n".join(self._data))
+            self._data = []
+
+
+__all__ = ["SSEParser"]
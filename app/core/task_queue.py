@@ -3,31 +3,121 @@ from __future__ import annotations
 import logging
 import threading
 import time
-from queue import Empty, Queue
-
+from queue import Empty
+
+from sqlalchemy.orm import Session
+
+from app.core.cancellation import cancellation_registry
+from app.core.fair_queue import FairShareQueue, QueueEstimate, QueuePriority
+from app.core.job_queue import (
+    durable_queue_enabled,
+    estimate_job,
+    register_job_handler,
+    request_job_cancel,
+    submit_job,
+)
 from app.db import session as db_session
 from app.models.test_run import TestRun, TestRunStatus
-from app.services.test_run import TestRunExecutionError, execute_test_run
+from app.services.test_run import (
+    TEST_RUN_KIND,
+    TestRunExecutionError,
+    execute_test_run,
+)
 
 
 logger = logging.getLogger("promptworks.task_queue")
 
+# 作业类型与取消登记表使用同一名称，跨进程的取消请求可以直接送达
+TEST_RUN_JOB = TEST_RUN_KIND
+
 
 class TestRunTaskQueue:
-    """简单的内存消息队列，用于串行执行测试任务。"""
+    """进程内消息队列，用于串行执行测试任务；启用持久化队列时改为写入作业表。
+
+    出队顺序按优先级类别与 batch 之间的公平份额决定，而不是简单的先进先出。
+    """
 
     def __init__(self) -> None:
-        self._queue: Queue[int] = Queue()
-        self._worker = threading.Thread(
-            target=self._worker_loop, name="test-run-queue", daemon=True
-        )
-        self._worker.start()
+        self._queue = FairShareQueue()
+        self._worker: threading.Thread | None = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        """首次入队时才启动进程内执行线程，持久化队列模式下不会启动。"""
+
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._worker_loop, name="test-run-queue", daemon=True
+                )
+                self._worker.start()
+
+    @staticmethod
+    def _describe(test_run_id: int) -> tuple[QueuePriority, str, float]:
+        """读取测试任务的优先级、公平键与预计调用次数。"""
+
+        session = db_session.SessionLocal()
+        try:
+            test_run = session.get(TestRun, test_run_id)
+            if test_run is None:
+                return QueuePriority.NORMAL, "adhoc", 1.0
+            schema = test_run.schema if isinstance(test_run.schema, dict) else {}
+            cost = float(max(test_run.repetitions or 1, 1))
+            priority = QueuePriority.resolve(
+                schema.get("priority"), batched=bool(test_run.batch_id), cost=cost
+            )
+            fair_key = f"batch:{test_run.batch_id}" if test_run.batch_id else "adhoc"
+            return priority, fair_key, cost
+        finally:
+            session.close()
 
     def enqueue(self, test_run_id: int) -> None:
-        """将测试任务加入待执行队列。"""
+        """将测试任务按优先级与公平份额加入待执行队列。"""
+
+        priority, fair_key, cost = self._describe(test_run_id)
+        if durable_queue_enabled():
+            job_id = submit_job(
+                TEST_RUN_JOB,
+                test_run_id,
+                priority=priority,
+                fair_key=fair_key,
+                cost=cost,
+            )
+            logger.info("测试任务 %s 已写入持久化队列（作业 %s）", test_run_id, job_id)
+            return
+
+        self._ensure_worker()
+        self._queue.put_nowait(
+            test_run_id, priority=priority, fair_key=fair_key, cost=cost
+        )
+        logger.info(
+            "测试任务 %s 已加入执行队列（优先级 %s，公平键 %s）",
+            test_run_id,
+            priority.value,
+            fair_key,
+        )
+
+    def estimate(self, test_run_id: int) -> QueueEstimate | None:
+        """返回测试任务的排队位置与预计等待时间，不在队列中时返回 None。"""
+
+        if durable_queue_enabled():
+            session = db_session.SessionLocal()
+            try:
+                return estimate_job(session, TEST_RUN_JOB, test_run_id)
+            finally:
+                session.close()
+        return self._queue.estimate(test_run_id)
+
+    def cancel(self, session: Session, test_run_id: int) -> None:
+        """撤回排队中的作业并中断本进程内的执行，调用方负责提交事务。
 
-        self._queue.put_nowait(test_run_id)
-        logger.info("测试任务 %s 已加入执行队列", test_run_id)
+        执行中的持久化作业由持有租约的工作进程在心跳时读取取消请求。
+        """
+
+        if durable_queue_enabled():
+            request_job_cancel(session, TEST_RUN_JOB, test_run_id)
+        if cancellation_registry.cancel(TEST_RUN_JOB, test_run_id, "测试任务已取消"):
+            logger.info("已通知执行中的测试任务 %s 取消", test_run_id)
 
     def _worker_loop(self) -> None:
         while True:
@@ -43,17 +133,35 @@ class TestRunTaskQueue:
             finally:
                 self._queue.task_done()
 
-    def _execute_task(self, test_run_id: int) -> None:
+    def _execute_job(self, test_run_id: int) -> None:
+        """持久化队列的作业入口，可重试的失败在标记测试任务后重新抛出。
+
+        异常交给作业表按退避重试并受 max_attempts 约束；作业只会在上一次
+        执行抛出异常后重试，因此开始时把上次标记为失败的测试任务恢复为待执行。
+        """
+
+        self._execute_task(test_run_id, durable=True)
+
+    def _execute_task(self, test_run_id: int, *, durable: bool = False) -> None:
         session = db_session.SessionLocal()
         try:
             test_run = session.get(TestRun, test_run_id)
             if not test_run:
                 logger.warning("测试任务 %s 不存在，跳过执行", test_run_id)
                 return
+            if test_run.status == TestRunStatus.CANCELLED:
+                logger.info("测试任务 %s 已取消，跳过执行", test_run_id)
+                return
+            if durable and test_run.status == TestRunStatus.FAILED:
+                test_run.status = TestRunStatus.PENDING
+                session.commit()
+                logger.info("测试任务 %s 开始重试", test_run_id)
 
             nested_txn = session.begin_nested()
             try:
-                execute_test_run(session, test_run)
+                # 执行期间登记取消标记，execute_test_run 通过登记表获取
+                with cancellation_registry.track(TEST_RUN_JOB, test_run_id):
+                    execute_test_run(session, test_run)
             except TestRunExecutionError as exc:
                 nested_txn.rollback()
                 session.expire(test_run)
@@ -68,6 +176,10 @@ class TestRunTaskQueue:
                 session.commit()
 
                 logger.warning("测试任务 %s 执行失败: %s", test_run_id, exc)
+                # 上游故障与超时可能是暂时的，交给持久化队列重试；参数错误、
+                # 预算不足等重试也无法成功的失败不再占用重试次数
+                if durable and exc.status_code >= 500:
+                    raise
                 return
             except Exception as exc:  # pragma: no cover - 防御性兜底
                 nested_txn.rollback()
@@ -80,11 +192,16 @@ class TestRunTaskQueue:
                     session.commit()
 
                 logger.exception("测试任务 %s 执行出现未知异常", test_run_id)
+                if durable:
+                    raise
                 return
             else:
                 nested_txn.commit()
                 session.commit()
-                logger.info("测试任务 %s 执行完成", test_run_id)
+                if test_run.status == TestRunStatus.CANCELLED:
+                    logger.info("测试任务 %s 已取消", test_run_id)
+                else:
+                    logger.info("测试任务 %s 执行完成", test_run_id)
         finally:
             session.close()
 
@@ -104,6 +221,7 @@ class TestRunTaskQueue:
 
 
 task_queue = TestRunTaskQueue()
+register_job_handler(TEST_RUN_JOB, task_queue._execute_job)
 
 
 def enqueue_test_run(test_run_id: int) -> None:
@@ -112,4 +230,4 @@ def enqueue_test_run(test_run_id: int) -> None:
     task_queue.enqueue(test_run_id)
 
 
-__all__ = ["enqueue_test_run", "task_queue"]
+__all__ = ["TEST_RUN_JOB", "enqueue_test_run", "task_queue"]
@@ -1,7 +1,10 @@
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
@@ -10,9 +13,14 @@ from starlette.middleware.base import BaseHTTPMiddleware
 from app.__version__ import get_version
 from app.api.v1.api import api_router
 from app.core.config import settings
+from app.core.job_queue import JobWorker, durable_queue_enabled
+from app.core.llm_http_client import llm_client_registry
 from app.core.logging_config import configure_logging, get_logger
 from app.core.middleware import RequestLoggingMiddleware
+from app.core.prompt_test_task_queue import task_queue as prompt_test_task_queue
 from app.core.task_queue import task_queue as _test_run_task_queue  # noqa: F401 - 确保队列初始化
+from app.services.budget import budget_tracker
+from app.services.usage_log_writer import usage_log_writer
 from app.api.v1.gallery.exceptions import (
     GalleryException,
     gallery_exception_handler,
@@ -35,6 +43,30 @@ class StaticFilesCORSMiddleware(BaseHTTPMiddleware):
         return response
 
 
+@asynccontextmanager
+async def _lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """管理应用生命周期：启动作业执行或续跑中断任务，退出时写回预算用量与缓冲的
+    调用日志并释放 LLM 长连接。"""
+
+    worker: JobWorker | None = None
+    if durable_queue_enabled():
+        # 持久化队列下中断的作业会在租约过期后被重新认领，无需额外续跑
+        if settings.JOB_WORKER_IN_PROCESS:
+            worker = JobWorker().start()
+    elif settings.PROMPT_TEST_RESUME_ON_STARTUP:
+        try:
+            prompt_test_task_queue.resume_interrupted()
+        except Exception:  # pragma: no cover - 数据库不可用时不影响启动
+            get_logger("promptworks.app").exception("恢复中断的 Prompt 测试任务失败")
+    usage_log_writer.start()
+    yield
+    if worker is not None:
+        worker.stop(timeout=settings.JOB_LEASE_SECONDS)
+    usage_log_writer.close()
+    budget_tracker.flush()
+    await llm_client_registry.aclose()
+
+
 def create_application() -> FastAPI:
     """Instantiate the FastAPI application."""
 
@@ -48,6 +80,7 @@ def create_application() -> FastAPI:
         version=get_version(),
         openapi_url=f"{settings.API_V1_STR}/openapi.json",
         redirect_slashes=False,  # 禁用自动重定向，避免 CORS 问题
+        lifespan=_lifespan,
     )
 
     # 注册自定义请求日志中间件，捕获每一次请求信息
@@ -111,7 +144,10 @@ def create_application() -> FastAPI:
                 ),
             )
         # 对其他路径保持原有的错误格式
-        return JSONResponse(status_code=422, content={"detail": exc.errors()})
+        # 自定义校验器抛出的异常对象位于 ctx 中，需要先转换为可序列化的结构
+        return JSONResponse(
+            status_code=422, content={"detail": jsonable_encoder(exc.errors())}
+        )
 
     app_logger.info("FastAPI 应用初始化完成")
     return app
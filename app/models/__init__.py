@@ -11,9 +11,14 @@ from app.models.prompt_test import (
     PromptTestUnit,
     PromptTestExperiment,
     PromptTestExperimentStatus,
+    PromptTestRound,
 )
 from app.models.media_type import MediaType
 from app.models.attachment import PromptAttachment
+from app.models.llm_cache import LLMResponseCacheEntry
+from app.models.job import Job, JobStatus
+from app.models.budget import BudgetPeriod, BudgetScope, UsageBudget
+from app.models.config_version import ConfigVersion
 
 __all__ = [
     "Base",
@@ -33,6 +38,14 @@ __all__ = [
     "PromptTestUnit",
     "PromptTestExperiment",
     "PromptTestExperimentStatus",
+    "PromptTestRound",
     "MediaType",
     "PromptAttachment",
+    "LLMResponseCacheEntry",
+    "Job",
+    "JobStatus",
+    "BudgetPeriod",
+    "BudgetScope",
+    "UsageBudget",
+    "ConfigVersion",
 ]
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from datetime import datetime
+from enum import Enum
+
+from sqlalchemy import (
+    BigInteger,
+    DateTime,
+    Enum as PgEnum,
+    Float,
+    Integer,
+    UniqueConstraint,
+    func,
+)
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class BudgetScope(str, Enum):
+    """预算的统计对象：单个模型或任务 owner。"""
+
+    MODEL = "model"
+    OWNER = "owner"
+
+
+class BudgetPeriod(str, Enum):
+    """预算的重置周期，total 表示不重置。"""
+
+    DAILY = "daily"
+    MONTHLY = "monthly"
+    TOTAL = "total"
+
+
+class UsageBudget(Base):
+    """模型或 owner 的 token/费用预算，已用量由各进程批量累加写回。"""
+
+    __tablename__ = "usage_budgets"
+    __table_args__ = (
+        UniqueConstraint("scope", "target_id", name="uq_usage_budget_scope_target"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    scope: Mapped[BudgetScope] = mapped_column(
+        PgEnum(
+            BudgetScope,
+            name="budget_scope",
+            values_callable=lambda enum: [member.value for member in enum],
+        ),
+        nullable=False,
+    )
+    # scope=model 时为 llm_models.id，scope=owner 时为任务的 owner_id
+    target_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    period: Mapped[BudgetPeriod] = mapped_column(
+        PgEnum(
+            BudgetPeriod,
+            name="budget_period",
+            values_callable=lambda enum: [member.value for member in enum],
+        ),
+        nullable=False,
+        default=BudgetPeriod.MONTHLY,
+        server_default=BudgetPeriod.MONTHLY.value,
+    )
+    token_limit: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    cost_limit: Mapped[float | None] = mapped_column(Float, nullable=True)
+    used_tokens: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    used_cost: Mapped[float] = mapped_column(
+        Float, nullable=False, default=0.0, server_default="0"
+    )
+    # 当前统计周期的起点，进入新周期后已用量从零累计
+    period_start: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover - 调试辅助
+        return "UsageBudget(scope={scope}, target={target}, used={used})".format(
+            scope=self.scope, target=self.target_id, used=self.used_tokens
+        )
+
+
+__all__ = ["BudgetPeriod", "BudgetScope", "UsageBudget"]
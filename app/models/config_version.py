@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class ConfigVersion(Base):
+    """配置版本号，进程内缓存据此判断其他进程是否修改过对应配置。"""
+
+    __tablename__ = "config_versions"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover - 调试辅助
+        return "ConfigVersion(name={name}, version={version})".format(
+            name=self.name, version=self.version
+        )
+
+
+__all__ = ["ConfigVersion"]
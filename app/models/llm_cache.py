@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import DateTime, Integer, String, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.types import JSONBCompat
+from app.models.base import Base
+
+
+class LLMResponseCacheEntry(Base):
+    """按请求内容哈希持久化的 LLM 响应缓存。"""
+
+    __tablename__ = "llm_response_cache"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    cache_key: Mapped[str] = mapped_column(
+        String(64), nullable=False, unique=True, index=True
+    )
+    model_name: Mapped[str] = mapped_column(String(150), nullable=False)
+    response: Mapped[dict[str, Any]] = mapped_column(JSONBCompat, nullable=False)
+    latency_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    size_bytes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    hit_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, index=True
+    )
+    last_hit_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+    def __repr__(self) -> str:  # pragma: no cover - 调试辅助
+        return "LLMResponseCacheEntry(key={key}, model={model}, hits={hits})".format(
+            key=self.cache_key, model=self.model_name, hits=self.hit_count
+        )
+
+
+__all__ = ["LLMResponseCacheEntry"]
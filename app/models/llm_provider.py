@@ -3,6 +3,7 @@ from typing import TYPE_CHECKING
 from sqlalchemy import (
     Boolean,
     DateTime,
+    Float,
     ForeignKey,
     Integer,
     String,
@@ -82,6 +83,25 @@ class LLMModel(Base):
     concurrency_limit: Mapped[int] = mapped_column(
         Integer, nullable=False, default=5, server_default="5"
     )
+    rate_limit_rpm: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    rate_limit_tpm: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # 每千 token 的输入/输出单价，用于预算的费用统计，未配置时只统计 token
+    input_price_per_1k: Mapped[float | None] = mapped_column(Float, nullable=True)
+    output_price_per_1k: Mapped[float | None] = mapped_column(Float, nullable=True)
+    # 调用超时（秒），为空时使用全局默认值
+    timeout_connect_seconds: Mapped[float | None] = mapped_column(Float, nullable=True)
+    timeout_first_byte_seconds: Mapped[float | None] = mapped_column(
+        Float, nullable=True
+    )
+    timeout_total_seconds: Mapped[float | None] = mapped_column(Float, nullable=True)
+    # 单次请求通过 n 参数返回的最大候选数，为空或 1 表示提供方不支持 n
+    max_choices_per_request: Mapped[int | None] = mapped_column(
+        Integer, nullable=True
+    )
+    # 熔断时改用的等价模型，通常位于另一提供者
+    failover_model_id: Mapped[int | None] = mapped_column(
+        ForeignKey("llm_models.id", ondelete="SET NULL"), nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
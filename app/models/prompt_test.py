@@ -33,6 +33,7 @@ class PromptTestTaskStatus(str, Enum):
     RUNNING = "running"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
 
 
 class PromptTestTask(Base):
@@ -188,6 +189,42 @@ class PromptTestExperiment(Base):
     unit: Mapped["PromptTestUnit"] = relationship(
         "PromptTestUnit", back_populates="experiments"
     )
+    rounds: Mapped[list["PromptTestRound"]] = relationship(
+        "PromptTestRound",
+        back_populates="experiment",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="PromptTestRound.run_index",
+    )
+
+
+class PromptTestRound(Base):
+    """实验单轮执行结果的检查点，每轮完成即落库，供中断后续跑。"""
+
+    __tablename__ = "prompt_test_rounds"
+    __table_args__ = (
+        UniqueConstraint(
+            "experiment_id", "run_index", name="uq_prompt_test_round_index"
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    experiment_id: Mapped[int] = mapped_column(
+        ForeignKey("prompt_test_experiments.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    run_index: Mapped[int] = mapped_column(Integer, nullable=False)
+    record: Mapped[dict] = mapped_column(
+        JSONBCompat, nullable=False, doc="与 outputs 元素结构一致的单轮结果"
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+    experiment: Mapped["PromptTestExperiment"] = relationship(
+        "PromptTestExperiment", back_populates="rounds"
+    )
 
 
 __all__ = [
@@ -196,4 +233,5 @@ __all__ = [
     "PromptTestUnit",
     "PromptTestExperiment",
     "PromptTestExperimentStatus",
+    "PromptTestRound",
 ]
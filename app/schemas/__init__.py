@@ -21,6 +21,8 @@ from app.schemas.prompt import (
     PromptClassStats,
     PromptCreate,
     PromptRead,
+    PromptRenderRequest,
+    PromptRenderResponse,
     PromptTagCreate,
     PromptTagListResponse,
     PromptTagRead,
@@ -30,9 +32,16 @@ from app.schemas.prompt import (
     PromptVersionCreate,
     PromptVersionRead,
 )
+from app.schemas.queue import QueuePositionRead
 from app.schemas.result import ResultCreate, ResultRead
 from app.schemas.test_run import TestRunCreate, TestRunRead, TestRunUpdate
-from app.schemas.usage import UsageModelSummary, UsageOverview, UsageTimeseriesPoint
+from app.schemas.usage import (
+    UsageBudgetCreate,
+    UsageBudgetRead,
+    UsageModelSummary,
+    UsageOverview,
+    UsageTimeseriesPoint,
+)
 
 __all__ = [
     "AttachmentBase",
@@ -48,6 +57,8 @@ __all__ = [
     "PromptCreate",
     "PromptUpdate",
     "PromptRead",
+    "PromptRenderRequest",
+    "PromptRenderResponse",
     "PromptTagCreate",
     "PromptTagUpdate",
     "PromptTagRead",
@@ -60,6 +71,7 @@ __all__ = [
     "TestRunRead",
     "ResultCreate",
     "ResultRead",
+    "QueuePositionRead",
     "MetricCreate",
     "MetricRead",
     "LLMProviderCreate",
@@ -70,4 +82,6 @@ __all__ = [
     "UsageOverview",
     "UsageModelSummary",
     "UsageTimeseriesPoint",
+    "UsageBudgetCreate",
+    "UsageBudgetRead",
 ]
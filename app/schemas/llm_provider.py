@@ -18,6 +18,38 @@ class LLMModelBase(BaseModel):
         le=50,
         description="执行测试任务时的最大并发请求数",
     )
+    rate_limit_rpm: int | None = Field(
+        default=None, ge=1, description="每分钟请求数上限，留空表示不限制"
+    )
+    rate_limit_tpm: int | None = Field(
+        default=None, ge=1, description="每分钟 token 数上限，留空表示不限制"
+    )
+    input_price_per_1k: float | None = Field(
+        default=None, ge=0, description="每千输入 token 单价，用于预算费用统计"
+    )
+    output_price_per_1k: float | None = Field(
+        default=None, ge=0, description="每千输出 token 单价，用于预算费用统计"
+    )
+    failover_model_id: int | None = Field(
+        default=None, description="熔断时改用的等价模型 ID，需属于其他提供者"
+    )
+    timeout_connect_seconds: float | None = Field(
+        default=None, gt=0, description="连接超时秒数，留空使用全局默认值"
+    )
+    timeout_first_byte_seconds: float | None = Field(
+        default=None,
+        gt=0,
+        description="流式调用等待首个数据块的超时秒数，留空使用全局默认值",
+    )
+    timeout_total_seconds: float | None = Field(
+        default=None, gt=0, description="单次调用的总超时秒数，留空使用全局默认值"
+    )
+    max_choices_per_request: int | None = Field(
+        default=None,
+        ge=1,
+        le=128,
+        description="单次请求通过 n 参数返回的最大候选数，留空表示不支持 n",
+    )
 
 
 class LLMModelCreate(LLMModelBase):
@@ -33,6 +65,38 @@ class LLMModelUpdate(BaseModel):
         le=50,
         description="执行测试任务时的最大并发请求数",
     )
+    rate_limit_rpm: int | None = Field(
+        default=None, ge=1, description="每分钟请求数上限，留空表示不限制"
+    )
+    rate_limit_tpm: int | None = Field(
+        default=None, ge=1, description="每分钟 token 数上限，留空表示不限制"
+    )
+    input_price_per_1k: float | None = Field(
+        default=None, ge=0, description="每千输入 token 单价，用于预算费用统计"
+    )
+    output_price_per_1k: float | None = Field(
+        default=None, ge=0, description="每千输出 token 单价，用于预算费用统计"
+    )
+    failover_model_id: int | None = Field(
+        default=None, description="熔断时改用的等价模型 ID，需属于其他提供者"
+    )
+    timeout_connect_seconds: float | None = Field(
+        default=None, gt=0, description="连接超时秒数，留空使用全局默认值"
+    )
+    timeout_first_byte_seconds: float | None = Field(
+        default=None,
+        gt=0,
+        description="流式调用等待首个数据块的超时秒数，留空使用全局默认值",
+    )
+    timeout_total_seconds: float | None = Field(
+        default=None, gt=0, description="单次调用的总超时秒数，留空使用全局默认值"
+    )
+    max_choices_per_request: int | None = Field(
+        default=None,
+        ge=1,
+        le=128,
+        description="单次请求通过 n 参数返回的最大候选数，留空表示不支持 n",
+    )
 
 
 class LLMModelRead(LLMModelBase):
@@ -72,6 +136,27 @@ class LLMProviderUpdate(BaseModel):
     default_model_name: str | None = None
 
 
+class LLMCircuitBreakerStatus(BaseModel):
+    key: str = Field(..., description="熔断键，格式为 provider_id:model_name")
+    model_name: str
+    state: str = Field(..., description="熔断状态 closed、open 或 half_open")
+    health_score: float = Field(
+        ..., description="健康度 0~1，按最近调用的成功率计算，熔断期间为 0"
+    )
+    failure_rate: float = Field(..., description="最近调用中失败与超时的占比")
+    window_calls: int = Field(..., description="参与统计的最近调用数")
+    failures_total: int
+    timeouts_total: int
+    opened_total: int = Field(..., description="累计熔断次数")
+    rejected_total: int = Field(..., description="熔断期间被直接拒绝的调用数")
+    retry_after_seconds: float | None = Field(
+        default=None, description="距离放行探测请求的秒数，未熔断时为空"
+    )
+    last_failure_reason: str | None = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class LLMProviderRead(BaseModel):
     id: int
     provider_key: str | None
@@ -84,6 +169,9 @@ class LLMProviderRead(BaseModel):
     default_model_name: str | None
     masked_api_key: str
     models: list[LLMModelRead] = Field(default_factory=list)
+    circuit_breakers: list[LLMCircuitBreakerStatus] = Field(
+        default_factory=list, description="该提供者下各模型的熔断状态"
+    )
     created_at: datetime
     updated_at: datetime
 
@@ -124,3 +212,42 @@ class LLMUsageLogRead(BaseModel):
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class LLMRateLimitStatus(BaseModel):
+    key: str = Field(..., description="限流键，格式为 provider_id:model_name")
+    concurrency_limit: int = Field(..., description="模型配置的并发上限")
+    effective_concurrency: int = Field(
+        ..., description="自适应控制当前生效的并发上限"
+    )
+    rpm_limit: int | None
+    tpm_limit: int | None
+    in_flight: int = Field(..., description="当前占用的并发槽位数")
+    waiting: int = Field(..., description="本进程内正在排队等待的调用数")
+    rpm_available: float | None
+    tpm_available: float | None
+    acquired_total: int
+    timeouts_total: int
+    avg_wait_ms: float
+    max_wait_ms: float
+    last_wait_ms: float
+    p95_latency_ms: float | None = None
+    adaptive_decreases: int = 0
+    last_decrease_reason: str | None = None
+    pacing_interval_ms: float | None = Field(
+        default=None, description="按 RPM 计算的请求开始间隔，未配置时为空"
+    )
+    paced_requests: int = Field(default=0, description="被推迟发送的请求数")
+    avg_pacing_delay_ms: float = Field(
+        default=0.0, description="节奏调度为每个请求平均增加的延迟"
+    )
+    max_pacing_delay_ms: float = 0.0
+    last_pacing_delay_ms: float = 0.0
+    hedge_calls: int = Field(default=0, description="开启对冲的调用数")
+    hedged_requests: int = Field(default=0, description="实际发出的对冲请求数")
+    hedge_rate: float = Field(default=0.0, description="发出对冲请求的调用占比")
+    hedge_win_rate: float = Field(
+        default=0.0, description="对冲请求先于原请求返回的比例"
+    )
+
+    model_config = ConfigDict(from_attributes=True)
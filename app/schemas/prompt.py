@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 
@@ -257,6 +257,39 @@ class PromptListResponse(BaseModel):
     total: int = Field(default=0, ge=0, description="符合筛选条件的总记录数")
 
 
+class PromptRenderRequest(BaseModel):
+    """批量渲染 Prompt 模板的入参"""
+
+    version_id: int | None = Field(
+        default=None, description="要渲染的版本，缺省为当前版本"
+    )
+    defaults: dict[str, Any] = Field(
+        default_factory=dict, description="所有用例共享的默认变量"
+    )
+    cases: list[dict[str, Any]] = Field(
+        min_length=1, max_length=10000, description="待渲染的用例变量"
+    )
+
+
+class PromptRenderItem(BaseModel):
+    """单个用例的渲染结果，缺少变量时 content 为空"""
+
+    index: int
+    content: str | None = None
+    missing: list[str] = Field(default_factory=list)
+    error: str | None = None
+
+
+class PromptRenderResponse(BaseModel):
+    """批量渲染结果"""
+
+    prompt_id: int
+    version_id: int
+    variables: list[str] = Field(default_factory=list)
+    rendered: int = Field(default=0, ge=0, description="渲染成功的用例数")
+    items: list[PromptRenderItem]
+
+
 # 解析前向引用 - 在所有模型定义之后导入
 from app.schemas.attachment import AttachmentRead  # noqa: E402
 
@@ -5,6 +5,7 @@ from typing import Any
 
 from pydantic import BaseModel, ConfigDict, Field
 
+from app.core.fair_queue import QueuePriority
 from app.models.prompt_test import (
     PromptTestExperimentStatus,
     PromptTestTaskStatus,
@@ -30,6 +31,8 @@ class PromptTestTaskCreate(PromptTestTaskBase):
 
     units: list["PromptTestUnitCreate"] | None = None
     auto_execute: bool = False
+    # 排队优先级，未指定时按 batch_id 与总轮次自动判定，写入 config.priority
+    priority: QueuePriority | None = None
 
 
 class PromptTestTaskUpdate(BaseModel):
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+
+from pydantic import BaseModel
+
+from app.core.fair_queue import QueueEstimate, QueuePriority
+
+
+class QueuePositionRead(BaseModel):
+    """任务在执行队列中的位置，position 为 0 表示已开始执行。"""
+
+    position: int
+    running: bool
+    priority: QueuePriority
+    fair_key: str
+    estimated_wait_seconds: float
+    estimated_start_at: datetime
+
+    @classmethod
+    def from_estimate(cls, estimate: QueueEstimate) -> "QueuePositionRead":
+        now = datetime.now(UTC)
+        return cls(
+            position=estimate.position,
+            running=estimate.position == 0,
+            priority=estimate.priority,
+            fair_key=estimate.fair_key,
+            estimated_wait_seconds=estimate.estimated_wait_seconds,
+            estimated_start_at=now
+            + timedelta(seconds=estimate.estimated_wait_seconds),
+        )
+
+
+__all__ = ["QueuePositionRead"]
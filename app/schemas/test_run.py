@@ -2,6 +2,7 @@ from datetime import datetime
 
 from pydantic import BaseModel, ConfigDict, Field
 
+from app.core.fair_queue import QueuePriority
 from app.models.test_run import TestRunStatus
 from app.schemas.prompt import PromptRead, PromptVersionRead
 from app.schemas.result import ResultRead
@@ -26,6 +27,8 @@ class TestRunBase(BaseModel):
 class TestRunCreate(TestRunBase):
     __test__ = False
     prompt_version_id: int = Field(..., ge=1)
+    # 排队优先级，未指定时按 batch_id 与重复次数自动判定，写入 schema.priority
+    priority: QueuePriority | None = None
 
 
 class TestRunUpdate(BaseModel):
@@ -1,6 +1,8 @@
-from datetime import date
+from datetime import date, datetime
 
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+from app.models.budget import BudgetPeriod, BudgetScope
 
 
 class UsageOverview(BaseModel):
@@ -8,6 +10,8 @@ class UsageOverview(BaseModel):
     input_tokens: int = Field(default=0, ge=0)
     output_tokens: int = Field(default=0, ge=0)
     call_count: int = Field(default=0, ge=0)
+    cached_tokens: int = Field(default=0, ge=0)
+    cached_call_count: int = Field(default=0, ge=0)
 
 
 class UsageModelSummary(BaseModel):
@@ -31,4 +35,39 @@ class UsageTimeseriesPoint(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
-__all__ = ["UsageOverview", "UsageModelSummary", "UsageTimeseriesPoint"]
+class UsageBudgetCreate(BaseModel):
+    scope: BudgetScope
+    target_id: int = Field(ge=1)
+    period: BudgetPeriod = BudgetPeriod.MONTHLY
+    token_limit: int | None = Field(default=None, ge=0)
+    cost_limit: float | None = Field(default=None, ge=0)
+
+    @model_validator(mode="after")
+    def validate_limits(self):
+        if self.token_limit is None and self.cost_limit is None:
+            raise ValueError("token_limit 与 cost_limit 至少需要设置一项")
+        return self
+
+
+class UsageBudgetRead(BaseModel):
+    id: int
+    scope: BudgetScope
+    target_id: int
+    period: BudgetPeriod
+    token_limit: int | None = None
+    cost_limit: float | None = None
+    used_tokens: int = Field(default=0, ge=0)
+    used_cost: float = Field(default=0.0, ge=0)
+    remaining_tokens: int | None = None
+    remaining_cost: float | None = None
+    exhausted: bool = False
+    period_start: datetime | None = None
+
+
+__all__ = [
+    "UsageOverview",
+    "UsageModelSummary",
+    "UsageTimeseriesPoint",
+    "UsageBudgetCreate",
+    "UsageBudgetRead",
+]
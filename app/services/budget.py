@@ -0,0 +1,443 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass, replace
+from datetime import UTC, datetime
+from typing import Any
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.llm_rate_limiter import estimate_payload_token_split
+from app.db import session as db_session
+from app.models.budget import BudgetPeriod, BudgetScope, UsageBudget
+from app.models.llm_provider import LLMModel
+from app.models.usage import LLMUsageLog
+
+
+logger = logging.getLogger("promptworks.budget")
+
+_SCOPE_LABELS = {BudgetScope.MODEL: "模型", BudgetScope.OWNER: "owner"}
+
+
+@dataclass(frozen=True, slots=True)
+class BudgetEstimate:
+    """执行前预估的用量，cost 为空表示模型未配置单价。"""
+
+    rounds: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float | None = None
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def __add__(self, other: "BudgetEstimate") -> "BudgetEstimate":
+        cost: float | None = None
+        if self.cost is not None or other.cost is not None:
+            cost = (self.cost or 0.0) + (other.cost or 0.0)
+        return BudgetEstimate(
+            rounds=self.rounds + other.rounds,
+            prompt_tokens=self.prompt_tokens + other.prompt_tokens,
+            completion_tokens=self.completion_tokens + other.completion_tokens,
+            cost=cost,
+        )
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "rounds": self.rounds,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "cost": round(self.cost, 6) if self.cost is not None else None,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class BudgetStatus:
+    """预算的当前用量快照，已合并本进程尚未写回的增量。"""
+
+    budget_id: int
+    scope: BudgetScope
+    target_id: int
+    period: BudgetPeriod
+    token_limit: int | None
+    cost_limit: float | None
+    used_tokens: int
+    used_cost: float
+    period_start: datetime | None
+
+    @property
+    def remaining_tokens(self) -> int | None:
+        if self.token_limit is None:
+            return None
+        return max(self.token_limit - self.used_tokens, 0)
+
+    @property
+    def remaining_cost(self) -> float | None:
+        if self.cost_limit is None:
+            return None
+        return max(self.cost_limit - self.used_cost, 0.0)
+
+    @property
+    def exhausted(self) -> bool:
+        return self.shortfall() is not None
+
+    def shortfall(self, estimate: BudgetEstimate | None = None) -> str | None:
+        """返回预算不足的说明，足够时返回 None。
+
+        未传入预估时只判断预算是否已经用尽。
+        """
+
+        label = f"{_SCOPE_LABELS[self.scope]} #{self.target_id} 的预算"
+        if self.token_limit is not None:
+            if estimate is None and self.used_tokens >= self.token_limit:
+                return f"{label}已用尽（{self.used_tokens}/{self.token_limit} tokens）"
+            if (
+                estimate is not None
+                and self.used_tokens + estimate.total_tokens > self.token_limit
+            ):
+                return (
+                    f"{label}不足：预计消耗 {estimate.total_tokens} tokens，"
+                    f"剩余 {self.remaining_tokens} tokens"
+                )
+        if self.cost_limit is not None:
+            if estimate is None and self.used_cost >= self.cost_limit:
+                return f"{label}已用尽（费用 {self.used_cost:.4f}/{self.cost_limit:.4f}）"
+            if (
+                estimate is not None
+                and estimate.cost is not None
+                and self.used_cost + estimate.cost > self.cost_limit
+            ):
+                return (
+                    f"{label}不足：预计费用 {estimate.cost:.4f}，"
+                    f"剩余 {self.remaining_cost:.4f}"
+                )
+        return None
+
+
+class BudgetExceededError(Exception):
+    """预算不足以执行请求的调用。"""
+
+    def __init__(self, message: str, *, budget: BudgetStatus) -> None:
+        super().__init__(message)
+        self.budget = budget
+
+
+def estimate_cost(
+    model: LLMModel | None, prompt_tokens: int, completion_tokens: int
+) -> float | None:
+    """按模型的每千 token 单价计算费用，未配置单价时返回 None。"""
+
+    if model is None:
+        return None
+    input_price = model.input_price_per_1k
+    output_price = model.output_price_per_1k
+    if input_price is None and output_price is None:
+        return None
+    return (
+        prompt_tokens * (input_price or 0.0) + completion_tokens * (output_price or 0.0)
+    ) / 1000
+
+
+def estimate_payloads(
+    model: LLMModel | None, payloads: Iterable[Mapping[str, Any]]
+) -> BudgetEstimate:
+    """按渲染后的请求体估算输入 token，输出 token 取 max_tokens 或默认值。"""
+
+    rounds = prompt_tokens = completion_tokens = 0
+    for payload in payloads:
+        prompt, completion = estimate_payload_token_split(payload)
+        rounds += 1
+        prompt_tokens += prompt
+        completion_tokens += completion
+    return BudgetEstimate(
+        rounds=rounds,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        cost=estimate_cost(model, prompt_tokens, completion_tokens),
+    )
+
+
+def current_period_start(period: BudgetPeriod, now: datetime) -> datetime | None:
+    """返回 now 所在统计周期的起点（UTC），total 周期返回 None。"""
+
+    now = now.astimezone(UTC)
+    if period is BudgetPeriod.DAILY:
+        return now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period is BudgetPeriod.MONTHLY:
+        return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return None
+
+
+def _as_utc(value: datetime | None) -> datetime | None:
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=UTC)
+
+
+def _snapshot(budget: UsageBudget, now: datetime) -> BudgetStatus:
+    period = BudgetPeriod(budget.period)
+    start = current_period_start(period, now)
+    stored_start = _as_utc(budget.period_start)
+    stale = start is not None and (stored_start is None or stored_start < start)
+    return BudgetStatus(
+        budget_id=budget.id,
+        scope=BudgetScope(budget.scope),
+        target_id=budget.target_id,
+        period=period,
+        token_limit=budget.token_limit,
+        cost_limit=budget.cost_limit,
+        # 已进入新周期但尚未写回时，上一周期的用量不再计入
+        used_tokens=0 if stale else int(budget.used_tokens or 0),
+        used_cost=0.0 if stale else float(budget.used_cost or 0.0),
+        period_start=start if stale else stored_start,
+    )
+
+
+class BudgetTracker:
+    """用量预算的进程内计数器。
+
+    每次调用的用量先累加到内存，超过 BUDGET_FLUSH_TOKENS 或
+    BUDGET_FLUSH_INTERVAL_SECONDS 后以增量 UPDATE 批量写回数据库，避免每轮
+    调用都争用预算行；预算配置与其他进程写回的用量按同一间隔重新加载。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._budgets: dict[tuple[BudgetScope, int], BudgetStatus] = {}
+        self._pending: dict[int, tuple[int, float]] = {}
+        self._pending_tokens = 0
+        self._synced_at: float | None = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._budgets = {}
+            self._pending = {}
+            self._pending_tokens = 0
+            self._synced_at = None
+
+    def invalidate(self) -> None:
+        """预算配置变更后调用，下次检查时重新加载。"""
+
+        with self._lock:
+            self._synced_at = None
+
+    def _stale(self) -> bool:
+        if self._synced_at is None:
+            return True
+        elapsed = time.monotonic() - self._synced_at
+        return elapsed >= settings.BUDGET_FLUSH_INTERVAL_SECONDS
+
+    def sync(self, db: Session | None = None) -> None:
+        """写回未提交的用量增量，并重新加载全部预算。"""
+
+        with self._sync_lock:
+            self._flush()
+            own_session = db is None
+            session = db or db_session.SessionLocal()
+            try:
+                now = datetime.now(UTC)
+                budgets = {
+                    (BudgetScope(item.scope), item.target_id): _snapshot(item, now)
+                    for item in session.scalars(select(UsageBudget))
+                }
+            finally:
+                if own_session:
+                    session.close()
+            with self._lock:
+                self._budgets = budgets
+                self._synced_at = time.monotonic()
+
+    def _flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._pending_tokens = 0
+            budgets = {status.budget_id: status for status in self._budgets.values()}
+        if not pending:
+            return 0
+        now = datetime.now(UTC)
+        session = db_session.SessionLocal()
+        try:
+            for budget_id, (tokens, cost) in pending.items():
+                known = budgets.get(budget_id)
+                start = current_period_start(known.period, now) if known else None
+                if start is not None:
+                    session.execute(
+                        update(UsageBudget)
+                        .where(
+                            UsageBudget.id == budget_id,
+                            or_(
+                                UsageBudget.period_start.is_(None),
+                                UsageBudget.period_start < start,
+                            ),
+                        )
+                        .values(used_tokens=0, used_cost=0.0, period_start=start)
+                    )
+                session.execute(
+                    update(UsageBudget)
+                    .where(UsageBudget.id == budget_id)
+                    .values(
+                        used_tokens=UsageBudget.used_tokens + tokens,
+                        used_cost=UsageBudget.used_cost + cost,
+                    )
+                )
+            session.commit()
+        except Exception:
+            session.rollback()
+            # 写回失败时保留增量，下次写回时重试
+            with self._lock:
+                for budget_id, (tokens, cost) in pending.items():
+                    old_tokens, old_cost = self._pending.get(budget_id, (0, 0.0))
+                    self._pending[budget_id] = (old_tokens + tokens, old_cost + cost)
+                    self._pending_tokens += tokens
+            logger.exception("写回预算用量失败")
+            return 0
+        finally:
+            session.close()
+        # 已写回的增量并入快照，避免在下次重新加载前被漏算
+        with self._lock:
+            for key, status in self._budgets.items():
+                tokens, cost = pending.get(status.budget_id, (0, 0.0))
+                if tokens or cost:
+                    self._budgets[key] = replace(
+                        status,
+                        used_tokens=status.used_tokens + tokens,
+                        used_cost=status.used_cost + cost,
+                    )
+        return len(pending)
+
+    def flush(self) -> int:
+        """立即写回未提交的用量增量，返回涉及的预算数量。"""
+
+        with self._sync_lock:
+            return self._flush()
+
+    def _effective(
+        self, keys: Iterable[tuple[BudgetScope, int | None]]
+    ) -> list[BudgetStatus]:
+        statuses: list[BudgetStatus] = []
+        with self._lock:
+            for scope, target_id in keys:
+                if target_id is None:
+                    continue
+                status = self._budgets.get((scope, target_id))
+                if status is None:
+                    continue
+                tokens, cost = self._pending.get(status.budget_id, (0, 0.0))
+                statuses.append(
+                    replace(
+                        status,
+                        used_tokens=status.used_tokens + tokens,
+                        used_cost=status.used_cost + cost,
+                    )
+                )
+        return statuses
+
+    def check(
+        self,
+        db: Session | None,
+        *,
+        model_id: int | None = None,
+        owner_id: int | None = None,
+        estimate: BudgetEstimate | None = None,
+    ) -> None:
+        """预算不足时抛出 BudgetExceededError；未配置预算的对象不受限制。
+
+        传入 estimate 时检查剩余额度能否覆盖预估用量，否则只检查是否已用尽。
+        """
+
+        if not settings.BUDGET_ENFORCEMENT_ENABLED:
+            return
+        if self._stale():
+            self.sync(db)
+        keys = [(BudgetScope.MODEL, model_id), (BudgetScope.OWNER, owner_id)]
+        for status in self._effective(keys):
+            message = status.shortfall(estimate)
+            if message is not None:
+                raise BudgetExceededError(message, budget=status)
+
+    def record(
+        self,
+        *,
+        model: LLMModel | None,
+        prompt_tokens: int | None,
+        completion_tokens: int | None,
+        total_tokens: int | None = None,
+        owner_id: int | None = None,
+    ) -> None:
+        """累计一次上游调用的实际用量，达到写回阈值时批量写回。"""
+
+        if not settings.BUDGET_ENFORCEMENT_ENABLED:
+            return
+        prompt = int(prompt_tokens or 0)
+        completion = int(completion_tokens or 0)
+        tokens = int(total_tokens or prompt + completion)
+        if tokens <= 0:
+            return
+        cost = estimate_cost(model, prompt, completion) or 0.0
+        if self._stale():
+            self.sync()
+        keys = [
+            (BudgetScope.MODEL, model.id if model is not None else None),
+            (BudgetScope.OWNER, owner_id),
+        ]
+        with self._lock:
+            for scope, target_id in keys:
+                status = self._budgets.get((scope, target_id)) if target_id else None
+                if status is None:
+                    continue
+                old_tokens, old_cost = self._pending.get(status.budget_id, (0, 0.0))
+                self._pending[status.budget_id] = (old_tokens + tokens, old_cost + cost)
+                self._pending_tokens += tokens
+            flush_now = self._pending_tokens >= settings.BUDGET_FLUSH_TOKENS
+        if flush_now:
+            self.flush()
+
+    def record_usage_log(
+        self,
+        usage_log: LLMUsageLog,
+        *,
+        model: LLMModel | None,
+        owner_id: int | None = None,
+    ) -> None:
+        """按用量记录累计；命中缓存或与其他请求合并的调用未请求上游，不计入。"""
+
+        if usage_log.cache_hit or usage_log.coalesced:
+            return
+        self.record(
+            model=model,
+            prompt_tokens=usage_log.prompt_tokens,
+            completion_tokens=usage_log.completion_tokens,
+            total_tokens=usage_log.total_tokens,
+            owner_id=owner_id,
+        )
+
+    def statuses(self, db: Session) -> list[BudgetStatus]:
+        """返回全部预算的最新用量，供用量看板展示剩余额度。"""
+
+        self.sync(db)
+        with self._lock:
+            keys = list(self._budgets)
+        return self._effective(keys)
+
+
+budget_tracker = BudgetTracker()
+
+
+__all__ = [
+    "BudgetEstimate",
+    "BudgetExceededError",
+    "BudgetStatus",
+    "BudgetTracker",
+    "budget_tracker",
+    "current_period_start",
+    "estimate_cost",
+    "estimate_payloads",
+]
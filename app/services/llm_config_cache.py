@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import Any, TypeVar
+
+from sqlalchemy import event, inspect, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.config import settings
+from app.models.config_version import ConfigVersion
+from app.models.llm_provider import LLMModel, LLMProvider
+
+logger = logging.getLogger("promptworks.llm_config_cache")
+
+LLM_CONFIG_VERSION_NAME = "llm_config"
+_CONFIG_TYPES = (LLMProvider, LLMModel)
+_MAX_ENTRIES = 1024
+_DIRTY_FLAG = "llm_config_dirty"
+
+_T = TypeVar("_T")
+
+
+@dataclass(frozen=True, slots=True)
+class _Snapshot:
+    """提供者或模型的列值快照，不持有任何会话。"""
+
+    model: type[Any]
+    values: tuple[tuple[str, Any], ...]
+
+    @classmethod
+    def capture(cls, instance: Any) -> _Snapshot:
+        mapper = inspect(type(instance))
+        return cls(
+            model=type(instance),
+            values=tuple(
+                (attr.key, getattr(instance, attr.key)) for attr in mapper.column_attrs
+            ),
+        )
+
+    def materialize(self, db: Session) -> Any:
+        """把快照挂到会话上，会话中已有同主键对象时直接复用，不访问数据库。"""
+
+        values = dict(self.values)
+        key = inspect(self.model).identity_key_from_primary_key([values["id"]])
+        existing = db.identity_map.get(key)
+        if existing is not None:
+            return existing
+        instance = self.model(**values)
+        make_transient_to_detached(instance)
+        return db.merge(instance, load=False)
+
+
+def _freeze(result: Any) -> Any:
+    if isinstance(result, _CONFIG_TYPES):
+        return _Snapshot.capture(result)
+    if isinstance(result, tuple):
+        return tuple(_freeze(item) for item in result)
+    return result
+
+
+def _thaw(db: Session, frozen: Any) -> Any:
+    if isinstance(frozen, _Snapshot):
+        return frozen.materialize(db)
+    if isinstance(frozen, tuple):
+        return tuple(_thaw(db, item) for item in frozen)
+    return frozen
+
+
+class LLMConfigCache:
+    """进程内的提供者/模型解析结果缓存。
+
+    解析结果以列值快照保存，命中时直接挂到调用方会话上，无需查询数据库。
+    提供者或模型的写入在 flush 时递增数据库中的配置版本号并清空本进程缓存；
+    其他进程每隔 ``LLM_CONFIG_CACHE_CHECK_SECONDS`` 读取一次版本号，发现变化后丢弃旧条目。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: dict[Hashable, Any] = {}
+        self._version: int | None = None
+        self._checked_at = 0.0
+        # 每次失效递增，避免失效前开始的加载把旧结果写回缓存
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, db: Session, key: Hashable, loader: Callable[[], _T]) -> _T:
+        """返回 key 对应的解析结果，未命中时调用 loader 并缓存其结果。
+
+        loader 抛出的异常不会被缓存。
+        """
+
+        if not settings.LLM_CONFIG_CACHE_ENABLED:
+            return loader()
+        self._ensure_current(db)
+        with self._lock:
+            frozen = self._entries.get(key)
+            generation = self._generation
+            if frozen is not None:
+                self.hits += 1
+        if frozen is not None:
+            return _thaw(db, frozen)
+
+        result = loader()
+        frozen = _freeze(result)
+        with self._lock:
+            self.misses += 1
+            if generation == self._generation:
+                if len(self._entries) >= _MAX_ENTRIES:
+                    self._entries.clear()
+                self._entries[key] = frozen
+        return result
+
+    def invalidate(self) -> None:
+        """清空本进程缓存，下次访问时重新读取版本号。"""
+
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._version = None
+
+    def reset(self) -> None:
+        self.invalidate()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def _ensure_current(self, db: Session) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._version is not None
+                and now - self._checked_at < settings.LLM_CONFIG_CACHE_CHECK_SECONDS
+            ):
+                return
+        version = (
+            db.scalar(
+                select(ConfigVersion.version).where(
+                    ConfigVersion.name == LLM_CONFIG_VERSION_NAME
+                )
+            )
+            or 0
+        )
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    logger.info(
+                        "模型配置版本变化，清空本地缓存: %s -> %s",
+                        self._version,
+                        version,
+                    )
+                self._entries.clear()
+                self._generation += 1
+                self._version = version
+            self._checked_at = now
+
+
+def bump_config_version(connection: Connection) -> None:
+    """在当前事务内递增模型配置版本号。"""
+
+    result = connection.execute(
+        update(ConfigVersion)
+        .where(ConfigVersion.name == LLM_CONFIG_VERSION_NAME)
+        .values(version=ConfigVersion.version + 1)
+    )
+    if not result.rowcount:
+        connection.execute(
+            insert(ConfigVersion).values(name=LLM_CONFIG_VERSION_NAME, version=1)
+        )
+
+
+def _touches_config(session: Session) -> bool:
+    for instance in (*session.new, *session.deleted):
+        if isinstance(instance, _CONFIG_TYPES):
+            return True
+    return any(
+        isinstance(instance, _CONFIG_TYPES)
+        and session.is_modified(instance, include_collections=False)
+        for instance in session.dirty
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _on_after_flush(session: Session, _flush_context: Any) -> None:
+    if not _touches_config(session):
+        return
+    bump_config_version(session.connection())
+    session.info[_DIRTY_FLAG] = True
+    llm_config_cache.invalidate()
+
+
+@event.listens_for(Session, "after_commit")
+def _on_after_commit(session: Session) -> None:
+    # 提交前其他线程可能按旧数据重新填充了缓存，提交后再清空一次
+    if session.info.pop(_DIRTY_FLAG, False):
+        llm_config_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _on_after_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY_FLAG, None)
+
+
+llm_config_cache = LLMConfigCache()
+
+
+__all__ = [
+    "LLM_CONFIG_VERSION_NAME",
+    "LLMConfigCache",
+    "bump_config_version",
+    "llm_config_cache",
+]
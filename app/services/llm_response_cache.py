@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from enum import Enum
+from typing import Any
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.llm_single_flight import (
+    canonical_request_digest,
+    is_deterministic_payload,
+)
+from app.models.llm_cache import LLMResponseCacheEntry
+
+
+logger = logging.getLogger("promptworks.llm_response_cache")
+
+
+class CacheMode(str, Enum):
+    """缓存模式：read 命中即返回并回填未命中，write 只刷新缓存，bypass 完全不使用。"""
+
+    READ = "read"
+    WRITE = "write"
+    BYPASS = "bypass"
+
+
+def resolve_cache_mode(*candidates: Any) -> CacheMode:
+    """按优先级取第一个有效的缓存模式，均未配置时使用全局默认值。"""
+
+    for candidate in candidates:
+        if isinstance(candidate, CacheMode):
+            return candidate
+        if isinstance(candidate, str):
+            try:
+                return CacheMode(candidate.strip().lower())
+            except ValueError:
+                logger.warning("忽略无效的缓存模式: %s", candidate)
+    try:
+        return CacheMode(settings.LLM_CACHE_DEFAULT_MODE)
+    except ValueError:
+        return CacheMode.BYPASS
+
+
+def build_cache_key(base_url: str, payload: Mapping[str, Any]) -> str:
+    """缓存键与单飞合并使用同一请求指纹。"""
+
+    return canonical_request_digest(base_url, payload)
+
+
+@dataclass(slots=True)
+class CachedResponse:
+    key: str
+    body: dict[str, Any]
+    latency_ms: int | None
+
+
+class _MemoryLRU:
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._items: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedResponse | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, cached = item
+            if expires_at <= time.monotonic():
+                self._items.pop(key, None)
+                return None
+            self._items.move_to_end(key)
+            return cached
+
+    def put(self, cached: CachedResponse) -> None:
+        if self._max_entries <= 0:
+            return
+        with self._lock:
+            self._items[cached.key] = (time.monotonic() + self._ttl, cached)
+            self._items.move_to_end(cached.key)
+            while len(self._items) > self._max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+@dataclass(slots=True)
+class _PendingWrite:
+    cached: CachedResponse
+    model_name: str
+
+
+class LLMResponseCache:
+    """两级响应缓存：进程内 LRU 加数据库持久层，持久层按 TTL 与总大小淘汰。"""
+
+    def __init__(
+        self,
+        *,
+        memory_max_entries: int | None = None,
+        ttl_seconds: float | None = None,
+        db_max_bytes: int | None = None,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds or settings.LLM_CACHE_TTL_SECONDS
+        self.db_max_bytes = db_max_bytes or settings.LLM_CACHE_DB_MAX_BYTES
+        self.memory = _MemoryLRU(
+            settings.LLM_CACHE_MEMORY_MAX_ENTRIES
+            if memory_max_entries is None
+            else memory_max_entries,
+            self.ttl_seconds,
+        )
+
+    def get(self, db: Session | None, key: str) -> CachedResponse | None:
+        cached = self.memory.get(key)
+        if cached is not None or db is None:
+            return cached
+
+        now = datetime.now(UTC)
+        entry = db.scalar(
+            select(LLMResponseCacheEntry).where(
+                LLMResponseCacheEntry.cache_key == key,
+                LLMResponseCacheEntry.expires_at > now,
+            )
+        )
+        if entry is None:
+            return None
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_hit_at = now
+        cached = CachedResponse(
+            key=key, body=dict(entry.response), latency_ms=entry.latency_ms
+        )
+        self.memory.put(cached)
+        return cached
+
+    def put_many(self, db: Session | None, writes: list[_PendingWrite]) -> None:
+        for item in writes:
+            self.memory.put(item.cached)
+        if db is None or not writes:
+            return
+
+        now = datetime.now(UTC)
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+        # 同一批次内相同键只保留最后一次写入，避免唯一约束冲突
+        latest = {item.cached.key: item for item in writes}
+        for item in latest.values():
+            body = item.cached.body
+            size = len(json.dumps(body, ensure_ascii=False, default=str).encode("utf-8"))
+            entry = db.scalar(
+                select(LLMResponseCacheEntry).where(
+                    LLMResponseCacheEntry.cache_key == item.cached.key
+                )
+            )
+            if entry is None:
+                entry = LLMResponseCacheEntry(cache_key=item.cached.key, hit_count=0)
+                db.add(entry)
+            entry.model_name = item.model_name
+            entry.response = body
+            entry.latency_ms = item.cached.latency_ms
+            entry.size_bytes = size
+            entry.expires_at = expires_at
+        db.flush()
+        self.evict(db)
+
+    def evict(self, db: Session) -> int:
+        """删除过期条目，并在总大小超限时按最近使用时间淘汰。"""
+
+        removed = db.execute(
+            delete(LLMResponseCacheEntry).where(
+                LLMResponseCacheEntry.expires_at <= datetime.now(UTC)
+            )
+        ).rowcount or 0
+
+        total = db.scalar(select(func.sum(LLMResponseCacheEntry.size_bytes))) or 0
+        if total <= self.db_max_bytes:
+            return removed
+
+        stale_ids: list[int] = []
+        rows = db.execute(
+            select(LLMResponseCacheEntry.id, LLMResponseCacheEntry.size_bytes).order_by(
+                func.coalesce(
+                    LLMResponseCacheEntry.last_hit_at, LLMResponseCacheEntry.created_at
+                ),
+                LLMResponseCacheEntry.id,
+            )
+        )
+        for entry_id, size in rows:
+            if total <= self.db_max_bytes:
+                break
+            stale_ids.append(entry_id)
+            total -= size or 0
+        if stale_ids:
+            db.execute(
+                delete(LLMResponseCacheEntry).where(
+                    LLMResponseCacheEntry.id.in_(stale_ids)
+                )
+            )
+            logger.info("LLM 响应缓存超出容量，淘汰 %s 条记录", len(stale_ids))
+        return removed + len(stale_ids)
+
+    def scope(self, db: Session | None, mode: CacheMode) -> "ResponseCacheScope":
+        return ResponseCacheScope(self, db, mode)
+
+
+class ResponseCacheScope:
+    """单次运行内的缓存会话：查询需在持有数据库会话的线程中调用，写入可跨线程暂存。"""
+
+    def __init__(
+        self, cache: LLMResponseCache, db: Session | None, mode: CacheMode
+    ) -> None:
+        self.cache = cache
+        self.db = db
+        self.mode = mode
+        self.hits = 0
+        self._pending: list[_PendingWrite] = []
+        self._lock = threading.Lock()
+
+    def key_for(self, base_url: str, payload: Mapping[str, Any]) -> str | None:
+        """返回可缓存请求的缓存键，不可缓存时返回 None。"""
+
+        if self.mode is CacheMode.BYPASS:
+            return None
+        if settings.LLM_CACHE_DETERMINISTIC_ONLY and not is_deterministic_payload(
+            payload
+        ):
+            return None
+        return build_cache_key(base_url, payload)
+
+    def lookup(self, key: str | None) -> CachedResponse | None:
+        if key is None or self.mode is not CacheMode.READ:
+            return None
+        cached = self.cache.get(self.db, key)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+        return cached
+
+    def store(
+        self,
+        key: str | None,
+        *,
+        model_name: str,
+        body: Mapping[str, Any],
+        latency_ms: int | None,
+    ) -> None:
+        if key is None or self.mode is CacheMode.BYPASS:
+            return
+        cached = CachedResponse(key=key, body=dict(body), latency_ms=latency_ms)
+        self.cache.memory.put(cached)
+        with self._lock:
+            self._pending.append(_PendingWrite(cached=cached, model_name=model_name))
+
+    def flush(self) -> None:
+        """将暂存的写入落库，需在持有数据库会话的线程中调用。"""
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            self.cache.put_many(self.db, pending)
+        except Exception:  # pragma: no cover - 缓存失败不影响主流程
+            logger.exception("写入 LLM 响应缓存失败")
+
+
+llm_response_cache = LLMResponseCache()
+
+
+__all__ = [
+    "CacheMode",
+    "CachedResponse",
+    "LLMResponseCache",
+    "ResponseCacheScope",
+    "build_cache_key",
+    "is_deterministic_payload",
+    "llm_response_cache",
+    "resolve_cache_mode",
+]
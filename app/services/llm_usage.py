@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+from collections.abc import Mapping
+from typing import Any
+
 from sqlalchemy import select
 from sqlalchemy.orm import Session, selectinload
 
@@ -20,4 +23,41 @@ def list_quick_test_usage_logs(
     return list(db.scalars(stmt))
 
 
-__all__ = ["list_quick_test_usage_logs"]
+def apply_hedge_outcome(
+    usage_log: LLMUsageLog,
+    hedge: Mapping[str, Any] | None,
+    *,
+    provider_id: int | None = None,
+    model_id: int | None = None,
+    model_name: str | None = None,
+) -> LLMUsageLog | None:
+    """标记发出了对冲请求的调用记录，并返回落败一路的用量记录。
+
+    hedge 为 ``HedgeOutcome.summary()`` 的结果。落败记录沿用胜出记录的上下文，
+    目标不同时通过 provider_id/model_id/model_name 指定；未发出对冲请求时返回 None。
+    """
+
+    if not hedge:
+        return None
+    usage_log.hedge_role = hedge.get("role")
+    usage_log.hedge_won = True
+    return LLMUsageLog(
+        provider_id=provider_id if provider_id is not None else usage_log.provider_id,
+        model_id=model_id if model_id is not None else usage_log.model_id,
+        model_name=model_name or usage_log.model_name,
+        source=usage_log.source,
+        prompt_id=usage_log.prompt_id,
+        prompt_version_id=usage_log.prompt_version_id,
+        messages=usage_log.messages,
+        parameters=usage_log.parameters,
+        temperature=usage_log.temperature,
+        latency_ms=hedge.get("loser_latency_ms"),
+        prompt_tokens=hedge.get("loser_prompt_tokens"),
+        completion_tokens=hedge.get("loser_completion_tokens"),
+        total_tokens=hedge.get("loser_total_tokens"),
+        hedge_role=hedge.get("loser_role"),
+        hedge_won=False,
+    )
+
+
+__all__ = ["apply_hedge_outcome", "list_quick_test_usage_logs"]
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from functools import lru_cache
+from string import Formatter
+from typing import Any
+
+
+RUN_INDEX_TOKEN = "{{run_index}}"
+# 编译后替换 {{run_index}} 的字段名，避免与用户变量冲突
+_RUN_INDEX_FIELD = "__pw_run_index__"
+_CACHE_SIZE = 2048
+_FORMATTER = Formatter()
+
+
+class TemplateRenderError(ValueError):
+    """模板渲染失败，missing 为上下文中缺少的变量。"""
+
+    def __init__(self, message: str, *, missing: tuple[str, ...] = ()) -> None:
+        super().__init__(message)
+        self.missing = missing
+
+
+def _root_name(field_name: str) -> str:
+    for index, char in enumerate(field_name):
+        if char in ".[":
+            return field_name[:index]
+    return field_name
+
+
+def _collect_fields(source: str, names: list[str]) -> bool:
+    """按出现顺序收集变量名，模板不是合法的具名占位符格式时返回 False。"""
+
+    try:
+        parsed = list(_FORMATTER.parse(source))
+    except ValueError:
+        return False
+    for _, field_name, format_spec, _ in parsed:
+        if field_name is None:
+            continue
+        root = _root_name(field_name)
+        if not root.isidentifier():
+            return False
+        if root not in names:
+            names.append(root)
+        if format_spec and not _collect_fields(format_spec, names):
+            return False
+    return True
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledTemplate:
+    """解析后的 Prompt 模板。
+
+    语法与 ``str.format`` 一致，另支持 ``{{run_index}}`` 占位符；包含非法占位符
+    （例如示例 JSON 中的花括号）的文本按纯文本处理，只替换 ``{{run_index}}``。
+    """
+
+    source: str
+    variables: tuple[str, ...]
+    is_literal: bool
+    _chunks: tuple[str, ...]
+    _format: str | None
+
+    def missing(self, context: Mapping[str, Any]) -> tuple[str, ...]:
+        """返回上下文中缺少的变量，run_index 由渲染时提供。"""
+
+        return tuple(
+            name
+            for name in self.variables
+            if name != "run_index" and name not in context
+        )
+
+    def render_literal(self, run_index: int) -> str:
+        """只替换 ``{{run_index}}``，不解析其他占位符。"""
+
+        if len(self._chunks) == 1:
+            return self.source
+        return str(run_index).join(self._chunks)
+
+    def render(
+        self,
+        context: Mapping[str, Any],
+        *,
+        run_index: int,
+        strict: bool = True,
+    ) -> str:
+        """用上下文渲染模板。
+
+        strict 为 False 时，缺少变量或格式化失败会回退为 ``render_literal``
+        的结果；否则抛出 TemplateRenderError。
+        """
+
+        if self._format is None:
+            return self.render_literal(run_index)
+        values = dict(context)
+        values.setdefault("run_index", run_index)
+        values[_RUN_INDEX_FIELD] = run_index
+        try:
+            return self._format.format_map(values)
+        except Exception as exc:
+            if not strict:
+                return self.render_literal(run_index)
+            missing = self.missing(values)
+            if missing:
+                raise TemplateRenderError(
+                    f"缺少模板变量: {', '.join(missing)}", missing=missing
+                ) from exc
+            raise TemplateRenderError(f"模板渲染失败: {exc}") from exc
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def compile_template(source: str) -> CompiledTemplate:
+    """解析模板并缓存结果，相同内容的模板只解析一次。"""
+
+    chunks = tuple(source.split(RUN_INDEX_TOKEN))
+    names: list[str] = []
+    if not all(_collect_fields(chunk, names) for chunk in chunks):
+        return CompiledTemplate(
+            source=source, variables=(), is_literal=True, _chunks=chunks, _format=None
+        )
+    return CompiledTemplate(
+        source=source,
+        variables=tuple(names),
+        is_literal=not names,
+        _chunks=chunks,
+        _format=f"{{{_RUN_INDEX_FIELD}}}".join(chunks),
+    )
+
+
+def validate_contexts(
+    templates: Iterable[str | None], contexts: Iterable[Mapping[str, Any]]
+) -> dict[int, tuple[str, ...]]:
+    """检查每个上下文是否提供了模板所需的全部变量。
+
+    返回 {上下文序号(从 1 开始): 缺少的变量}，全部满足时返回空字典。
+    """
+
+    compiled = [compile_template(item) for item in templates if isinstance(item, str)]
+    problems: dict[int, tuple[str, ...]] = {}
+    for index, context in enumerate(contexts, start=1):
+        missing: list[str] = []
+        for template in compiled:
+            for name in template.missing(context):
+                if name not in missing:
+                    missing.append(name)
+        if missing:
+            problems[index] = tuple(missing)
+    return problems
+
+
+__all__ = [
+    "RUN_INDEX_TOKEN",
+    "CompiledTemplate",
+    "TemplateRenderError",
+    "compile_template",
+    "validate_contexts",
+]
@@ -1,28 +1,58 @@
 from __future__ import annotations
 
-import random
-import statistics
-import time
-from collections.abc import Mapping, Sequence
+import asyncio
+from collections.abc import Coroutine, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime
-from typing import Any
+from typing import Any, TypeVar
 
 import httpx
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
+from app.core.cancellation import CancellationToken, cancellation_registry
+from app.core.llm_circuit_breaker import CircuitOpenError
+from app.core.llm_gateway import LLMCallRequest, LLMCallResult, acall_llm
+from app.core.llm_hedging import HEDGE_ROLE_BACKUP, HedgePolicy
+from app.core.llm_http_client import llm_client_registry
 from app.core.llm_provider_registry import get_provider_defaults
+from app.core.llm_rate_limiter import (
+    LimitConfig,
+    RateLimitTimeout,
+    estimate_payload_tokens,
+)
+from app.core.llm_retry import RetryBudget, RetryPolicy
+from app.core.llm_timeouts import Deadline, DeadlineExceeded, TimeoutConfig
 from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.prompt import PromptVersion
 from app.models.prompt_test import (
     PromptTestExperiment,
     PromptTestExperimentStatus,
+    PromptTestRound,
+    PromptTestTask,
     PromptTestUnit,
 )
 from app.models.usage import LLMUsageLog
+from app.services.budget import (
+    BudgetEstimate,
+    BudgetExceededError,
+    budget_tracker,
+    estimate_payloads,
+)
+from app.services.llm_config_cache import llm_config_cache
+from app.services.llm_response_cache import (
+    ResponseCacheScope,
+    llm_response_cache,
+    resolve_cache_mode,
+)
+from app.services.llm_usage import apply_hedge_outcome
+from app.services.prompt_template import compile_template, validate_contexts
+from app.services.run_metrics import RunMetricsAggregator, cancellation_summary
+from app.services.usage_log_writer import usage_log_writer
 from app.services.test_run import (
-    DEFAULT_TEST_TIMEOUT,
-    REQUEST_SLEEP_RANGE,
+    DEFAULT_CONCURRENCY_LIMIT,
     _format_error_detail,
+    _resolve_failover,
     _try_parse_json,
 )
 
@@ -45,6 +75,11 @@ _KNOWN_PARAMETER_KEYS = {
 
 _NESTED_PARAMETER_KEYS = {"llm_parameters", "model_parameters", "parameters"}
 
+_T = TypeVar("_T")
+
+# 取消登记表中实验的类型名，执行方按该键登记取消标记
+PROMPT_TEST_EXPERIMENT_KIND = "prompt_test_experiment"
+
 
 class PromptTestExecutionError(Exception):
     """执行 Prompt 测试实验时抛出的业务异常。"""
@@ -57,14 +92,51 @@ class PromptTestExecutionError(Exception):
 
 
 def execute_prompt_test_experiment(
-    db: Session, experiment: PromptTestExperiment
+    db: Session,
+    experiment: PromptTestExperiment,
+    *,
+    resume: bool = False,
+    cancel_token: CancellationToken | None = None,
 ) -> PromptTestExperiment:
     """执行单个最小测试单元的实验，并存储结果。"""
 
-    if experiment.status not in {
-        PromptTestExperimentStatus.PENDING,
-        PromptTestExperimentStatus.RUNNING,
-    }:
+    return _run_coroutine_sync(
+        execute_prompt_test_experiment_async(
+            db, experiment, resume=resume, cancel_token=cancel_token
+        )
+    )
+
+
+async def execute_prompt_test_experiment_async(
+    db: Session,
+    experiment: PromptTestExperiment,
+    *,
+    resume: bool = False,
+    cancel_token: CancellationToken | None = None,
+) -> PromptTestExperiment:
+    """在事件循环中并发执行实验的全部轮次，并按 run_index 顺序写回结果。
+
+    每轮完成后立即提交检查点与用量记录。处于 RUNNING 的实验总是从已有
+    检查点续跑；resume=True 时 FAILED 与 CANCELLED 的实验也会续跑，已完成
+    的轮次不再调用模型。
+
+    cancel_token 被触发或实验在数据库中被标记为取消时，停止调度新轮次并
+    取消在途请求，已完成的轮次照常保留，实验以 CANCELLED 状态结束。未传入
+    cancel_token 时使用执行方在取消登记表中为该实验登记的标记。
+
+    模型与任务 owner 的预算在执行前与每轮检查点后检查，用尽时同样取消在途
+    请求，实验以 FAILED 状态结束。
+
+    deadline_seconds 选项为实验设置截止时间，各轮超时按剩余时间收紧，来不及
+    完成的轮次不再发出，实验以 FAILED 状态结束并在 metrics 中记录超时统计。
+    """
+
+    runnable = {PromptTestExperimentStatus.PENDING, PromptTestExperimentStatus.RUNNING}
+    if resume:
+        runnable.update(
+            {PromptTestExperimentStatus.FAILED, PromptTestExperimentStatus.CANCELLED}
+        )
+    if experiment.status not in runnable:
         return experiment
 
     unit = experiment.unit
@@ -72,27 +144,63 @@ def execute_prompt_test_experiment(
         raise PromptTestExecutionError("实验缺少关联的测试单元。")
 
     provider, model = _resolve_provider_and_model(db, unit)
+    failover = _resolve_failover(db, model)
+    model_id = model.id if model else None
+    owner_id = unit.task.owner_id if unit.task else None
+    try:
+        budget_tracker.check(db, model_id=model_id, owner_id=owner_id)
+    except BudgetExceededError as exc:
+        raise PromptTestExecutionError(str(exc), status_code=429) from exc
     prompt_snapshot = _resolve_prompt_snapshot(unit)
     parameters = _collect_parameters(unit)
     context_template = unit.variables or {}
 
-    experiment.status = PromptTestExperimentStatus.RUNNING
-    experiment.started_at = datetime.now(UTC)
-    experiment.error = None
-    db.flush()
-
-    run_records: list[dict[str, Any]] = []
-    latencies: list[int] = []
-    token_totals: list[int] = []
-    json_success = 0
-
     rounds_per_case = max(1, int(unit.rounds or 1))
     case_count = _count_variable_cases(context_template)
     total_runs = rounds_per_case * max(case_count, 1)
+    _check_template_variables(unit, prompt_snapshot, context_template, case_count)
+    checkpoints = _load_checkpoints(db, experiment, total_runs)
 
-    for run_index in range(1, total_runs + 1):
-        try:
-            run_record = _execute_single_round(
+    experiment.status = PromptTestExperimentStatus.RUNNING
+    if not checkpoints or experiment.started_at is None:
+        experiment.started_at = datetime.now(UTC)
+    experiment.error = None
+    experiment.finished_at = None
+    db.flush()
+
+    concurrency_limit = DEFAULT_CONCURRENCY_LIMIT
+    if model and isinstance(model.concurrency_limit, int):
+        concurrency_limit = max(1, model.concurrency_limit)
+    semaphore = asyncio.Semaphore(max(1, min(concurrency_limit, total_runs)))
+    retry_budget = RetryBudget()
+    task_config = getattr(unit.task, "config", None) if unit.task else None
+    cache_scope = llm_response_cache.scope(
+        db,
+        resolve_cache_mode(
+            (unit.extra or {}).get("cache") if isinstance(unit.extra, Mapping) else None,
+            task_config.get("cache") if isinstance(task_config, Mapping) else None,
+        ),
+    )
+    stream_rounds = _resolve_stream_flag(unit.extra, task_config)
+    hedge_policy = HedgePolicy.from_option(
+        _resolve_option("hedge", unit.extra, task_config)
+    )
+    deadline = Deadline.from_option(
+        _resolve_option("deadline_seconds", unit.extra, task_config)
+    )
+    token = (
+        cancel_token
+        or cancellation_registry.get(PROMPT_TEST_EXPERIMENT_KIND, experiment.id)
+        or CancellationToken()
+    )
+    started_rounds: set[int] = set()
+
+    async def _run_bounded(run_index: int) -> dict[str, Any]:
+        async with semaphore:
+            if deadline is not None:
+                deadline.ensure_room()
+            started_rounds.add(run_index)
+            return await _execute_single_round(
                 provider=provider,
                 model=model,
                 unit=unit,
@@ -100,69 +208,310 @@ def execute_prompt_test_experiment(
                 base_parameters=parameters,
                 context_template=context_template,
                 run_index=run_index,
+                retry_budget=retry_budget,
+                cache_scope=cache_scope,
+                stream=stream_rounds,
+                hedge=hedge_policy,
+                deadline=deadline,
+                failover=failover,
             )
-        except PromptTestExecutionError as exc:
-            experiment.status = PromptTestExperimentStatus.FAILED
-            experiment.error = str(exc)
-            experiment.finished_at = datetime.now(UTC)
-            db.flush()
-            return experiment
-
-        run_records.append(run_record)
+
+    completed: dict[int, dict[str, Any]] = {}
+    aggregator = RunMetricsAggregator()
+    for run_index, run_record in sorted(checkpoints.items()):
+        completed[run_index] = run_record
+        _add_round_metrics(aggregator, run_record)
+
+    tasks = [
+        asyncio.create_task(_run_bounded(run_index))
+        for run_index in range(1, total_runs + 1)
+        if run_index not in completed
+    ]
+    loop = asyncio.get_running_loop()
+
+    def _abort_pending() -> None:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    # 取消可能来自其他线程，统一切回事件循环线程取消在途轮次
+    unregister = token.add_callback(lambda: loop.call_soon_threadsafe(_abort_pending))
+
+    def _checkpoint(run_record: dict[str, Any]) -> None:
+        completed[int(run_record["run_index"])] = run_record
+        _add_round_metrics(aggregator, run_record)
+        if deadline is not None and not run_record.get("cache_hit"):
+            deadline.observe(float(run_record.get("latency_ms") or 0) / 1000)
+        target_provider, target_model = provider, model
+        if run_record.get("failed_over") and failover is not None:
+            target_provider, target_model = failover
         usage_log = _build_usage_log(
-            provider=provider,
-            model=model,
+            provider=target_provider,
+            model=target_model,
             unit=unit,
             run_record=run_record,
         )
-        db.add(usage_log)
-        latency = run_record.get("latency_ms")
-        if isinstance(latency, (int, float)):
-            latencies.append(int(latency))
-        tokens = run_record.get("total_tokens")
-        if isinstance(tokens, (int, float)):
-            token_totals.append(int(tokens))
-        if run_record.get("parsed_output") is not None:
-            json_success += 1
+        usage_logs = [usage_log]
+        loser_log = apply_hedge_outcome(usage_log, run_record.get("hedge"))
+        if loser_log is not None:
+            usage_logs.append(loser_log)
+        _checkpoint_round(db, experiment, run_record, usage_logs=usage_logs)
+        for item in usage_logs:
+            budget_tracker.record_usage_log(
+                item, model=target_model, owner_id=owner_id
+            )
+
+    failure: PromptTestExecutionError | None = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                run_record = await next_done
+            except DeadlineExceeded:
+                continue
+            except PromptTestExecutionError as exc:
+                failure = exc
+                break
+            except asyncio.CancelledError:
+                if not token.cancelled:
+                    raise
+                break
+            _checkpoint(run_record)
+            try:
+                budget_tracker.check(db, model_id=model_id, owner_id=owner_id)
+            except BudgetExceededError as exc:
+                failure = PromptTestExecutionError(str(exc), status_code=429)
+                break
+            if _cancel_requested(db, experiment):
+                token.cancel("实验已取消")
+    finally:
+        unregister()
+        _abort_pending()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        cache_scope.flush()
+
+    # 首个失败即停止等待，超时与跳过的轮次按全部已结束的任务统计
+    timed_out_rounds = 0
+    deadline_skipped = 0
+    for task in tasks:
+        if task.cancelled():
+            continue
+        exc = task.exception()
+        if isinstance(exc, DeadlineExceeded):
+            deadline_skipped += 1
+        elif isinstance(exc, PromptTestExecutionError) and isinstance(
+            exc.__cause__, httpx.TimeoutException
+        ):
+            timed_out_rounds += 1
+
+    if token.cancelled and failure is None:
+        # 与取消同时完成的轮次已经付费，照常落库
+        for task in tasks:
+            if task.cancelled() or task.exception() is not None:
+                continue
+            run_record = task.result()
+            if int(run_record["run_index"]) not in completed:
+                _checkpoint(run_record)
+
+    run_records = [completed[index] for index in sorted(completed)]
+    if deadline_skipped and failure is None and deadline is not None:
+        failure = PromptTestExecutionError(
+            str(DeadlineExceeded(deadline.seconds)), status_code=504
+        )
+
+    if token.cancelled and failure is None:
+        experiment.status = PromptTestExperimentStatus.CANCELLED
+        experiment.error = token.reason or "实验已取消"
+        experiment.outputs = run_records or None
+        experiment.metrics = aggregator.summary()
+        experiment.metrics["cancellation"] = cancellation_summary(
+            planned_rounds=total_runs,
+            completed_rounds=len(completed),
+            aborted_rounds=len(started_rounds - completed.keys()),
+            tokens_per_round=aggregator.avg_total_tokens
+            or estimate_payload_tokens(
+                {**parameters, "messages": [{"content": prompt_snapshot}]}
+            ),
+        )
+        experiment.finished_at = datetime.now(UTC)
+        db.flush()
+        return experiment
+
+    if failure is not None:
+        experiment.status = PromptTestExperimentStatus.FAILED
+        experiment.error = str(failure)
+        experiment.outputs = run_records or None
+        if timed_out_rounds or deadline_skipped:
+            experiment.metrics = aggregator.summary()
+            experiment.metrics["timeouts"] = {
+                "timed_out_rounds": timed_out_rounds,
+                "deadline_skipped_rounds": deadline_skipped,
+                "deadline_seconds": deadline.seconds if deadline else None,
+            }
+        experiment.finished_at = datetime.now(UTC)
+        db.flush()
+        return experiment
 
     experiment.outputs = run_records
-    experiment.metrics = _aggregate_metrics(
-        latencies=latencies,
-        tokens=token_totals,
-        total_rounds=len(run_records),
-        json_success=json_success,
-    )
+    experiment.metrics = aggregator.summary()
+    if checkpoints:
+        experiment.metrics["resumed_rounds"] = len(checkpoints)
+    if retry_budget.retries:
+        experiment.metrics["retry_count"] = retry_budget.retries
+        experiment.metrics["retry_backoff_ms"] = int(retry_budget.backoff_ms)
+    if cache_scope.hits:
+        experiment.metrics["cache_hits"] = cache_scope.hits
+    pacing_delays = [
+        int(record["pacing_delay_ms"])
+        for record in run_records
+        if record.get("pacing_delay_ms")
+    ]
+    if pacing_delays:
+        experiment.metrics["paced_rounds"] = len(pacing_delays)
+        experiment.metrics["pacing_delay_ms"] = sum(pacing_delays)
+    hedges = [record["hedge"] for record in run_records if record.get("hedge")]
+    if hedges:
+        experiment.metrics["hedged_rounds"] = len(hedges)
+        experiment.metrics["hedge_backup_wins"] = sum(
+            1 for item in hedges if item.get("role") == HEDGE_ROLE_BACKUP
+        )
+    failover_rounds = sum(1 for record in run_records if record.get("failed_over"))
+    if failover is not None and failover_rounds:
+        experiment.metrics["failover"] = {
+            "model_id": failover[1].id,
+            "rounds": failover_rounds,
+        }
     experiment.status = PromptTestExperimentStatus.COMPLETED
     experiment.finished_at = datetime.now(UTC)
     db.flush()
     return experiment
 
 
+def _run_coroutine_sync(coro: Coroutine[Any, Any, _T]) -> _T:
+    """在同步上下文中驱动协程，并在事件循环退出前释放其专属连接。"""
+
+    async def _runner() -> _T:
+        try:
+            return await coro
+        finally:
+            await llm_client_registry.aclose_current_loop()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_runner())
+
+    # 已处于事件循环中时不能嵌套 asyncio.run，改由独立线程驱动
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, _runner()).result()
+
+
+def preflight_prompt_test_task(
+    db: Session,
+    task: PromptTestTask,
+    units: Sequence[PromptTestUnit] | None = None,
+) -> BudgetEstimate:
+    """按渲染后的请求体预估测试任务全部单元的用量并检查预算。
+
+    各模型按其单元的预估分别检查，任务 owner 按总量检查，预算不足时抛出
+    BudgetExceededError。找不到模型配置的单元留给执行阶段报告，不计入预估。
+    """
+
+    per_model: dict[int | None, BudgetEstimate] = {}
+    for unit in units if units is not None else task.units:
+        try:
+            _, model = _resolve_provider_and_model(db, unit)
+        except PromptTestExecutionError:
+            continue
+        prompt_snapshot = _resolve_prompt_snapshot(unit)
+        if not prompt_snapshot and unit.prompt_version_id is not None:
+            # 尚未入库的单元不会加载关联的 Prompt 版本
+            version = db.get(PromptVersion, unit.prompt_version_id)
+            prompt_snapshot = version.content if version else ""
+        parameters = _collect_parameters(unit)
+        context_template = unit.variables or {}
+        total_runs = max(1, int(unit.rounds or 1)) * max(
+            _count_variable_cases(context_template), 1
+        )
+        payloads = (
+            {
+                "model": model.name if model else unit.model_name,
+                "messages": _build_messages(
+                    unit,
+                    prompt_snapshot,
+                    _resolve_context(context_template, run_index),
+                    run_index,
+                ),
+                **parameters,
+            }
+            for run_index in range(1, total_runs + 1)
+        )
+        model_id = model.id if model else None
+        estimate = estimate_payloads(model, payloads)
+        per_model[model_id] = per_model.get(model_id, BudgetEstimate()) + estimate
+
+    total = BudgetEstimate()
+    for model_id, estimate in per_model.items():
+        budget_tracker.check(db, model_id=model_id, estimate=estimate)
+        total += estimate
+    budget_tracker.check(db, owner_id=task.owner_id, estimate=total)
+    return total
+
+
 def _resolve_provider_and_model(
     db: Session, unit: PromptTestUnit
+) -> tuple[LLMProvider, LLMModel | None]:
+    provider_id = unit.llm_provider_id
+    if not isinstance(provider_id, int):
+        provider_id = None
+    extra_data = unit.extra if isinstance(unit.extra, Mapping) else {}
+    provider_key = extra_data.get("provider_key")
+    if not isinstance(provider_key, str):
+        provider_key = None
+    model_id = extra_data.get("llm_model_id")
+    if not isinstance(model_id, int):
+        model_id = None
+
+    key = ("prompt_test", provider_id, provider_key, model_id, unit.model_name)
+    return llm_config_cache.resolve(
+        db,
+        key,
+        lambda: _lookup_provider_and_model(
+            db,
+            provider_id=provider_id,
+            provider_key=provider_key,
+            model_id=model_id,
+            model_name=unit.model_name,
+        ),
+    )
+
+
+def _lookup_provider_and_model(
+    db: Session,
+    *,
+    provider_id: int | None,
+    provider_key: str | None,
+    model_id: int | None,
+    model_name: str,
 ) -> tuple[LLMProvider, LLMModel | None]:
     provider: LLMProvider | None = None
     model: LLMModel | None = None
 
-    if isinstance(unit.llm_provider_id, int):
-        provider = db.get(LLMProvider, unit.llm_provider_id)
+    if provider_id is not None:
+        provider = db.get(LLMProvider, provider_id)
 
-    extra_data = unit.extra if isinstance(unit.extra, Mapping) else {}
-    provider_key = extra_data.get("provider_key")
-    if provider is None and isinstance(provider_key, str):
+    if provider is None and provider_key is not None:
         provider = db.scalar(
             select(LLMProvider).where(LLMProvider.provider_key == provider_key)
         )
 
-    model_id = extra_data.get("llm_model_id")
-    if provider and isinstance(model_id, int):
+    if provider and model_id is not None:
         model = db.get(LLMModel, model_id)
 
     if provider is None:
         stmt = (
             select(LLMProvider, LLMModel)
             .join(LLMModel, LLMModel.provider_id == LLMProvider.id)
-            .where(LLMModel.name == unit.model_name)
+            .where(LLMModel.name == model_name)
         )
         record = db.execute(stmt).first()
         if record:
@@ -170,7 +519,7 @@ def _resolve_provider_and_model(
 
     if provider is None:
         provider = db.scalar(
-            select(LLMProvider).where(LLMProvider.provider_name == unit.model_name)
+            select(LLMProvider).where(LLMProvider.provider_name == model_name)
         )
 
     if provider is None:
@@ -180,7 +529,7 @@ def _resolve_provider_and_model(
         model = db.scalar(
             select(LLMModel).where(
                 LLMModel.provider_id == provider.id,
-                LLMModel.name == unit.model_name,
+                LLMModel.name == model_name,
             )
         )
 
@@ -215,7 +564,7 @@ def _collect_parameters(unit: PromptTestUnit) -> dict[str, Any]:
     return params
 
 
-def _execute_single_round(
+async def _execute_single_round(
     *,
     provider: LLMProvider,
     model: LLMModel | None,
@@ -224,6 +573,12 @@ def _execute_single_round(
     base_parameters: Mapping[str, Any],
     context_template: Mapping[str, Any] | Sequence[Any],
     run_index: int,
+    retry_budget: RetryBudget | None = None,
+    cache_scope: ResponseCacheScope | None = None,
+    stream: bool = False,
+    hedge: HedgePolicy | None = None,
+    deadline: Deadline | None = None,
+    failover: tuple[LLMProvider, LLMModel] | None = None,
 ) -> dict[str, Any]:
     context = _resolve_context(context_template, run_index)
     messages = _build_messages(unit, prompt_snapshot, context, run_index)
@@ -238,54 +593,33 @@ def _execute_single_round(
     }
 
     base_url = _resolve_base_url(provider)
-    headers = {
-        "Authorization": f"Bearer {provider.api_key}",
-        "Content-Type": "application/json",
-    }
-
-    try:
-        sleep_lower, sleep_upper = REQUEST_SLEEP_RANGE
-        if sleep_upper > 0:
-            jitter = random.uniform(sleep_lower, sleep_upper)
-            if jitter > 0:
-                time.sleep(jitter)
-    except Exception:  # pragma: no cover - 容错兜底
-        pass
-
-    start_time = time.perf_counter()
-    try:
-        response = httpx.post(
-            f"{base_url}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=DEFAULT_TEST_TIMEOUT,
-        )
-    except httpx.HTTPError as exc:  # pragma: no cover - 网络异常兜底
-        raise PromptTestExecutionError(f"调用外部 LLM 失败: {exc}") from exc
-
-    if response.status_code >= 400:
-        try:
-            error_payload = response.json()
-        except ValueError:
-            error_payload = {"message": response.text}
-        detail = _format_error_detail(error_payload)
-        raise PromptTestExecutionError(
-            f"LLM 请求失败 (HTTP {response.status_code}): {detail}",
-            status_code=response.status_code,
+    cache_key = cache_scope.key_for(base_url, payload) if cache_scope else None
+    cached = cache_scope.lookup(cache_key) if cache_scope else None
+    if cached is not None:
+        payload_obj = cached.body
+        latency_ms = cached.latency_ms
+        call = None
+    else:
+        call, payload_obj = await _call_round(
+            provider=provider,
+            model=model,
+            base_url=base_url,
+            payload=payload,
+            retry_budget=retry_budget,
+            stream=stream,
+            hedge=hedge,
+            deadline=deadline,
+            failover=failover,
         )
-
-    try:
-        payload_obj = response.json()
-    except ValueError as exc:  # pragma: no cover - 响应解析异常
-        raise PromptTestExecutionError("LLM 响应解析失败。") from exc
-
-    elapsed = response.elapsed.total_seconds() * 1000 if response.elapsed else None
-    latency_ms = (
-        int(elapsed)
-        if elapsed is not None
-        else int((time.perf_counter() - start_time) * 1000)
-    )
-    latency_ms = max(latency_ms, 0)
+        latency_ms = call.latency_ms
+        # 故障转移得到的是等价模型的输出，不写入原模型的响应缓存
+        if cache_scope is not None and not call.coalesced and not call.failed_over:
+            cache_scope.store(
+                cache_key,
+                model_name=payload["model"],
+                body=payload_obj,
+                latency_ms=latency_ms,
+            )
 
     output_text = _extract_output(payload_obj)
     parsed_output = _try_parse_json(output_text)
@@ -305,10 +639,12 @@ def _execute_single_round(
         and completion_tokens is not None
     ):
         total_tokens = prompt_tokens + completion_tokens
+    if call is not None:
+        await call.arecord_usage(total_tokens)
 
     variables = _extract_variables(context)
 
-    return {
+    record = {
         "run_index": run_index,
         "messages": messages,
         "parameters": request_parameters or None,
@@ -319,7 +655,180 @@ def _execute_single_round(
         "completion_tokens": completion_tokens,
         "total_tokens": total_tokens,
         "latency_ms": latency_ms,
+        "retry_count": call.retry.retries if call else 0,
+        "retry_backoff_ms": int(call.retry.backoff_ms) if call else 0,
+        "cache_hit": call is None,
+        "coalesced": bool(call and call.coalesced),
+        "pacing_delay_ms": int(call.pacing_delay_ms) if call else 0,
+        "ttft_ms": round(call.ttft_ms, 2)
+        if call is not None and call.ttft_ms is not None
+        else None,
     }
+    if call is not None and call.hedge is not None:
+        record["hedge"] = call.hedge.summary()
+    if call is not None and call.failed_over:
+        record["failed_over"] = True
+    return record
+
+
+async def _call_round(
+    *,
+    provider: LLMProvider,
+    model: LLMModel | None,
+    base_url: str,
+    payload: dict[str, Any],
+    retry_budget: RetryBudget | None,
+    stream: bool = False,
+    hedge: HedgePolicy | None = None,
+    deadline: Deadline | None = None,
+    failover: tuple[LLMProvider, LLMModel] | None = None,
+) -> tuple[LLMCallResult, dict[str, Any]]:
+    failover_request: LLMCallRequest | None = None
+    if failover is not None:
+        # 目标模型熔断时由网关改发至等价模型，与测试任务的处理保持一致
+        failover_provider, failover_model = failover
+        failover_request = LLMCallRequest(
+            provider_id=failover_provider.id,
+            model_name=failover_model.name,
+            base_url=_resolve_base_url(failover_provider),
+            api_key=failover_provider.api_key,
+            payload={**payload, "model": failover_model.name},
+            limit_config=LimitConfig.for_model(failover_model),
+            timeout=TimeoutConfig.for_model(failover_model),
+            source="prompt_test",
+            stream=stream,
+            deadline=deadline,
+        )
+    request = LLMCallRequest(
+        provider_id=provider.id,
+        model_name=payload["model"],
+        base_url=base_url,
+        api_key=provider.api_key,
+        payload=payload,
+        limit_config=LimitConfig.for_model(model),
+        timeout=TimeoutConfig.for_model(model),
+        source="prompt_test",
+        stream=stream,
+        hedge=hedge,
+        deadline=deadline,
+        failover=failover_request,
+    )
+    try:
+        call = await acall_llm(
+            request,
+            retry_policy=RetryPolicy.from_settings(),
+            retry_budget=retry_budget,
+        )
+    except RateLimitTimeout as exc:
+        raise PromptTestExecutionError(str(exc), status_code=429) from exc
+    except CircuitOpenError as exc:
+        raise PromptTestExecutionError(str(exc), status_code=503) from exc
+    except httpx.TimeoutException as exc:
+        raise PromptTestExecutionError(
+            f"LLM 调用超时: {type(exc).__name__}", status_code=504
+        ) from exc
+    except httpx.HTTPError as exc:  # pragma: no cover - 网络异常兜底
+        raise PromptTestExecutionError(f"调用外部 LLM 失败: {exc}") from exc
+
+    response = call.response
+    if response.status_code >= 400:
+        try:
+            error_payload = response.json()
+        except ValueError:
+            error_payload = {"message": response.text}
+        detail = _format_error_detail(error_payload)
+        raise PromptTestExecutionError(
+            f"LLM 请求失败 (HTTP {response.status_code}): {detail}",
+            status_code=response.status_code,
+        )
+
+    try:
+        payload_obj = response.json()
+    except ValueError as exc:  # pragma: no cover - 响应解析异常
+        raise PromptTestExecutionError("LLM 响应解析失败。") from exc
+
+    return call, payload_obj
+
+
+def _cancel_requested(db: Session, experiment: PromptTestExperiment) -> bool:
+    """读取数据库中的实验状态，感知其他进程发起的取消。"""
+
+    current = db.scalar(
+        select(PromptTestExperiment.status).where(
+            PromptTestExperiment.id == experiment.id
+        )
+    )
+    return current == PromptTestExperimentStatus.CANCELLED
+
+
+def _load_checkpoints(
+    db: Session, experiment: PromptTestExperiment, total_runs: int
+) -> dict[int, dict[str, Any]]:
+    if experiment.id is None:
+        return {}
+    rounds = db.scalars(
+        select(PromptTestRound).where(
+            PromptTestRound.experiment_id == experiment.id,
+            PromptTestRound.run_index <= total_runs,
+        )
+    )
+    return {item.run_index: dict(item.record) for item in rounds}
+
+
+def _checkpoint_round(
+    db: Session,
+    experiment: PromptTestExperiment,
+    run_record: Mapping[str, Any],
+    *,
+    usage_logs: Sequence[LLMUsageLog],
+) -> None:
+    """单轮结果与用量记录一起提交，进程中断时已付费的轮次不会丢失。"""
+
+    db.add(
+        PromptTestRound(
+            experiment_id=experiment.id,
+            run_index=int(run_record["run_index"]),
+            record=dict(run_record),
+        )
+    )
+    usage_log_writer.write_many(db, usage_logs)
+    db.commit()
+
+
+def _add_round_metrics(
+    aggregator: RunMetricsAggregator, run_record: Mapping[str, Any]
+) -> None:
+    aggregator.add(
+        latency_ms=_numeric(run_record.get("latency_ms")),
+        total_tokens=_numeric(run_record.get("total_tokens")),
+        completion_tokens=_numeric(run_record.get("completion_tokens")),
+        ttft_ms=_numeric(run_record.get("ttft_ms")),
+        json_success=run_record.get("parsed_output") is not None,
+    )
+
+
+def _resolve_option(name: str, *sources: Any) -> Any:
+    """按顺序返回第一个提供了该选项的配置中的值。"""
+
+    for source in sources:
+        if isinstance(source, Mapping) and name in source:
+            return source[name]
+    return None
+
+
+def _resolve_stream_flag(*sources: Any) -> bool:
+    """单元 extra 优先于任务配置，决定各轮是否以流式方式调用以测量首字延迟。"""
+
+    for source in sources:
+        if isinstance(source, Mapping) and isinstance(source.get("stream"), bool):
+            return source["stream"]
+    return False
+
+
+def _numeric(value: Any) -> float | None:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
 
 
 def _resolve_context(
@@ -366,6 +875,41 @@ def _resolve_context(
     return context
 
 
+def _check_template_variables(
+    unit: PromptTestUnit,
+    prompt_snapshot: str,
+    context_template: Mapping[str, Any] | Sequence[Any],
+    case_count: int,
+) -> None:
+    """执行前按全部用例校验模板变量，缺少变量时不再把未渲染的模板发给模型。"""
+
+    templates: list[str | None] = [prompt_snapshot]
+    for item in _conversation(unit):
+        if isinstance(item, Mapping):
+            templates.append(item.get("content"))
+
+    problems: list[str] = []
+    for run_index in range(1, max(case_count, 1) + 1):
+        context = _resolve_context(context_template, run_index)
+        user_template = unit.prompt_template or context.get("user_prompt")
+        missing = validate_contexts([*templates, user_template], [context])
+        if missing:
+            problems.append(f"用例 {run_index} 缺少 {', '.join(missing[1])}")
+    if problems:
+        raise PromptTestExecutionError("模板变量校验失败：" + "；".join(problems))
+
+
+def _conversation(unit: PromptTestUnit) -> Sequence[Any]:
+    if not isinstance(unit.parameters, Mapping):
+        return ()
+    conversation = unit.parameters.get("conversation") or unit.parameters.get(
+        "messages"
+    )
+    if isinstance(conversation, Sequence) and not isinstance(conversation, str):
+        return conversation
+    return ()
+
+
 def _count_variable_cases(template: Mapping[str, Any] | Sequence[Any] | None) -> int:
     if isinstance(template, Mapping):
         cases = template.get("cases")
@@ -398,22 +942,15 @@ def _build_messages(
     context: Mapping[str, Any],
     run_index: int,
 ) -> list[dict[str, Any]]:
-    conversation: Any = None
-    if isinstance(unit.parameters, Mapping):
-        conversation = unit.parameters.get("conversation") or unit.parameters.get(
-            "messages"
-        )
-
     messages: list[dict[str, Any]] = []
-    if isinstance(conversation, Sequence):
-        for item in conversation:
-            if not isinstance(item, Mapping):
-                continue
-            role = str(item.get("role", "")).strip() or "user"
-            content = _format_text(item.get("content"), context, run_index)
-            if content is None:
-                continue
-            messages.append({"role": role, "content": content})
+    for item in _conversation(unit):
+        if not isinstance(item, Mapping):
+            continue
+        role = str(item.get("role", "")).strip() or "user"
+        content = _format_text(item.get("content"), context, run_index)
+        if content is None:
+            continue
+        messages.append({"role": role, "content": content})
 
     system_prompt = _format_text(prompt_snapshot, context, run_index)
     if system_prompt and not any(msg["role"] == "system" for msg in messages):
@@ -443,11 +980,10 @@ def _format_text(
         return None
     if not isinstance(template, str):
         return str(template)
-    try:
-        replaced = template.replace("{{run_index}}", str(run_index))
-        return replaced.format(**context)
-    except Exception:
-        return template.replace("{{run_index}}", str(run_index))
+    # 变量已在执行前校验，此处只兜底格式说明符与取值类型不匹配等情况
+    return compile_template(template).render(
+        context, run_index=run_index, strict=False
+    )
 
 
 def _extract_output(payload_obj: Mapping[str, Any]) -> str:
@@ -475,33 +1011,6 @@ def _safe_int(value: Any) -> int | None:
     return None
 
 
-def _aggregate_metrics(
-    *,
-    latencies: Sequence[int],
-    tokens: Sequence[int],
-    total_rounds: int,
-    json_success: int,
-) -> dict[str, Any]:
-    metrics: dict[str, Any] = {
-        "rounds": total_rounds,
-    }
-
-    if latencies:
-        metrics["avg_latency_ms"] = statistics.fmean(latencies)
-        metrics["max_latency_ms"] = max(latencies)
-        metrics["min_latency_ms"] = min(latencies)
-
-    if tokens:
-        metrics["avg_total_tokens"] = statistics.fmean(tokens)
-        metrics["max_total_tokens"] = max(tokens)
-        metrics["min_total_tokens"] = min(tokens)
-
-    if total_rounds:
-        metrics["json_success_rate"] = round(json_success / total_rounds, 4)
-
-    return metrics
-
-
 def _build_usage_log(
     *,
     provider: LLMProvider,
@@ -549,9 +1058,14 @@ def _build_usage_log(
         response_text=run_record.get("output_text"),
         temperature=unit.temperature,
         latency_ms=latency_value,
+        ttft_ms=_safe_int_value("ttft_ms"),
         prompt_tokens=_safe_int_value("prompt_tokens"),
         completion_tokens=_safe_int_value("completion_tokens"),
         total_tokens=_safe_int_value("total_tokens"),
+        retry_count=_safe_int_value("retry_count") or 0,
+        retry_backoff_ms=_safe_int_value("retry_backoff_ms") or 0,
+        cache_hit=bool(run_record.get("cache_hit")),
+        coalesced=bool(run_record.get("coalesced")),
     )
 
 
@@ -563,4 +1077,10 @@ def _resolve_base_url(provider: LLMProvider) -> str:
     return base_url.rstrip("/")
 
 
-__all__ = ["execute_prompt_test_experiment", "PromptTestExecutionError"]
+__all__ = [
+    "PROMPT_TEST_EXPERIMENT_KIND",
+    "execute_prompt_test_experiment",
+    "execute_prompt_test_experiment_async",
+    "preflight_prompt_test_task",
+    "PromptTestExecutionError",
+]
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from app.core.quantile_sketch import QuantileSketch
+
+_PERCENTILES: tuple[tuple[str, float], ...] = (
+    ("p50", 0.50),
+    ("p90", 0.90),
+    ("p95", 0.95),
+    ("p99", 0.99),
+)
+
+
+class RunMetricsAggregator:
+    """逐轮累积执行指标，供测试任务与 Prompt 实验生成统一的统计结构。
+
+    延迟与首字延迟使用分位数草图记录，轮次再多内存也保持有界。
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self.rounds = 0
+        self.json_success = 0
+        self._latency = QuantileSketch(relative_accuracy)
+        self._ttft = QuantileSketch(relative_accuracy)
+        self._token_count = 0
+        self._token_total = 0
+        self._token_min: int | None = None
+        self._token_max: int | None = None
+        self._output_tokens = 0
+        self._generation_ms = 0.0
+
+    def add(
+        self,
+        *,
+        latency_ms: float | None,
+        total_tokens: int | None = None,
+        completion_tokens: int | None = None,
+        ttft_ms: float | None = None,
+        json_success: bool = False,
+    ) -> None:
+        self.rounds += 1
+        if json_success:
+            self.json_success += 1
+        if latency_ms is not None:
+            self._latency.add(latency_ms)
+        if ttft_ms is not None:
+            self._ttft.add(ttft_ms)
+        if total_tokens is not None:
+            tokens = int(total_tokens)
+            self._token_count += 1
+            self._token_total += tokens
+            if self._token_min is None or tokens < self._token_min:
+                self._token_min = tokens
+            if self._token_max is None or tokens > self._token_max:
+                self._token_max = tokens
+        # 吞吐按生成阶段计算，流式轮次扣除首字前的排队与预填充时间
+        if completion_tokens and latency_ms is not None:
+            generation_ms = float(latency_ms) - (ttft_ms or 0.0)
+            if generation_ms > 0:
+                self._output_tokens += int(completion_tokens)
+                self._generation_ms += generation_ms
+
+    @property
+    def avg_total_tokens(self) -> float | None:
+        return self._token_total / self._token_count if self._token_count else None
+
+    def summary(self) -> dict[str, float | int]:
+        metrics: dict[str, float | int] = {"rounds": self.rounds}
+
+        if self._latency.count:
+            metrics["avg_latency_ms"] = self._latency.mean or 0.0
+            metrics["max_latency_ms"] = int(self._latency.max)
+            metrics["min_latency_ms"] = int(self._latency.min)
+            for label, q in _PERCENTILES:
+                value = self._latency.quantile(q) or 0.0
+                metrics[f"{label}_latency_ms"] = round(value, 2)
+
+        if self._ttft.count:
+            metrics["avg_ttft_ms"] = round(self._ttft.mean or 0.0, 2)
+            for label, q in _PERCENTILES:
+                value = self._ttft.quantile(q) or 0.0
+                metrics[f"{label}_ttft_ms"] = round(value, 2)
+
+        if self._token_count:
+            metrics["avg_total_tokens"] = self._token_total / self._token_count
+            metrics["max_total_tokens"] = self._token_max or 0
+            metrics["min_total_tokens"] = self._token_min or 0
+
+        if self._generation_ms > 0:
+            metrics["output_tokens_per_sec"] = round(
+                self._output_tokens / (self._generation_ms / 1000), 2
+            )
+
+        if self.rounds:
+            metrics["json_success_rate"] = round(self.json_success / self.rounds, 4)
+
+        return metrics
+
+
+def cancellation_summary(
+    *,
+    planned_rounds: int,
+    completed_rounds: int,
+    aborted_rounds: int,
+    tokens_per_round: float | None,
+) -> dict[str, int]:
+    """汇总取消时的轮次情况，按已完成轮次的平均用量估算节省的 token。
+
+    已发出但被中断的请求可能已产生部分消耗，不计入节省量。
+    """
+
+    skipped = max(planned_rounds - completed_rounds - aborted_rounds, 0)
+    return {
+        "planned_rounds": planned_rounds,
+        "completed_rounds": completed_rounds,
+        "aborted_rounds": aborted_rounds,
+        "skipped_rounds": skipped,
+        "tokens_avoided_estimate": int(round(skipped * (tokens_per_round or 0))),
+    }
+
+
+__all__ = ["RunMetricsAggregator", "cancellation_summary"]
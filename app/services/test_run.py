@@ -1,27 +1,69 @@
 from __future__ import annotations
 
 import json
-import random
+import re
+import threading
 import time
-from collections.abc import Mapping, Sequence
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
-from typing import Any
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
 
 import httpx
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 from starlette import status
 
+from app.core.cancellation import (
+    CancellationToken,
+    OperationCancelled,
+    cancellation_registry,
+)
+from app.core.config import settings
+from app.core.llm_circuit_breaker import CircuitOpenError
+from app.core.llm_gateway import LLMCallRequest, LLMCallResult, call_llm
+from app.core.llm_hedging import HEDGE_ROLE_BACKUP, HEDGE_ROLE_PRIMARY, HedgePolicy
+from app.core.llm_pacing import llm_pacer
 from app.core.llm_provider_registry import get_provider_defaults
+from app.core.llm_rate_limiter import (
+    LimitConfig,
+    RateLimitTimeout,
+    build_limiter_key,
+    estimate_payload_tokens,
+)
+from app.core.llm_retry import RetryBudget, RetryPolicy
+from app.core.llm_timeouts import Deadline, DeadlineExceeded, TimeoutConfig
 from app.models.llm_provider import LLMModel, LLMProvider
 from app.models.result import Result
 from app.models.test_run import TestRun, TestRunStatus
 from app.models.usage import LLMUsageLog
+from app.services.budget import (
+    BudgetEstimate,
+    BudgetExceededError,
+    budget_tracker,
+    estimate_payloads,
+)
+from app.services.llm_config_cache import llm_config_cache
+from app.services.llm_response_cache import (
+    ResponseCacheScope,
+    llm_response_cache,
+    resolve_cache_mode,
+)
+from app.services.llm_usage import apply_hedge_outcome
+from app.services.prompt_template import compile_template
+from app.services.run_metrics import RunMetricsAggregator, cancellation_summary
+from app.services.usage_log_writer import usage_log_writer
 
-DEFAULT_TEST_TIMEOUT = 30.0
 DEFAULT_CONCURRENCY_LIMIT = 5
-REQUEST_SLEEP_RANGE = (0.05, 0.2)
+# 取消登记表中测试任务的类型名，与持久化作业类型保持一致
+TEST_RUN_KIND = "test_run"
 
 _KNOWN_PARAMETER_KEYS = {
     "max_tokens",
@@ -42,6 +84,9 @@ _KNOWN_PARAMETER_KEYS = {
 
 _NESTED_PARAMETER_KEYS = {"llm_parameters", "model_parameters", "parameters"}
 
+_J = TypeVar("_J")
+_R = TypeVar("_R")
+
 
 @dataclass(frozen=True)
 class RunRequestContext:
@@ -49,6 +94,60 @@ class RunRequestContext:
     model_name: str
     prompt_id: int | None
     prompt_version_id: int | None
+    retry_budget: RetryBudget | None = None
+    cache: ResponseCacheScope | None = None
+    stream: bool = False
+    cancel_token: CancellationToken | None = None
+    hedge: HedgePolicy | None = None
+    # 对冲请求发往的备用提供者与模型，为空时发往同一目标
+    hedge_backup: tuple[LLMProvider, LLMModel] | None = None
+    # 工作线程产生的落败一路用量记录，由执行线程取出落库
+    hedge_logs: deque[LLMUsageLog] = field(default_factory=deque)
+    # 目标模型熔断时改用的等价模型
+    failover: tuple[LLMProvider, LLMModel] | None = None
+    deadline: Deadline | None = None
+
+
+@dataclass(slots=True)
+class _PacingTally:
+    paced_requests: int = 0
+    delay_ms: float = 0.0
+    # 截止时间前来不及完成而未分发的轮次数
+    deadline_skipped: int = 0
+
+
+@dataclass(slots=True)
+class _HedgeTally:
+    hedged_rounds: int = 0
+    backup_wins: int = 0
+
+
+@dataclass(slots=True)
+class _ChoiceBatchTally:
+    requests: int = 0
+    rounds: int = 0
+    fallback_rounds: int = 0
+    # 提供方忽略或拒绝 n 参数后，本任务剩余的合并请求改为逐轮调用；
+    # 由工作线程设置并在分发前读取，使用 Event 保证跨线程可见
+    unsupported: threading.Event = field(default_factory=threading.Event)
+
+
+@dataclass(slots=True)
+class _JobOutcome:
+    """一项分发任务的执行结果，任务部分完成后失败时同时带回已完成的轮次。"""
+
+    planned: int
+    rounds: list[tuple[int, Result, LLMUsageLog]] = field(default_factory=list)
+    # 由带 n 的合并请求完成的轮次数，以及合并请求未覆盖而改为单独调用的轮次数
+    batched_rounds: int = 0
+    fallback_rounds: int = 0
+    failure: Exception | None = None
+    # 最近一次请求覆盖的轮次数，任务失败时即失败请求涉及的轮次
+    last_request_rounds: int = 0
+
+    @property
+    def unfinished(self) -> int:
+        return self.planned - len(self.rounds)
 
 
 class TestRunExecutionError(Exception):
@@ -57,19 +156,59 @@ class TestRunExecutionError(Exception):
     __test__ = False
 
     def __init__(
-        self, message: str, *, status_code: int = status.HTTP_400_BAD_REQUEST
+        self,
+        message: str,
+        *,
+        status_code: int = status.HTTP_400_BAD_REQUEST,
+        detail: Any = None,
     ) -> None:
         super().__init__(message)
         self.status_code = status_code
+        # 上游返回的原始错误体，用于判断失败原因
+        self.detail = detail
+
+
+def execute_test_run(
+    db: Session, test_run: TestRun, *, cancel_token: CancellationToken | None = None
+) -> TestRun:
+    """调用外部 LLM 完成测试任务，并记录结果与用量。
+
+    cancel_token 被触发后不再分发新轮次，在途请求在等待上游响应时随即中断
+    并关闭连接，释放限流租约与调度槽位；已完成的轮次照常保存，测试任务以
+    CANCELLED 状态结束。未传入 cancel_token 时使用执行方在取消登记表中为
+    该任务登记的标记。
+
+    模型预算在执行前与每轮落库后检查，用尽时按同样方式停止分发，测试任务
+    以 FAILED 状态结束。schema 中的 hedge 选项为各轮开启对冲请求，可通过
+    backup_model_id 指定备用模型，落败一路的用量同样写入调用日志。
+
+    模型熔断时，配置了等价模型的轮次改由该模型完成，否则停止分发剩余轮次，
+    测试任务以 FAILED 状态结束，不再逐轮等待上游超时。
 
+    各轮按模型配置的连接、首字与总超时调用；schema 中的 deadline_seconds 为
+    整个任务设置截止时间，各轮超时按剩余时间收紧，来不及完成的轮次不再发出，
+    测试任务以 FAILED 状态结束。超时与跳过的轮次记录在 timeout_stats 中。
 
-def execute_test_run(db: Session, test_run: TestRun) -> TestRun:
-    """调用外部 LLM 完成测试任务，并记录结果与用量。"""
+    模型配置了 max_choices_per_request 时，请求体完全相同的轮次合并为一次带
+    n 参数的请求，返回的候选按 run_index 拆回各轮并分摊用量；提供方返回的
+    候选不足或拒绝 n 参数时，其余轮次改为单独调用。合并情况记录在 batch_stats 中。
+    """
 
     if test_run.status not in {TestRunStatus.PENDING, TestRunStatus.RUNNING}:
         return test_run
 
     provider, model = _resolve_provider_and_model(db, test_run)
+    model_id = model.id if model else None
+    try:
+        budget_tracker.check(db, model_id=model_id)
+    except BudgetExceededError as exc:
+        raise TestRunExecutionError(
+            str(exc), status_code=status.HTTP_429_TOO_MANY_REQUESTS
+        ) from exc
+    if cancel_token is None:
+        cancel_token = cancellation_registry.get(TEST_RUN_KIND, test_run.id)
+    if cancel_token is None:
+        cancel_token = CancellationToken()
 
     prompt_version = test_run.prompt_version
     if not prompt_version:
@@ -79,6 +218,15 @@ def execute_test_run(db: Session, test_run: TestRun) -> TestRun:
     schema_data = _ensure_mapping(test_run.schema)
     schema_data.pop("last_error", None)
     schema_data.pop("last_error_status", None)
+    schema_data.pop("retry_stats", None)
+    schema_data.pop("cache_stats", None)
+    schema_data.pop("pacing_stats", None)
+    schema_data.pop("hedge_stats", None)
+    schema_data.pop("failover_stats", None)
+    schema_data.pop("timeout_stats", None)
+    schema_data.pop("batch_stats", None)
+    schema_data.pop("metrics", None)
+    schema_data.pop("cancellation", None)
     schema_data.setdefault("prompt_snapshot", prompt_snapshot)
     schema_data.setdefault("llm_provider_id", provider.id)
     schema_data.setdefault("llm_provider_name", provider.provider_name)
@@ -93,6 +241,14 @@ def execute_test_run(db: Session, test_run: TestRun) -> TestRun:
         "Content-Type": "application/json",
     }
 
+    hedge_option = schema_data.get("hedge")
+    hedge_policy = HedgePolicy.from_option(hedge_option)
+    hedge_backup = None
+    if hedge_policy is not None and isinstance(hedge_option, Mapping):
+        hedge_backup = _resolve_hedge_backup(db, hedge_option.get("backup_model_id"))
+    failover = _resolve_failover(db, model)
+    deadline = Deadline.from_option(schema_data.get("deadline_seconds"))
+
     test_run.status = TestRunStatus.RUNNING
     db.flush()
 
@@ -101,56 +257,305 @@ def execute_test_run(db: Session, test_run: TestRun) -> TestRun:
         model_name=test_run.model_name,
         prompt_id=prompt_version.prompt_id,
         prompt_version_id=test_run.prompt_version_id,
+        retry_budget=RetryBudget(),
+        cache=llm_response_cache.scope(
+            db, resolve_cache_mode(schema_data.get("cache"))
+        ),
+        stream=schema_data.get("stream") is True,
+        cancel_token=cancel_token,
+        hedge=hedge_policy,
+        hedge_backup=hedge_backup,
+        failover=failover,
+        deadline=deadline,
     )
+    cache_scope = context.cache
+    aggregator = RunMetricsAggregator()
 
     concurrency_limit = DEFAULT_CONCURRENCY_LIMIT
     if model and isinstance(model.concurrency_limit, int):
         concurrency_limit = max(1, model.concurrency_limit)
 
-    def _execute_single(run_index: int) -> tuple[int, Result, LLMUsageLog]:
-        messages = _build_messages(schema_data, prompt_snapshot, run_index)
-        payload: dict[str, Any] = dict(parameters_template)
-        payload["model"] = model.name if model else test_run.model_name
-        payload["messages"] = messages
+    # 已发出但尚未落库的轮次，取消时计为被中断的轮次
+    started_rounds: set[int] = set()
+
+    choice_batching = _ChoiceBatchTally()
+
+    def _execute_job(
+        run_indices: tuple[int, ...], payload: dict[str, Any]
+    ) -> _JobOutcome:
+        outcome = _JobOutcome(planned=len(run_indices))
 
-        result, usage_log = _invoke_llm_once(
+        def _collect(run_index: int, result: Result, usage_log: LLMUsageLog) -> None:
+            result.test_run_id = context.test_run_id
+            result.run_index = run_index
+            outcome.rounds.append((run_index, result, usage_log))
+
+        remaining = list(run_indices)
+        try:
+            if len(remaining) > 1 and not choice_batching.unsupported.is_set():
+                if deadline is not None:
+                    deadline.ensure_room()
+                started_rounds.update(remaining)
+                outcome.last_request_rounds = len(remaining)
+                try:
+                    batched = _invoke_llm_batch(
+                        provider=provider,
+                        model=model,
+                        base_url=base_url,
+                        headers=headers,
+                        payload=payload,
+                        choices=len(remaining),
+                        context=context,
+                    )
+                except TestRunExecutionError as exc:
+                    # 只有明确拒绝 n 参数时才改为逐轮调用，其他 400 错误照常失败
+                    if not _rejects_choice_count(exc):
+                        raise
+                    batched = []
+                if len(batched) < len(remaining):
+                    choice_batching.unsupported.set()
+                for run_index, (result, usage_log) in zip(remaining, batched):
+                    _collect(run_index, result, usage_log)
+                outcome.batched_rounds = len(batched)
+                remaining = remaining[len(batched) :]
+                outcome.fallback_rounds = len(remaining)
+            for run_index in remaining:
+                if deadline is not None:
+                    # 排队期间截止时间可能已不足以完成本轮
+                    deadline.ensure_room()
+                started_rounds.add(run_index)
+                outcome.last_request_rounds = 1
+                result, usage_log = _invoke_llm_once(
+                    provider=provider,
+                    model=model,
+                    base_url=base_url,
+                    headers=headers,
+                    payload=payload,
+                    context=context,
+                )
+                _collect(run_index, result, usage_log)
+        except (Exception, OperationCancelled) as exc:
+            outcome.failure = exc
+        return outcome
+
+    payloads = {
+        index: _build_payload(
+            test_run, model, parameters_template, schema_data, prompt_snapshot, index
+        )
+        for index in range(1, test_run.repetitions + 1)
+    }
+    error_message: str | None = None
+    error_status_code: int | None = None
+    artifacts = _RunArtifactBatch(db)
+    hedge_tally = _HedgeTally()
+    failover_rounds = 0
+    timed_out_rounds = 0
+    deadline_skipped = 0
+
+    def _usage_model(usage_log: LLMUsageLog) -> LLMModel | None:
+        for target in (hedge_backup, failover):
+            if target is not None and usage_log.model_id == target[1].id:
+                return target[1]
+        return model
+
+    def _drain_hedge_logs() -> None:
+        while context.hedge_logs:
+            loser_log = context.hedge_logs.popleft()
+            artifacts.add_usage_log(loser_log)
+            budget_tracker.record_usage_log(loser_log, model=_usage_model(loser_log))
+            hedge_tally.hedged_rounds += 1
+            if loser_log.hedge_role == HEDGE_ROLE_PRIMARY:
+                hedge_tally.backup_wins += 1
+
+    def _persist_round(result_obj: Result, usage_obj: LLMUsageLog) -> None:
+        nonlocal error_message, error_status_code, failover_rounds
+        artifacts.add(result_obj, usage_obj)
+        if failover is not None and usage_obj.model_id == failover[1].id:
+            failover_rounds += 1
+        if deadline is not None and result_obj.latency_ms is not None:
+            deadline.observe(result_obj.latency_ms / 1000)
+        _record_run_metrics(aggregator, result_obj, usage_obj)
+        budget_tracker.record_usage_log(usage_obj, model=_usage_model(usage_obj))
+        _drain_hedge_logs()
+        try:
+            budget_tracker.check(db, model_id=model_id)
+        except BudgetExceededError as exc:
+            if error_message is None:
+                error_message = str(exc)
+                error_status_code = status.HTTP_429_TOO_MANY_REQUESTS
+            cancel_token.cancel(str(exc))
+
+    # 缓存查询在当前线程完成，命中的轮次无需再占用工作线程
+    pending_payloads: dict[int, dict[str, Any]] = {}
+    completed_rounds = 0
+    for run_index, payload in payloads.items():
+        if cancel_token.cancelled:
+            break
+        cached = cache_scope.lookup(cache_scope.key_for(base_url, payload))
+        if cached is None:
+            pending_payloads[run_index] = payload
+            continue
+        result_obj, usage_obj = _build_run_artifacts(
             provider=provider,
             model=model,
-            base_url=base_url,
-            headers=headers,
             payload=payload,
             context=context,
+            payload_obj=cached.body,
+            latency_ms=cached.latency_ms,
+            cache_hit=True,
         )
+        result_obj.test_run_id = context.test_run_id
+        result_obj.run_index = run_index
+        _persist_round(result_obj, usage_obj)
+        completed_rounds += 1
+
+    choices_per_request = 1
+    if (
+        settings.TEST_RUN_CHOICE_BATCHING_ENABLED
+        and model is not None
+        and model.max_choices_per_request
+        and hedge_policy is None
+        and "n" not in parameters_template
+    ):
+        choices_per_request = max(1, model.max_choices_per_request)
+    jobs = _group_identical_rounds(pending_payloads, choices_per_request)
+    worker_count = max(1, min(concurrency_limit, len(jobs) or 1))
+    pacing = _PacingTally()
 
-        result.test_run_id = context.test_run_id
-        result.run_index = run_index
-        return run_index, result, usage_log
+    executor = ThreadPoolExecutor(max_workers=worker_count)
+    try:
+        completed = _paced_as_completed(
+            lambda item: executor.submit(_execute_job, *item),
+            jobs,
+            pacing_key=build_limiter_key(
+                provider.id, model.name if model else test_run.model_name
+            ),
+            rpm=LimitConfig.for_model(model).rpm,
+            tally=pacing,
+            cancel_token=cancel_token,
+            deadline=deadline,
+            job_size=lambda item: len(item[0]),
+        )
+        for future in completed:
+            outcome = future.result()
+            for run_index, result_obj, usage_obj in outcome.rounds:
+                _persist_round(result_obj, usage_obj)
+                completed_rounds += 1
+                started_rounds.discard(run_index)
+            if outcome.batched_rounds:
+                choice_batching.requests += 1
+                choice_batching.rounds += outcome.batched_rounds
+            choice_batching.fallback_rounds += outcome.fallback_rounds
+
+            exc = outcome.failure
+            if exc is None or isinstance(exc, OperationCancelled):
+                continue
+            if isinstance(exc, DeadlineExceeded):
+                deadline_skipped += outcome.unfinished
+            elif isinstance(exc, TestRunExecutionError):
+                if error_message is None:
+                    error_message = str(exc)
+                    error_status_code = getattr(exc, "status_code", None)
+                if isinstance(exc.__cause__, httpx.TimeoutException):
+                    timed_out_rounds += outcome.last_request_rounds
+                if isinstance(exc.__cause__, CircuitOpenError):
+                    # 模型已熔断，剩余轮次同样会被拒绝，不再继续分发
+                    cancel_token.cancel(str(exc))
+            elif error_message is None:  # pragma: no cover - 防御性
+                error_message = f"执行测试任务失败: {exc}"
+                error_status_code = status.HTTP_502_BAD_GATEWAY
+    finally:
+        # 在途请求会响应取消标记尽快退出，这里等待工作线程结束，不遗留线程
+        executor.shutdown(wait=True, cancel_futures=True)
+    cancelled = cancel_token.cancelled
+
+    _drain_hedge_logs()
+    artifacts.flush()
+    deadline_skipped += pacing.deadline_skipped
+    if deadline_skipped and error_message is None and deadline is not None:
+        error_message = str(DeadlineExceeded(deadline.seconds))
+        error_status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    if artifacts.written:
+        # 结果绕过会话直接写入，重新加载关联集合
+        db.expire(test_run, ["results"])
+    cache_scope.flush()
+    if aggregator.rounds:
+        current_schema = _ensure_mapping(test_run.schema)
+        current_schema["metrics"] = aggregator.summary()
+        test_run.schema = current_schema
 
-    run_indices = range(1, test_run.repetitions + 1)
-    error_message: str | None = None
-    error_status_code: int | None = None
+    if cache_scope.hits:
+        current_schema = _ensure_mapping(test_run.schema)
+        current_schema["cache_stats"] = {
+            "mode": cache_scope.mode.value,
+            "hits": cache_scope.hits,
+        }
+        test_run.schema = current_schema
 
-    worker_count = max(1, min(concurrency_limit, test_run.repetitions))
+    if pacing.paced_requests:
+        current_schema = _ensure_mapping(test_run.schema)
+        current_schema["pacing_stats"] = {
+            "paced_requests": pacing.paced_requests,
+            "delay_ms": int(pacing.delay_ms),
+        }
+        test_run.schema = current_schema
 
-    with ThreadPoolExecutor(max_workers=worker_count) as executor:
-        future_map = {
-            executor.submit(_execute_single, index): index for index in run_indices
+    if hedge_tally.hedged_rounds:
+        current_schema = _ensure_mapping(test_run.schema)
+        current_schema["hedge_stats"] = {
+            "hedged_rounds": hedge_tally.hedged_rounds,
+            "backup_wins": hedge_tally.backup_wins,
         }
-        for future in as_completed(future_map):
-            try:
-                _, result_obj, usage_obj = future.result()
-            except TestRunExecutionError as exc:
-                if error_message is None:
-                    error_message = str(exc)
-                    error_status_code = getattr(exc, "status_code", None)
-            except Exception as exc:  # pragma: no cover - 防御性
-                if error_message is None:
-                    error_message = f"执行测试任务失败: {exc}"
-                    error_status_code = status.HTTP_502_BAD_GATEWAY
-            else:
-                _persist_run_artifacts(db, result_obj, usage_obj)
+        test_run.schema = current_schema
+
+    if failover is not None and failover_rounds:
+        current_schema = _ensure_mapping(test_run.schema)
+        current_schema["failover_stats"] = {
+            "model_id": failover[1].id,
+            "rounds": failover_rounds,
+        }
+        test_run.schema = current_schema
+
+    if choice_batching.requests or choice_batching.fallback_rounds:
+        current_schema = _ensure_mapping(test_run.schema)
+        current_schema["batch_stats"] = {
+            "batched_requests": choice_batching.requests,
+            "batched_rounds": choice_batching.rounds,
+            "fallback_rounds": choice_batching.fallback_rounds,
+        }
+        test_run.schema = current_schema
+
+    if timed_out_rounds or deadline_skipped:
+        current_schema = _ensure_mapping(test_run.schema)
+        current_schema["timeout_stats"] = {
+            "timed_out_rounds": timed_out_rounds,
+            "deadline_skipped_rounds": deadline_skipped,
+            "deadline_seconds": deadline.seconds if deadline else None,
+        }
+        test_run.schema = current_schema
 
-    if error_message:
+    retry_budget = context.retry_budget
+    if retry_budget is not None and retry_budget.retries:
+        current_schema = _ensure_mapping(test_run.schema)
+        current_schema["retry_stats"] = {
+            "retries": retry_budget.retries,
+            "backoff_ms": int(retry_budget.backoff_ms),
+        }
+        test_run.schema = current_schema
+
+    if cancelled and error_message is None:
+        current_schema = _ensure_mapping(test_run.schema)
+        current_schema["cancellation"] = cancellation_summary(
+            planned_rounds=len(payloads),
+            completed_rounds=completed_rounds,
+            aborted_rounds=len(started_rounds),
+            tokens_per_round=aggregator.avg_total_tokens
+            or estimate_payload_tokens(payloads[1]),
+        )
+        test_run.schema = current_schema
+        test_run.status = TestRunStatus.CANCELLED
+        test_run.last_error = None
+    elif error_message:
         test_run.status = TestRunStatus.FAILED
         test_run.last_error = error_message
         if error_status_code is not None:
@@ -169,6 +574,95 @@ def execute_test_run(db: Session, test_run: TestRun) -> TestRun:
     return test_run
 
 
+def _paced_as_completed(
+    submit: Callable[[_J], Future[_R]],
+    jobs: Iterable[_J],
+    *,
+    pacing_key: str,
+    rpm: int | None,
+    tally: _PacingTally | None = None,
+    cancel_token: CancellationToken | None = None,
+    deadline: Deadline | None = None,
+    job_size: Callable[[_J], int] | None = None,
+) -> Iterator[Future[_R]]:
+    """按节奏调度依次提交任务，并在等待下一个时间槽期间产出已完成的任务。
+
+    等待只发生在分发线程中，工作线程拿到任务后立即发送请求。取消后
+    立即停止分发，已分发的任务会响应取消尽快结束，仍在结束后产出。deadline 剩余时间不足以
+    完成下一项任务时不再分发，已分发的任务照常产出，未分发的任务按
+    job_size 计入跳过数。
+    """
+
+    queue = deque(jobs)
+    in_flight: set[Future[Any]] = set()
+    due_at: float | None = None
+    # 取消信号与任务一起参与 wait，等待期间也能被立即唤醒
+    cancelled: Future[None] = Future()
+    unregister: Callable[[], None] = lambda: None
+    if cancel_token is not None:
+        unregister = cancel_token.add_callback(lambda: cancelled.set_result(None))
+    try:
+        while (queue or in_flight) and not cancelled.done():
+            remaining: float | None = None
+            if queue:
+                if due_at is None:
+                    delay = llm_pacer.reserve(pacing_key, rpm)
+                    if delay > 0 and tally is not None:
+                        tally.paced_requests += 1
+                        tally.delay_ms += delay * 1000
+                    due_at = time.monotonic() + delay
+                remaining = due_at - time.monotonic()
+                if remaining <= 0:
+                    if deadline is not None and not deadline.has_room():
+                        if tally is not None:
+                            tally.deadline_skipped += sum(
+                                job_size(job) if job_size else 1 for job in queue
+                            )
+                        queue.clear()
+                        continue
+                    in_flight.add(submit(queue.popleft()))
+                    due_at = None
+                    continue
+            done, _ = wait(
+                in_flight | {cancelled},
+                timeout=remaining,
+                return_when=FIRST_COMPLETED,
+            )
+            done.discard(cancelled)
+            in_flight -= done
+            yield from done
+        # 取消后在途请求会随即中断，仍等待其结束，以便保存已完成的轮次
+        yield from as_completed(in_flight)
+    finally:
+        unregister()
+
+
+def preflight_test_run(db: Session, test_run: TestRun) -> BudgetEstimate:
+    """按渲染后的请求体预估测试任务的用量，模型预算不足时抛出 BudgetExceededError。"""
+
+    _, model = _resolve_provider_and_model(db, test_run)
+    prompt_version = test_run.prompt_version
+    prompt_snapshot = prompt_version.content if prompt_version else ""
+    schema_data = _ensure_mapping(test_run.schema)
+    parameters_template = _build_parameters(test_run, schema_data)
+    estimate = estimate_payloads(
+        model,
+        (
+            _build_payload(
+                test_run,
+                model,
+                parameters_template,
+                schema_data,
+                prompt_snapshot,
+                index,
+            )
+            for index in range(1, (test_run.repetitions or 1) + 1)
+        ),
+    )
+    budget_tracker.check(db, model_id=model.id if model else None, estimate=estimate)
+    return estimate
+
+
 def ensure_completed(db: Session, runs: Sequence[TestRun]) -> None:
     for run in runs:
         execute_test_run(db, run)
@@ -179,45 +673,74 @@ def _resolve_provider_and_model(
     db: Session, test_run: TestRun
 ) -> tuple[LLMProvider, LLMModel | None]:
     schema_data = _ensure_mapping(test_run.schema)
+    provider_id = _coerce_id(
+        schema_data.get("llm_provider_id") or schema_data.get("provider_id")
+    )
+    model_id = _coerce_id(
+        schema_data.get("llm_model_id") or schema_data.get("model_id")
+    )
+    provider_key = schema_data.get("provider_key")
+    if not isinstance(provider_key, str):
+        provider_key = None
+
+    key = (
+        "test_run",
+        provider_id,
+        model_id,
+        test_run.model_version,
+        provider_key,
+        test_run.model_name,
+    )
+    return llm_config_cache.resolve(
+        db,
+        key,
+        lambda: _lookup_provider_and_model(
+            db,
+            provider_id=provider_id,
+            model_id=model_id,
+            provider_name=test_run.model_version,
+            provider_key=provider_key,
+            model_name=test_run.model_name,
+        ),
+    )
 
+
+def _lookup_provider_and_model(
+    db: Session,
+    *,
+    provider_id: int | None,
+    model_id: int | None,
+    provider_name: str | None,
+    provider_key: str | None,
+    model_name: str,
+) -> tuple[LLMProvider, LLMModel | None]:
     provider: LLMProvider | None = None
     model: LLMModel | None = None
 
-    provider_id = schema_data.get("llm_provider_id") or schema_data.get("provider_id")
-    model_id = schema_data.get("llm_model_id") or schema_data.get("model_id")
-
-    if isinstance(provider_id, int):
+    if provider_id is not None:
         provider = db.get(LLMProvider, provider_id)
-    elif isinstance(provider_id, str) and provider_id.isdigit():
-        provider = db.get(LLMProvider, int(provider_id))
 
-    if provider and isinstance(model_id, int):
+    if provider and model_id is not None:
         model = db.get(LLMModel, model_id)
-    elif provider and isinstance(model_id, str) and model_id.isdigit():
-        model = db.get(LLMModel, int(model_id))
 
     if model and provider and model.provider_id != provider.id:
         model = None
 
-    if provider is None and test_run.model_version:
+    if provider is None and provider_name:
         provider = db.scalar(
-            select(LLMProvider).where(
-                LLMProvider.provider_name == test_run.model_version
-            )
+            select(LLMProvider).where(LLMProvider.provider_name == provider_name)
         )
 
-    if provider is None and isinstance(
-        schema_key := schema_data.get("provider_key"), str
-    ):
+    if provider is None and provider_key is not None:
         provider = db.scalar(
-            select(LLMProvider).where(LLMProvider.provider_key == schema_key)
+            select(LLMProvider).where(LLMProvider.provider_key == provider_key)
         )
 
     if provider is None:
         stmt = (
             select(LLMProvider, LLMModel)
             .join(LLMModel, LLMModel.provider_id == LLMProvider.id)
-            .where(LLMModel.name == test_run.model_name)
+            .where(LLMModel.name == model_name)
         )
         record = db.execute(stmt).first()
         if record:
@@ -232,13 +755,57 @@ def _resolve_provider_and_model(
         model = db.scalar(
             select(LLMModel).where(
                 LLMModel.provider_id == provider.id,
-                LLMModel.name == test_run.model_name,
+                LLMModel.name == model_name,
             )
         )
 
     return provider, model
 
 
+def _coerce_id(value: Any) -> int | None:
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+def _resolve_hedge_backup(
+    db: Session, model_id: Any
+) -> tuple[LLMProvider, LLMModel] | None:
+    """解析对冲请求的备用模型，未指定时对冲请求发往同一目标。"""
+
+    model_id = _coerce_id(model_id)
+    if model_id is None:
+        return None
+
+    def _load() -> tuple[LLMProvider, LLMModel]:
+        backup = db.get(LLMModel, model_id)
+        if backup is None or backup.provider is None:
+            raise TestRunExecutionError("未找到对冲请求的备用模型。")
+        return backup.provider, backup
+
+    return llm_config_cache.resolve(db, ("hedge_backup", model_id), _load)
+
+
+def _resolve_failover(
+    db: Session, model: LLMModel | None
+) -> tuple[LLMProvider, LLMModel] | None:
+    """解析模型配置的等价模型，未配置或已被删除时返回 None。"""
+
+    if model is None or model.failover_model_id is None:
+        return None
+    failover_id = model.failover_model_id
+
+    def _load() -> tuple[LLMProvider, LLMModel] | None:
+        failover = db.get(LLMModel, failover_id)
+        if failover is None or failover.provider is None:
+            return None
+        return failover.provider, failover
+
+    return llm_config_cache.resolve(db, ("failover", failover_id), _load)
+
+
 def _resolve_base_url(provider: LLMProvider) -> str:
     defaults = get_provider_defaults(provider.provider_key)
     base_url = provider.base_url or (defaults.base_url if defaults else None)
@@ -274,9 +841,23 @@ def _build_parameters(
     return parameters
 
 
+def _build_payload(
+    test_run: TestRun,
+    model: LLMModel | None,
+    parameters_template: Mapping[str, Any],
+    schema_data: Mapping[str, Any],
+    prompt_snapshot: str,
+    run_index: int,
+) -> dict[str, Any]:
+    payload: dict[str, Any] = dict(parameters_template)
+    payload["model"] = model.name if model else test_run.model_name
+    payload["messages"] = _build_messages(schema_data, prompt_snapshot, run_index)
+    return payload
+
+
 def _render_content(content: Any, run_index: int) -> Any:
     if isinstance(content, str):
-        return content.replace("{{run_index}}", str(run_index))
+        return compile_template(content).render_literal(run_index)
     return content
 
 
@@ -327,7 +908,27 @@ def _build_messages(
     return normalized
 
 
-def _invoke_llm_once(
+def _group_identical_rounds(
+    payloads: Mapping[int, dict[str, Any]], choices_per_request: int
+) -> list[tuple[tuple[int, ...], dict[str, Any]]]:
+    """把请求体完全相同的轮次按 choices_per_request 分组，每组发送一次请求。"""
+
+    groups: dict[str, list[int]] = {}
+    for run_index, payload in payloads.items():
+        digest = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        groups.setdefault(digest, []).append(run_index)
+
+    size = max(1, choices_per_request)
+    jobs = [
+        (tuple(indices[start : start + size]), payloads[indices[start]])
+        for indices in groups.values()
+        for start in range(0, len(indices), size)
+    ]
+    jobs.sort(key=lambda job: job[0][0])
+    return jobs
+
+
+def _round_request(
     *,
     provider: LLMProvider,
     model: LLMModel | None,
@@ -335,28 +936,61 @@ def _invoke_llm_once(
     headers: Mapping[str, str],
     payload: dict[str, Any],
     context: RunRequestContext,
-) -> tuple[Result, LLMUsageLog]:
-    url = f"{base_url}/chat/completions"
-    start_time = time.perf_counter()
+) -> LLMCallRequest:
+    backup_request: LLMCallRequest | None = None
+    if context.hedge is not None and context.hedge_backup is not None:
+        backup_request = _equivalent_request(context.hedge_backup, payload, context)
+    return LLMCallRequest(
+        provider_id=provider.id,
+        model_name=payload.get("model") or context.model_name,
+        base_url=base_url,
+        api_key=provider.api_key,
+        payload=payload,
+        limit_config=LimitConfig.for_model(model),
+        timeout=TimeoutConfig.for_model(model),
+        headers=headers,
+        source="test_run",
+        stream=context.stream,
+        deadline=context.deadline,
+        cancel_token=context.cancel_token,
+        hedge=context.hedge,
+        hedge_backup=backup_request,
+        failover=_equivalent_request(context.failover, payload, context)
+        if context.failover is not None
+        else None,
+    )
 
-    try:
-        sleep_lower, sleep_upper = REQUEST_SLEEP_RANGE
-        if sleep_upper > 0:
-            jitter = random.uniform(sleep_lower, sleep_upper)
-            if jitter > 0:
-                time.sleep(jitter)
-    except Exception:  # pragma: no cover - 容错
-        pass
+
+def _send_round(
+    request: LLMCallRequest, context: RunRequestContext
+) -> tuple[LLMCallResult, Any]:
+    """发送请求并解析响应体，调用失败或上游返回错误时抛出 TestRunExecutionError。"""
 
     try:
-        response = httpx.post(
-            url, headers=dict(headers), json=payload, timeout=DEFAULT_TEST_TIMEOUT
+        call = call_llm(
+            request,
+            retry_policy=RetryPolicy.from_settings(),
+            retry_budget=context.retry_budget,
         )
+    except RateLimitTimeout as exc:
+        raise TestRunExecutionError(
+            str(exc), status_code=status.HTTP_429_TOO_MANY_REQUESTS
+        ) from exc
+    except CircuitOpenError as exc:
+        raise TestRunExecutionError(
+            str(exc), status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+        ) from exc
+    except httpx.TimeoutException as exc:
+        raise TestRunExecutionError(
+            f"LLM 调用超时: {type(exc).__name__}",
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        ) from exc
     except httpx.HTTPError as exc:  # pragma: no cover - 网络异常场景
         raise TestRunExecutionError(
             f"调用外部 LLM 失败: {exc}", status_code=status.HTTP_502_BAD_GATEWAY
         ) from exc
 
+    response = call.response
     if response.status_code >= 400:
         try:
             error_payload = response.json()
@@ -366,6 +1000,7 @@ def _invoke_llm_once(
         raise TestRunExecutionError(
             f"LLM 请求失败 (HTTP {response.status_code}): {detail_text}",
             status_code=response.status_code,
+            detail=error_payload,
         ) from None
 
     try:
@@ -375,17 +1010,272 @@ def _invoke_llm_once(
             "LLM 响应解析失败。", status_code=status.HTTP_502_BAD_GATEWAY
         ) from exc
 
+    return call, payload_obj
+
+
+def _invoke_llm_once(
+    *,
+    provider: LLMProvider,
+    model: LLMModel | None,
+    base_url: str,
+    headers: Mapping[str, str],
+    payload: dict[str, Any],
+    context: RunRequestContext,
+) -> tuple[Result, LLMUsageLog]:
+    request = _round_request(
+        provider=provider,
+        model=model,
+        base_url=base_url,
+        headers=headers,
+        payload=payload,
+        context=context,
+    )
+    call, payload_obj = _send_round(request, context)
+
+    # 备用目标胜出或熔断转移时结果与用量记在实际返回的模型上，落败记录记在原目标上
+    target = loser = (provider, model)
+    if call.failed_over and context.failover is not None:
+        target = context.failover
+    backup_won = False
+    if call.hedge is not None and context.hedge_backup is not None:
+        backup_won = call.hedge.role == HEDGE_ROLE_BACKUP
+        if backup_won:
+            target = context.hedge_backup
+        else:
+            loser = context.hedge_backup
+
+    if (
+        context.cache is not None
+        and not call.coalesced
+        and not backup_won
+        and not call.failed_over
+        and isinstance(payload_obj, Mapping)
+    ):
+        context.cache.store(
+            context.cache.key_for(base_url, payload),
+            model_name=request.model_name,
+            body=payload_obj,
+            latency_ms=call.latency_ms,
+        )
+
+    result, usage_log = _build_run_artifacts(
+        provider=target[0],
+        model=target[1],
+        payload=payload,
+        context=context,
+        payload_obj=payload_obj,
+        latency_ms=call.latency_ms,
+        retry_count=call.retry.retries,
+        retry_backoff_ms=int(call.retry.backoff_ms),
+        coalesced=call.coalesced,
+        ttft_ms=call.ttft_ms,
+    )
+    call.record_usage(result.tokens_used)
+    if call.hedge is not None:
+        loser_provider, loser_model = loser
+        loser_log = apply_hedge_outcome(
+            usage_log,
+            call.hedge.summary(),
+            provider_id=loser_provider.id,
+            model_id=loser_model.id if loser_model else None,
+            model_name=loser_model.name if loser_model else None,
+        )
+        if loser_log is not None:
+            context.hedge_logs.append(loser_log)
+    return result, usage_log
+
+
+def _invoke_llm_batch(
+    *,
+    provider: LLMProvider,
+    model: LLMModel | None,
+    base_url: str,
+    headers: Mapping[str, str],
+    payload: dict[str, Any],
+    choices: int,
+    context: RunRequestContext,
+) -> list[tuple[Result, LLMUsageLog]]:
+    """以 n 参数一次请求多个候选，并按候选拆分为逐轮的结果与用量记录。
+
+    提供方返回的候选少于 choices 时只拆出实际返回的部分，由调用方补发其余轮次。
+    """
+
+    batch_payload = {**payload, "n": choices}
+    request = _round_request(
+        provider=provider,
+        model=model,
+        base_url=base_url,
+        headers=headers,
+        payload=batch_payload,
+        context=context,
+    )
+    call, payload_obj = _send_round(request, context)
+    target = (provider, model)
+    if call.failed_over and context.failover is not None:
+        target = context.failover
+
+    bodies = _split_choices(payload_obj) if isinstance(payload_obj, Mapping) else [{}]
+    if context.cache is not None and not call.coalesced and not call.failed_over:
+        # 缓存按单轮请求体索引，只保存第一个候选
+        context.cache.store(
+            context.cache.key_for(base_url, payload),
+            model_name=request.model_name,
+            body=bodies[0],
+            latency_ms=call.latency_ms,
+        )
+
+    rounds: list[tuple[Result, LLMUsageLog]] = []
+    for position, body in enumerate(bodies):
+        rounds.append(
+            _build_run_artifacts(
+                provider=target[0],
+                model=target[1],
+                payload=batch_payload,
+                context=context,
+                payload_obj=body,
+                latency_ms=call.latency_ms,
+                # 重试只发生在整次请求上，记在第一轮以免汇总时重复计算
+                retry_count=call.retry.retries if position == 0 else 0,
+                retry_backoff_ms=int(call.retry.backoff_ms) if position == 0 else 0,
+                coalesced=call.coalesced,
+                ttft_ms=call.ttft_ms,
+            )
+        )
+    call.record_usage(sum(result.tokens_used or 0 for result, _ in rounds) or None)
+    return rounds
+
+
+def _equivalent_request(
+    target: tuple[LLMProvider, LLMModel],
+    payload: Mapping[str, Any],
+    context: RunRequestContext,
+) -> LLMCallRequest:
+    """构造发往等价模型的请求，用于对冲的备用目标与熔断时的故障转移。"""
+
+    provider, model = target
+    return LLMCallRequest(
+        provider_id=provider.id,
+        model_name=model.name,
+        base_url=_resolve_base_url(provider),
+        api_key=provider.api_key,
+        payload={**payload, "model": model.name},
+        limit_config=LimitConfig.for_model(model),
+        timeout=TimeoutConfig.for_model(model),
+        source="test_run",
+        stream=context.stream,
+        deadline=context.deadline,
+        cancel_token=context.cancel_token,
+    )
+
+
+def _choice_text(choice: Any) -> str:
+    if isinstance(choice, Mapping):
+        message = choice.get("message")
+        if isinstance(message, Mapping) and isinstance(message.get("content"), str):
+            return message["content"]
+        if isinstance(choice.get("text"), str):
+            return str(choice["text"])
+    return ""
+
+
+def _apportion(total: Any, weights: Sequence[int]) -> list[int] | None:
+    """按权重把 token 数拆分到各轮，各份之和等于 total。"""
+
+    if isinstance(total, bool) or not isinstance(total, (int, float)):
+        return None
+    total = int(total)
+    weight_sum = sum(weights) or len(weights)
+    shares = [total * weight // weight_sum for weight in weights]
+    for index in range(total - sum(shares)):
+        shares[index % len(shares)] += 1
+    return shares
+
+
+_CHOICE_COUNT_PATTERN = re.compile(
+    r"""['"`]n['"`]|\bn\s*(?:parameter|参数)|(?:\bparameter|参数)\s*n\b""",
+    re.IGNORECASE,
+)
+
+
+def _rejects_choice_count(exc: TestRunExecutionError) -> bool:
+    """判断 400 错误是否由 n 参数引起，错误体的 param 或描述需明确指向 n。"""
+
+    if exc.status_code != status.HTTP_400_BAD_REQUEST:
+        return False
+    detail = exc.detail
+    if isinstance(detail, Mapping):
+        error_obj = detail.get("error")
+        if isinstance(error_obj, Mapping):
+            if error_obj.get("param") == "n":
+                return True
+            detail = error_obj
+        message = detail.get("message")
+        return isinstance(message, str) and bool(
+            _CHOICE_COUNT_PATTERN.search(message)
+        )
+    return False
+
+
+def _split_choices(payload_obj: Mapping[str, Any]) -> list[dict[str, Any]]:
+    """把带多个候选的响应拆成每个候选一份的响应体，并分摊 usage。
+
+    提示词只计费一次，按轮均摊；补全 token 按各候选输出长度分摊。只有
+    total_tokens 时按轮均摊。
+    """
+
+    choices = payload_obj.get("choices")
+    if not isinstance(choices, list) or len(choices) <= 1:
+        return [dict(payload_obj)]
+    ordered = sorted(choices, key=_choice_index)
+    usage = payload_obj.get("usage")
+    if not isinstance(usage, Mapping):
+        usage = {}
+    even = [1] * len(ordered)
+    prompt_shares = _apportion(usage.get("prompt_tokens"), even)
+    completion_shares = _apportion(
+        usage.get("completion_tokens"),
+        [max(len(_choice_text(choice)), 1) for choice in ordered],
+    )
+    total_shares = _apportion(usage.get("total_tokens"), even)
+
+    bodies: list[dict[str, Any]] = []
+    for position, choice in enumerate(ordered):
+        share: dict[str, int] = {}
+        if prompt_shares is not None:
+            share["prompt_tokens"] = prompt_shares[position]
+        if completion_shares is not None:
+            share["completion_tokens"] = completion_shares[position]
+        if share:
+            share["total_tokens"] = sum(share.values())
+        elif total_shares is not None:
+            share["total_tokens"] = total_shares[position]
+        bodies.append({**payload_obj, "choices": [choice], "usage": share})
+    return bodies
+
+
+def _choice_index(choice: Any) -> int:
+    index = choice.get("index") if isinstance(choice, Mapping) else None
+    return index if isinstance(index, int) else 0
+
+
+def _build_run_artifacts(
+    *,
+    provider: LLMProvider,
+    model: LLMModel | None,
+    payload: Mapping[str, Any],
+    context: RunRequestContext,
+    payload_obj: Mapping[str, Any],
+    latency_ms: int | None,
+    retry_count: int = 0,
+    retry_backoff_ms: int = 0,
+    cache_hit: bool = False,
+    coalesced: bool = False,
+    ttft_ms: float | None = None,
+) -> tuple[Result, LLMUsageLog]:
     choices = payload_obj.get("choices")
     output_text = ""
     if isinstance(choices, Sequence) and choices:
-        first = choices[0]
-        if isinstance(first, Mapping):
-            message = first.get("message")
-            if isinstance(message, Mapping) and isinstance(message.get("content"), str):
-                output_text = message["content"]
-            elif isinstance(first.get("text"), str):
-                output_text = str(first["text"])
-    output_text = str(output_text)
+        output_text = _choice_text(choices[0])
 
     parsed_output = _try_parse_json(output_text)
 
@@ -409,13 +1299,8 @@ def _invoke_llm_once(
         if isinstance(completion_tokens, (int, float)):
             total_tokens += int(completion_tokens)
 
-    elapsed_delta = getattr(response, "elapsed", None)
-    if elapsed_delta is not None:
-        latency_ms = int(elapsed_delta.total_seconds() * 1000)
-    else:
-        latency_ms = int((time.perf_counter() - start_time) * 1000)
-
-    latency_ms = max(latency_ms, 0)
+    if latency_ms is not None:
+        latency_ms = max(int(latency_ms), 0)
 
     result = Result(
         output=output_text,
@@ -442,6 +1327,7 @@ def _invoke_llm_once(
         response_text=output_text or None,
         temperature=request_parameters.get("temperature"),
         latency_ms=latency_ms,
+        ttft_ms=int(ttft_ms) if ttft_ms is not None else None,
         prompt_tokens=int(prompt_tokens)
         if isinstance(prompt_tokens, (int, float))
         else None,
@@ -451,6 +1337,10 @@ def _invoke_llm_once(
         total_tokens=int(total_tokens)
         if isinstance(total_tokens, (int, float))
         else None,
+        retry_count=retry_count,
+        retry_backoff_ms=retry_backoff_ms,
+        cache_hit=cache_hit,
+        coalesced=coalesced,
     )
 
     return result, usage_log
@@ -488,10 +1378,67 @@ def _try_parse_json(text: str) -> Any:
         return None
 
 
-def _persist_run_artifacts(db: Session, result: Result, usage_log: LLMUsageLog) -> None:
-    db.add(result)
-    db.add(usage_log)
-    db.flush()
+class _RunArtifactBatch:
+    """累计测试结果与调用日志，达到 TEST_RUN_INSERT_BATCH_SIZE 时批量写入。
+
+    结果以多行 INSERT 在当前事务内写入，调用日志按配置的写入模式交给
+    usage_log_writer；PostgreSQL 下由驱动的 executemany/insertmanyvalues 合并发送。
+    """
+
+    def __init__(self, db: Session, batch_size: int | None = None) -> None:
+        self._db = db
+        self._batch_size = max(batch_size or settings.TEST_RUN_INSERT_BATCH_SIZE, 1)
+        self._results: list[dict[str, Any]] = []
+        self._usage_logs: list[LLMUsageLog] = []
+        self.written = 0
+
+    def add_usage_log(self, usage_log: LLMUsageLog) -> None:
+        self._usage_logs.append(usage_log)
+
+    def add(self, result: Result, usage_log: LLMUsageLog) -> None:
+        self._results.append(
+            {
+                "test_run_id": result.test_run_id,
+                "run_index": result.run_index,
+                "output": result.output,
+                "parsed_output": result.parsed_output,
+                "tokens_used": result.tokens_used,
+                "latency_ms": result.latency_ms,
+            }
+        )
+        self._usage_logs.append(usage_log)
+        if len(self._results) >= self._batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._results and not self._usage_logs:
+            return
+        results, self._results = self._results, []
+        usage_logs, self._usage_logs = self._usage_logs, []
+        if results:
+            self._db.execute(insert(Result), results)
+            self.written += len(results)
+        # 没有结果时仍需写入单独登记的调用日志，例如对冲落败一路的用量
+        if usage_logs:
+            usage_log_writer.write_many(self._db, usage_logs)
+
+
+def _record_run_metrics(
+    aggregator: RunMetricsAggregator, result: Result, usage_log: LLMUsageLog
+) -> None:
+    aggregator.add(
+        latency_ms=result.latency_ms,
+        total_tokens=result.tokens_used,
+        completion_tokens=usage_log.completion_tokens,
+        ttft_ms=usage_log.ttft_ms,
+        json_success=result.parsed_output is not None,
+    )
 
 
-__all__ = ["execute_test_run", "ensure_completed", "TestRunExecutionError"]
+__all__ = [
+    "TEST_RUN_KIND",
+    "execute_test_run",
+    "ensure_completed",
+    "preflight_test_run",
+    "TestRunExecutionError",
+]
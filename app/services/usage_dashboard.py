@@ -3,7 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import date, datetime
 
-from sqlalchemy import Select, func, select
+from sqlalchemy import Select, case, func, select
 from sqlalchemy.orm import Session
 
 from app.models.llm_provider import LLMProvider
@@ -16,6 +16,8 @@ class UsageOverviewTotals:
     input_tokens: int
     output_tokens: int
     call_count: int
+    cached_tokens: int = 0
+    cached_call_count: int = 0
 
 
 @dataclass(slots=True)
@@ -66,8 +68,22 @@ def calculate_usage_overview(
     input_tokens = func.sum(_prompt_tokens_expr()).label("input_tokens")
     output_tokens = func.sum(_completion_tokens_expr()).label("output_tokens")
     call_count = func.count(LLMUsageLog.id).label("call_count")
-
-    stmt = select(total_tokens, input_tokens, output_tokens, call_count)
+    # 命中响应缓存的调用未实际请求上游，其 token 即为缓存节省的用量
+    cached_tokens = func.sum(
+        case((LLMUsageLog.cache_hit.is_(True), _total_tokens_expr()), else_=0)
+    ).label("cached_tokens")
+    cached_call_count = func.sum(
+        case((LLMUsageLog.cache_hit.is_(True), 1), else_=0)
+    ).label("cached_call_count")
+
+    stmt = select(
+        total_tokens,
+        input_tokens,
+        output_tokens,
+        call_count,
+        cached_tokens,
+        cached_call_count,
+    )
     stmt = _apply_date_filters(stmt, start_date, end_date)
 
     row = db.execute(stmt).one()
@@ -82,7 +98,12 @@ def calculate_usage_overview(
         return None
 
     return UsageOverviewTotals(
-        total_tokens=total, input_tokens=inputs, output_tokens=outputs, call_count=calls
+        total_tokens=total,
+        input_tokens=inputs,
+        output_tokens=outputs,
+        call_count=calls,
+        cached_tokens=int(data.get("cached_tokens") or 0),
+        cached_call_count=int(data.get("cached_call_count") or 0),
     )
 
 
@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import app.db.session as db_session
+from app.core.config import settings
+from app.core.quantile_sketch import QuantileSketch
+from app.models.usage import LLMUsageLog
+
+logger = logging.getLogger("promptworks.usage_log_writer")
+
+_TABLE = LLMUsageLog.__table__
+
+
+class UsageWriteMode(str, Enum):
+    """调用日志的持久化方式：sync 随业务事务提交，buffered 缓冲后批量写入。"""
+
+    SYNC = "sync"
+    BUFFERED = "buffered"
+
+
+def resolve_write_mode() -> UsageWriteMode:
+    try:
+        return UsageWriteMode(settings.USAGE_LOG_WRITE_MODE.strip().lower())
+    except ValueError:
+        logger.warning("忽略无效的调用日志写入模式: %s", settings.USAGE_LOG_WRITE_MODE)
+        return UsageWriteMode.SYNC
+
+
+def _row_from_log(log: LLMUsageLog) -> dict[str, Any]:
+    """把未持久化的日志对象转换为批量 INSERT 所需的列值。"""
+
+    row: dict[str, Any] = {}
+    for column in _TABLE.columns:
+        if column.primary_key:
+            continue
+        value = getattr(log, column.key)
+        default = column.default
+        if value is None and default is not None and default.is_scalar:
+            value = default.arg
+        row[column.key] = value
+    # 以提交时间而非写回时间作为记录时间
+    if row.get("created_at") is None:
+        row["created_at"] = datetime.now(UTC)
+    return row
+
+
+def _encode_row(row: dict[str, Any]) -> str:
+    data = dict(row)
+    if isinstance(data.get("created_at"), datetime):
+        data["created_at"] = data["created_at"].isoformat()
+    return json.dumps(data, ensure_ascii=False)
+
+
+def _decode_row(line: str) -> dict[str, Any]:
+    row = json.loads(line)
+    if isinstance(row.get("created_at"), str):
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return row
+
+
+@dataclass(frozen=True, slots=True)
+class UsageLogWriterStats:
+    mode: str
+    running: bool
+    backlog: int
+    spilled_rows: int
+    written_total: int
+    flushes_total: int
+    failures_total: int
+    dropped_total: int
+    last_flush_ms: float | None
+    p50_flush_ms: float | None
+    p99_flush_ms: float | None
+    max_flush_ms: float | None
+
+
+class UsageLogWriter:
+    """LLM 调用日志的写入服务。
+
+    sync 模式下日志加入调用方会话，随业务数据一起提交；buffered 模式下日志
+    转为列值放入有界队列，由后台线程按 USAGE_LOG_FLUSH_ROWS 或
+    USAGE_LOG_FLUSH_INTERVAL_SECONDS 以多行 INSERT 写入。队列写满或未启动
+    后台线程时由写入方同步写回；数据库不可用时追加到 USAGE_LOG_SPILL_PATH，
+    恢复后在下次写回时补写。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buffer: deque[dict[str, Any]] = deque()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._flushed_at = time.monotonic()
+        self._spilled_rows: int | None = None
+        self._reset_metrics()
+
+    def _reset_metrics(self) -> None:
+        self._written_total = 0
+        self._flushes_total = 0
+        self._failures_total = 0
+        self._dropped_total = 0
+        self._last_flush_ms: float | None = None
+        self._flush_ms = QuantileSketch()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def write(self, db: Session, log: LLMUsageLog) -> None:
+        """登记一条调用日志。"""
+
+        if resolve_write_mode() is UsageWriteMode.SYNC:
+            db.add(log)
+            return
+        row = _row_from_log(log)
+        with self._lock:
+            self._buffer.append(row)
+            backlog = len(self._buffer)
+        if backlog >= settings.USAGE_LOG_BUFFER_SIZE:
+            # 队列已满时由写入方承担写回，形成背压
+            self.flush()
+            return
+        due = backlog >= settings.USAGE_LOG_FLUSH_ROWS or (
+            time.monotonic() - self._flushed_at
+            >= settings.USAGE_LOG_FLUSH_INTERVAL_SECONDS
+        )
+        if not due:
+            return
+        if self.running:
+            self._wakeup.set()
+        else:
+            self.flush()
+
+    def write_many(self, db: Session, logs: Sequence[LLMUsageLog]) -> None:
+        """批量登记调用日志，sync 模式下在调用方事务内以多行 INSERT 写入。"""
+
+        if not logs:
+            return
+        if resolve_write_mode() is UsageWriteMode.SYNC:
+            db.execute(insert(LLMUsageLog), [_row_from_log(log) for log in logs])
+            return
+        for log in logs:
+            self.write(db, log)
+
+    def flush(self) -> int:
+        """写回缓冲与落盘的日志，返回写入的行数。"""
+
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        with self._lock:
+            rows = list(self._buffer)
+            self._buffer.clear()
+        self._flushed_at = time.monotonic()
+        spilled = self._load_spill()
+        batch = spilled + rows
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            self._insert(batch)
+        except Exception:
+            self._failures_total += 1
+            logger.exception("批量写入调用日志失败，转存到本地文件: rows=%s", len(rows))
+            self._spill(rows)
+            return 0
+        if spilled:
+            self._clear_spill()
+            logger.info("已补写落盘的调用日志: rows=%s", len(spilled))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._flushes_total += 1
+        self._written_total += len(batch)
+        self._last_flush_ms = elapsed_ms
+        self._flush_ms.add(elapsed_ms)
+        return len(batch)
+
+    def _insert(self, rows: list[dict[str, Any]]) -> None:
+        chunk = max(settings.USAGE_LOG_FLUSH_ROWS, 1)
+        session = db_session.SessionLocal()
+        try:
+            for offset in range(0, len(rows), chunk):
+                session.execute(insert(LLMUsageLog), rows[offset : offset + chunk])
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _spill_path(self) -> Path | None:
+        raw = settings.USAGE_LOG_SPILL_PATH.strip()
+        return Path(raw) if raw else None
+
+    def _spill(self, rows: list[dict[str, Any]]) -> None:
+        if not rows:
+            return
+        path = self._spill_path()
+        try:
+            if path is None:
+                raise OSError("未配置 USAGE_LOG_SPILL_PATH")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with path.open("a", encoding="utf-8") as handle:
+                handle.writelines(_encode_row(row) + "\n" for row in rows)
+        except OSError:
+            self._dropped_total += len(rows)
+            logger.exception("调用日志落盘失败，丢弃 %s 条记录", len(rows))
+            return
+        self._spilled_rows = (self._spilled_rows or 0) + len(rows)
+
+    def _load_spill(self) -> list[dict[str, Any]]:
+        path = self._spill_path()
+        if path is None or not path.exists():
+            self._spilled_rows = 0
+            return []
+        rows: list[dict[str, Any]] = []
+        with path.open(encoding="utf-8") as handle:
+            for line in handle:
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(_decode_row(line))
+                except (ValueError, TypeError):
+                    logger.warning("跳过无法解析的落盘调用日志: %s", line[:200])
+        self._spilled_rows = len(rows)
+        return rows
+
+    def _clear_spill(self) -> None:
+        path = self._spill_path()
+        if path is not None:
+            path.unlink(missing_ok=True)
+        self._spilled_rows = 0
+
+    def start(self) -> UsageLogWriter:
+        """buffered 模式下启动后台写回线程，sync 模式下不做任何事。"""
+
+        if resolve_write_mode() is not UsageWriteMode.BUFFERED or self.running:
+            return self
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="usage-log-writer", daemon=True
+        )
+        self._thread.start()
+        logger.info("调用日志后台写回线程已启动")
+        return self
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(timeout=settings.USAGE_LOG_FLUSH_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:  # pragma: no cover - 防御性
+                logger.exception("调用日志后台写回异常")
+
+    def close(self, timeout: float = 10.0) -> None:
+        """停止后台线程并写回剩余日志。"""
+
+        thread = self._thread
+        if thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            thread.join(timeout=timeout)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> UsageLogWriterStats:
+        with self._lock:
+            backlog = len(self._buffer)
+        sketch = self._flush_ms
+        if self._spilled_rows is None:
+            path = self._spill_path()
+            exists = path is not None and path.exists()
+            self._spilled_rows = len(self._load_spill()) if exists else 0
+        return UsageLogWriterStats(
+            mode=resolve_write_mode().value,
+            running=self.running,
+            backlog=backlog,
+            spilled_rows=self._spilled_rows,
+            written_total=self._written_total,
+            flushes_total=self._flushes_total,
+            failures_total=self._failures_total,
+            dropped_total=self._dropped_total,
+            last_flush_ms=self._last_flush_ms,
+            p50_flush_ms=sketch.quantile(0.5),
+            p99_flush_ms=sketch.quantile(0.99),
+            max_flush_ms=sketch.max if sketch.count else None,
+        )
+
+    def reset(self) -> None:
+        """丢弃缓冲与统计，仅用于测试。"""
+
+        with self._lock:
+            self._buffer.clear()
+        self._spilled_rows = None
+        self._flushed_at = time.monotonic()
+        self._reset_metrics()
+
+
+usage_log_writer = UsageLogWriter()
+
+
+__all__ = [
+    "UsageLogWriter",
+    "UsageLogWriterStats",
+    "UsageWriteMode",
+    "resolve_write_mode",
+    "usage_log_writer",
+]
@@ -0,0 +1,80 @@
+"""独立的作业执行进程，与 API 进程共享同一个数据库作业队列。
+
+使用方法:
+    python -m app.worker --concurrency 4
+    python -m app.worker --kinds prompt_test_task
+
+可在多台机器上启动任意数量的工作进程，作业通过 SKIP LOCKED 认领，
+进程失联后其作业会在租约过期后由其他进程接管。
+"""
+
+from __future__ import annotations
+
+import argparse
+import signal
+import sys
+
+from app.core.config import settings
+from app.core.job_queue import JobWorker, durable_queue_enabled, registered_job_kinds
+from app.core.logging_config import configure_logging, get_logger
+from app.services.usage_log_writer import usage_log_writer
+
+# 导入队列模块以登记各类作业的执行函数
+from app.core import prompt_test_task_queue as _prompt_test_task_queue  # noqa: F401
+from app.core import task_queue as _test_run_task_queue  # noqa: F401
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="运行 PromptWorks 作业执行进程")
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY
+    )
+    parser.add_argument(
+        "--kinds",
+        default="",
+        help="只执行指定类型的作业，逗号分隔，可选: "
+        + ", ".join(registered_job_kinds()),
+    )
+    parser.add_argument("--worker-id", default=None)
+    parser.add_argument(
+        "--poll-interval", type=float, default=settings.JOB_POLL_INTERVAL_SECONDS
+    )
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    logger = get_logger("promptworks.worker")
+    if not durable_queue_enabled():
+        logger.error(
+            "当前配置未启用持久化作业队列，请使用 PostgreSQL 或设置 JOB_QUEUE_BACKEND"
+        )
+        return 1
+
+    kinds = [item.strip() for item in args.kinds.split(",") if item.strip()]
+    unknown = sorted(set(kinds) - set(registered_job_kinds()))
+    if unknown:
+        logger.error("未知的作业类型: %s", ", ".join(unknown))
+        return 1
+
+    worker = JobWorker(
+        worker_id=args.worker_id,
+        kinds=kinds or None,
+        concurrency=args.concurrency,
+        poll_interval=args.poll_interval,
+    )
+
+    def _shutdown(signum: int, _frame: object) -> None:
+        logger.info("收到信号 %s，等待在途作业完成后退出", signum)
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+    usage_log_writer.start()
+    try:
+        worker.run_forever()
+    finally:
+        usage_log_writer.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
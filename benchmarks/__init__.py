@@ -0,0 +1 @@
+"""基于本地模拟 LLM 服务的执行引擎压测工具。"""
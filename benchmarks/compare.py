@@ -0,0 +1,93 @@
+"""比较两次压测结果，按场景与并发档位输出吞吐与延迟变化。
+
+使用方法:
+    python -m benchmarks.compare baseline.json current.json --threshold 0.1
+
+当任一档位的吞吐下降或 p95 延迟上升超过阈值时以非零状态码退出，便于接入 CI。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+
+def _index(report: dict[str, Any]) -> dict[tuple[str, int], dict[str, Any]]:
+    return {
+        (item["scenario"], int(item["concurrency"])): item
+        for item in report.get("results", [])
+    }
+
+
+def _change(before: float | None, after: float | None) -> float | None:
+    if not before or after is None:
+        return None
+    return (after - before) / before
+
+
+def compare_reports(
+    baseline: dict[str, Any], current: dict[str, Any], *, threshold: float
+) -> tuple[list[dict[str, Any]], bool]:
+    """返回逐档位的对比行，以及是否存在超过阈值的退化。"""
+
+    rows: list[dict[str, Any]] = []
+    regressed = False
+    before_index = _index(baseline)
+    for key, after in sorted(_index(current).items()):
+        before = before_index.get(key)
+        if before is None:
+            continue
+        rps_change = _change(before["requests_per_sec"], after["requests_per_sec"])
+        p95_change = _change(
+            before["job_latency_ms"]["p95"], after["job_latency_ms"]["p95"]
+        )
+        row_regressed = (rps_change is not None and rps_change < -threshold) or (
+            p95_change is not None and p95_change > threshold
+        )
+        regressed = regressed or row_regressed
+        rows.append(
+            {
+                "scenario": key[0],
+                "concurrency": key[1],
+                "rps_before": before["requests_per_sec"],
+                "rps_after": after["requests_per_sec"],
+                "rps_change": rps_change,
+                "p95_before": before["job_latency_ms"]["p95"],
+                "p95_after": after["job_latency_ms"]["p95"],
+                "p95_change": p95_change,
+                "regressed": row_regressed,
+            }
+        )
+    return rows, regressed
+
+
+def _fmt(value: float | None) -> str:
+    return "n/a" if value is None else f"{value:+.1%}"
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="比较两次压测结果")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1, help="允许的退化比例")
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    current = json.loads(Path(args.current).read_text(encoding="utf-8"))
+    rows, regressed = compare_reports(baseline, current, threshold=args.threshold)
+    for row in rows:
+        flag = " <- 退化" if row["regressed"] else ""
+        print(
+            f"{row['scenario']:<12} c={row['concurrency']:<4} "
+            f"req/s {row['rps_before']} -> {row['rps_after']} ({_fmt(row['rps_change'])}) "
+            f"p95 {row['p95_before']} -> {row['p95_after']} ({_fmt(row['p95_change'])})"
+            f"{flag}"
+        )
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
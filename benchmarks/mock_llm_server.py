@@ -0,0 +1,335 @@
+"""本地 OpenAI 兼容模拟服务，用于离线压测执行引擎。
+
+使用方法:
+    python -m benchmarks.mock_llm_server --port 9100 --latency lognormal:300:0.4 \
+        --error-429 0.05 --ttft-ms 200 --chunk-interval-ms 20
+
+延迟分布格式:
+    fixed:<ms>                固定延迟
+    uniform:<min_ms>:<max_ms> 均匀分布
+    lognormal:<median_ms>:<sigma> 对数正态分布，贴近真实服务的长尾
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from typing import Any
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+@dataclass(frozen=True, slots=True)
+class LatencyDistribution:
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        parts = spec.split(":")
+        kind = parts[0].strip().lower()
+        values = [float(item) for item in parts[1:]]
+        if kind == "fixed" and len(values) == 1:
+            return cls(kind, values[0])
+        if kind in {"uniform", "lognormal"} and len(values) == 2:
+            return cls(kind, values[0], values[1])
+        raise ValueError(f"无法解析的延迟分布: {spec}")
+
+    def sample_ms(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(max(self.a, 1e-3)), self.b)
+        return self.a
+
+
+@dataclass(slots=True)
+class MockLLMConfig:
+    """模拟服务的行为配置，全部时间单位为毫秒。"""
+
+    latency: LatencyDistribution = field(default_factory=LatencyDistribution)
+    completion_tokens: int = 64
+    error_429_rate: float = 0.0
+    error_500_rate: float = 0.0
+    timeout_rate: float = 0.0
+    timeout_ms: float = 60_000.0
+    retry_after_ms: float = 50.0
+    ttft_ms: float = 0.0
+    chunk_interval_ms: float = 10.0
+    chunk_tokens: int = 4
+    seed: int | None = None
+
+
+@dataclass(slots=True)
+class MockLLMStats:
+    requests: int = 0
+    stream_requests: int = 0
+    errors_429: int = 0
+    errors_500: int = 0
+    timeouts: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "requests": self.requests,
+            "stream_requests": self.stream_requests,
+            "errors_429": self.errors_429,
+            "errors_500": self.errors_500,
+            "timeouts": self.timeouts,
+        }
+
+
+def _estimate_prompt_tokens(messages: Any) -> int:
+    text = json.dumps(messages, ensure_ascii=False) if messages else ""
+    return max(1, len(text) // 4)
+
+
+def create_mock_app(config: MockLLMConfig | None = None) -> FastAPI:
+    """创建模拟服务应用，统计信息挂在 app.state.stats 上。"""
+
+    config = config or MockLLMConfig()
+    rng = random.Random(config.seed)
+    rng_lock = threading.Lock()
+    stats = MockLLMStats()
+    app = FastAPI(title="PromptWorks Mock LLM")
+    app.state.config = config
+    app.state.stats = stats
+
+    def _draw() -> tuple[float, float]:
+        with rng_lock:
+            return rng.random(), config.latency.sample_ms(rng)
+
+    def _completion_text(tokens: int) -> str:
+        return " ".join(f"tok{index}" for index in range(tokens))
+
+    async def _stream_body(
+        model: str, prompt_tokens: int, include_usage: bool
+    ) -> AsyncIterator[bytes]:
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        await asyncio.sleep(config.ttft_ms / 1000)
+        produced = 0
+        while produced < config.completion_tokens:
+            size = min(config.chunk_tokens, config.completion_tokens - produced)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"content": _completion_text(size) + " "},
+                        "finish_reason": None,
+                    }
+                ],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+            produced += size
+            if produced < config.completion_tokens:
+                await asyncio.sleep(config.chunk_interval_ms / 1000)
+        final: dict[str, Any] = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        if include_usage:
+            final["usage"] = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": config.completion_tokens,
+                "total_tokens": prompt_tokens + config.completion_tokens,
+            }
+        yield f"data: {json.dumps(final)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    async def _chat_completions(request: Request):
+        body = await request.json()
+        stats.requests += 1
+        roll, latency_ms = _draw()
+
+        if roll < config.error_429_rate:
+            stats.errors_429 += 1
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "mock rate limit", "type": "rate_limit"}},
+                headers={"retry-after-ms": str(int(config.retry_after_ms))},
+            )
+        roll -= config.error_429_rate
+        if roll < config.error_500_rate:
+            stats.errors_500 += 1
+            await asyncio.sleep(latency_ms / 1000)
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "mock server error", "type": "server"}},
+            )
+        roll -= config.error_500_rate
+        if roll < config.timeout_rate:
+            stats.timeouts += 1
+            await asyncio.sleep(config.timeout_ms / 1000)
+
+        model = str(body.get("model") or "mock-model")
+        messages = body.get("messages")
+        prompt_tokens = _estimate_prompt_tokens(messages)
+        if body.get("stream"):
+            stats.stream_requests += 1
+            options = body.get("stream_options") or {}
+            return StreamingResponse(
+                _stream_body(model, prompt_tokens, bool(options.get("include_usage"))),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(latency_ms / 1000)
+        n = max(1, int(body.get("n") or 1))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": index,
+                    "message": {
+                        "role": "assistant",
+                        "content": _completion_text(config.completion_tokens),
+                    },
+                    "finish_reason": "stop",
+                }
+                for index in range(n)
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": config.completion_tokens * n,
+                "total_tokens": prompt_tokens + config.completion_tokens * n,
+            },
+        }
+
+    app.add_api_route("/v1/chat/completions", _chat_completions, methods=["POST"])
+    app.add_api_route("/chat/completions", _chat_completions, methods=["POST"])
+
+    @app.get("/stats")
+    def _read_stats() -> dict[str, int]:
+        return stats.as_dict()
+
+    return app
+
+
+class MockLLMServer:
+    """在后台线程中运行模拟服务，供压测脚本以真实 HTTP 方式调用。"""
+
+    def __init__(
+        self,
+        config: MockLLMConfig | None = None,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        import uvicorn
+
+        self.app = create_mock_app(config)
+        self._server = uvicorn.Server(
+            uvicorn.Config(
+                self.app,
+                host=host,
+                port=port,
+                log_level="warning",
+                access_log=False,
+                timeout_keep_alive=30,
+            )
+        )
+        self._thread = threading.Thread(
+            target=self._server.run, name="mock-llm-server", daemon=True
+        )
+        self.host = host
+
+    @property
+    def stats(self) -> MockLLMStats:
+        return self.app.state.stats
+
+    @property
+    def base_url(self) -> str:
+        sockets = self._server.servers[0].sockets
+        port = sockets[0].getsockname()[1]
+        return f"http://{self.host}:{port}/v1"
+
+    def start(self, timeout: float = 10.0) -> "MockLLMServer":
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("模拟 LLM 服务启动失败")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="lognormal:200:0.4", help="延迟分布")
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--error-429", type=float, default=0.0, help="429 错误比例")
+    parser.add_argument("--error-500", type=float, default=0.0, help="500 错误比例")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="超时比例")
+    parser.add_argument("--timeout-ms", type=float, default=60_000.0)
+    parser.add_argument("--retry-after-ms", type=float, default=50.0)
+    parser.add_argument("--ttft-ms", type=float, default=150.0, help="流式首字延迟")
+    parser.add_argument("--chunk-interval-ms", type=float, default=15.0)
+    parser.add_argument("--chunk-tokens", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> MockLLMConfig:
+    return MockLLMConfig(
+        latency=LatencyDistribution.parse(args.latency),
+        completion_tokens=args.completion_tokens,
+        error_429_rate=args.error_429,
+        error_500_rate=args.error_500,
+        timeout_rate=args.timeout_rate,
+        timeout_ms=args.timeout_ms,
+        retry_after_ms=args.retry_after_ms,
+        ttft_ms=args.ttft_ms,
+        chunk_interval_ms=args.chunk_interval_ms,
+        chunk_tokens=args.chunk_tokens,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="启动本地 OpenAI 兼容模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_mock_app(config_from_args(args)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
+
+
+__all__ = [
+    "LatencyDistribution",
+    "MockLLMConfig",
+    "MockLLMServer",
+    "MockLLMStats",
+    "add_mock_arguments",
+    "config_from_args",
+    "create_mock_app",
+]
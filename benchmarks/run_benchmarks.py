@@ -0,0 +1,592 @@
+"""执行引擎吞吐压测脚本，基于本地模拟 LLM 服务，不会调用任何付费接口。
+
+使用方法:
+    python -m benchmarks.run_benchmarks --scenarios test_run,prompt_test,stream \
+        --concurrency 1,4,16 --jobs 8 --rounds 5 --output bench.json
+
+    # 比较两次提交的结果
+    python -m benchmarks.run_benchmarks --output after.json
+    python -m benchmarks.compare before.json after.json
+
+场景说明:
+    test_run     通过 execute_test_run 执行测试任务，concurrency 同时作为并发任务数与模型并发上限
+    prompt_test  通过 execute_prompt_test_experiment 执行 Prompt 测试实验
+    stream       通过 HTTP 调用 /api/v1/llm-providers/{id}/invoke/stream
+
+默认使用临时 SQLite 数据库，可通过 --database-url 指向 PostgreSQL 以获得更贴近生产的写入耗时。
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmarks.mock_llm_server import (  # noqa: E402
+    MockLLMServer,
+    add_mock_arguments,
+    config_from_args,
+)
+
+SCENARIOS = ("test_run", "prompt_test", "stream")
+
+
+@dataclass(slots=True)
+class LatencySummary:
+    count: int
+    mean: float | None
+    p50: float | None
+    p95: float | None
+    p99: float | None
+    max: float | None
+
+
+@dataclass(slots=True)
+class ScenarioResult:
+    scenario: str
+    concurrency: int
+    jobs: int
+    llm_requests: int
+    errors: int
+    duration_s: float
+    requests_per_sec: float
+    job_latency_ms: LatencySummary
+    llm_latency_ms: LatencySummary
+    db_write_ms: float
+    db_write_statements: int
+    peak_traced_memory_mb: float | None
+    peak_rss_mb: float
+    extra: dict[str, Any] = field(default_factory=dict)
+
+
+def percentile(ordered: Sequence[float], q: float) -> float | None:
+    """最近秩法计算分位数，ordered 需已升序排列。"""
+
+    if not ordered:
+        return None
+    rank = max(1, min(len(ordered), math.ceil(q * len(ordered))))
+    return float(ordered[rank - 1])
+
+
+def summarize(samples: Sequence[float]) -> LatencySummary:
+    ordered = sorted(samples)
+    return LatencySummary(
+        count=len(ordered),
+        mean=round(sum(ordered) / len(ordered), 3) if ordered else None,
+        p50=_round(percentile(ordered, 0.50)),
+        p95=_round(percentile(ordered, 0.95)),
+        p99=_round(percentile(ordered, 0.99)),
+        max=_round(ordered[-1]) if ordered else None,
+    )
+
+
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(float(value), 3)
+
+
+class DBWriteTimer:
+    """通过 SQLAlchemy 事件统计 INSERT/UPDATE/DELETE 语句的累计执行时间。"""
+
+    _WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+
+    def __init__(self, engine: Any) -> None:
+        self.engine = engine
+        self.total_seconds = 0.0
+        self.statements = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.started = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(self._local, "started", None)
+        if started is None:
+            return
+        if statement.lstrip()[:6].upper() in self._WRITE_PREFIXES:
+            with self._lock:
+                self.total_seconds += time.perf_counter() - started
+                self.statements += 1
+
+    def __enter__(self) -> "DBWriteTimer":
+        from sqlalchemy import event
+
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        event.listen(self.engine, "after_cursor_execute", self._after)
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        from sqlalchemy import event
+
+        event.remove(self.engine, "before_cursor_execute", self._before)
+        event.remove(self.engine, "after_cursor_execute", self._after)
+
+
+def _peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage / divisor, 2)
+
+
+def _git_commit() -> str | None:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True
+            ).strip()
+            or None
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkContext:
+    """准备压测所需的数据库、模拟服务与基础数据。"""
+
+    def __init__(self, mock: MockLLMServer, *, trace_memory: bool) -> None:
+        from app.db import session as db_session
+        from app.models import Base
+
+        # 压测期间只保留告警日志，避免逐请求日志影响吞吐
+        for name in ("promptworks", "httpx"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+        self.mock = mock
+        self.trace_memory = trace_memory
+        self.db_session = db_session
+        Base.metadata.create_all(bind=db_session.engine)
+        self.provider_id, self.prompt_version_id = self._seed()
+
+    def _seed(self) -> tuple[int, int]:
+        from app.models.llm_provider import LLMProvider
+        from app.models.prompt import Prompt, PromptClass, PromptVersion
+
+        with self.db_session.SessionLocal() as session:
+            provider = LLMProvider(
+                provider_name=f"bench-{int(time.time() * 1000)}",
+                api_key="bench-key",
+                is_custom=True,
+                base_url=self.mock.base_url,
+            )
+            prompt_class = PromptClass(name=f"压测-{int(time.time() * 1000)}")
+            prompt = Prompt(name="压测 Prompt", prompt_class=prompt_class)
+            version = PromptVersion(
+                prompt=prompt, version="v1", content="你是一位用于压测的助手。"
+            )
+            prompt.current_version = version
+            session.add_all([provider, prompt_class, prompt, version])
+            session.commit()
+            return provider.id, version.id
+
+    def create_model(self, concurrency: int) -> tuple[int, str]:
+        from app.models.llm_provider import LLMModel
+
+        with self.db_session.SessionLocal() as session:
+            name = f"mock-c{concurrency}-{int(time.time() * 1000)}"
+            model = LLMModel(
+                provider_id=self.provider_id,
+                name=name,
+                concurrency_limit=concurrency,
+            )
+            session.add(model)
+            session.commit()
+            return model.id, name
+
+    def llm_latencies(self, since_id: int, model_name: str) -> list[float]:
+        from sqlalchemy import select
+
+        from app.models.usage import LLMUsageLog
+
+        with self.db_session.SessionLocal() as session:
+            rows = session.scalars(
+                select(LLMUsageLog.latency_ms).where(
+                    LLMUsageLog.id > since_id,
+                    LLMUsageLog.model_name == model_name,
+                    LLMUsageLog.latency_ms.is_not(None),
+                )
+            ).all()
+        return [float(value) for value in rows]
+
+    def max_usage_id(self) -> int:
+        from sqlalchemy import func, select
+
+        from app.models.usage import LLMUsageLog
+
+        with self.db_session.SessionLocal() as session:
+            return session.scalar(select(func.max(LLMUsageLog.id))) or 0
+
+    @contextmanager
+    def measure(self) -> Iterator[dict[str, Any]]:
+        """统计代码块的耗时、数据库写入耗时与内存峰值。"""
+
+        metrics: dict[str, Any] = {}
+        mock_before = self.mock.stats.as_dict()
+        if self.trace_memory:
+            tracemalloc.start()
+        timer = DBWriteTimer(self.db_session.engine)
+        started = time.perf_counter()
+        with timer:
+            yield metrics
+        metrics["duration_s"] = time.perf_counter() - started
+        metrics["db_write_ms"] = round(timer.total_seconds * 1000, 3)
+        metrics["db_write_statements"] = timer.statements
+        metrics["peak_traced_memory_mb"] = None
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            metrics["peak_traced_memory_mb"] = round(peak / (1024 * 1024), 2)
+        metrics["peak_rss_mb"] = _peak_rss_mb()
+        metrics["mock"] = {
+            key: value - mock_before.get(key, 0)
+            for key, value in self.mock.stats.as_dict().items()
+        }
+
+
+def _timed_jobs(
+    job_ids: Sequence[int], run: Callable[[int], bool], concurrency: int
+) -> tuple[list[float], int]:
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def _job(job_id: int) -> None:
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            ok = run(job_id)
+        except Exception:  # 单个任务失败计入错误数，不中断整个场景
+            ok = False
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        list(executor.map(_job, job_ids))
+    return latencies, errors
+
+
+def run_test_run_scenario(
+    ctx: BenchmarkContext, *, concurrency: int, jobs: int, rounds: int
+) -> ScenarioResult:
+    from app.models.test_run import TestRun, TestRunStatus
+    from app.services.test_run import TestRunExecutionError, execute_test_run
+
+    model_id, model_name = ctx.create_model(concurrency)
+    with ctx.db_session.SessionLocal() as session:
+        runs = [
+            TestRun(
+                prompt_version_id=ctx.prompt_version_id,
+                model_name=model_name,
+                temperature=0.7,
+                repetitions=rounds,
+                schema={"llm_provider_id": ctx.provider_id, "llm_model_id": model_id},
+            )
+            for _ in range(jobs)
+        ]
+        session.add_all(runs)
+        session.commit()
+        run_ids = [run.id for run in runs]
+
+    def _run(run_id: int) -> bool:
+        with ctx.db_session.SessionLocal() as session:
+            test_run = session.get(TestRun, run_id)
+            try:
+                execute_test_run(session, test_run)
+            except TestRunExecutionError:
+                session.rollback()
+                return False
+            session.commit()
+            return test_run.status == TestRunStatus.COMPLETED
+
+    since_id = ctx.max_usage_id()
+    with ctx.measure() as metrics:
+        latencies, errors = _timed_jobs(run_ids, _run, concurrency)
+    return _build_result(
+        "test_run",
+        metrics,
+        concurrency=concurrency,
+        jobs=jobs,
+        latencies=latencies,
+        errors=errors,
+        llm_latencies=ctx.llm_latencies(since_id, model_name),
+    )
+
+
+def run_prompt_test_scenario(
+    ctx: BenchmarkContext, *, concurrency: int, jobs: int, rounds: int
+) -> ScenarioResult:
+    from app.models.prompt_test import (
+        PromptTestExperiment,
+        PromptTestExperimentStatus,
+        PromptTestTask,
+        PromptTestUnit,
+    )
+    from app.services.prompt_test_engine import (
+        PromptTestExecutionError,
+        execute_prompt_test_experiment,
+    )
+
+    _, model_name = ctx.create_model(concurrency)
+    with ctx.db_session.SessionLocal() as session:
+        task = PromptTestTask(name="压测任务", prompt_version_id=ctx.prompt_version_id)
+        experiments = []
+        for index in range(jobs):
+            unit = PromptTestUnit(
+                task=task,
+                prompt_version_id=ctx.prompt_version_id,
+                name=f"压测单元-{index}",
+                model_name=model_name,
+                llm_provider_id=ctx.provider_id,
+                rounds=rounds,
+                prompt_template="请复述：{text}",
+                variables={"cases": [{"text": f"样例 {index}"}]},
+            )
+            experiments.append(PromptTestExperiment(unit=unit, sequence=1))
+        session.add(task)
+        session.add_all(experiments)
+        session.commit()
+        experiment_ids = [experiment.id for experiment in experiments]
+
+    def _run(experiment_id: int) -> bool:
+        with ctx.db_session.SessionLocal() as session:
+            experiment = session.get(PromptTestExperiment, experiment_id)
+            try:
+                execute_prompt_test_experiment(session, experiment)
+            except PromptTestExecutionError:
+                session.rollback()
+                return False
+            session.commit()
+            return experiment.status == PromptTestExperimentStatus.COMPLETED
+
+    since_id = ctx.max_usage_id()
+    # Prompt 测试队列串行执行任务，轮次并发由模型并发上限控制
+    with ctx.measure() as metrics:
+        latencies, errors = _timed_jobs(experiment_ids, _run, 1)
+    return _build_result(
+        "prompt_test",
+        metrics,
+        concurrency=concurrency,
+        jobs=jobs,
+        latencies=latencies,
+        errors=errors,
+        llm_latencies=ctx.llm_latencies(since_id, model_name),
+    )
+
+
+def run_stream_scenario(
+    ctx: BenchmarkContext, *, concurrency: int, jobs: int, rounds: int
+) -> ScenarioResult:
+    import httpx
+    import uvicorn
+
+    from app.main import app
+
+    model_id, model_name = ctx.create_model(concurrency)
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, name="bench-api", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    url = (
+        f"http://127.0.0.1:{port}/api/v1/llm-providers/{ctx.provider_id}/invoke/stream"
+    )
+    body = {
+        "model_id": model_id,
+        "messages": [{"role": "user", "content": "压测流式输出"}],
+        "temperature": 0.7,
+    }
+    ttfts: list[float] = []
+    lock = threading.Lock()
+    client = httpx.Client(timeout=120, limits=httpx.Limits(max_connections=concurrency))
+
+    def _run(_: int) -> bool:
+        started = time.perf_counter()
+        first: float | None = None
+        with client.stream("POST", url, json=body) as response:
+            if response.status_code != 200:
+                return False
+            for chunk in response.iter_bytes():
+                if first is None and chunk:
+                    first = (time.perf_counter() - started) * 1000
+        if first is not None:
+            with lock:
+                ttfts.append(first)
+        return True
+
+    since_id = ctx.max_usage_id()
+    total = jobs * rounds
+    try:
+        with ctx.measure() as metrics:
+            latencies, errors = _timed_jobs(range(total), _run, concurrency)
+    finally:
+        client.close()
+        server.should_exit = True
+        thread.join(timeout=10)
+    result = _build_result(
+        "stream",
+        metrics,
+        concurrency=concurrency,
+        jobs=total,
+        latencies=latencies,
+        errors=errors,
+        llm_latencies=ctx.llm_latencies(since_id, model_name),
+    )
+    result.extra["ttft_ms"] = asdict(summarize(ttfts))
+    return result
+
+
+def _build_result(
+    scenario: str,
+    metrics: dict[str, Any],
+    *,
+    concurrency: int,
+    jobs: int,
+    latencies: list[float],
+    errors: int,
+    llm_latencies: list[float],
+) -> ScenarioResult:
+    duration = metrics["duration_s"]
+    llm_requests = len(llm_latencies)
+    return ScenarioResult(
+        scenario=scenario,
+        concurrency=concurrency,
+        jobs=jobs,
+        llm_requests=llm_requests,
+        errors=errors,
+        duration_s=round(duration, 4),
+        requests_per_sec=round(llm_requests / duration, 3) if duration else 0.0,
+        job_latency_ms=summarize(latencies),
+        llm_latency_ms=summarize(llm_latencies),
+        db_write_ms=metrics["db_write_ms"],
+        db_write_statements=metrics["db_write_statements"],
+        peak_traced_memory_mb=metrics["peak_traced_memory_mb"],
+        peak_rss_mb=metrics["peak_rss_mb"],
+        extra={"mock": metrics["mock"]},
+    )
+
+
+_RUNNERS: dict[str, Callable[..., ScenarioResult]] = {
+    "test_run": run_test_run_scenario,
+    "prompt_test": run_prompt_test_scenario,
+    "stream": run_stream_scenario,
+}
+
+
+def _parse_int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: Sequence[str] | None = None) -> dict[str, Any]:
+    parser = argparse.ArgumentParser(description="PromptWorks 执行引擎吞吐压测")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=_parse_int_list, default=[1, 4, 16])
+    parser.add_argument("--jobs", type=int, default=8, help="每个并发档位的任务数")
+    parser.add_argument("--rounds", type=int, default=5, help="每个任务的调用轮次")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="使用 tracemalloc 统计 Python 堆峰值，会降低吞吐",
+    )
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    scenarios = [item.strip() for item in args.scenarios.split(",") if item.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    tmpdir = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        tmpdir = tempfile.TemporaryDirectory(prefix="promptworks-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir.name}/bench.db"
+    # 压测关注执行引擎本身，不做人为的请求节奏控制
+    os.environ.setdefault("LLM_PACING_ENABLED", "false")
+
+    mock_config = config_from_args(args)
+    results: list[ScenarioResult] = []
+    with MockLLMServer(mock_config) as mock:
+        ctx = BenchmarkContext(mock, trace_memory=args.trace_memory)
+        for scenario in scenarios:
+            for concurrency in args.concurrency:
+                result = _RUNNERS[scenario](
+                    ctx, concurrency=concurrency, jobs=args.jobs, rounds=args.rounds
+                )
+                results.append(result)
+                print(
+                    f"[{scenario} c={concurrency}] {result.requests_per_sec} req/s "
+                    f"p50={result.job_latency_ms.p50} p95={result.job_latency_ms.p95} "
+                    f"p99={result.job_latency_ms.p99} ms errors={result.errors}",
+                    file=sys.stderr,
+                )
+
+    report = {
+        "generated_at": datetime.now(UTC).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": "sqlite" if tmpdir else "custom",
+        "parameters": {
+            "scenarios": scenarios,
+            "concurrency": args.concurrency,
+            "jobs": args.jobs,
+            "rounds": args.rounds,
+            "mock": {
+                key: value
+                for key, value in vars(args).items()
+                if key
+                in {
+                    "latency",
+                    "completion_tokens",
+                    "error_429",
+                    "error_500",
+                    "timeout_rate",
+                    "ttft_ms",
+                    "chunk_interval_ms",
+                    "chunk_tokens",
+                    "seed",
+                }
+            },
+        },
+        "results": [asdict(result) for result in results],
+    }
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        print(payload)
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    return report
+
+
+if __name__ == "__main__":
+    main()
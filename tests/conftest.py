@@ -1,5 +1,6 @@
-from collections.abc import Iterator
+from collections.abc import Callable, Iterator
 
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -8,9 +9,18 @@ from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import StaticPool
 
 import app.db.session as db_session_module
+from app.core.llm_adaptive_concurrency import adaptive_concurrency
+from app.core.llm_circuit_breaker import llm_circuit_breaker
+from app.core.llm_hedging import llm_hedger
+from app.core.llm_http_client import llm_client_registry
+from app.core.llm_pacing import llm_pacer
 from app.core.task_queue import task_queue
 from app.db.session import get_db
 from app.main import app
+from app.services.budget import budget_tracker
+from app.services.llm_config_cache import llm_config_cache
+from app.services.llm_response_cache import llm_response_cache
+from app.services.usage_log_writer import usage_log_writer
 from app.models import Base  # noqa: F401 - ensure models are loaded
 
 
@@ -43,10 +53,16 @@ def db_session(engine: Engine) -> Iterator[Session]:
 
     original_session_local = db_session_module.SessionLocal
     db_session_module.SessionLocal = session_local
+    budget_tracker.reset()
+    llm_config_cache.reset()
+    usage_log_writer.reset()
     try:
         yield session
     finally:
         task_queue.wait_for_idle(timeout=2.0)
+        budget_tracker.reset()
+        llm_config_cache.reset()
+        usage_log_writer.reset()
         db_session_module.SessionLocal = original_session_local
         session.close()
         if transaction.is_active:
@@ -65,3 +81,19 @@ def client(db_session: Session) -> Iterator[TestClient]:
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
+
+
+@pytest.fixture()
+def llm_transport() -> Iterator[Callable[[Callable[..., httpx.Response]], None]]:
+    """Route pooled LLM clients to an in-process handler instead of the network."""
+
+    def install(handler: Callable[..., httpx.Response]) -> None:
+        llm_client_registry.use_transport(httpx.MockTransport(handler))
+
+    yield install
+    llm_client_registry.use_transport(None)
+    adaptive_concurrency.reset()
+    llm_response_cache.memory.clear()
+    llm_pacer.reset()
+    llm_hedger.reset()
+    llm_circuit_breaker.reset()
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.compare import compare_reports
+from benchmarks.mock_llm_server import (
+    LatencyDistribution,
+    MockLLMConfig,
+    create_mock_app,
+)
+from benchmarks.run_benchmarks import percentile, summarize
+
+
+def _body(**extra):
+    return {
+        "model": "mock",
+        "messages": [{"role": "user", "content": "ping"}],
+        **extra,
+    }
+
+
+def test_mock_returns_openai_compatible_completion():
+    app = create_mock_app(MockLLMConfig(completion_tokens=3))
+    with TestClient(app) as client:
+        response = client.post("/v1/chat/completions", json=_body(n=2))
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert len(payload["choices"]) == 2
+    assert payload["choices"][0]["message"]["content"] == "tok0 tok1 tok2"
+    assert payload["usage"]["completion_tokens"] == 6
+    assert app.state.stats.requests == 1
+
+
+def test_mock_injects_rate_limit_errors():
+    app = create_mock_app(MockLLMConfig(error_429_rate=1.0, retry_after_ms=25))
+    with TestClient(app) as client:
+        response = client.post("/v1/chat/completions", json=_body())
+
+    assert response.status_code == 429
+    assert response.headers["retry-after-ms"] == "25"
+    assert app.state.stats.errors_429 == 1
+
+
+def test_mock_streams_sse_chunks_with_usage():
+    app = create_mock_app(
+        MockLLMConfig(completion_tokens=5, chunk_tokens=2, chunk_interval_ms=0)
+    )
+    with TestClient(app) as client:
+        response = client.post(
+            "/v1/chat/completions",
+            json=_body(stream=True, stream_options={"include_usage": True}),
+        )
+
+    events = [
+        line[len("data: ") :]
+        for line in response.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(item) for item in events[:-1]]
+    assert len(chunks) == 4
+    assert chunks[-1]["usage"]["completion_tokens"] == 5
+
+
+def test_latency_distribution_parsing():
+    assert LatencyDistribution.parse("fixed:120") == LatencyDistribution("fixed", 120)
+    assert LatencyDistribution.parse("lognormal:200:0.5").kind == "lognormal"
+    with pytest.raises(ValueError):
+        LatencyDistribution.parse("gamma:1")
+
+
+def test_percentiles_and_regression_compare():
+    ordered = [float(value) for value in range(1, 101)]
+    assert percentile(ordered, 0.5) == 50.0
+    assert percentile(ordered, 0.99) == 99.0
+    assert summarize([]).p95 is None
+
+    def _report(rps: float, p95: float) -> dict:
+        return {
+            "results": [
+                {
+                    "scenario": "test_run",
+                    "concurrency": 4,
+                    "requests_per_sec": rps,
+                    "job_latency_ms": {"p95": p95},
+                }
+            ]
+        }
+
+    rows, regressed = compare_reports(
+        _report(100, 200), _report(80, 210), threshold=0.1
+    )
+    assert regressed and rows[0]["rps_change"] == pytest.approx(-0.2)
+    _, regressed = compare_reports(_report(100, 200), _report(98, 205), threshold=0.1)
+    assert not regressed
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.models.budget import BudgetPeriod, BudgetScope, UsageBudget
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.usage import LLMUsageLog
+from app.services.budget import (
+    BudgetEstimate,
+    BudgetExceededError,
+    budget_tracker,
+    current_period_start,
+    estimate_cost,
+    estimate_payloads,
+)
+
+
+@pytest.fixture()
+def priced_model(db_session) -> LLMModel:
+    provider = LLMProvider(provider_name="Internal", api_key="secret-key")
+    model = LLMModel(
+        provider=provider,
+        name="chat-mini",
+        input_price_per_1k=0.5,
+        output_price_per_1k=1.5,
+    )
+    db_session.add_all([provider, model])
+    db_session.commit()
+    return model
+
+
+def _add_budget(db_session, **values) -> UsageBudget:
+    budget = UsageBudget(**values)
+    db_session.add(budget)
+    db_session.commit()
+    budget_tracker.invalidate()
+    return budget
+
+
+def test_estimate_payloads_sums_rounds_and_prices(priced_model):
+    payload = {
+        "model": "chat-mini",
+        "messages": [{"role": "user", "content": "x" * 400}],
+        "max_tokens": 100,
+    }
+
+    estimate = estimate_payloads(priced_model, [payload, payload])
+
+    assert estimate.rounds == 2
+    assert estimate.completion_tokens == 200
+    assert estimate.prompt_tokens > 0
+    assert estimate.cost == pytest.approx(
+        (estimate.prompt_tokens * 0.5 + estimate.completion_tokens * 1.5) / 1000
+    )
+    assert estimate.as_dict()["total_tokens"] == estimate.total_tokens
+
+
+def test_estimate_cost_requires_prices():
+    assert estimate_cost(LLMModel(name="free"), 100, 100) is None
+    assert estimate_cost(None, 100, 100) is None
+    combined = BudgetEstimate(rounds=1, prompt_tokens=10) + BudgetEstimate(
+        rounds=2, completion_tokens=5, cost=0.1
+    )
+    assert (combined.rounds, combined.total_tokens, combined.cost) == (3, 15, 0.1)
+
+
+def test_check_rejects_estimate_beyond_remaining_budget(db_session, priced_model):
+    _add_budget(
+        db_session,
+        scope=BudgetScope.MODEL,
+        target_id=priced_model.id,
+        period=BudgetPeriod.TOTAL,
+        token_limit=1000,
+        used_tokens=900,
+    )
+
+    budget_tracker.check(
+        db_session, model_id=priced_model.id, estimate=BudgetEstimate(prompt_tokens=50)
+    )
+    with pytest.raises(BudgetExceededError) as exc_info:
+        budget_tracker.check(
+            db_session,
+            model_id=priced_model.id,
+            estimate=BudgetEstimate(prompt_tokens=150),
+        )
+    assert exc_info.value.budget.remaining_tokens == 100
+
+    # 未配置预算的对象不受限制
+    budget_tracker.check(
+        db_session, owner_id=7, estimate=BudgetEstimate(prompt_tokens=10**9)
+    )
+
+
+def test_check_enforces_cost_limit(db_session, priced_model):
+    _add_budget(
+        db_session,
+        scope=BudgetScope.OWNER,
+        target_id=3,
+        period=BudgetPeriod.TOTAL,
+        cost_limit=1.0,
+        used_cost=0.9,
+    )
+
+    with pytest.raises(BudgetExceededError, match="预计费用"):
+        budget_tracker.check(db_session, owner_id=3, estimate=BudgetEstimate(cost=0.2))
+
+
+def test_record_accumulates_in_memory_and_flushes_in_batches(
+    db_session, priced_model, monkeypatch
+):
+    monkeypatch.setattr(settings, "BUDGET_FLUSH_TOKENS", 10**6)
+    budget = _add_budget(
+        db_session,
+        scope=BudgetScope.MODEL,
+        target_id=priced_model.id,
+        period=BudgetPeriod.TOTAL,
+        token_limit=100,
+    )
+
+    budget_tracker.record(model=priced_model, prompt_tokens=40, completion_tokens=20)
+    db_session.refresh(budget)
+    assert budget.used_tokens == 0
+
+    # 尚未写回的增量同样参与检查
+    with pytest.raises(BudgetExceededError):
+        budget_tracker.check(
+            db_session,
+            model_id=priced_model.id,
+            estimate=BudgetEstimate(prompt_tokens=50),
+        )
+
+    cached = LLMUsageLog(provider_id=priced_model.provider_id, model_name="chat-mini")
+    cached.total_tokens = 500
+    cached.cache_hit = True
+    budget_tracker.record_usage_log(cached, model=priced_model)
+
+    assert budget_tracker.flush() == 1
+    db_session.refresh(budget)
+    assert budget.used_tokens == 60
+    assert budget.used_cost == pytest.approx((40 * 0.5 + 20 * 1.5) / 1000)
+
+
+def test_record_flushes_when_threshold_reached(db_session, priced_model, monkeypatch):
+    monkeypatch.setattr(settings, "BUDGET_FLUSH_TOKENS", 50)
+    budget = _add_budget(
+        db_session,
+        scope=BudgetScope.MODEL,
+        target_id=priced_model.id,
+        period=BudgetPeriod.TOTAL,
+        token_limit=100,
+    )
+
+    budget_tracker.record(
+        model=priced_model, prompt_tokens=None, completion_tokens=None, total_tokens=80
+    )
+
+    db_session.refresh(budget)
+    assert budget.used_tokens == 80
+    with pytest.raises(BudgetExceededError, match="已用尽"):
+        budget_tracker.record(model=priced_model, prompt_tokens=30, completion_tokens=0)
+        budget_tracker.check(db_session, model_id=priced_model.id)
+
+
+def test_new_period_starts_from_zero(db_session, priced_model):
+    now = datetime.now(UTC)
+    last_month = current_period_start(BudgetPeriod.MONTHLY, now) - timedelta(days=1)
+    budget = _add_budget(
+        db_session,
+        scope=BudgetScope.MODEL,
+        target_id=priced_model.id,
+        period=BudgetPeriod.MONTHLY,
+        token_limit=100,
+        used_tokens=100,
+        period_start=current_period_start(BudgetPeriod.MONTHLY, last_month),
+    )
+
+    budget_tracker.check(db_session, model_id=priced_model.id)
+    budget_tracker.record(model=priced_model, prompt_tokens=10, completion_tokens=0)
+    budget_tracker.flush()
+
+    db_session.refresh(budget)
+    assert budget.used_tokens == 10
+    assert budget.period_start.replace(tzinfo=UTC) == current_period_start(
+        BudgetPeriod.MONTHLY, now
+    )
+
+
+def test_enforcement_can_be_disabled(db_session, priced_model, monkeypatch):
+    monkeypatch.setattr(settings, "BUDGET_ENFORCEMENT_ENABLED", False)
+    _add_budget(
+        db_session,
+        scope=BudgetScope.MODEL,
+        target_id=priced_model.id,
+        period=BudgetPeriod.TOTAL,
+        token_limit=1,
+        used_tokens=1,
+    )
+
+    budget_tracker.check(db_session, model_id=priced_model.id)
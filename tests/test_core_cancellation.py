@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from app.core.cancellation import (
+    CancellationRegistry,
+    CancellationToken,
+    OperationCancelled,
+)
+
+
+def test_token_runs_callbacks_once_and_reports_first_cancel():
+    token = CancellationToken()
+    calls: list[str] = []
+    token.add_callback(lambda: calls.append("a"))
+    remove = token.add_callback(lambda: calls.append("b"))
+    remove()
+
+    assert token.cancel("停止") is True
+    assert token.cancel("再次停止") is False
+    assert token.cancelled
+    assert token.reason == "停止"
+    assert calls == ["a"]
+
+    # 已取消的标记登记回调时立即执行
+    token.add_callback(lambda: calls.append("late"))
+    assert calls == ["a", "late"]
+
+
+def test_raise_if_cancelled_is_not_a_regular_exception():
+    token = CancellationToken()
+    token.raise_if_cancelled()
+    token.cancel()
+
+    with pytest.raises(OperationCancelled):
+        token.raise_if_cancelled()
+    assert not issubclass(OperationCancelled, Exception)
+
+
+def test_wait_returns_when_cancelled_from_another_thread():
+    token = CancellationToken()
+    timer = threading.Timer(0.02, token.cancel)
+    timer.start()
+    try:
+        assert token.wait(timeout=1.0)
+    finally:
+        timer.cancel()
+
+
+def test_registry_tracks_only_while_executing():
+    registry = CancellationRegistry()
+    assert registry.cancel("test_run", 1) is False
+
+    with registry.track("test_run", 1) as token:
+        assert registry.get("test_run", 1) is token
+        assert registry.cancel("test_run", 1, "用户取消") is True
+        assert token.reason == "用户取消"
+
+    assert registry.get("test_run", 1) is None
+
+
+def test_child_tokens_follow_parent_until_released():
+    registry = CancellationRegistry()
+    parent = CancellationToken()
+
+    with registry.track("experiment", 1, parent=parent):
+        pass
+    with registry.track("experiment", 2, parent=parent) as child:
+        # 单独取消子标记不影响父标记
+        with registry.track("experiment", 3, parent=parent) as sibling:
+            sibling.cancel()
+            assert not parent.cancelled
+        parent.cancel("任务已取消")
+        assert child.cancelled
+        assert child.reason == "任务已取消"
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import threading
+import time
+from queue import Empty
+
+import pytest
+
+from app.core.config import settings
+from app.core.fair_queue import (
+    FairShareQueue,
+    FairShareState,
+    QueuePriority,
+    QueueTicket,
+    plan_dispatch,
+)
+
+
+def _drain(queue: FairShareQueue) -> list[int]:
+    order: list[int] = []
+    while queue.qsize():
+        order.append(queue.get(timeout=0.1))
+        queue.task_done()
+    return order
+
+
+def _ticket(item_id: int, priority: QueuePriority, *, age: float = 0.0) -> QueueTicket:
+    return QueueTicket(
+        item_id=item_id,
+        priority=priority,
+        fair_key=f"key-{item_id}",
+        cost=1.0,
+        enqueued_at=1_000.0 - age,
+        sequence=item_id,
+    )
+
+
+def test_interactive_items_jump_ahead_of_bulk_work():
+    queue = FairShareQueue()
+    queue.put_nowait(1, priority=QueuePriority.BULK, fair_key="batch:a", cost=1000)
+    queue.put_nowait(2, priority=QueuePriority.NORMAL, fair_key="owner:1")
+    queue.put_nowait(3, priority=QueuePriority.INTERACTIVE, fair_key="owner:2")
+
+    assert _drain(queue) == [3, 2, 1]
+    assert queue.unfinished_tasks == 0
+
+
+def test_owners_share_a_priority_class_by_cost():
+    queue = FairShareQueue()
+    for item_id in (1, 2, 3):
+        queue.put_nowait(item_id, fair_key="batch:big", cost=10)
+    queue.put_nowait(4, fair_key="owner:small", cost=1)
+    queue.put_nowait(5, fair_key="owner:small", cost=1)
+
+    # 大批量任务出队一次后份额领先，小任务依次插入
+    assert _drain(queue) == [1, 4, 5, 2, 3]
+
+
+def test_fair_share_weights_scale_the_share(monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_FAIR_SHARE_WEIGHTS", {"owner:vip": 3.0})
+    queue = FairShareQueue()
+    for item_id in range(1, 4):
+        queue.put_nowait(item_id, fair_key="owner:vip", cost=1)
+    for item_id in range(11, 14):
+        queue.put_nowait(item_id, fair_key="owner:other", cost=1)
+
+    assert _drain(queue)[:4] == [1, 11, 2, 3]
+
+
+def test_waiting_items_are_promoted_to_avoid_starvation(monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_STARVATION_SECONDS", 60.0)
+    state = FairShareState()
+    fresh = _ticket(1, QueuePriority.INTERACTIVE)
+    starving = _ticket(2, QueuePriority.BULK, age=150.0)
+    waiting = _ticket(3, QueuePriority.BULK, age=30.0)
+
+    assert starving.effective_rank(1_000.0) == 0
+    assert waiting.effective_rank(1_000.0) == QueuePriority.BULK.rank
+    # 提升到同一类别后按入队顺序与公平份额竞争
+    assert state.select([starving, waiting, fresh], 1_000.0) is fresh
+    assert state.select([starving, waiting], 1_000.0) is starving
+
+    monkeypatch.setattr(settings, "QUEUE_STARVATION_SECONDS", 0.0)
+    assert starving.effective_rank(1_000.0) == QueuePriority.BULK.rank
+
+
+def test_plan_dispatch_estimates_start_times():
+    tickets = [
+        QueueTicket(1, QueuePriority.NORMAL, "a", 4.0, 0.0, 1),
+        QueueTicket(2, QueuePriority.NORMAL, "b", 2.0, 0.0, 2),
+        QueueTicket(3, QueuePriority.INTERACTIVE, "c", 1.0, 0.0, 3),
+    ]
+    plan = plan_dispatch(
+        tickets,
+        FairShareState(),
+        now=0.0,
+        seconds_per_unit=2.0,
+        busy_seconds=[5.0],
+    )
+    assert [(item.item_id, item.position) for item in plan] == [(3, 1), (1, 2), (2, 3)]
+    assert [item.estimated_wait_seconds for item in plan] == [5.0, 7.0, 15.0]
+
+    parallel = plan_dispatch(
+        tickets, FairShareState(), now=0.0, seconds_per_unit=2.0, slots=2
+    )
+    assert [item.estimated_wait_seconds for item in parallel] == [0.0, 0.0, 2.0]
+
+
+def test_queue_estimates_report_running_and_waiting_items(monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_SECONDS_PER_UNIT", 1.0)
+    queue = FairShareQueue()
+    queue.put_nowait(1, fair_key="a", cost=3)
+    queue.put_nowait(2, fair_key="b", cost=2)
+    started = threading.Event()
+    release = threading.Event()
+
+    def worker() -> None:
+        queue.get()
+        started.set()
+        release.wait(timeout=2)
+        queue.task_done()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert started.wait(timeout=2)
+
+    running = queue.estimate(1)
+    waiting = queue.estimate(2)
+    assert running is not None and running.position == 0
+    assert waiting is not None and waiting.position == 1
+    assert 2.0 <= waiting.estimated_wait_seconds <= 3.0
+    assert queue.estimate(99) is None
+
+    release.set()
+    thread.join(timeout=2)
+    assert queue.estimate(1) is None
+
+
+def test_get_times_out_when_empty():
+    queue = FairShareQueue()
+    started = time.monotonic()
+    with pytest.raises(Empty):
+        queue.get(timeout=0.05)
+    assert time.monotonic() - started >= 0.05
+
+
+@pytest.mark.parametrize(
+    ("value", "batched", "cost", "expected"),
+    [
+        ("bulk", False, 1, QueuePriority.BULK),
+        ("INTERACTIVE", True, 500, QueuePriority.INTERACTIVE),
+        (None, True, 1, QueuePriority.BULK),
+        (None, False, 5, QueuePriority.INTERACTIVE),
+        ("unknown", False, 50, QueuePriority.NORMAL),
+    ],
+)
+def test_priority_resolution(value, batched, cost, expected):
+    assert QueuePriority.resolve(value, batched=batched, cost=cost) is expected
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app.core import job_queue
+from app.core.cancellation import cancellation_registry
+from app.core.config import settings
+from app.core.fair_queue import QueuePriority
+from app.core.job_queue import (
+    JobWorker,
+    claim_jobs,
+    durable_queue_enabled,
+    estimate_job,
+    extend_leases,
+    finish_job,
+    request_job_cancel,
+    submit_job,
+)
+from app.core import task_queue as task_queue_module
+from app.core.task_queue import TEST_RUN_JOB, enqueue_test_run, task_queue
+from app.models.job import Job, JobStatus
+from app.models.prompt import Prompt, PromptClass, PromptVersion
+from app.models.test_run import TestRun, TestRunStatus
+from app.services.test_run import TestRunExecutionError
+
+
+def _claim(db_session, worker_id: str, *, lease_seconds: float = 30) -> list[Job]:
+    return claim_jobs(
+        db_session,
+        worker_id=worker_id,
+        kinds=["demo"],
+        limit=10,
+        lease_seconds=lease_seconds,
+    )
+
+
+def test_claim_leases_jobs_to_a_single_worker(db_session):
+    first = submit_job("demo", 1, session=db_session)
+    second = submit_job("demo", 2, session=db_session)
+    submit_job("other", 3, session=db_session)
+
+    claimed = _claim(db_session, "worker-a")
+    assert [job.id for job in claimed] == [first, second]
+    assert all(job.status == JobStatus.RUNNING for job in claimed)
+    assert all(job.attempts == 1 and job.locked_by == "worker-a" for job in claimed)
+    # 租约有效期内其他工作进程认领不到
+    assert _claim(db_session, "worker-b") == []
+
+    assert extend_leases(
+        db_session, worker_id="worker-a", job_ids=[first, second], lease_seconds=30
+    ) == 2
+    assert finish_job(db_session, first, worker_id="worker-a") == JobStatus.SUCCEEDED
+    assert db_session.get(Job, first).finished_at is not None
+
+
+def test_expired_lease_is_reclaimed_and_stale_worker_cannot_finish(db_session):
+    job_id = submit_job("demo", 1, session=db_session)
+    _claim(db_session, "worker-a")
+
+    job = db_session.get(Job, job_id)
+    job.lease_expires_at = datetime.now(UTC) - timedelta(seconds=1)
+    db_session.commit()
+
+    reclaimed = _claim(db_session, "worker-b")
+    assert [item.id for item in reclaimed] == [job_id]
+    assert reclaimed[0].attempts == 2
+
+    assert finish_job(db_session, job_id, worker_id="worker-a") is None
+    assert extend_leases(
+        db_session, worker_id="worker-a", job_ids=[job_id], lease_seconds=30
+    ) == 0
+    assert finish_job(db_session, job_id, worker_id="worker-b") == JobStatus.SUCCEEDED
+
+
+def test_expired_lease_fails_job_after_max_attempts(db_session):
+    job_id = submit_job("demo", 1, session=db_session, max_attempts=2)
+
+    for worker_id in ("worker-a", "worker-b"):
+        assert [job.id for job in _claim(db_session, worker_id)] == [job_id]
+        # 模拟工作进程崩溃，未续约也未上报结果
+        job = db_session.get(Job, job_id)
+        job.lease_expires_at = datetime.now(UTC) - timedelta(seconds=1)
+        db_session.commit()
+
+    assert _claim(db_session, "worker-c") == []
+    job = db_session.get(Job, job_id)
+    assert job.status == JobStatus.FAILED
+    assert job.attempts == 2
+    assert job.last_error == "工作进程失联，租约已过期"
+    assert job.locked_by is None
+    assert job.finished_at is not None
+
+
+def test_failed_job_backs_off_then_gives_up(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 0)
+    job_id = submit_job("demo", 1, session=db_session, max_attempts=2)
+
+    _claim(db_session, "worker-a")
+    assert finish_job(db_session, job_id, worker_id="worker-a", error="boom") == (
+        JobStatus.QUEUED
+    )
+    assert db_session.get(Job, job_id).last_error == "boom"
+
+    _claim(db_session, "worker-a")
+    assert finish_job(db_session, job_id, worker_id="worker-a", error="boom") == (
+        JobStatus.FAILED
+    )
+    assert _claim(db_session, "worker-a") == []
+
+
+def test_worker_runs_registered_handlers(db_session, monkeypatch):
+    seen: list[int] = []
+    monkeypatch.setitem(job_queue._handlers, "demo", seen.append)
+
+    def broken(_: int) -> None:
+        raise RuntimeError("handler crashed")
+
+    monkeypatch.setitem(job_queue._handlers, "broken", broken)
+    ok_id = submit_job("demo", 42)
+    broken_id = submit_job("broken", 7, max_attempts=1)
+
+    worker = JobWorker(worker_id="worker-a", kinds=["demo", "broken"], concurrency=4)
+    assert worker.run_once() == 2
+
+    db_session.expire_all()
+    assert seen == [42]
+    assert db_session.get(Job, ok_id).status == JobStatus.SUCCEEDED
+    failed = db_session.get(Job, broken_id)
+    assert failed.status == JobStatus.FAILED
+    assert "handler crashed" in failed.last_error
+
+
+def test_cancel_request_reaches_worker_through_heartbeat(db_session):
+    running_id = submit_job("demo", 2, session=db_session)
+    db_session.commit()
+    _claim(db_session, "worker-a")
+    queued_id = submit_job("demo", 1, session=db_session)
+    db_session.commit()
+
+    assert request_job_cancel(db_session, "demo", 1) == 1
+    assert request_job_cancel(db_session, "demo", 2) == 1
+    db_session.commit()
+
+    db_session.expire_all()
+    withdrawn = db_session.get(Job, queued_id)
+    assert withdrawn.status == JobStatus.CANCELLED
+    assert withdrawn.last_error == "已取消"
+    assert db_session.get(Job, running_id).cancel_requested_at is not None
+
+    worker = JobWorker(worker_id="worker-a", kinds=["demo"])
+    with cancellation_registry.track("demo", 2) as token:
+        worker._heartbeat([running_id])
+        assert token.cancelled
+
+    assert finish_job(db_session, running_id, worker_id="worker-a") == (
+        JobStatus.CANCELLED
+    )
+
+
+def test_worker_retries_test_run_after_transient_failure(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 0.0)
+    prompt_class = PromptClass(name="聊天类")
+    prompt = Prompt(name="对话助手", prompt_class=prompt_class)
+    version = PromptVersion(prompt=prompt, version="v1", content="你是一位助手。")
+    test_run = TestRun(prompt_version=version, model_name="chat-mini", repetitions=1)
+    db_session.add_all([prompt_class, prompt, version, test_run])
+    db_session.commit()
+    attempts: list[TestRunStatus] = []
+
+    def flaky_execute(session, run, **_: object) -> TestRun:
+        attempts.append(run.status)
+        if len(attempts) == 1:
+            raise TestRunExecutionError("上游暂时不可用", status_code=502)
+        run.status = TestRunStatus.COMPLETED
+        return run
+
+    monkeypatch.setattr(task_queue_module, "execute_test_run", flaky_execute)
+    job_id = submit_job(TEST_RUN_JOB, test_run.id, max_attempts=2)
+    worker = JobWorker(worker_id="worker-a", kinds=[TEST_RUN_JOB])
+
+    assert worker.run_once() == 1
+    db_session.expire_all()
+    # 可重试的失败交给作业表退避重排，而不是按成功结束
+    assert db_session.get(Job, job_id).status == JobStatus.QUEUED
+    assert db_session.get(TestRun, test_run.id).status == TestRunStatus.FAILED
+
+    assert worker.run_once() == 1
+    db_session.expire_all()
+    assert attempts == [TestRunStatus.PENDING, TestRunStatus.PENDING]
+    assert db_session.get(Job, job_id).status == JobStatus.SUCCEEDED
+    assert db_session.get(TestRun, test_run.id).status == TestRunStatus.COMPLETED
+
+
+@pytest.mark.parametrize(
+    ("backend", "expected"),
+    [("auto", False), ("memory", False), ("database", True)],
+)
+def test_durable_queue_backend_selection(db_session, monkeypatch, backend, expected):
+    # 测试会话绑定的是 SQLite，auto 模式应回退到进程内队列
+    monkeypatch.setattr(settings, "JOB_QUEUE_BACKEND", backend)
+    assert durable_queue_enabled() is expected
+
+
+def test_enqueue_writes_job_when_durable_queue_enabled(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_QUEUE_BACKEND", "database")
+
+    enqueue_test_run(123)
+
+    assert task_queue.wait_for_idle(timeout=0.1)
+    job = db_session.scalars(select(Job).where(Job.target_id == 123)).one()
+    assert job.kind == TEST_RUN_JOB
+    assert job.status == JobStatus.QUEUED
+
+
+def test_claim_prefers_priority_then_fair_share(db_session):
+    bulk = [
+        submit_job(
+            "demo",
+            index,
+            session=db_session,
+            priority=QueuePriority.BULK,
+            fair_key="batch:nightly",
+            cost=100,
+        )
+        for index in range(3)
+    ]
+    normal_a = submit_job("demo", 10, session=db_session, fair_key="owner:1", cost=5)
+    normal_b = submit_job("demo", 11, session=db_session, fair_key="owner:1", cost=5)
+    normal_c = submit_job("demo", 12, session=db_session, fair_key="owner:2", cost=5)
+    interactive = submit_job(
+        "demo", 20, session=db_session, priority=QueuePriority.INTERACTIVE
+    )
+    db_session.commit()
+
+    claimed = claim_jobs(
+        db_session, worker_id="worker-a", kinds=["demo"], limit=4, lease_seconds=30
+    )
+    assert [job.id for job in claimed] == [interactive, normal_a, normal_c, normal_b]
+
+    remaining = _claim(db_session, "worker-b")
+    assert [job.id for job in remaining] == bulk
+
+
+def test_estimate_job_reports_queue_position(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "QUEUE_SECONDS_PER_UNIT", 2.0)
+    monkeypatch.setattr(settings, "JOB_WORKER_CONCURRENCY", 1)
+    first = submit_job("demo", 1, session=db_session, cost=3)
+    submit_job("demo", 2, session=db_session, fair_key="owner:9", cost=1)
+    claim_jobs(db_session, worker_id="w", kinds=["demo"], limit=1, lease_seconds=30)
+
+    running = estimate_job(db_session, "demo", 1)
+    assert running is not None and running.position == 0 and running.item_id == first
+    waiting = estimate_job(db_session, "demo", 2)
+    assert waiting is not None and waiting.position == 1
+    assert 5.0 <= waiting.estimated_wait_seconds <= 6.0
+    assert estimate_job(db_session, "demo", 3) is None
+
+
+def test_queue_position_endpoint_in_durable_mode(client, db_session, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_QUEUE_BACKEND", "database")
+    response = client.post(
+        "/api/v1/prompt-test/tasks",
+        json={
+            "name": "批量回归",
+            "config": {"batch_id": "nightly"},
+            "units": [{"name": "u1", "model_name": "gpt-4o", "rounds": 20}],
+            "auto_execute": True,
+        },
+    )
+    assert response.status_code == 201
+    task_id = response.json()["id"]
+    job = db_session.scalars(select(Job).where(Job.target_id == task_id)).one()
+    assert job.priority == QueuePriority.BULK.rank
+    assert job.fair_key == "batch:nightly"
+    assert job.cost == 20
+
+    position = client.get(f"/api/v1/prompt-test/tasks/{task_id}/queue")
+    assert position.status_code == 200
+    payload = position.json()
+    assert payload["position"] == 1
+    assert payload["running"] is False
+    assert payload["priority"] == "bulk"
+
+    monkeypatch.setattr(settings, "JOB_QUEUE_BACKEND", "memory")
+    missing = client.get(f"/api/v1/prompt-test/tasks/{task_id}/queue")
+    assert missing.status_code == 404
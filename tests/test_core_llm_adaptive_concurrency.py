@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import pytest
+
+from app.core.llm_adaptive_concurrency import AdaptiveConcurrencyController
+from app.core.llm_rate_limiter import (
+    InMemoryLimiterBackend,
+    LimitConfig,
+    LLMRateLimiter,
+    RateLimitTimeout,
+)
+
+
+def test_overload_halves_limit_and_success_recovers_additively():
+    controller = AdaptiveConcurrencyController(decrease_factor=0.5, cooldown=0)
+    assert controller.current_limit("1:chat", 8) == 8
+
+    controller.record("1:chat", 8, status_code=429, latency_ms=None)
+    assert controller.current_limit("1:chat", 8) == 4
+    controller.record("1:chat", 8, status_code=503, latency_ms=None)
+    assert controller.current_limit("1:chat", 8) == 2
+
+    for _ in range(3):
+        controller.record("1:chat", 8, status_code=200, latency_ms=None)
+    assert controller.current_limit("1:chat", 8) == 3
+
+    for _ in range(100):
+        controller.record("1:chat", 8, status_code=200, latency_ms=None)
+    assert controller.current_limit("1:chat", 8) == 8
+
+    status = controller.status("1:chat")
+    assert status is not None
+    assert status.decreases_total == 2
+    assert status.last_decrease_reason == "HTTP 503"
+
+
+def test_cooldown_limits_consecutive_decreases():
+    controller = AdaptiveConcurrencyController(decrease_factor=0.5, cooldown=60)
+    for _ in range(5):
+        controller.record("1:chat", 8, status_code=429, latency_ms=None)
+    assert controller.current_limit("1:chat", 8) == 4
+
+
+def test_rising_p95_latency_cuts_limit():
+    controller = AdaptiveConcurrencyController(
+        decrease_factor=0.5, latency_tolerance=2.0, window=20, cooldown=0
+    )
+    for _ in range(20):
+        controller.record("1:chat", 4, status_code=200, latency_ms=100)
+    assert controller.current_limit("1:chat", 4) == 4
+
+    for _ in range(10):
+        controller.record("1:chat", 4, status_code=200, latency_ms=1000)
+    assert controller.current_limit("1:chat", 4) < 4
+    assert "p95" in (controller.status("1:chat").last_decrease_reason or "")
+
+
+def test_configured_limit_is_upper_bound():
+    controller = AdaptiveConcurrencyController(cooldown=0)
+    for _ in range(10):
+        controller.record("1:chat", 6, status_code=200, latency_ms=None)
+    assert controller.current_limit("1:chat", 6) == 6
+    assert controller.current_limit("1:chat", 3) == 3
+
+
+def test_limiter_applies_adaptive_limit():
+    controller = AdaptiveConcurrencyController(decrease_factor=0.5, cooldown=0)
+    limiter = LLMRateLimiter(InMemoryLimiterBackend(), controller=controller)
+    config = LimitConfig(concurrency=2)
+
+    with limiter.acquire("1:chat", config) as lease:
+        lease.record_outcome(429, None)
+        # 上限降为 1 后，第二个并发调用需要等待
+        with pytest.raises(RateLimitTimeout):
+            with limiter.acquire("1:chat", config, timeout=0.05):
+                pass
+
+    status = limiter.status()[0]
+    assert status.concurrency_limit == 2
+    assert status.effective_concurrency == 1
+    assert status.adaptive_decreases == 1
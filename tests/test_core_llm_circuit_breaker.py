@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.core.llm_circuit_breaker import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _call(breaker: CircuitBreaker, status_code: int, key: str = "k") -> None:
+    with breaker.guard(key) as circuit:
+        circuit.record_status(status_code)
+
+
+def _breaker(clock: FakeClock, **kwargs) -> CircuitBreaker:
+    options = {"window": 4, "min_calls": 4, "failure_ratio": 0.5, "open_seconds": 10}
+    options.update(kwargs)
+    return CircuitBreaker(clock=clock, **options)
+
+
+def test_opens_when_failure_rate_reaches_threshold():
+    breaker = _breaker(FakeClock())
+
+    for status_code in (200, 500, 200):
+        _call(breaker, status_code)
+    assert breaker.status()[0].state == CIRCUIT_CLOSED
+
+    _call(breaker, 503)
+    [status] = breaker.status()
+    assert status.state == CIRCUIT_OPEN
+    assert status.health_score == 0.0
+    assert status.failure_rate == 0.5
+    assert status.last_failure_reason == "HTTP 503"
+
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.admit("k")
+    assert exc_info.value.retry_after == pytest.approx(10)
+    assert breaker.status()[0].rejected_total == 1
+
+
+def test_client_errors_do_not_count_as_failures():
+    breaker = _breaker(FakeClock())
+
+    for _ in range(4):
+        _call(breaker, 429)
+        _call(breaker, 400)
+
+    [status] = breaker.status()
+    assert status.state == CIRCUIT_CLOSED
+    assert status.health_score == 1.0
+
+
+def test_transport_timeouts_count_as_failures():
+    breaker = _breaker(FakeClock(), min_calls=2)
+
+    for _ in range(2):
+        with pytest.raises(httpx.ReadTimeout):
+            with breaker.guard("k"):
+                raise httpx.ReadTimeout("timed out")
+
+    [status] = breaker.status()
+    assert status.state == CIRCUIT_OPEN
+    assert status.timeouts_total == 2
+    assert status.last_failure_reason == "ReadTimeout"
+
+
+def test_half_open_probe_success_closes_circuit():
+    clock = FakeClock()
+    breaker = _breaker(clock, min_calls=1)
+    _call(breaker, 500)
+    clock.now = 11
+
+    probe = breaker.admit("k")
+    assert probe.probe is True
+    assert breaker.status()[0].state == CIRCUIT_HALF_OPEN
+    # 探测期间其余调用仍被拒绝
+    with pytest.raises(CircuitOpenError) as exc_info:
+        breaker.admit("k")
+    assert exc_info.value.retry_after is None
+
+    probe.record_status(200)
+    [status] = breaker.status()
+    assert status.state == CIRCUIT_CLOSED
+    assert status.window_calls == 0
+    breaker.admit("k")
+
+
+def test_half_open_probe_failure_reopens_circuit():
+    clock = FakeClock()
+    breaker = _breaker(clock, min_calls=1)
+    _call(breaker, 500)
+    clock.now = 11
+
+    _call(breaker, 502)
+
+    [status] = breaker.status()
+    assert status.state == CIRCUIT_OPEN
+    assert status.opened_total == 2
+    assert status.retry_after_seconds == pytest.approx(10)
+
+
+def test_abandoned_probe_releases_its_slot():
+    clock = FakeClock()
+    breaker = _breaker(clock, min_calls=1)
+    _call(breaker, 500)
+    clock.now = 11
+
+    with pytest.raises(RuntimeError):
+        with breaker.guard("k"):
+            raise RuntimeError("排队超时")
+
+    # 未产生结果的探测不改变状态，名额归还给下一次调用
+    assert breaker.status()[0].state == CIRCUIT_HALF_OPEN
+    _call(breaker, 200)
+    assert breaker.status()[0].state == CIRCUIT_CLOSED
+
+
+def test_disabled_breaker_admits_everything(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_BREAKER_ENABLED", False)
+    breaker = _breaker(FakeClock(), min_calls=1)
+
+    for _ in range(3):
+        _call(breaker, 500)
+
+    assert breaker.status() == []
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from app.core.cancellation import CancellationToken, OperationCancelled
+from app.core.config import settings
+from app.core.llm_hedging import (
+    HEDGE_ROLE_BACKUP,
+    HEDGE_ROLE_PRIMARY,
+    HedgePolicy,
+    LLMHedger,
+)
+
+
+def test_policy_from_option(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_DELAY_SECONDS", 0.0)
+    assert HedgePolicy.from_option(None) is None
+    assert HedgePolicy.from_option(False) is None
+    assert HedgePolicy.from_option(True) == HedgePolicy(delay_seconds=None)
+    assert HedgePolicy.from_option(1.5) == HedgePolicy(delay_seconds=1.5)
+    assert HedgePolicy.from_option({"delay_seconds": 0.2}) == HedgePolicy(0.2)
+    assert HedgePolicy.from_option({"enabled": False}) is None
+
+    monkeypatch.setattr(settings, "LLM_HEDGE_DELAY_SECONDS", 3.0)
+    assert HedgePolicy.from_option(True) == HedgePolicy(delay_seconds=3.0)
+
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", False)
+    assert HedgePolicy.from_option(True) is None
+
+
+def test_delay_follows_observed_p95(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_FALLBACK_DELAY_SECONDS", 2.0)
+    hedger = LLMHedger()
+    policy = HedgePolicy()
+
+    assert hedger.delay_for("k", policy) == 2.0
+    for latency in range(1, 101):
+        hedger.observe("k", latency * 10)
+    assert hedger.delay_for("k", policy) == pytest.approx(0.95)
+    assert hedger.delay_for("k", HedgePolicy(delay_seconds=0.1)) == 0.1
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    hedger = LLMHedger()
+    cancelled = threading.Event()
+
+    def attempt(role: str, token: CancellationToken) -> str:
+        if role == HEDGE_ROLE_PRIMARY:
+            token.wait(timeout=2)
+            if token.cancelled:
+                cancelled.set()
+            token.raise_if_cancelled()
+        return role
+
+    race = hedger.run("k", HedgePolicy(delay_seconds=0.01), attempt)
+
+    assert race.hedged is True
+    assert race.result == HEDGE_ROLE_BACKUP
+    assert race.loser_role == HEDGE_ROLE_PRIMARY
+    assert race.loser_result is None
+    assert cancelled.wait(timeout=1)
+    [status] = hedger.status()
+    assert (status.calls_total, status.hedged_total) == (1, 1)
+    assert status.hedge_rate == 1.0
+    assert status.win_rate == 1.0
+
+
+def test_fast_primary_is_not_hedged():
+    hedger = LLMHedger()
+    roles: list[str] = []
+
+    def attempt(role: str, token: CancellationToken) -> str:
+        roles.append(role)
+        return "ok"
+
+    race = hedger.run("k", HedgePolicy(delay_seconds=1.0), attempt)
+
+    assert (race.result, race.role, race.hedged) == ("ok", HEDGE_ROLE_PRIMARY, False)
+    assert roles == [HEDGE_ROLE_PRIMARY]
+    assert hedger.status()[0].hedge_rate == 0.0
+
+
+def test_failed_backup_falls_back_to_primary():
+    hedger = LLMHedger()
+
+    def attempt(role: str, token: CancellationToken) -> str:
+        if role == HEDGE_ROLE_BACKUP:
+            raise RuntimeError("backup down")
+        token.wait(timeout=0.1)
+        return role
+
+    race = hedger.run("k", HedgePolicy(delay_seconds=0.01), attempt)
+
+    assert race.role == HEDGE_ROLE_PRIMARY
+    assert race.hedged is True
+    assert hedger.status()[0].win_rate == 0.0
+
+
+def test_parent_cancellation_stops_both_attempts():
+    hedger = LLMHedger()
+    parent = CancellationToken()
+
+    def attempt(role: str, token: CancellationToken) -> str:
+        if role == HEDGE_ROLE_BACKUP:
+            parent.cancel("stop")
+        token.wait(timeout=2)
+        token.raise_if_cancelled()
+        return role
+
+    with pytest.raises(OperationCancelled):
+        hedger.run("k", HedgePolicy(delay_seconds=0.01), attempt, cancel_token=parent)
+
+
+def test_hedges_are_capped_by_ratio(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_MAX_RATIO", 0.5)
+    hedger = LLMHedger()
+
+    def attempt(role: str, token: CancellationToken) -> str:
+        if role == HEDGE_ROLE_PRIMARY:
+            token.wait(timeout=0.05)
+        return role
+
+    races = [hedger.run("k", HedgePolicy(delay_seconds=0.0), attempt) for _ in range(4)]
+
+    assert [race.hedged for race in races] == [True, False, True, False]
+    [status] = hedger.status()
+    assert (status.hedged_total, status.throttled_total) == (2, 2)
+
+
+def test_async_race_cancels_loser():
+    hedger = LLMHedger()
+    loser_cancelled = asyncio.Event()
+
+    async def attempt(role: str) -> str:
+        if role == HEDGE_ROLE_PRIMARY:
+            try:
+                await asyncio.sleep(2)
+            except asyncio.CancelledError:
+                loser_cancelled.set()
+                raise
+        return role
+
+    async def main():
+        race = await hedger.arun("k", HedgePolicy(delay_seconds=0.01), attempt)
+        return race, loser_cancelled.is_set()
+
+    race, cancelled = asyncio.run(main())
+
+    assert (race.result, race.hedged) == (HEDGE_ROLE_BACKUP, True)
+    assert race.loser_elapsed_ms > 0
+    assert cancelled is True
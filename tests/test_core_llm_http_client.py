@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import asyncio
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.core.cancellation import CancellationToken, OperationCancelled
+from app.core.llm_http_client import (
+    LLMClientRegistry,
+    cancellable_io,
+    response_elapsed_ms,
+)
+
+
+def _ok(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={"choices": []})
+
+
+def test_registry_reuses_client_per_base_url_and_key():
+    registry = LLMClientRegistry(max_connections=4, max_keepalive_connections=2)
+    registry.use_transport(httpx.MockTransport(_ok))
+
+    first = registry.get_client("https://llm.example/v1/", "key-a")
+    second = registry.get_client("https://llm.example/v1", "key-a")
+    other_key = registry.get_client("https://llm.example/v1", "key-b")
+
+    assert first is second
+    assert first is not other_key
+
+    first.post("https://llm.example/v1/chat/completions", json={})
+    first.post("https://llm.example/v1/chat/completions", json={})
+
+    stats = {(item.base_url, item.requests_total) for item in registry.stats()}
+    assert ("https://llm.example/v1", 2) in stats
+    assert all("key-a" not in item.key_fingerprint for item in registry.stats())
+
+    registry.close()
+    assert first.is_closed
+    assert registry.stats() == []
+
+
+def test_registry_falls_back_when_http2_unavailable(monkeypatch):
+    monkeypatch.setattr("app.core.llm_http_client._http2_available", lambda: False)
+    registry = LLMClientRegistry(http2=True)
+    assert registry.http2 is False
+
+
+def test_async_clients_are_scoped_to_event_loop():
+    registry = LLMClientRegistry()
+    registry.use_transport(httpx.MockTransport(_ok))
+
+    async def _use() -> httpx.AsyncClient:
+        client = registry.get_async_client("https://llm.example/v1", "key")
+        assert client is registry.get_async_client("https://llm.example/v1", "key")
+        response = await client.post("https://llm.example/v1/chat/completions")
+        assert response.status_code == 200
+        await registry.aclose_current_loop()
+        return client
+
+    first = asyncio.run(_use())
+    second = asyncio.run(_use())
+    assert first is not second
+    assert first.is_closed and second.is_closed
+
+
+def test_sync_client_aborts_pending_response_on_cancel():
+    server = socket.create_server(("127.0.0.1", 0))
+    accepted: list[socket.socket] = []
+
+    def _accept_without_reply() -> None:
+        conn, _ = server.accept()
+        accepted.append(conn)
+
+    threading.Thread(target=_accept_without_reply, daemon=True).start()
+    registry = LLMClientRegistry()
+    base_url = f"http://127.0.0.1:{server.getsockname()[1]}"
+    client = registry.get_client(base_url, "key")
+    token = CancellationToken()
+    threading.Timer(0.1, token.cancel).start()
+
+    started = time.perf_counter()
+    with cancellable_io(token), pytest.raises(OperationCancelled):
+        client.post(f"{base_url}/chat/completions", json={}, timeout=5.0)
+
+    # 上游迟迟不返回时，取消在读取超时之前生效并关闭连接
+    assert time.perf_counter() - started < 1.0
+    assert registry.stats()[0].connections == 0
+    registry.close()
+    for conn in accepted:
+        conn.close()
+    server.close()
+
+
+def test_response_elapsed_ms_handles_unread_response():
+    assert response_elapsed_ms(httpx.Response(200)) is None
+
+
+def test_llm_client_pool_endpoint(client, llm_transport):
+    llm_transport(_ok)
+    from app.core.llm_http_client import llm_client_registry
+
+    llm_client_registry.get_client("https://pool.example/v1", "secret").post(
+        "https://pool.example/v1/chat/completions"
+    )
+
+    response = client.get("/api/v1/system/llm-client-pools")
+    assert response.status_code == 200
+    pools = response.json()
+    matched = next(item for item in pools if item["base_url"] == "https://pool.example/v1")
+    assert matched["requests_total"] == 1
+    assert matched["is_async"] is False
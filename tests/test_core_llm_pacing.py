@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import pytest
+
+from app.core.config import settings
+from app.core.llm_pacing import PacingScheduler
+
+
+def test_reserve_without_rate_adds_no_delay(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_PACING_DEFAULT_RPM", 0)
+    pacer = PacingScheduler()
+
+    assert [pacer.reserve("1:chat", None) for _ in range(3)] == [0.0, 0.0, 0.0]
+    status = pacer.status("1:chat")
+    assert status.interval_ms is None
+    assert status.requests_total == 3
+    assert status.delayed_total == 0
+
+
+def test_reserve_spaces_requests_by_rpm():
+    pacer = PacingScheduler()
+    delays = [pacer.reserve("1:chat", 60) for _ in range(3)]
+
+    assert delays[0] == 0.0
+    assert delays[1] == pytest.approx(1.0, abs=0.05)
+    assert delays[2] == pytest.approx(2.0, abs=0.05)
+
+    status = pacer.status("1:chat")
+    assert status.interval_ms == pytest.approx(1000.0)
+    assert status.delayed_total == 2
+    assert status.max_delay_ms == pytest.approx(2000.0, abs=50)
+    assert status.avg_delay_ms == pytest.approx(1000.0, abs=50)
+    # 其他模型键互不影响
+    assert pacer.reserve("2:chat", 60) == 0.0
+
+
+def test_reserve_uses_default_rpm_and_respects_switch(monkeypatch):
+    pacer = PacingScheduler()
+    monkeypatch.setattr(settings, "LLM_PACING_DEFAULT_RPM", 120)
+    pacer.reserve("1:chat", None)
+    assert pacer.reserve("1:chat", None) == pytest.approx(0.5, abs=0.05)
+
+    monkeypatch.setattr(settings, "LLM_PACING_ENABLED", False)
+    assert pacer.reserve("1:chat", 60) == 0.0
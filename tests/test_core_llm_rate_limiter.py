@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from app.core.llm_rate_limiter import (
+    InMemoryLimiterBackend,
+    LimitConfig,
+    LLMRateLimiter,
+    RateLimitTimeout,
+    estimate_payload_tokens,
+)
+from app.models.llm_provider import LLMModel, LLMProvider
+
+
+def test_limiter_caps_concurrency_across_threads():
+    limiter = LLMRateLimiter(InMemoryLimiterBackend())
+    config = LimitConfig(concurrency=2)
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def _call() -> None:
+        nonlocal in_flight, peak
+        with limiter.acquire("1:chat", config, timeout=5):
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.02)
+            with lock:
+                in_flight -= 1
+
+    threads = [threading.Thread(target=_call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak == 2
+    status = limiter.status()[0]
+    assert status.acquired_total == 6
+    assert status.in_flight == 0
+    assert status.waiting == 0
+    assert status.max_wait_ms > 0
+
+
+class _BlockingBackend(InMemoryLimiterBackend):
+    """模拟需要网络往返的后端，记录每次调用所在的线程。"""
+
+    blocking = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.threads: list[int] = []
+
+    def try_acquire(self, key, config, cost):
+        self.threads.append(threading.get_ident())
+        return super().try_acquire(key, config, cost)
+
+    def release(self, key, lease_id):
+        self.threads.append(threading.get_ident())
+        super().release(key, lease_id)
+
+    def adjust_tokens(self, key, config, delta):
+        self.threads.append(threading.get_ident())
+        super().adjust_tokens(key, config, delta)
+
+
+def test_async_acquire_runs_blocking_backend_off_event_loop():
+    backend = _BlockingBackend()
+    limiter = LLMRateLimiter(backend)
+    config = LimitConfig(concurrency=1, tpm=1000)
+
+    async def _call() -> int:
+        async with limiter.acquire_async(
+            "1:chat", config, estimated_tokens=10
+        ) as lease:
+            await lease.arecord_usage(30)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(_call())
+
+    assert len(backend.threads) == 3
+    assert loop_thread not in backend.threads
+    assert limiter.status()[0].in_flight == 0
+
+
+def test_async_waiter_is_woken_by_sync_release():
+    limiter = LLMRateLimiter(InMemoryLimiterBackend())
+    config = LimitConfig(concurrency=1)
+    lease_cm = limiter.acquire("1:chat", config)
+    lease_cm.__enter__()
+
+    async def _wait() -> float:
+        started = time.perf_counter()
+        async with limiter.acquire_async("1:chat", config, timeout=5) as lease:
+            assert lease.waited > 0
+        return time.perf_counter() - started
+
+    timer = threading.Timer(0.05, lambda: lease_cm.__exit__(None, None, None))
+    timer.start()
+    elapsed = asyncio.run(_wait())
+    timer.join()
+
+    assert elapsed < 0.4
+
+
+def test_rpm_bucket_blocks_until_timeout():
+    limiter = LLMRateLimiter(InMemoryLimiterBackend())
+    config = LimitConfig(concurrency=5, rpm=2)
+
+    for _ in range(2):
+        with limiter.acquire("1:chat", config):
+            pass
+
+    with pytest.raises(RateLimitTimeout):
+        with limiter.acquire("1:chat", config, timeout=0.05):
+            pass
+    assert limiter.status()[0].timeouts_total == 1
+
+
+def test_tpm_bucket_refunds_unused_estimate():
+    limiter = LLMRateLimiter(InMemoryLimiterBackend())
+    config = LimitConfig(concurrency=5, tpm=100)
+
+    with limiter.acquire("1:chat", config, estimated_tokens=80) as lease:
+        lease.record_usage(10)
+
+    with limiter.acquire("1:chat", config, estimated_tokens=80, timeout=0.05):
+        pass
+
+    with pytest.raises(RateLimitTimeout):
+        with limiter.acquire("1:chat", config, estimated_tokens=80, timeout=0.05):
+            pass
+
+
+def test_lease_is_renewed_while_call_outlives_ttl():
+    limiter = LLMRateLimiter(InMemoryLimiterBackend(lease_ttl=0.15))
+    config = LimitConfig(concurrency=1)
+
+    with limiter.acquire("1:chat", config):
+        time.sleep(0.5)
+        assert limiter.status()[0].in_flight == 1
+        with pytest.raises(RateLimitTimeout):
+            with limiter.acquire("1:chat", config, timeout=0.05):
+                pass
+
+    assert limiter.status()[0].in_flight == 0
+    with limiter.acquire("1:chat", config, timeout=0.05):
+        pass
+
+
+def test_limit_config_for_model_and_token_estimate():
+    model = LLMModel(name="chat", concurrency_limit=3, rate_limit_rpm=60)
+    config = LimitConfig.for_model(model)
+    assert config == LimitConfig(concurrency=3, rpm=60, tpm=None)
+    assert LimitConfig.for_model(None).concurrency >= 1
+
+    payload = {"messages": [{"role": "user", "content": "x" * 40}], "max_tokens": 10}
+    assert estimate_payload_tokens(payload) > 10
+
+
+def test_rate_limit_endpoint_reports_invocations(client, db_session, llm_transport):
+    provider = LLMProvider(
+        provider_name="Limited",
+        api_key="key",
+        is_custom=True,
+        base_url="https://limited.example/v1",
+    )
+    model = LLMModel(provider=provider, name="limited-chat", rate_limit_tpm=10000)
+    db_session.add_all([provider, model])
+    db_session.commit()
+
+    llm_transport(
+        lambda request: httpx.Response(
+            200,
+            json={"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 7}},
+        )
+    )
+    response = client.post(
+        f"/api/v1/llm-providers/{provider.id}/invoke",
+        json={"messages": [{"role": "user", "content": "hi"}], "model_id": model.id},
+    )
+    assert response.status_code == 200
+
+    limits = client.get("/api/v1/llm-providers/rate-limits")
+    assert limits.status_code == 200
+    matched = next(
+        item for item in limits.json() if item["key"] == f"{provider.id}:limited-chat"
+    )
+    assert matched["tpm_limit"] == 10000
+    assert matched["in_flight"] == 0
+    assert matched["acquired_total"] >= 1
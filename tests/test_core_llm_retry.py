@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+from app.core.llm_retry import (
+    RetryBudget,
+    RetryPolicy,
+    RetryRule,
+    asend_with_retry,
+    compute_backoff,
+    parse_retry_after,
+    send_with_retry,
+)
+
+_RULE = RetryRule(max_attempts=3, base_delay=0.5, max_delay=4.0)
+_POLICY = RetryPolicy(status_rules={429: _RULE, 502: _RULE}, transport_rule=_RULE)
+
+
+def test_parse_retry_after_variants():
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+    assert parse_retry_after({"x-ratelimit-reset-requests": "1m30s"}) == 90.0
+    assert parse_retry_after(
+        {"x-ratelimit-reset-requests": "20ms", "x-ratelimit-reset-tokens": "2s"}
+    ) == 2.0
+    future = format_datetime(datetime.now(UTC) + timedelta(seconds=30), usegmt=True)
+    assert 25 < parse_retry_after({"retry-after": future}) <= 30
+    assert parse_retry_after({"retry-after": "soon"}) is None
+    assert parse_retry_after({}) is None
+
+
+def test_compute_backoff_uses_capped_full_jitter():
+    for index in range(6):
+        delay = compute_backoff(_RULE, index)
+        assert 0 <= delay <= min(4.0, 0.5 * 2**index)
+    assert compute_backoff(_RULE, 0, retry_after=10) == 4.0
+    assert compute_backoff(_RULE, 0, retry_after=1.5) == 1.5
+
+
+def test_send_with_retry_honors_retry_after_and_records_stats():
+    responses = iter(
+        [
+            httpx.Response(429, headers={"retry-after": "1"}),
+            httpx.Response(502),
+            httpx.Response(200, json={"ok": True}),
+        ]
+    )
+    sleeps: list[float] = []
+
+    response, stats = send_with_retry(
+        lambda: next(responses), policy=_POLICY, sleep=sleeps.append
+    )
+
+    assert response.status_code == 200
+    assert stats.attempts == 3
+    assert stats.retries == 2
+    assert sleeps[0] == 1.0
+    assert stats.backoff_ms == pytest.approx(sum(sleeps) * 1000)
+    assert stats.reasons == ["HTTP 429", "HTTP 502"]
+
+
+def test_send_with_retry_stops_at_max_attempts_and_non_retryable_status():
+    calls = 0
+
+    def _send() -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(429, headers={"retry-after": "0"})
+
+    response, stats = send_with_retry(_send, policy=_POLICY, sleep=lambda _: None)
+    assert response.status_code == 429
+    assert calls == 3 and stats.retries == 2
+
+    response, stats = send_with_retry(
+        lambda: httpx.Response(400), policy=_POLICY, sleep=lambda _: None
+    )
+    assert response.status_code == 400 and stats.retries == 0
+
+
+def test_retry_budget_is_shared_across_calls():
+    budget = RetryBudget(limit=1)
+    sender = lambda: httpx.Response(429, headers={"retry-after": "0"})  # noqa: E731
+
+    _, first = send_with_retry(sender, policy=_POLICY, budget=budget, sleep=lambda _: None)
+    _, second = send_with_retry(sender, policy=_POLICY, budget=budget, sleep=lambda _: None)
+
+    assert first.retries == 1
+    assert second.retries == 0
+    assert budget.retries == 1
+
+
+def test_async_retry_on_transport_error():
+    attempts = 0
+
+    async def _send() -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise httpx.ConnectTimeout("timeout")
+        return httpx.Response(200)
+
+    policy = RetryPolicy(
+        status_rules={},
+        transport_rule=RetryRule(max_attempts=2, base_delay=0.001, max_delay=0.001),
+    )
+    response, stats = asyncio.run(asend_with_retry(_send, policy=policy))
+    assert response.status_code == 200
+    assert stats.reasons == ["ConnectTimeout"]
+
+    async def _always_fail() -> httpx.Response:
+        raise httpx.ConnectError("down")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(asend_with_retry(_always_fail, policy=policy))
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.config import settings
+from app.core.llm_single_flight import SingleFlightGroup, single_flight_key
+
+_PAYLOAD = {
+    "model": "chat-mini",
+    "messages": [{"role": "user", "content": "ping"}],
+    "temperature": 0,
+}
+
+
+def test_sync_callers_share_single_execution():
+    group: SingleFlightGroup[str] = SingleFlightGroup()
+    release = threading.Event()
+    calls = 0
+
+    def work() -> str:
+        nonlocal calls
+        calls += 1
+        release.wait(timeout=2)
+        return "done"
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(group.do, "k", work) for _ in range(3)]
+        while group.coalesced_total < 2:
+            threading.Event().wait(0.005)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert calls == 1
+    assert sorted(coalesced for _, coalesced in results) == [False, True, True]
+    assert {value for value, _ in results} == {"done"}
+    assert group.inflight() == 0
+
+
+def test_leader_errors_propagate_to_waiters():
+    group: SingleFlightGroup[str] = SingleFlightGroup()
+
+    async def scenario() -> list[BaseException | tuple[str, bool]]:
+        started = asyncio.Event()
+
+        async def work() -> str:
+            started.set()
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        leader = asyncio.create_task(group.ado("k", work))
+        await started.wait()
+        follower = asyncio.create_task(group.ado("k", work))
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(item, RuntimeError) for item in results)
+
+
+def test_cancelled_leader_lets_waiter_retry():
+    group: SingleFlightGroup[str] = SingleFlightGroup()
+    calls = 0
+
+    async def scenario() -> tuple[str, bool]:
+        started = asyncio.Event()
+
+        async def work() -> str:
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        leader = asyncio.create_task(group.ado("k", work))
+        await started.wait()
+        follower = asyncio.create_task(group.ado("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == ("ok", False)
+    assert calls == 2
+
+
+def test_unshareable_leader_error_lets_waiter_retry():
+    group: SingleFlightGroup[str] = SingleFlightGroup()
+    release = threading.Event()
+    calls = 0
+
+    def work() -> str:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            release.wait(timeout=2)
+            raise TimeoutError("领头调用的截止时间已到")
+        return "retried"
+
+    def unshareable(exc: BaseException) -> bool:
+        return not isinstance(exc, TimeoutError)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(group.do, "k", work, shareable=unshareable)
+        while group.inflight() == 0:
+            threading.Event().wait(0.005)
+        follower = executor.submit(group.do, "k", work, shareable=unshareable)
+        while group.coalesced_total < 1:
+            threading.Event().wait(0.005)
+        release.set()
+        with pytest.raises(TimeoutError):
+            leader.result()
+        assert follower.result() == ("retried", False)
+
+    assert calls == 2
+
+
+def test_waiter_gives_up_at_its_own_timeout():
+    group: SingleFlightGroup[str] = SingleFlightGroup()
+
+    async def scenario() -> None:
+        started = asyncio.Event()
+
+        async def work() -> str:
+            started.set()
+            await asyncio.sleep(0.2)
+            return "late"
+
+        leader = asyncio.create_task(group.ado("k", work))
+        await started.wait()
+        with pytest.raises(TimeoutError):
+            await group.ado("k", work, timeout=0.01)
+        # 等待方超时不影响领头调用继续完成
+        assert await leader == ("late", False)
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_key_respects_source_and_determinism(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_SINGLE_FLIGHT_SOURCES", ["test_run"])
+    key = single_flight_key("test_run", "1:chat-mini", "https://llm/api", _PAYLOAD)
+
+    assert key is not None and key.startswith("1:chat-mini:")
+    assert single_flight_key("quick_test", "1:chat-mini", "https://llm/api", _PAYLOAD) is None
+    assert (
+        single_flight_key(
+            "test_run", "1:chat-mini", "https://llm/api", {**_PAYLOAD, "temperature": 0.7}
+        )
+        is None
+    )
+    assert single_flight_key(None, "1:chat-mini", "https://llm/api", _PAYLOAD) is None
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import pytest
+
+from app.core.config import settings
+from app.core.llm_timeouts import Deadline, DeadlineExceeded, TimeoutConfig
+from app.models.llm_provider import LLMModel
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_for_model_falls_back_to_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_CONNECT_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_FIRST_BYTE_SECONDS", 20.0)
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_TOTAL_SECONDS", 60.0)
+
+    assert TimeoutConfig.for_model(None) == TimeoutConfig(5.0, 20.0, 60.0)
+    model = LLMModel(name="chat", timeout_first_byte_seconds=8.0)
+    assert TimeoutConfig.for_model(model) == TimeoutConfig(5.0, 8.0, 60.0)
+
+
+def test_to_httpx_bounds_reads_by_phase():
+    config = TimeoutConfig(connect=2.0, first_byte=8.0, total=60.0)
+
+    streamed = config.to_httpx(stream=True)
+    assert (streamed.connect, streamed.read) == (2.0, 8.0)
+    # 非流式响应在生成完成后才返回首个字节，读取阶段按总超时控制
+    assert config.to_httpx(stream=False).read == 60.0
+    assert config.within(5.0) == TimeoutConfig(2.0, 5.0, 5.0)
+
+
+def test_deadline_skips_work_that_cannot_finish():
+    clock = FakeClock()
+    deadline = Deadline(10.0, clock=clock)
+
+    deadline.ensure_room()
+    deadline.observe(4.0)
+    clock.now = 5.0
+    deadline.ensure_room()
+
+    clock.now = 7.0
+    assert deadline.has_room() is False
+    with pytest.raises(DeadlineExceeded):
+        deadline.ensure_room()
+    assert deadline.check() == pytest.approx(3.0)
+
+    clock.now = 10.0
+    with pytest.raises(DeadlineExceeded):
+        deadline.check()
+
+
+def test_deadline_from_option(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RUN_DEADLINE_SECONDS", 0.0)
+    assert Deadline.from_option(None) is None
+    assert Deadline.from_option(True) is None
+    assert Deadline.from_option(30).seconds == 30.0
+
+    monkeypatch.setattr(settings, "LLM_RUN_DEADLINE_SECONDS", 120.0)
+    assert Deadline.from_option(None).seconds == 120.0
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import math
+import random
+
+import pytest
+
+from app.core.quantile_sketch import QuantileSketch
+from app.services.run_metrics import RunMetricsAggregator
+
+
+def _exact_quantile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+def test_quantiles_stay_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5.5, 0.8) for _ in range(20_000)]
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.count == len(values)
+    assert sketch.mean == pytest.approx(sum(values) / len(values))
+    for q in (0.5, 0.9, 0.95, 0.99):
+        assert sketch.quantile(q) == pytest.approx(_exact_quantile(values, q), rel=0.011)
+    assert sketch.quantile(0) == min(values)
+    assert sketch.quantile(1) == max(values)
+
+
+def test_bucket_count_is_bounded_and_keeps_tail_accurate():
+    sketch = QuantileSketch(relative_accuracy=0.02, max_buckets=64)
+    values = [float(value) for value in range(1, 100_001)]
+    for value in values:
+        sketch.add(value)
+
+    assert len(sketch._buckets) <= 64
+    assert sketch.quantile(0.99) == pytest.approx(_exact_quantile(values, 0.99), rel=0.021)
+
+
+def test_merge_and_zero_values():
+    left = QuantileSketch()
+    right = QuantileSketch()
+    for value in (0, 0, 10):
+        left.add(value)
+    for value in (20, 30):
+        right.add(value)
+    left.merge(right)
+
+    assert left.count == 5
+    assert left.quantile(0.25) == 0.0
+    assert left.quantile(1.0) == 30
+    assert QuantileSketch().quantile(0.5) is None
+    with pytest.raises(ValueError):
+        left.merge(QuantileSketch(relative_accuracy=0.05))
+
+
+def test_run_metrics_summary_shape():
+    aggregator = RunMetricsAggregator()
+    for latency in (100, 200, 300, 400):
+        aggregator.add(
+            latency_ms=latency,
+            total_tokens=latency // 10,
+            completion_tokens=50,
+            ttft_ms=latency / 2,
+            json_success=latency > 200,
+        )
+
+    metrics = aggregator.summary()
+    assert metrics["rounds"] == 4
+    assert metrics["avg_latency_ms"] == pytest.approx(250)
+    assert metrics["min_latency_ms"] == 100 and metrics["max_latency_ms"] == 400
+    assert metrics["p50_latency_ms"] == pytest.approx(200, rel=0.01)
+    assert metrics["p99_latency_ms"] == pytest.approx(400, rel=0.01)
+    assert metrics["avg_ttft_ms"] == pytest.approx(125)
+    assert metrics["avg_total_tokens"] == pytest.approx(25)
+    # 生成阶段共 500ms，输出 200 个 token
+    assert metrics["output_tokens_per_sec"] == pytest.approx(400)
+    assert metrics["json_success_rate"] == 0.5
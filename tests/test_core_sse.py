@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from app.core.sse import SSEParser
+
+
+STREAM = (
+    ": keep-alive\r\n"
+    'data: {"a": 1}\r\n'
+    "\r\n"
+    "event: message\n"
+    "data: line-1\n"
+    "data:line-2\n"
+    "\n"
+    "data: 你好\r\r"
+    "data: [DONE]"
+).encode("utf-8")
+EXPECTED = ['{"a": 1}', "line-1\nline-2", "你好", "[DONE]"]
+
+
+def test_parser_extracts_events_and_flushes_tail():
+    parser = SSEParser()
+    events = parser.feed(STREAM)
+    # 最后一个事件没有以空行结束，留到流结束时返回
+    assert events == EXPECTED[:3]
+    assert parser.close() == EXPECTED[3:]
+
+
+def test_parser_handles_arbitrary_chunk_boundaries():
+    for size in (1, 2, 3, 7):
+        parser = SSEParser()
+        events: list[str] = []
+        for offset in range(0, len(STREAM), size):
+            events.extend(parser.feed(STREAM[offset : offset + size]))
+        events.extend(parser.close())
+        assert events == EXPECTED, size
+
+
+def test_parser_ignores_empty_chunks_and_blank_events():
+    parser = SSEParser()
+    assert parser.feed(b"") == []
+    assert parser.feed(b"\n\n: comment\n\n") == []
+    assert parser.close() == []
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, select
+
+from app.core.config import settings
+from app.models.config_version import ConfigVersion
+from app.models.llm_provider import LLMModel, LLMProvider
+from app.models.test_run import TestRun
+from app.services.llm_config_cache import (
+    LLM_CONFIG_VERSION_NAME,
+    bump_config_version,
+    llm_config_cache,
+)
+from app.services.test_run import TestRunExecutionError, _resolve_provider_and_model
+
+
+@pytest.fixture()
+def provider_model(db_session) -> LLMModel:
+    provider = LLMProvider(
+        provider_name="Internal",
+        api_key="secret-key",
+        base_url="https://llm.internal/api",
+    )
+    model = LLMModel(provider=provider, name="chat-mini", concurrency_limit=2)
+    db_session.add_all([provider, model])
+    db_session.commit()
+    return model
+
+
+@contextmanager
+def count_queries(db_session) -> Iterator[list[str]]:
+    statements: list[str] = []
+    engine = db_session.get_bind().engine
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_execute)
+
+
+def _version(db_session) -> int:
+    return db_session.scalar(
+        select(ConfigVersion.version).where(
+            ConfigVersion.name == LLM_CONFIG_VERSION_NAME
+        )
+    )
+
+
+def _test_run(model: LLMModel) -> TestRun:
+    return TestRun(
+        model_name=model.name,
+        schema={"llm_provider_id": model.provider_id, "llm_model_id": model.id},
+    )
+
+
+def test_resolve_hits_without_database_round_trips(db_session, provider_model):
+    test_run = _test_run(provider_model)
+    provider, model = _resolve_provider_and_model(db_session, test_run)
+    assert (provider.id, model.id) == (provider_model.provider_id, provider_model.id)
+
+    # 清空会话后命中的结果从快照重建，仍可正常读取字段
+    db_session.expunge_all()
+    with count_queries(db_session) as statements:
+        provider, model = _resolve_provider_and_model(db_session, test_run)
+        assert provider.api_key == "secret-key"
+        assert model.concurrency_limit == 2
+        assert model in db_session
+    assert statements == []
+    assert llm_config_cache.hits == 1
+
+
+def test_config_writes_bump_version_and_invalidate(db_session, provider_model):
+    test_run = _test_run(provider_model)
+    _resolve_provider_and_model(db_session, test_run)
+    before = _version(db_session) or 0
+
+    model = db_session.get(LLMModel, provider_model.id)
+    model.concurrency_limit = 7
+    db_session.commit()
+    db_session.expunge_all()
+
+    assert _version(db_session) == before + 1
+    _, model = _resolve_provider_and_model(db_session, test_run)
+    assert model.concurrency_limit == 7
+    assert llm_config_cache.hits == 0
+
+    # 删除提供者后不再返回缓存中的旧配置
+    db_session.delete(db_session.get(LLMProvider, provider_model.provider_id))
+    db_session.commit()
+    with pytest.raises(TestRunExecutionError):
+        _resolve_provider_and_model(db_session, test_run)
+
+
+def test_version_change_from_other_process_is_detected(
+    db_session, provider_model, monkeypatch
+):
+    test_run = _test_run(provider_model)
+    calls = 0
+
+    def loader():
+        nonlocal calls
+        calls += 1
+        return _resolve_provider_and_model(db_session, test_run)
+
+    llm_config_cache.resolve(db_session, "key", loader)
+    llm_config_cache.resolve(db_session, "key", loader)
+    assert calls == 1
+
+    # 模拟其他进程修改配置：只递增数据库版本号，不清空本进程缓存
+    bump_config_version(db_session.connection())
+    llm_config_cache.resolve(db_session, "key", loader)
+    assert calls == 1
+
+    monkeypatch.setattr(settings, "LLM_CONFIG_CACHE_CHECK_SECONDS", 0.0)
+    llm_config_cache.resolve(db_session, "key", loader)
+    assert calls == 2
+
+
+def test_failed_resolution_is_not_cached(db_session, monkeypatch):
+    test_run = TestRun(model_name="missing-model", schema={})
+
+    with pytest.raises(TestRunExecutionError):
+        _resolve_provider_and_model(db_session, test_run)
+
+    provider = LLMProvider(provider_name="Late", api_key="late-key")
+    db_session.add_all([provider, LLMModel(provider=provider, name="missing-model")])
+    db_session.commit()
+
+    resolved, model = _resolve_provider_and_model(db_session, test_run)
+    assert resolved.provider_name == "Late"
+    assert model is not None
+
+    monkeypatch.setattr(settings, "LLM_CONFIG_CACHE_ENABLED", False)
+    _resolve_provider_and_model(db_session, test_run)
+    assert llm_config_cache.hits == 0
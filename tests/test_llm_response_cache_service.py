@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import select
+
+from app.models.llm_cache import LLMResponseCacheEntry
+from app.services.llm_response_cache import (
+    CacheMode,
+    LLMResponseCache,
+    build_cache_key,
+    is_deterministic_payload,
+    resolve_cache_mode,
+)
+
+
+def _payload(**overrides):
+    payload = {
+        "model": "chat-mini",
+        "messages": [{"role": "user", "content": "ping"}],
+        "temperature": 0,
+    }
+    payload.update(overrides)
+    return payload
+
+
+def test_build_cache_key_is_canonical():
+    key = build_cache_key("https://llm.example/api/", _payload(max_tokens=32))
+    reordered = {
+        "max_tokens": 32,
+        "temperature": 0,
+        "messages": [{"content": "ping", "role": "user"}],
+        "model": "chat-mini",
+        "stream": False,
+        "user": "tester",
+    }
+
+    assert build_cache_key("https://LLM.example/api", reordered) == key
+    assert build_cache_key("https://llm.example/api", _payload(max_tokens=64)) != key
+    assert build_cache_key("https://other.example/api", _payload(max_tokens=32)) != key
+
+
+def test_is_deterministic_payload_and_mode_resolution():
+    assert is_deterministic_payload(_payload())
+    assert is_deterministic_payload(_payload(temperature=0.8, seed=7))
+    assert not is_deterministic_payload(_payload(temperature=0.8))
+
+    assert resolve_cache_mode(None, "READ") is CacheMode.READ
+    assert resolve_cache_mode("unknown", "write") is CacheMode.WRITE
+    assert resolve_cache_mode() is CacheMode.BYPASS
+
+
+def test_scope_reads_from_database_after_memory_eviction(db_session):
+    cache = LLMResponseCache(memory_max_entries=1, ttl_seconds=60)
+    writer = cache.scope(db_session, CacheMode.WRITE)
+    key = writer.key_for("https://llm.example/api", _payload())
+    other_key = writer.key_for("https://llm.example/api", _payload(seed=1))
+    writer.store(key, model_name="chat-mini", body={"id": "a"}, latency_ms=120)
+    writer.store(other_key, model_name="chat-mini", body={"id": "b"}, latency_ms=80)
+    # write 模式只回填缓存，不读取
+    assert writer.lookup(key) is None
+    writer.flush()
+
+    reader = cache.scope(db_session, CacheMode.READ)
+    cached = reader.lookup(key)
+    assert cached is not None
+    assert cached.body == {"id": "a"}
+    assert cached.latency_ms == 120
+    assert reader.hits == 1
+
+    entry = db_session.scalar(
+        select(LLMResponseCacheEntry).where(LLMResponseCacheEntry.cache_key == key)
+    )
+    assert entry.hit_count == 1
+    assert entry.size_bytes > 0
+
+
+def test_scope_skips_non_deterministic_and_bypass(db_session):
+    cache = LLMResponseCache(ttl_seconds=60)
+    reader = cache.scope(db_session, CacheMode.READ)
+    assert reader.key_for("https://llm.example/api", _payload(temperature=0.5)) is None
+
+    bypass = cache.scope(db_session, CacheMode.BYPASS)
+    assert bypass.key_for("https://llm.example/api", _payload()) is None
+
+
+def test_evict_removes_expired_and_oldest_entries(db_session):
+    cache = LLMResponseCache(memory_max_entries=0, ttl_seconds=60, db_max_bytes=60)
+    now = datetime.now(UTC)
+    db_session.add_all(
+        [
+            LLMResponseCacheEntry(
+                cache_key="expired",
+                model_name="m",
+                response={},
+                size_bytes=10,
+                expires_at=now - timedelta(seconds=1),
+            ),
+            LLMResponseCacheEntry(
+                cache_key="old",
+                model_name="m",
+                response={},
+                size_bytes=40,
+                expires_at=now + timedelta(hours=1),
+                last_hit_at=now - timedelta(hours=2),
+            ),
+            LLMResponseCacheEntry(
+                cache_key="recent",
+                model_name="m",
+                response={},
+                size_bytes=40,
+                expires_at=now + timedelta(hours=1),
+                last_hit_at=now,
+            ),
+        ]
+    )
+    db_session.flush()
+
+    assert cache.evict(db_session) == 2
+    remaining = db_session.scalars(select(LLMResponseCacheEntry.cache_key)).all()
+    assert remaining == ["recent"]
@@ -1,6 +1,6 @@
-from datetime import timedelta
-from types import TracebackType
-from typing import Any, Literal
+import json
+import time
+from typing import Any
 
 import anyio
 import httpx
@@ -9,6 +9,8 @@ from fastapi import HTTPException
 
 from app.api.v1.endpoints import llms as llms_api
 from app.api.v1.endpoints.llms import ChatMessage, LLMStreamInvocationRequest
+from app.core import llm_gateway
+from app.core.llm_circuit_breaker import CircuitBreaker
 from app.models.llm_provider import LLMModel, LLMProvider
 from app.models.usage import LLMUsageLog
 
@@ -145,7 +147,7 @@ def test_update_provider_requires_base_url_when_non_custom(client):
     assert "基础 URL" in response.text
 
 
-def test_invoke_llm_uses_request_parameters_only(client, monkeypatch):
+def test_invoke_llm_uses_request_parameters_only(client, llm_transport):
     provider = create_provider(
         client,
         {
@@ -164,28 +166,18 @@ def test_invoke_llm_uses_request_parameters_only(client, monkeypatch):
 
     captured: dict[str, Any] = {}
 
-    class DummyResponse:
-        status_code = 200
-
-        def __init__(self) -> None:
-            self.elapsed = timedelta(milliseconds=5)
-
-        def json(self) -> dict[str, Any]:
-            return {"choices": []}
-
-        @property
-        def text(self) -> str:
-            return ""
-
-    def fake_post(
-        url: str, headers: dict[str, str], json: dict[str, Any], timeout: float
-    ) -> DummyResponse:
+    def handler(request: httpx.Request) -> httpx.Response:
         captured.update(
-            {"url": url, "headers": headers, "json": json, "timeout": timeout}
+            {
+                "url": str(request.url),
+                "headers": request.headers,
+                "json": json.loads(request.content),
+                "timeout": request.extensions["timeout"]["read"],
+            }
         )
-        return DummyResponse()
+        return httpx.Response(200, json={"choices": []})
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.post", fake_post)
+    llm_transport(handler)
 
     body = {
         "model_id": model["id"],
@@ -207,6 +199,55 @@ def test_invoke_llm_uses_request_parameters_only(client, monkeypatch):
     assert captured["timeout"] == 30.0
 
 
+def test_invoke_llm_serves_deterministic_requests_from_cache(
+    client, db_session, llm_transport
+):
+    provider = create_provider(
+        client,
+        {
+            "provider_name": "Cached",
+            "api_key": "cache-secret",
+            "is_custom": True,
+            "base_url": "https://llm.cache/api",
+        },
+    )
+    model = create_model(client, provider["id"], {"name": "chat-cache"})
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(
+            200, json={"choices": [{"message": {"content": "pong"}}]}
+        )
+
+    llm_transport(handler)
+
+    body = {
+        "model_id": model["id"],
+        "messages": [{"role": "user", "content": "ping"}],
+        "parameters": {"temperature": 0},
+        "cache": "read",
+    }
+    first = client.post(f"{API_PREFIX}/{provider['id']}/invoke", json=body)
+    second = client.post(f"{API_PREFIX}/{provider['id']}/invoke", json=body)
+    assert first.status_code == second.status_code == 200
+    assert first.headers["X-PromptWorks-Cache"] == "miss"
+    assert second.headers["X-PromptWorks-Cache"] == "hit"
+    assert second.json() == first.json()
+    assert calls == 1
+    # 命中与未命中都写入调用日志，命中的一条标记 cache_hit 供看板统计节省量
+    logs = db_session.query(LLMUsageLog).order_by(LLMUsageLog.id).all()
+    assert [log.cache_hit for log in logs] == [False, True]
+    assert {log.response_text for log in logs} == {"pong"}
+
+    # 非确定性请求不参与缓存
+    body["parameters"] = {"temperature": 0.7}
+    third = client.post(f"{API_PREFIX}/{provider['id']}/invoke", json=body)
+    assert "X-PromptWorks-Cache" not in third.headers
+    assert calls == 2
+
+
 def test_invoke_llm_without_models_requires_model_argument(client):
     provider = create_provider(
         client,
@@ -265,7 +306,7 @@ def test_update_model_concurrency_limit(client):
     assert invalid_resp.status_code == 422
 
 
-def test_invoke_llm_uses_known_base_url_when_missing(client, db_session, monkeypatch):
+def test_invoke_llm_uses_known_base_url_when_missing(client, db_session, llm_transport):
     provider = LLMProvider(
         provider_name="OpenAI",
         provider_key="openai",
@@ -276,30 +317,19 @@ def test_invoke_llm_uses_known_base_url_when_missing(client, db_session, monkeyp
     db_session.add(provider)
     db_session.commit()
 
-    class DummyResponse:
-        status_code = 200
-
-        def __init__(self) -> None:
-            self.elapsed = timedelta(milliseconds=8)
-
-        def json(self) -> dict[str, Any]:
-            return {"choices": []}
-
-        @property
-        def text(self) -> str:
-            return ""
-
     captured: dict[str, Any] = {}
 
-    def fake_post(
-        url: str, headers: dict[str, str], json: dict[str, Any], timeout: float
-    ) -> DummyResponse:
+    def handler(request: httpx.Request) -> httpx.Response:
         captured.update(
-            {"url": url, "headers": headers, "json": json, "timeout": timeout}
+            {
+                "url": str(request.url),
+                "headers": request.headers,
+                "json": json.loads(request.content),
+            }
         )
-        return DummyResponse()
+        return httpx.Response(200, json={"choices": []})
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.post", fake_post)
+    llm_transport(handler)
 
     body = {
         "messages": [{"role": "user", "content": "Hello"}],
@@ -397,7 +427,7 @@ def test_masked_api_key_format(client, mask_value: str, expected: str):
     assert provider["masked_api_key"] == expected
 
 
-def test_stream_invoke_llm_persists_usage(client, db_session, monkeypatch):
+def test_stream_invoke_llm_persists_usage(client, db_session, llm_transport):
     provider = create_provider(
         client,
         {
@@ -411,30 +441,6 @@ def test_stream_invoke_llm_persists_usage(client, db_session, monkeypatch):
 
     captured: dict[str, Any] = {}
 
-    class DummyStream:
-        status_code = 200
-
-        def __init__(self, lines: list[str]) -> None:
-            self._lines = lines
-
-        def __enter__(self) -> "DummyStream":
-            return self
-
-        def __exit__(
-            self,
-            exc_type: type[BaseException] | None,
-            exc: BaseException | None,
-            tb: TracebackType | None,
-        ) -> Literal[False]:
-            return False
-
-        def read(self) -> bytes:
-            return b""
-
-        def iter_lines(self):  # noqa: ANN201 - 接口保持与 httpx 一致
-            for item in self._lines:
-                yield item
-
     lines = [
         'data: {"id":"chatcmpl-1","choices":[{"delta":{"role":"assistant"}}]}',
         "",
@@ -449,19 +455,21 @@ def test_stream_invoke_llm_persists_usage(client, db_session, monkeypatch):
         "",
     ]
 
-    def fake_stream(method, url, headers, json, timeout):  # noqa: ANN001 - 与 httpx 接口对齐
+    def handler(request: httpx.Request) -> httpx.Response:
         captured.update(
             {
-                "method": method,
-                "url": url,
-                "headers": headers,
-                "json": json,
-                "timeout": timeout,
+                "method": request.method,
+                "url": str(request.url),
+                "headers": request.headers,
+                "json": json.loads(request.content),
             }
         )
-        return DummyStream(lines)
+        body = "".join(f"{line}\n" for line in lines).encode("utf-8")
+        return httpx.Response(
+            200, content=body, headers={"Content-Type": "text/event-stream"}
+        )
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.stream", fake_stream)
+    llm_transport(handler)
 
     body = {
         "model_id": model["id"],
@@ -536,7 +544,7 @@ def test_quick_test_history_endpoint_returns_logs(client, db_session):
     assert matched["messages"][0]["content"] == "回顾一下"
 
 
-def test_invoke_llm_network_error_returns_gateway_error(client, monkeypatch):
+def test_invoke_llm_network_error_returns_gateway_error(client, llm_transport):
     provider = create_provider(
         client,
         {
@@ -548,10 +556,10 @@ def test_invoke_llm_network_error_returns_gateway_error(client, monkeypatch):
     )
     model = create_model(client, provider["id"], {"name": "err-model"})
 
-    def fake_post(*args, **kwargs):  # noqa: ANN002 - 与 httpx 接口对齐
-        raise httpx.HTTPError("network down")
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("network down", request=request)
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.post", fake_post)
+    llm_transport(handler)
 
     payload = {
         "model_id": model["id"],
@@ -562,32 +570,101 @@ def test_invoke_llm_network_error_returns_gateway_error(client, monkeypatch):
     assert "network down" in response.text
 
 
-def test_invoke_llm_error_response_falls_back_to_text(client, monkeypatch):
+def test_invoke_llm_rejects_calls_while_circuit_is_open(
+    client, llm_transport, monkeypatch
+):
+    breaker = CircuitBreaker(window=2, min_calls=2, open_seconds=30)
+    monkeypatch.setattr(llm_gateway, "llm_circuit_breaker", breaker)
+    monkeypatch.setattr(llms_api, "llm_circuit_breaker", breaker)
     provider = create_provider(
         client,
         {
-            "provider_name": "InvokeErrorText",
-            "api_key": "invoke-text",
+            "provider_name": "Flaky",
+            "api_key": "flaky-key",
             "is_custom": True,
-            "base_url": "https://invoke.text/api",
+            "base_url": "https://flaky.example/api",
         },
     )
-    model = create_model(client, provider["id"], {"name": "err-text"})
+    model = create_model(client, provider["id"], {"name": "flaky-model"})
+    attempts = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        return httpx.Response(500, json={"error": {"message": "boom"}})
+
+    llm_transport(handler)
+
+    payload = {
+        "model_id": model["id"],
+        "messages": [{"role": "user", "content": "ping"}],
+    }
+    for _ in range(2):
+        response = client.post(f"{API_PREFIX}/{provider['id']}/invoke", json=payload)
+        assert response.status_code == 500
 
-    class ErrorResponse:
-        status_code = 429
+    response = client.post(f"{API_PREFIX}/{provider['id']}/invoke", json=payload)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "30"
+    assert attempts == 2
+
+    listing = client.get(API_PREFIX + "/").json()
+    [item] = [entry for entry in listing if entry["id"] == provider["id"]]
+    [circuit] = item["circuit_breakers"]
+    assert circuit["model_name"] == "flaky-model"
+    assert circuit["state"] == "open"
+    assert circuit["health_score"] == 0.0
+    assert circuit["failures_total"] == 2
+    assert circuit["rejected_total"] == 1
+
+
+def test_update_model_failover_requires_other_provider(client):
+    primary = create_provider(
+        client,
+        {
+            "provider_name": "Primary",
+            "api_key": "primary-key",
+            "is_custom": True,
+            "base_url": "https://primary.example/api",
+        },
+    )
+    standby = create_provider(
+        client,
+        {
+            "provider_name": "Standby",
+            "api_key": "standby-key",
+            "is_custom": True,
+            "base_url": "https://standby.example/api",
+        },
+    )
+    model = create_model(client, primary["id"], {"name": "chat"})
+    sibling = create_model(client, primary["id"], {"name": "chat-lite"})
+    equivalent = create_model(client, standby["id"], {"name": "chat"})
+    url = f"{API_PREFIX}/{primary['id']}/models/{model['id']}"
 
-        def json(self) -> dict[str, Any]:  # noqa: ANN401 - 接口返回任意内容
-            raise ValueError("boom")
+    response = client.patch(url, json={"failover_model_id": sibling["id"]})
+    assert response.status_code == 400
+    response = client.patch(url, json={"failover_model_id": 9999})
+    assert response.status_code == 400
+
+    response = client.patch(url, json={"failover_model_id": equivalent["id"]})
+    assert response.status_code == 200
+    assert response.json()["failover_model_id"] == equivalent["id"]
 
-        @property
-        def text(self) -> str:
-            return "too many requests"
 
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.post",
-        lambda *args, **kwargs: ErrorResponse(),
+def test_invoke_llm_error_response_falls_back_to_text(client, llm_transport):
+    provider = create_provider(
+        client,
+        {
+            "provider_name": "InvokeErrorText",
+            "api_key": "invoke-text",
+            "is_custom": True,
+            "base_url": "https://invoke.text/api",
+        },
     )
+    model = create_model(client, provider["id"], {"name": "err-text"})
+
+    llm_transport(lambda request: httpx.Response(429, text="too many requests"))
 
     payload = {
         "model_id": model["id"],
@@ -598,7 +675,7 @@ def test_invoke_llm_error_response_falls_back_to_text(client, monkeypatch):
     assert "too many requests" in response.text
 
 
-def test_invoke_llm_without_elapsed_logs(client, monkeypatch):
+def test_invoke_llm_without_elapsed_logs(client, llm_transport):
     provider = create_provider(
         client,
         {
@@ -610,21 +687,7 @@ def test_invoke_llm_without_elapsed_logs(client, monkeypatch):
     )
     model = create_model(client, provider["id"], {"name": "model-elapsed"})
 
-    class SuccessResponse:
-        status_code = 200
-        elapsed = None
-
-        def json(self) -> dict[str, Any]:  # noqa: ANN401
-            return {"choices": []}
-
-        @property
-        def text(self) -> str:
-            return ""
-
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.post",
-        lambda *args, **kwargs: SuccessResponse(),
-    )
+    llm_transport(lambda request: httpx.Response(200, json={"choices": []}))
 
     payload = {
         "model_id": model["id"],
@@ -634,7 +697,7 @@ def test_invoke_llm_without_elapsed_logs(client, monkeypatch):
     assert response.status_code == 200
 
 
-def test_stream_invoke_llm_handles_error_status(db_session, monkeypatch):
+def test_stream_invoke_llm_handles_error_status(db_session, llm_transport):
     provider = LLMProvider(
         provider_name="StreamError",
         api_key="stream-error",
@@ -645,25 +708,7 @@ def test_stream_invoke_llm_handles_error_status(db_session, monkeypatch):
     db_session.add_all([provider, model])
     db_session.commit()
 
-    class ErrorStream:
-        status_code = 502
-
-        def __enter__(self):
-            return self
-
-        def __exit__(self, exc_type, exc, tb):
-            return False
-
-        def read(self) -> bytes:
-            return b'{"message": "bad"}'
-
-        def iter_lines(self):  # noqa: ANN201
-            yield from []
-
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.stream",
-        lambda *args, **kwargs: ErrorStream(),
-    )
+    llm_transport(lambda request: httpx.Response(502, json={"message": "bad"}))
 
     payload = LLMStreamInvocationRequest(
         model_id=model.id,
@@ -672,22 +717,20 @@ def test_stream_invoke_llm_handles_error_status(db_session, monkeypatch):
         temperature=0.5,
     )
 
-    response = llms_api.stream_invoke_llm(
-        db=db_session,
-        provider_id=provider.id,
-        payload=payload,
-    )
-
-    async def consume():
-        async for _ in response.body_iterator:
-            pass
+    async def invoke():
+        return await llms_api.stream_invoke_llm(
+            db=db_session,
+            provider_id=provider.id,
+            payload=payload,
+        )
 
+    # 上游错误在发送响应头之前返回，客户端能拿到真实的状态码
     with pytest.raises(HTTPException) as exc:
-        anyio.run(consume)
+        anyio.run(invoke)
     assert exc.value.status_code == 502
 
 
-def test_stream_invoke_llm_handles_http_exception(db_session, monkeypatch):
+def test_stream_invoke_llm_handles_http_exception(db_session, llm_transport):
     provider = LLMProvider(
         provider_name="StreamHttpError",
         api_key="stream-http",
@@ -698,10 +741,10 @@ def test_stream_invoke_llm_handles_http_exception(db_session, monkeypatch):
     db_session.add_all([provider, model])
     db_session.commit()
 
-    def fake_stream(*args, **kwargs):  # noqa: ANN002
-        raise httpx.HTTPError("stream boom")
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("stream boom", request=request)
 
-    monkeypatch.setattr("app.api.v1.endpoints.llms.httpx.stream", fake_stream)
+    llm_transport(handler)
 
     payload = LLMStreamInvocationRequest(
         model_id=model.id,
@@ -710,23 +753,21 @@ def test_stream_invoke_llm_handles_http_exception(db_session, monkeypatch):
         temperature=0.2,
     )
 
-    response = llms_api.stream_invoke_llm(
-        db=db_session,
-        provider_id=provider.id,
-        payload=payload,
-    )
-
-    async def consume():
-        async for _ in response.body_iterator:
-            pass
+    async def invoke():
+        return await llms_api.stream_invoke_llm(
+            db=db_session,
+            provider_id=provider.id,
+            payload=payload,
+        )
 
+    # 上游错误在发送响应头之前返回，客户端能拿到真实的状态码
     with pytest.raises(HTTPException) as exc:
-        anyio.run(consume)
+        anyio.run(invoke)
 
     assert exc.value.status_code == 502
 
 
-def test_stream_invoke_llm_ignores_invalid_chunks(client, db_session, monkeypatch):
+def test_stream_invoke_llm_ignores_invalid_chunks(client, db_session, llm_transport):
     provider = create_provider(
         client,
         {
@@ -738,34 +779,17 @@ def test_stream_invoke_llm_ignores_invalid_chunks(client, db_session, monkeypatc
     )
     model = create_model(client, provider["id"], {"name": "stream-noise-model"})
 
-    class NoiseStream:
-        status_code = 200
-
-        def __init__(self) -> None:
-            self._lines = [
-                "data: not-a-json",
-                "",
-                'data: {"choices": [{"message": {"content": "A"}}]}',
-                "",
-                "data: [DONE]",
-            ]
-
-        def __enter__(self):
-            return self
-
-        def __exit__(self, exc_type, exc, tb):
-            return False
-
-        def iter_lines(self):  # noqa: ANN201
-            for item in self._lines:
-                yield item
-
-        def read(self) -> bytes:
-            return b""
-
-    monkeypatch.setattr(
-        "app.api.v1.endpoints.llms.httpx.stream",
-        lambda *args, **kwargs: NoiseStream(),
+    noise_lines = [
+        "data: not-a-json",
+        "",
+        'data: {"choices": [{"message": {"content": "A"}}]}',
+        "",
+        "data: [DONE]",
+    ]
+    llm_transport(
+        lambda request: httpx.Response(
+            200, content="\n".join(noise_lines).encode("utf-8")
+        )
     )
 
     payload = {
@@ -784,3 +808,205 @@ def test_stream_invoke_llm_ignores_invalid_chunks(client, db_session, monkeypatc
     logs = db_session.query(LLMUsageLog).order_by(LLMUsageLog.id.desc()).first()
     assert logs is not None
     assert logs.response_text == "A"
+
+
+def test_invoke_llm_picks_up_provider_updates(client, llm_transport):
+    provider = create_provider(
+        client,
+        {
+            "provider_name": "Rotating",
+            "api_key": "old-secret",
+            "is_custom": True,
+            "base_url": "https://llm.rotate/api",
+        },
+    )
+    create_model(client, provider["id"], {"name": "chat-rotate"})
+    seen: list[tuple[str, str]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(
+            (request.headers["Authorization"], json.loads(request.content)["model"])
+        )
+        return httpx.Response(200, json={"choices": []})
+
+    llm_transport(handler)
+
+    body = {"model": "chat-rotate", "messages": [{"role": "user", "content": "hi"}]}
+    url = f"{API_PREFIX}/{provider['id']}/invoke"
+    assert client.post(url, json=body).status_code == 200
+
+    response = client.patch(
+        f"{API_PREFIX}/{provider['id']}", json={"api_key": "new-secret"}
+    )
+    assert response.status_code == 200
+    assert client.post(url, json=body).status_code == 200
+
+    # 删除模型后同名请求不再关联到模型记录
+    model_id = response.json()["models"][0]["id"]
+    deleted = client.delete(f"{API_PREFIX}/{provider['id']}/models/{model_id}")
+    assert deleted.status_code == 204
+    response = client.delete(f"{API_PREFIX}/{provider['id']}")
+    assert response.status_code == 204
+    assert client.post(url, json=body).status_code == 404
+
+    assert seen == [
+        ("Bearer old-secret", "chat-rotate"),
+        ("Bearer new-secret", "chat-rotate"),
+    ]
+
+
+def test_invoke_llm_hedges_slow_request_and_logs_both_calls(
+    client, db_session, llm_transport
+):
+    provider = create_provider(
+        client,
+        {
+            "provider_name": "Hedged",
+            "api_key": "secret",
+            "is_custom": True,
+            "base_url": "https://llm.hedge/api",
+        },
+    )
+    create_model(client, provider["id"], {"name": "chat-hedge"})
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            time.sleep(0.3)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": f"reply-{calls}"}}],
+                "usage": {
+                    "prompt_tokens": 3,
+                    "completion_tokens": 2,
+                    "total_tokens": 5,
+                },
+            },
+        )
+
+    llm_transport(handler)
+
+    response = client.post(
+        f"{API_PREFIX}/{provider['id']}/invoke",
+        json={
+            "model": "chat-hedge",
+            "messages": [{"role": "user", "content": "hi"}],
+            "hedge": 0.02,
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"] == "reply-2"
+    assert response.headers["X-PromptWorks-Hedge"] == "backup"
+    logs = db_session.query(LLMUsageLog).order_by(LLMUsageLog.id).all()
+    assert [(log.hedge_role, log.hedge_won) for log in logs] == [
+        ("backup", True),
+        ("primary", False),
+    ]
+    assert logs[0].response_text == "reply-2"
+    assert logs[0].total_tokens == 5
+
+    statuses = client.get(f"{API_PREFIX}/rate-limits").json()
+    [hedged] = [item for item in statuses if item["key"].endswith(":chat-hedge")]
+    assert hedged["hedged_requests"] == 1
+    assert hedged["hedge_win_rate"] == 1.0
+
+
+def test_stream_invoke_llm_forwards_upstream_bytes_unchanged(
+    client, db_session, llm_transport
+):
+    provider = create_provider(
+        client,
+        {
+            "provider_name": "StreamRaw",
+            "api_key": "stream-raw",
+            "is_custom": True,
+            "base_url": "https://stream.raw/api",
+        },
+    )
+    model = create_model(client, provider["id"], {"name": "stream-raw-model"})
+    upstream_body = (
+        ": ping\r\n\r\n"
+        'data: {"choices":[{"delta":{"content":"片"}}]}\r\n\r\n'
+        'data: {"choices":[],"usage":{"prompt_tokens":2,'
+        '"completion_tokens":1,"total_tokens":3}}\r\n\r\n'
+        "data: [DONE]\r\n\r\n"
+    ).encode("utf-8")
+    llm_transport(
+        lambda request: httpx.Response(
+            200,
+            content=upstream_body,
+            headers={"Content-Type": "text/event-stream"},
+        )
+    )
+
+    body = {
+        "model_id": model["id"],
+        "messages": [{"role": "user", "content": "hi"}],
+        "temperature": 0.3,
+    }
+    with client.stream(
+        "POST", f"{API_PREFIX}/{provider['id']}/invoke/stream", json=body
+    ) as response:
+        assert response.status_code == 200
+        received = b"".join(response.iter_bytes())
+
+    assert received == upstream_body
+    log_entry = db_session.query(LLMUsageLog).one()
+    assert log_entry.response_text == "片"
+    assert log_entry.total_tokens == 3
+
+
+def test_stream_invoke_llm_returns_upstream_status(client, db_session, llm_transport):
+    provider = create_provider(
+        client,
+        {
+            "provider_name": "StreamLimited",
+            "api_key": "stream-limited",
+            "is_custom": True,
+            "base_url": "https://stream.limited/api",
+        },
+    )
+    model = create_model(client, provider["id"], {"name": "stream-limited-model"})
+    llm_transport(
+        lambda request: httpx.Response(429, json={"message": "slow down"})
+    )
+
+    response = client.post(
+        f"{API_PREFIX}/{provider['id']}/invoke/stream",
+        json={
+            "model_id": model["id"],
+            "messages": [{"role": "user", "content": "hi"}],
+        },
+    )
+
+    assert response.status_code == 429
+    assert response.json()["detail"] == {"message": "slow down"}
+    assert db_session.query(LLMUsageLog).count() == 0
+
+
+def test_proxy_streaming_response_closes_relay_on_disconnect():
+    closed = anyio.Event()
+
+    async def relay():
+        try:
+            yield b"data: 1\n\n"
+            yield b"data: 2\n\n"
+        finally:
+            closed.set()
+
+    async def send(message):
+        if message.get("body"):
+            raise OSError("client gone")
+
+    response = llms_api._ProxyStreamingResponse(relay())
+
+    async def run():
+        with pytest.raises(OSError):
+            await response.stream_response(send)
+        assert closed.is_set()
+
+    anyio.run(run)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import pytest
+
+from app.services.prompt_template import (
+    TemplateRenderError,
+    compile_template,
+    validate_contexts,
+)
+
+
+def test_compile_collects_variables_in_order_and_caches():
+    template = compile_template("{greeting}，{user.name}！第 {{run_index}} 轮 {greeting}")
+    user = type("User", (), {"name": "小王"})
+
+    assert template.variables == ("greeting", "user")
+    assert compile_template(template.source) is template
+    rendered = template.render({"greeting": "你好", "user": user}, run_index=3)
+    assert rendered == "你好，小王！第 3 轮 你好"
+
+
+def test_render_matches_str_format_semantics():
+    template = compile_template("{score:.1f} {{literal}} {name!r} {items[0]}")
+
+    rendered = template.render(
+        {"score": 3.14159, "name": "a", "items": ["x"]}, run_index=1
+    )
+
+    assert rendered == "3.1 {literal} 'a' x"
+    assert template.variables == ("score", "name", "items")
+
+
+def test_invalid_placeholders_are_treated_as_literal_text():
+    source = '返回 JSON：{"answer": 1}，第 {{run_index}} 次'
+    template = compile_template(source)
+
+    assert template.is_literal
+    assert template.variables == ()
+    assert template.render({}, run_index=2) == '返回 JSON：{"answer": 1}，第 2 次'
+
+
+def test_missing_variables_raise_or_fall_back():
+    template = compile_template("翻译 {text} 到 {{run_index}}")
+
+    assert template.missing({"run_index": 1}) == ("text",)
+    with pytest.raises(TemplateRenderError) as exc_info:
+        template.render({}, run_index=1)
+    assert exc_info.value.missing == ("text",)
+    assert template.render({}, run_index=4, strict=False) == "翻译 {text} 到 4"
+
+
+def test_render_literal_only_substitutes_run_index():
+    template = compile_template("第 {{run_index}} 次 {keep} {{brace}}")
+
+    assert template.render_literal(7) == "第 7 次 {keep} {{brace}}"
+
+
+def test_validate_contexts_reports_each_case():
+    problems = validate_contexts(
+        ["{a} {b}", None, "{c}"],
+        [{"a": 1, "b": 2, "c": 3}, {"a": 1}, {"b": 1, "c": 2, "a": 0}],
+    )
+
+    assert problems == {2: ("b", "c")}
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
-from datetime import timedelta
-from typing import Any
+import asyncio
+import json
+import time
 
+import httpx
 import pytest
 from sqlalchemy import func, select
 
@@ -11,30 +13,21 @@ from app.models.prompt import Prompt, PromptClass, PromptVersion
 from app.models.prompt_test import (
     PromptTestExperiment,
     PromptTestExperimentStatus,
+    PromptTestRound,
     PromptTestTask,
     PromptTestUnit,
 )
+from app.core.cancellation import CancellationToken
+from app.core import llm_gateway
+from app.core.config import settings
+from app.core.llm_circuit_breaker import CircuitBreaker
+from app.models.budget import BudgetPeriod, BudgetScope, UsageBudget
 from app.models.usage import LLMUsageLog
-from app.services import prompt_test_engine
-from app.services.prompt_test_engine import execute_prompt_test_experiment
-
-
-class DummyResponse:
-    """用于伪造 httpx 返回值的简单封装。"""
-
-    def __init__(self, payload: dict[str, Any], *, elapsed_ms: int | None) -> None:
-        self._payload = payload
-        self.status_code = 200
-        self.elapsed = (
-            timedelta(milliseconds=elapsed_ms) if elapsed_ms is not None else None
-        )
-
-    def json(self) -> dict[str, Any]:
-        return self._payload
-
-    @property
-    def text(self) -> str:
-        return ""
+from app.services.budget import budget_tracker
+from app.services.prompt_test_engine import (
+    PromptTestExecutionError,
+    execute_prompt_test_experiment,
+)
 
 
 def _create_prompt_version(db_session) -> PromptVersion:
@@ -65,7 +58,7 @@ def _create_provider_and_model(
     return model
 
 
-def test_execute_prompt_test_experiment_generates_metrics(db_session, monkeypatch):
+def test_execute_prompt_test_experiment_generates_metrics(db_session, llm_transport):
     prompt_version = _create_prompt_version(db_session)
     model = _create_provider_and_model(db_session)
     provider = model.provider
@@ -88,23 +81,25 @@ def test_execute_prompt_test_experiment_generates_metrics(db_session, monkeypatc
     db_session.add_all([task, unit, experiment])
     db_session.commit()
 
-    def fake_post(*_, **kwargs):
-        payload = kwargs.get("json") or {}
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
         messages = payload.get("messages") or []
         user_text = messages[-1]["content"] if messages else ""
+        # 模拟少量网络耗时，确保延迟统计有值
+        time.sleep(0.002)
         if "你好" in user_text:
             response = {
                 "choices": [{"message": {"content": "Hello"}}],
                 "usage": {"prompt_tokens": 5, "completion_tokens": 4},
             }
-            return DummyResponse(response, elapsed_ms=18)
+            return httpx.Response(200, json=response)
         response = {
             "choices": [{"message": {"content": '{"value":"Thanks"}'}}],
             "usage": {"total_tokens": 16},
         }
-        return DummyResponse(response, elapsed_ms=24)
+        return httpx.Response(200, json=response)
 
-    monkeypatch.setattr("app.services.prompt_test_engine.httpx.post", fake_post)
+    llm_transport(handler)
 
     execute_prompt_test_experiment(db_session, experiment)
     db_session.commit()
@@ -127,6 +122,14 @@ def test_execute_prompt_test_experiment_generates_metrics(db_session, monkeypatc
     assert metrics and metrics["rounds"] == 4
     assert metrics["json_success_rate"] == pytest.approx(0.5, rel=1e-3)
     assert metrics["avg_latency_ms"] > 0
+    assert (
+        metrics["min_latency_ms"]
+        <= metrics["p50_latency_ms"]
+        <= metrics["p99_latency_ms"]
+        <= metrics["max_latency_ms"]
+    )
+    assert metrics["output_tokens_per_sec"] > 0
+    assert "p50_ttft_ms" not in metrics
     after_count = db_session.scalar(select(func.count()).select_from(LLMUsageLog)) or 0
     assert after_count - before_count == 4
 
@@ -144,21 +147,591 @@ def test_execute_prompt_test_experiment_generates_metrics(db_session, monkeypatc
     assert latest_log.prompt_tokens is not None or latest_log.total_tokens is not None
 
 
+def test_experiment_rounds_run_concurrently_and_keep_order(db_session, llm_transport):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    model.concurrency_limit = 3
+    db_session.commit()
+
+    task = PromptTestTask(name="并发实验", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="并发单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=2,
+        prompt_template="复述：{text}",
+        variables={"cases": [{"text": str(index)} for index in range(4)]},
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+
+    in_flight = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        payload = json.loads(request.content)
+        text = payload["messages"][-1]["content"]
+        # 让先发出的请求更晚返回，验证结果仍按 run_index 排序
+        await asyncio.sleep(0.05 if text.endswith("0") else 0.01)
+        in_flight -= 1
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": text}}],
+                "usage": {"prompt_tokens": 2, "completion_tokens": 3},
+            },
+        )
+
+    llm_transport(handler)
+
+    execute_prompt_test_experiment(db_session, experiment)
+    db_session.commit()
+
+    refreshed = db_session.get(PromptTestExperiment, experiment.id)
+    assert refreshed.status == PromptTestExperimentStatus.COMPLETED
+    assert [item["run_index"] for item in refreshed.outputs] == list(range(1, 9))
+    assert [item["output_text"] for item in refreshed.outputs] == [
+        f"复述：{index % 4}" for index in range(8)
+    ]
+    assert 1 < peak <= 3
+    assert refreshed.metrics["rounds"] == 8
+    assert refreshed.metrics["avg_total_tokens"] == pytest.approx(5.0)
+
+
+def test_experiment_failure_cancels_pending_rounds(db_session, llm_transport):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    task = PromptTestTask(name="失败实验", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="失败单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=3,
+        prompt_template="你好",
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+
+    llm_transport(
+        lambda request: httpx.Response(400, json={"error": {"message": "bad request"}})
+    )
+
+    execute_prompt_test_experiment(db_session, experiment)
+    db_session.commit()
+
+    refreshed = db_session.get(PromptTestExperiment, experiment.id)
+    assert refreshed.status == PromptTestExperimentStatus.FAILED
+    assert "HTTP 400" in (refreshed.error or "")
+    assert refreshed.outputs is None
+
+
+def test_experiment_counts_every_timed_out_round(
+    db_session, llm_transport, monkeypatch
+):
+    monkeypatch.setattr(settings, "LLM_RETRY_ENABLED", False)
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    model.concurrency_limit = 3
+    db_session.commit()
+    task = PromptTestTask(name="超时实验", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="超时单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=3,
+        prompt_template="你好",
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ReadTimeout("upstream stalled", request=request)
+
+    llm_transport(handler)
+
+    execute_prompt_test_experiment(db_session, experiment)
+    db_session.commit()
+
+    refreshed = db_session.get(PromptTestExperiment, experiment.id)
+    assert refreshed.status == PromptTestExperimentStatus.FAILED
+    # 首个失败即停止等待，同时结束的其余超时轮次也应计入
+    assert refreshed.metrics["timeouts"]["timed_out_rounds"] == 3
+
+
+def test_experiment_fails_over_when_circuit_is_open(
+    db_session, llm_transport, monkeypatch
+):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    standby_provider = LLMProvider(
+        provider_name="Standby",
+        api_key="standby-key",
+        is_custom=True,
+        base_url="https://standby.example/api",
+    )
+    standby = LLMModel(provider=standby_provider, name="chat-standby")
+    db_session.add_all([standby_provider, standby])
+    db_session.flush()
+    model.failover_model_id = standby.id
+    task = PromptTestTask(name="故障转移实验", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="故障转移单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=2,
+        prompt_template="你好",
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+
+    breaker = CircuitBreaker(window=1, min_calls=1, open_seconds=60)
+    monkeypatch.setattr(llm_gateway, "llm_circuit_breaker", breaker)
+    ticket = breaker.admit(f"{model.provider_id}:chat-mini")
+    breaker.record(ticket, failure=True, reason="HTTP 503")
+    hosts: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        model_name = json.loads(request.content)["model"]
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": model_name}}],
+                "usage": {"prompt_tokens": 4, "completion_tokens": 2},
+            },
+        )
+
+    llm_transport(handler)
+
+    execute_prompt_test_experiment(db_session, experiment)
+    db_session.commit()
+
+    refreshed = db_session.get(PromptTestExperiment, experiment.id)
+    assert refreshed.status == PromptTestExperimentStatus.COMPLETED
+    assert hosts == ["standby.example", "standby.example"]
+    assert [item["output_text"] for item in refreshed.outputs] == ["chat-standby"] * 2
+    assert refreshed.metrics["failover"] == {"model_id": standby.id, "rounds": 2}
+    usage_logs = db_session.scalars(select(LLMUsageLog)).all()
+    assert {(log.provider_id, log.model_id) for log in usage_logs} == {
+        (standby_provider.id, standby.id)
+    }
+
+
+def test_experiment_stops_when_owner_budget_exhausted(db_session, llm_transport):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    model.concurrency_limit = 1
+    task = PromptTestTask(
+        name="预算实验", prompt_version_id=prompt_version.id, owner_id=5
+    )
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="预算单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=6,
+        prompt_template="你好",
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    budget = UsageBudget(
+        scope=BudgetScope.OWNER,
+        target_id=5,
+        period=BudgetPeriod.TOTAL,
+        token_limit=20,
+    )
+    db_session.add_all([task, unit, experiment, budget])
+    db_session.commit()
+    budget_tracker.invalidate()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        time.sleep(0.01)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "Hi"}}],
+                "usage": {"total_tokens": 8},
+            },
+        )
+
+    llm_transport(handler)
+
+    execute_prompt_test_experiment(db_session, experiment)
+    db_session.commit()
+
+    refreshed = db_session.get(PromptTestExperiment, experiment.id)
+    assert refreshed.status == PromptTestExperimentStatus.FAILED
+    assert "已用尽" in (refreshed.error or "")
+    assert 3 <= len(refreshed.outputs) < 6
+
+    budget_tracker.flush()
+    db_session.refresh(budget)
+    assert budget.used_tokens == 8 * len(refreshed.outputs)
+
+
+def test_prompt_test_task_preflight_rejects_over_budget(client, db_session):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    db_session.add(
+        UsageBudget(
+            scope=BudgetScope.OWNER,
+            target_id=9,
+            period=BudgetPeriod.TOTAL,
+            token_limit=1000,
+        )
+    )
+    db_session.commit()
+    budget_tracker.invalidate()
+    unit = {
+        "name": "预估单元",
+        "model_name": model.name,
+        "llm_provider_id": model.provider_id,
+        "prompt_template": "翻译：{text}",
+        "variables": {"cases": [{"text": "你好"}, {"text": "谢谢"}]},
+        "parameters": {"max_tokens": 100},
+    }
+    request = {
+        "name": "预估任务",
+        "prompt_version_id": prompt_version.id,
+        "owner_id": 9,
+        "auto_execute": True,
+    }
+
+    rejected = client.post(
+        "/api/v1/prompt-test/tasks", json={**request, "units": [{**unit, "rounds": 5}]}
+    )
+    assert rejected.status_code == 429
+    assert "owner #9" in rejected.json()["detail"]
+    assert db_session.scalar(select(func.count()).select_from(PromptTestTask)) == 0
+
+    draft = client.post(
+        "/api/v1/prompt-test/tasks",
+        json={**request, "auto_execute": False, "units": [{**unit, "rounds": 5}]},
+    )
+    assert draft.status_code == 201
+    assert "budget_estimate" not in (draft.json()["config"] or {})
+
+
+def test_experiment_validates_template_variables_before_calling(
+    db_session, llm_transport
+):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    task = PromptTestTask(name="变量校验", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="缺少变量",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        prompt_template="把 {text} 翻译成{language}",
+        variables={"defaults": {"language": "英语"}, "cases": [{"text": "你好"}, {}]},
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+    calls: list[httpx.Request] = []
+    llm_transport(lambda request: calls.append(request) or httpx.Response(500))
+
+    with pytest.raises(PromptTestExecutionError, match="用例 2 缺少 text"):
+        execute_prompt_test_experiment(db_session, experiment)
+    assert calls == []
+
+
+def test_streaming_rounds_measure_time_to_first_token(db_session, llm_transport):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    task = PromptTestTask(name="流式实验", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="流式单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=3,
+        prompt_template="你好",
+        extra={"stream": True},
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+    seen_payloads: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen_payloads.append(json.loads(request.content))
+        chunks = [
+            {"choices": [{"index": 0, "delta": {"role": "assistant"}}]},
+            {"choices": [{"index": 0, "delta": {"content": '{"value":'}}]},
+            {"choices": [{"index": 0, "delta": {"content": '"Hi"}'}}]},
+            {
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 5},
+            },
+        ]
+        body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks)
+        return httpx.Response(
+            200,
+            content=(body + "data: [DONE]\n\n").encode(),
+            headers={"Content-Type": "text/event-stream"},
+        )
+
+    llm_transport(handler)
+
+    execute_prompt_test_experiment(db_session, experiment)
+    db_session.commit()
+
+    assert experiment.status == PromptTestExperimentStatus.COMPLETED
+    assert all(item["stream"] is True for item in seen_payloads)
+    assert all(item["stream_options"] == {"include_usage": True} for item in seen_payloads)
+    assert [item["parsed_output"] for item in experiment.outputs] == [
+        {"value": "Hi"}
+    ] * 3
+    assert all(item["ttft_ms"] is not None for item in experiment.outputs)
+    assert experiment.outputs[0]["total_tokens"] == 8
+
+    metrics = experiment.metrics
+    assert metrics["p50_ttft_ms"] <= metrics["p99_ttft_ms"]
+    assert metrics["avg_ttft_ms"] <= metrics["max_latency_ms"] + 1
+    assert metrics["json_success_rate"] == 1.0
+
+    logs = db_session.scalars(
+        select(LLMUsageLog).where(LLMUsageLog.source == "prompt_test")
+    ).all()
+    assert len(logs) == 3
+    assert all(log.ttft_ms is not None for log in logs)
+
+
+def test_failed_experiment_resumes_from_checkpointed_rounds(db_session, llm_transport):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    task = PromptTestTask(name="续跑实验", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="续跑单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=1,
+        prompt_template="翻译：{text}",
+        variables={"cases": [{"text": "甲"}, {"text": "乙"}, {"text": "丙"}]},
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+    called: list[str] = []
+    broken = True
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        text = json.loads(request.content)["messages"][-1]["content"]
+        called.append(text)
+        if "丙" in text and broken:
+            await asyncio.sleep(0.05)
+            return httpx.Response(400, json={"error": {"message": "bad request"}})
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": f"ok-{text}"}}],
+                "usage": {"total_tokens": 3},
+            },
+        )
+
+    llm_transport(handler)
+
+    execute_prompt_test_experiment(db_session, experiment)
+    db_session.commit()
+
+    assert experiment.status == PromptTestExperimentStatus.FAILED
+    checkpoints = db_session.scalars(
+        select(PromptTestRound).where(PromptTestRound.experiment_id == experiment.id)
+    ).all()
+    assert sorted(item.run_index for item in checkpoints) == [1, 2]
+    assert [item["run_index"] for item in experiment.outputs] == [1, 2]
+
+    # 未显式续跑时失败的实验保持原状
+    execute_prompt_test_experiment(db_session, experiment)
+    assert experiment.status == PromptTestExperimentStatus.FAILED
+
+    called.clear()
+    broken = False
+    execute_prompt_test_experiment(db_session, experiment, resume=True)
+    db_session.commit()
+
+    assert called == ["翻译：丙"]
+    assert experiment.status == PromptTestExperimentStatus.COMPLETED
+    assert experiment.error is None
+    assert [item["output_text"] for item in experiment.outputs] == [
+        "ok-翻译：甲",
+        "ok-翻译：乙",
+        "ok-翻译：丙",
+    ]
+    assert experiment.metrics["rounds"] == 3
+    assert experiment.metrics["resumed_rounds"] == 2
+    usage_total = db_session.scalar(
+        select(func.count())
+        .select_from(LLMUsageLog)
+        .where(LLMUsageLog.source == "prompt_test")
+    )
+    assert usage_total == 3
+
+
+def test_cancelled_experiment_keeps_finished_rounds_and_resumes(
+    db_session, llm_transport
+):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    model.concurrency_limit = 1
+    db_session.commit()
+    task = PromptTestTask(name="取消实验", prompt_version_id=prompt_version.id)
+    unit = PromptTestUnit(
+        task=task,
+        prompt_version_id=prompt_version.id,
+        name="取消单元",
+        model_name=model.name,
+        llm_provider_id=model.provider_id,
+        rounds=6,
+        prompt_template="你好",
+    )
+    experiment = PromptTestExperiment(unit=unit, sequence=1)
+    db_session.add_all([task, unit, experiment])
+    db_session.commit()
+    token = CancellationToken()
+    calls = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        if calls == 3:
+            token.cancel("手动取消")
+            await asyncio.sleep(1)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"total_tokens": 10},
+            },
+        )
+
+    llm_transport(handler)
+
+    started = time.perf_counter()
+    execute_prompt_test_experiment(db_session, experiment, cancel_token=token)
+    db_session.commit()
+
+    assert time.perf_counter() - started < 0.5
+    assert calls == 3
+    assert experiment.status == PromptTestExperimentStatus.CANCELLED
+    assert experiment.error == "手动取消"
+    assert [item["run_index"] for item in experiment.outputs] == [1, 2]
+    assert experiment.metrics["cancellation"] == {
+        "planned_rounds": 6,
+        "completed_rounds": 2,
+        "aborted_rounds": 1,
+        "skipped_rounds": 3,
+        "tokens_avoided_estimate": 30,
+    }
+    checkpoints = db_session.scalars(
+        select(PromptTestRound).where(PromptTestRound.experiment_id == experiment.id)
+    ).all()
+    assert sorted(item.run_index for item in checkpoints) == [1, 2]
+
+    # 已取消的实验可以显式续跑，只补齐剩余轮次
+    calls = 0
+    execute_prompt_test_experiment(db_session, experiment, resume=True)
+    db_session.commit()
+
+    assert calls == 4
+    assert experiment.status == PromptTestExperimentStatus.COMPLETED
+    assert experiment.metrics["rounds"] == 6
+    assert "cancellation" not in experiment.metrics
+
+
+def test_experiment_reuses_cached_responses_per_task_config(db_session, llm_transport):
+    prompt_version = _create_prompt_version(db_session)
+    model = _create_provider_and_model(db_session)
+    task = PromptTestTask(
+        name="缓存实验",
+        prompt_version_id=prompt_version.id,
+        config={"cache": "read"},
+    )
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "Hello"}}],
+                "usage": {"total_tokens": 6},
+            },
+        )
+
+    llm_transport(handler)
+
+    def _run(rounds: int) -> PromptTestExperiment:
+        unit = PromptTestUnit(
+            task=task,
+            prompt_version_id=prompt_version.id,
+            name=f"缓存单元-{rounds}",
+            model_name=model.name,
+            llm_provider_id=model.provider_id,
+            rounds=rounds,
+            temperature=0.0,
+            prompt_template="你好",
+        )
+        experiment = PromptTestExperiment(unit=unit, sequence=1)
+        db_session.add_all([task, unit, experiment])
+        db_session.commit()
+        execute_prompt_test_experiment(db_session, experiment)
+        db_session.commit()
+        return experiment
+
+    first = _run(1)
+    second = _run(2)
+
+    assert calls == 1
+    assert first.outputs[0]["cache_hit"] is False
+    assert [item["cache_hit"] for item in second.outputs] == [True, True]
+    assert second.metrics["cache_hits"] == 2
+    assert "cache_hits" not in first.metrics
+
+    cached_logs = db_session.scalars(
+        select(LLMUsageLog).where(LLMUsageLog.cache_hit.is_(True))
+    ).all()
+    assert len(cached_logs) == 2
+    assert {log.total_tokens for log in cached_logs} == {6}
+
+
 def test_prompt_test_api_creates_and_executes_experiment(
-    client, db_session, monkeypatch
+    client, db_session, llm_transport
 ):
     prompt_version = _create_prompt_version(db_session)
     model = _create_provider_and_model(db_session)
     provider = model.provider
 
-    def fake_post(*_, **kwargs):
+    def handler(request: httpx.Request) -> httpx.Response:
         response = {
             "choices": [{"message": {"content": "Hello World"}}],
             "usage": {"prompt_tokens": 4, "completion_tokens": 5},
         }
-        return DummyResponse(response, elapsed_ms=10)
+        return httpx.Response(200, json=response)
 
-    monkeypatch.setattr("app.services.prompt_test_engine.httpx.post", fake_post)
+    llm_transport(handler)
 
     response = client.post(
         "/api/v1/prompt-test/tasks",
@@ -202,6 +775,20 @@ def test_prompt_test_api_creates_and_executes_experiment(
     assert detail_resp.status_code == 200
     assert detail_resp.json()["status"] == PromptTestExperimentStatus.COMPLETED.value
 
+    # 已完成的实验不能再取消
+    cancel_resp = client.post(f"/api/v1/prompt-test/experiments/{body['id']}/cancel")
+    assert cancel_resp.status_code == 409
+
+    pending_resp = client.post(
+        f"/api/v1/prompt-test/units/{unit_id}/experiments",
+        json={"auto_execute": False},
+    )
+    pending_id = pending_resp.json()["id"]
+    cancel_resp = client.post(f"/api/v1/prompt-test/experiments/{pending_id}/cancel")
+    assert cancel_resp.status_code == 200
+    assert cancel_resp.json()["status"] == PromptTestExperimentStatus.CANCELLED.value
+    assert cancel_resp.json()["finished_at"] is not None
+
 
 def test_soft_delete_prompt_test_task_hides_from_list(client, db_session):
     prompt_version = _create_prompt_version(db_session)
@@ -1,9 +1,17 @@
+import threading
+import time
 from datetime import UTC, datetime
 
 import pytest
 from sqlalchemy import func, select
 
-from app.core.prompt_test_task_queue import enqueue_prompt_test_task, task_queue
+from app.core.cancellation import cancellation_registry
+from app.core.config import settings
+from app.core.prompt_test_task_queue import (
+    PROMPT_TEST_TASK_JOB,
+    enqueue_prompt_test_task,
+    task_queue,
+)
 from app.models.prompt_test import (
     PromptTestExperiment,
     PromptTestExperimentStatus,
@@ -11,7 +19,10 @@ from app.models.prompt_test import (
     PromptTestTaskStatus,
     PromptTestUnit,
 )
-from app.services.prompt_test_engine import PromptTestExecutionError
+from app.services.prompt_test_engine import (
+    PROMPT_TEST_EXPERIMENT_KIND,
+    PromptTestExecutionError,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -120,3 +131,197 @@ def test_prompt_test_task_execution_succeeds(db_session, monkeypatch):
         select(PromptTestExperiment).where(PromptTestExperiment.unit_id == unit.id)
     ).all()
     assert experiments and experiments[0].status == PromptTestExperimentStatus.COMPLETED
+
+
+def test_failed_prompt_test_task_resumes_latest_experiment(db_session, monkeypatch):
+    task = PromptTestTask(
+        name="续跑任务",
+        status=PromptTestTaskStatus.FAILED,
+        config={"last_error": "执行失败"},
+    )
+    done_unit = PromptTestUnit(
+        task=task, name="已完成单元", model_name="gpt-4o-mini", rounds=1
+    )
+    failed_unit = PromptTestUnit(
+        task=task, name="失败单元", model_name="gpt-4o-mini", rounds=1
+    )
+    done = PromptTestExperiment(
+        unit=done_unit, sequence=1, status=PromptTestExperimentStatus.COMPLETED
+    )
+    failed = PromptTestExperiment(
+        unit=failed_unit, sequence=1, status=PromptTestExperimentStatus.FAILED
+    )
+    db_session.add_all([task, done_unit, failed_unit, done, failed])
+    db_session.commit()
+    calls: list[tuple[int, bool]] = []
+
+    def resume_execute(session, experiment, *, resume=False):
+        calls.append((experiment.id, resume))
+        experiment.status = PromptTestExperimentStatus.COMPLETED
+        session.flush()
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        resume_execute,
+    )
+
+    enqueue_prompt_test_task(task.id)
+    task_queue.wait_for_idle(timeout=2.0)
+
+    db_session.expire_all()
+    assert calls == [(failed.id, True)]
+    assert db_session.get(PromptTestTask, task.id).status == (
+        PromptTestTaskStatus.COMPLETED
+    )
+    total = db_session.scalar(select(func.count()).select_from(PromptTestExperiment))
+    assert total == 2
+
+
+def test_resume_interrupted_enqueues_running_tasks(db_session, monkeypatch):
+    running = PromptTestTask(name="中断任务", status=PromptTestTaskStatus.RUNNING)
+    deleted = PromptTestTask(
+        name="已删除任务", status=PromptTestTaskStatus.RUNNING, is_deleted=True
+    )
+    ready = PromptTestTask(name="就绪任务", status=PromptTestTaskStatus.READY)
+    db_session.add_all([running, deleted, ready])
+    db_session.commit()
+    enqueued: list[int] = []
+    monkeypatch.setattr(task_queue, "enqueue", enqueued.append)
+
+    assert task_queue.resume_interrupted() == [running.id]
+    assert enqueued == [running.id]
+
+
+def _task_with_units(db_session, *, config=None, models=("m1", "m2", "m3")):
+    task = PromptTestTask(
+        name="并发任务", status=PromptTestTaskStatus.READY, config=config
+    )
+    units = [
+        PromptTestUnit(task=task, name=f"单元{index}", model_name=model, rounds=1)
+        for index, model in enumerate(models)
+    ]
+    db_session.add_all([task, *units])
+    db_session.commit()
+    return task, units
+
+
+def test_units_run_concurrently_across_models(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "PROMPT_TEST_UNIT_CONCURRENCY", 2)
+    task, units = _task_with_units(db_session, models=("m1", "m2"))
+    barrier = threading.Barrier(2, timeout=2)
+
+    def concurrent_execute(session, experiment):
+        # 两个单元必须同时进入才能通过屏障
+        barrier.wait()
+        if experiment.unit_id == units[0].id:
+            time.sleep(0.05)
+        experiment.status = PromptTestExperimentStatus.COMPLETED
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        concurrent_execute,
+    )
+
+    enqueue_prompt_test_task(task.id)
+    task_queue.wait_for_idle(timeout=3.0)
+
+    db_session.expire_all()
+    assert db_session.get(PromptTestTask, task.id).status == (
+        PromptTestTaskStatus.COMPLETED
+    )
+
+
+def test_units_sharing_a_model_respect_per_model_cap(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "PROMPT_TEST_UNIT_CONCURRENCY", 3)
+    monkeypatch.setattr(settings, "PROMPT_TEST_UNIT_CONCURRENCY_PER_MODEL", 1)
+    task, _ = _task_with_units(db_session, models=("same", "same", "same"))
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def tracked_execute(session, experiment):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        experiment.status = PromptTestExperimentStatus.COMPLETED
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        tracked_execute,
+    )
+
+    enqueue_prompt_test_task(task.id)
+    task_queue.wait_for_idle(timeout=3.0)
+
+    assert peak == 1
+    total = db_session.scalar(select(func.count()).select_from(PromptTestExperiment))
+    assert total == 3
+
+
+@pytest.mark.parametrize(
+    ("policy", "expected_runs"),
+    [("fail_fast", 1), ("continue", 3)],
+)
+def test_unit_failure_policy(db_session, monkeypatch, policy, expected_runs):
+    monkeypatch.setattr(settings, "PROMPT_TEST_UNIT_CONCURRENCY", 1)
+    task, units = _task_with_units(db_session, config={"failure_policy": policy})
+    executed: list[int] = []
+
+    def failing_first(session, experiment):
+        executed.append(experiment.unit_id)
+        if experiment.unit_id == units[0].id:
+            raise PromptTestExecutionError("首个单元失败")
+        experiment.status = PromptTestExperimentStatus.COMPLETED
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        failing_first,
+    )
+
+    enqueue_prompt_test_task(task.id)
+    task_queue.wait_for_idle(timeout=3.0)
+
+    db_session.expire_all()
+    refreshed = db_session.get(PromptTestTask, task.id)
+    assert len(executed) == expected_runs
+    assert refreshed.status == PromptTestTaskStatus.FAILED
+    assert refreshed.config["last_error"] == "首个单元失败"
+
+
+def test_cancelled_task_stops_dispatching_and_cancels_running_units(
+    db_session, monkeypatch
+):
+    monkeypatch.setattr(settings, "PROMPT_TEST_UNIT_CONCURRENCY", 1)
+    task, _ = _task_with_units(db_session)
+    executed: list[int] = []
+
+    def cancelling_execute(session, experiment):
+        executed.append(experiment.unit_id)
+        cancellation_registry.cancel(PROMPT_TEST_TASK_JOB, task.id)
+        # 任务取消随父标记传递给执行中的实验
+        token = cancellation_registry.get(PROMPT_TEST_EXPERIMENT_KIND, experiment.id)
+        assert token is not None and token.cancelled
+        experiment.status = PromptTestExperimentStatus.CANCELLED
+
+    monkeypatch.setattr(
+        "app.core.prompt_test_task_queue.execute_prompt_test_experiment",
+        cancelling_execute,
+    )
+
+    enqueue_prompt_test_task(task.id)
+    task_queue.wait_for_idle(timeout=3.0)
+
+    db_session.expire_all()
+    refreshed = db_session.get(PromptTestTask, task.id)
+    assert len(executed) == 1
+    assert refreshed.status == PromptTestTaskStatus.CANCELLED
+    assert (refreshed.config or {}).get("last_error") is None
+
+    # 已取消的任务再次入队时直接跳过
+    enqueue_prompt_test_task(task.id)
+    task_queue.wait_for_idle(timeout=3.0)
+    assert len(executed) == 1
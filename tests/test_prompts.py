@@ -431,3 +431,47 @@ def test_delete_prompt_not_found(client: TestClient):
     # 直接请求删除一个不存在的 ID，验证兜底分支
     response = client.delete("/api/v1/prompts/999999")
     assert response.status_code == 404
+
+
+def test_render_prompt_batch(client: TestClient):
+    """批量渲染时逐个用例返回结果，缺少变量的用例单独标出"""
+    create_resp = client.post(
+        "/api/v1/prompts/",
+        json={
+            "name": "翻译模版",
+            "version": "v1",
+            "content": "把 {text} 翻译成{language}（第 {{run_index}} 条）",
+            "class_name": "翻译",
+        },
+    )
+    assert create_resp.status_code == 201
+    prompt = create_resp.json()
+
+    render_resp = client.post(
+        f"/api/v1/prompts/{prompt['id']}/render",
+        json={
+            "defaults": {"language": "英语"},
+            "cases": [
+                {"text": "你好"},
+                {"text": "谢谢", "language": "日语"},
+                {"language": "法语"},
+            ],
+        },
+    )
+    assert render_resp.status_code == 200
+    body = render_resp.json()
+    assert body["version_id"] == prompt["current_version"]["id"]
+    assert body["variables"] == ["text", "language"]
+    assert body["rendered"] == 2
+    assert [item["content"] for item in body["items"]] == [
+        "把 你好 翻译成英语（第 1 条）",
+        "把 谢谢 翻译成日语（第 2 条）",
+        None,
+    ]
+    assert body["items"][2]["missing"] == ["text"]
+
+    missing_version = client.post(
+        f"/api/v1/prompts/{prompt['id']}/render",
+        json={"version_id": 999999, "cases": [{"text": "你好"}]},
+    )
+    assert missing_version.status_code == 404
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import threading
 from datetime import timedelta
 from typing import Any
 
@@ -7,7 +8,8 @@ from fastapi.testclient import TestClient
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from app.core.task_queue import task_queue
+from app.core.cancellation import cancellation_registry
+from app.core.task_queue import TEST_RUN_JOB, task_queue
 from app.models.result import Result
 from app.models.usage import LLMUsageLog
 from app.services.test_run import TestRunExecutionError
@@ -445,6 +447,86 @@ def test_update_test_prompt_allows_partial_fields(client: TestClient, monkeypatc
     assert payload["status"] == "failed"
 
 
+def test_cancel_running_test_prompt(client: TestClient, monkeypatch):
+    prompt_payload = _create_prompt(client)
+    prompt_version_id = prompt_payload["current_version"]["id"]
+    started = threading.Event()
+    released = threading.Event()
+
+    def blocking_execute(db, test_run):
+        token = cancellation_registry.get(TEST_RUN_JOB, test_run.id)
+        started.set()
+        assert token is not None and token.wait(timeout=2.0)
+        # 取消接口提交后再返回，避免两个线程同时使用测试共享的数据库连接
+        released.wait(timeout=2.0)
+        test_run.status = "cancelled"
+        return test_run
+
+    monkeypatch.setattr("app.core.task_queue.execute_test_run", blocking_execute)
+
+    create_resp = client.post(
+        "/api/v1/test_prompt/",
+        json={
+            "prompt_version_id": prompt_version_id,
+            "model_name": "gpt-4o",
+            "temperature": 0.2,
+            "repetitions": 3,
+        },
+    )
+    test_run_id = create_resp.json()["id"]
+    assert started.wait(timeout=2.0)
+
+    cancel_resp = client.post(f"/api/v1/test_prompt/{test_run_id}/cancel")
+    assert cancel_resp.status_code == 200
+    assert cancel_resp.json()["status"] == "cancelled"
+    released.set()
+
+    assert task_queue.wait_for_idle(timeout=2.0)
+    detail = client.get(f"/api/v1/test_prompt/{test_run_id}").json()
+    assert detail["status"] == "cancelled"
+
+    again = client.post(f"/api/v1/test_prompt/{test_run_id}/cancel")
+    assert again.status_code == 409
+
+
+def test_create_test_prompt_rejected_when_budget_insufficient(
+    client: TestClient, monkeypatch
+):
+    provider, model = _create_provider_with_model(client)
+    budget_resp = client.put(
+        "/api/v1/usage/budgets",
+        json={"scope": "model", "target_id": model["id"], "token_limit": 500},
+    )
+    assert budget_resp.status_code == 200
+    enqueued: list[int] = []
+    monkeypatch.setattr(
+        "app.api.v1.endpoints.test_prompt.enqueue_test_run", enqueued.append
+    )
+    prompt_version_id = _create_prompt(client)["current_version"]["id"]
+    request = {
+        "prompt_version_id": prompt_version_id,
+        "model_name": model["name"],
+        "model_version": provider["provider_name"],
+        "temperature": 0.2,
+        "repetitions": 3,
+        "schema": {"llm_parameters": {"max_tokens": 100}},
+    }
+
+    accepted = client.post("/api/v1/test_prompt/", json=request)
+    assert accepted.status_code == 201
+    estimate = accepted.json()["schema"]["budget_estimate"]
+    assert estimate["rounds"] == 3
+    assert estimate["completion_tokens"] == 300
+
+    rejected = client.post(
+        "/api/v1/test_prompt/", json={**request, "repetitions": 6}
+    )
+    assert rejected.status_code == 429
+    assert "预计消耗" in rejected.json()["detail"]
+    assert len(enqueued) == 1
+    assert len(client.get("/api/v1/test_prompt/").json()) == 1
+
+
 def test_get_test_prompt_not_found(client: TestClient):
     resp = client.get("/api/v1/test_prompt/9999")
     assert resp.status_code == 404
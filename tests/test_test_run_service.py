@@ -1,17 +1,27 @@
 from __future__ import annotations
 
-from datetime import timedelta
-from typing import Any, Mapping
+import json
+import threading
+import time
+from typing import Mapping
 
 import httpx
 import pytest
-from sqlalchemy import select
+from sqlalchemy import event, select
 
+from app.core.cancellation import CancellationToken
+from app.core import llm_gateway
+from app.core.config import settings
+from app.core.llm_circuit_breaker import CircuitBreaker
+from app.models.budget import BudgetPeriod, BudgetScope, UsageBudget
 from app.models.llm_provider import LLMModel, LLMProvider
 from app.models.prompt import Prompt, PromptClass, PromptVersion
 from app.models.test_run import TestRun, TestRunStatus
 from app.models.usage import LLMUsageLog
 from app.services import test_run as test_run_service
+from app.services.budget import BudgetExceededError, budget_tracker
+from app.services.llm_response_cache import llm_response_cache
+from app.services.usage_log_writer import usage_log_writer
 
 
 def _create_prompt_version(db_session) -> PromptVersion:
@@ -40,22 +50,6 @@ def _create_provider_with_model(
     return model
 
 
-class DummyResponse:
-    def __init__(self, payload: dict[str, Any], *, elapsed_ms: int | None) -> None:
-        self._payload = payload
-        self.status_code = 200
-        self.elapsed = (
-            timedelta(milliseconds=elapsed_ms) if elapsed_ms is not None else None
-        )
-
-    def json(self) -> dict[str, Any]:  # noqa: ANN401 - 与 httpx 接口对齐
-        return self._payload
-
-    @property
-    def text(self) -> str:
-        return ""
-
-
 @pytest.fixture()
 def prompt_version(db_session):
     return _create_prompt_version(db_session)
@@ -67,7 +61,7 @@ def provider_model(db_session):
 
 
 def test_execute_test_run_generates_results_and_usage(
-    db_session, prompt_version, provider_model, monkeypatch
+    db_session, prompt_version, provider_model, llm_transport
 ):
     provider = provider_model.provider
 
@@ -82,18 +76,16 @@ def test_execute_test_run_generates_results_and_usage(
         },
     }
 
-    def fake_post(*_, **kwargs):  # noqa: ANN002 - 接口保持与 httpx 一致
-        payload = kwargs.get("json") or {}
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
         messages = payload.get("messages") or []
         user_content = ""
         if len(messages) > 1 and isinstance(messages[1], Mapping):
             user_content = str(messages[1].get("content", ""))
         run_index = 1 if "第 1" in user_content else 2
-        selected = response_payloads[run_index]
-        elapsed_ms = 12 if run_index == 1 else None
-        return DummyResponse(selected, elapsed_ms=elapsed_ms)
+        return httpx.Response(200, json=response_payloads[run_index])
 
-    monkeypatch.setattr("app.services.test_run.httpx.post", fake_post)
+    llm_transport(handler)
 
     test_run = TestRun(
         prompt_version_id=prompt_version.id,
@@ -124,6 +116,11 @@ def test_execute_test_run_generates_results_and_usage(
     assert executed.schema["prompt_snapshot"] == prompt_version.content
     assert executed.schema["llm_provider_id"] == provider.id
     assert executed.schema["llm_model_id"] == provider_model.id
+    metrics = executed.schema["metrics"]
+    assert metrics["rounds"] == 2
+    assert metrics["min_total_tokens"] == 8 and metrics["max_total_tokens"] == 9
+    assert metrics["p50_latency_ms"] <= metrics["p99_latency_ms"]
+    assert "p50_ttft_ms" not in metrics
 
     results = (
         db_session.scalars(select(TestRun).where(TestRun.id == executed.id))
@@ -139,17 +136,967 @@ def test_execute_test_run_generates_results_and_usage(
     assert {log.total_tokens for log in usage_logs} == {8, 9}
 
 
+def test_execute_test_run_retries_transient_errors(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider = provider_model.provider
+    attempts = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            return httpx.Response(
+                429, headers={"Retry-After": "0.01"}, json={"error": "slow down"}
+            )
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "重试成功"}}],
+                "usage": {"total_tokens": 6},
+            },
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.0,
+        repetitions=1,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert attempts == 2
+    assert executed.status == TestRunStatus.COMPLETED
+    assert executed.schema["retry_stats"]["retries"] == 1
+    assert executed.schema["retry_stats"]["backoff_ms"] == 10
+
+    usage_log = db_session.scalars(select(LLMUsageLog)).one()
+    assert usage_log.retry_count == 1
+    assert usage_log.retry_backoff_ms == 10
+
+
+def test_execute_test_run_coalesces_identical_inflight_requests(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider = provider_model.provider
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        # 保持请求在途，让其余重复轮次合并到这次调用
+        time.sleep(0.2)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "合并输出"}}],
+                "usage": {"total_tokens": 5},
+            },
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.0,
+        repetitions=3,
+        schema={
+            "llm_provider_id": provider.id,
+            "llm_model_id": provider_model.id,
+            "conversation": [{"role": "user", "content": "固定问题"}],
+        },
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert calls == 1
+    assert executed.status == TestRunStatus.COMPLETED
+    assert [result.output for result in executed.results] == ["合并输出"] * 3
+
+    usage_logs = db_session.scalars(select(LLMUsageLog)).all()
+    assert len(usage_logs) == 3
+    assert sorted(log.coalesced for log in usage_logs) == [False, True, True]
+    assert {log.total_tokens for log in usage_logs} == {5}
+
+
+def test_execute_test_run_paces_requests_by_model_rpm(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider_model.rate_limit_rpm = 600
+    db_session.commit()
+    provider = provider_model.provider
+    started: list[float] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        started.append(time.monotonic())
+        return httpx.Response(
+            200, json={"choices": [{"message": {"content": "ok"}}]}
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=3,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.COMPLETED
+    assert executed.schema["pacing_stats"]["paced_requests"] == 2
+    assert executed.schema["pacing_stats"]["delay_ms"] >= 150
+    started.sort()
+    # 600 RPM 对应 100ms 的开始间隔
+    assert started[-1] - started[0] >= 0.18
+
+
+def test_execute_test_run_stops_dispatching_when_cancelled(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider_model.rate_limit_rpm = 600
+    db_session.commit()
+    provider = provider_model.provider
+    token = CancellationToken()
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            token.cancel("测试任务已取消")
+            # 真实传输层在等待响应时检查取消标记，这里模拟在途请求被中断
+            token.raise_if_cancelled()
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"total_tokens": 8},
+            },
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=5,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    started = time.perf_counter()
+    executed = test_run_service.execute_test_run(
+        db_session, test_run, cancel_token=token
+    )
+    db_session.commit()
+
+    assert time.perf_counter() - started < 0.5
+    assert calls == 2
+    assert executed.status == TestRunStatus.CANCELLED
+    assert executed.last_error is None
+    assert [result.run_index for result in executed.results] == [1]
+    assert executed.schema["cancellation"] == {
+        "planned_rounds": 5,
+        "completed_rounds": 1,
+        "aborted_rounds": 1,
+        "skipped_rounds": 3,
+        "tokens_avoided_estimate": 24,
+    }
+
+
+def test_execute_test_run_stops_when_budget_exhausted(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider_model.concurrency_limit = 1
+    provider = provider_model.provider
+    db_session.add(
+        UsageBudget(
+            scope=BudgetScope.MODEL,
+            target_id=provider_model.id,
+            period=BudgetPeriod.TOTAL,
+            token_limit=20,
+        )
+    )
+    db_session.commit()
+    budget_tracker.invalidate()
+    calls = 0
+    workers: set[threading.Thread] = set()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        workers.add(threading.current_thread())
+        time.sleep(0.02)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 3},
+            },
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=8,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.FAILED
+    assert "已用尽" in executed.last_error
+    assert executed.schema["last_error_status"] == 429
+    assert 3 <= len(executed.results) < 8
+    assert calls < 8
+
+    # 预算用尽后新的测试任务在执行前即被拒绝
+    with pytest.raises(BudgetExceededError):
+        test_run_service.preflight_test_run(db_session, test_run)
+    for worker in workers:
+        worker.join(1)
+
+
+def test_execute_test_run_reuses_cached_responses(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider = provider_model.provider
+    calls = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal calls
+        calls += 1
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "确定性输出"}}],
+                "usage": {"total_tokens": 7},
+            },
+        )
+
+    llm_transport(handler)
+
+    def _run() -> TestRun:
+        test_run = TestRun(
+            prompt_version_id=prompt_version.id,
+            model_name=provider_model.name,
+            model_version=provider.provider_name,
+            temperature=0.0,
+            repetitions=1,
+            schema={
+                "llm_provider_id": provider.id,
+                "llm_model_id": provider_model.id,
+                "cache": "read",
+            },
+        )
+        test_run.prompt_version = prompt_version
+        db_session.add(test_run)
+        db_session.commit()
+        executed = test_run_service.execute_test_run(db_session, test_run)
+        db_session.commit()
+        return executed
+
+    first = _run()
+    # 清空进程内缓存，确认第二次命中来自数据库持久层
+    llm_response_cache.memory.clear()
+    second = _run()
+
+    assert calls == 1
+    assert "cache_stats" not in first.schema
+    assert second.schema["cache_stats"]["hits"] == 1
+    assert [result.output for result in second.results] == ["确定性输出"]
+
+    usage_logs = db_session.scalars(
+        select(LLMUsageLog).order_by(LLMUsageLog.id)
+    ).all()
+    assert [log.cache_hit for log in usage_logs] == [False, True]
+    assert usage_logs[1].total_tokens == 7
+
+
+def test_execute_test_run_buffers_usage_logs(
+    db_session, prompt_version, provider_model, llm_transport, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(settings, "USAGE_LOG_WRITE_MODE", "buffered")
+    monkeypatch.setattr(settings, "USAGE_LOG_FLUSH_ROWS", 100)
+    monkeypatch.setattr(settings, "USAGE_LOG_FLUSH_INTERVAL_SECONDS", 3600.0)
+    monkeypatch.setattr(settings, "USAGE_LOG_SPILL_PATH", str(tmp_path / "spill"))
+    provider = provider_model.provider
+    llm_transport(
+        lambda request: httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"total_tokens": 4},
+            },
+        )
+    )
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=3,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert len(test_run.results) == 3
+    assert db_session.scalars(select(LLMUsageLog)).all() == []
+    assert usage_log_writer.stats().backlog == 3
+
+    assert usage_log_writer.flush() == 3
+    usage_logs = db_session.scalars(select(LLMUsageLog)).all()
+    assert [log.total_tokens for log in usage_logs] == [4, 4, 4]
+    assert {log.source for log in usage_logs} == {"test_run"}
+
+
+def test_execute_test_run_inserts_artifacts_in_batches(
+    db_session, prompt_version, provider_model, llm_transport, monkeypatch
+):
+    monkeypatch.setattr(settings, "TEST_RUN_INSERT_BATCH_SIZE", 2)
+    provider = provider_model.provider
+    llm_transport(
+        lambda request: httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"total_tokens": 4},
+            },
+        )
+    )
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=5,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    inserts: list[str] = []
+    engine = db_session.get_bind().engine
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO results") or statement.startswith(
+            "INSERT INTO llm_usage_logs"
+        ):
+            inserts.append(statement.split()[2])
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        test_run_service.execute_test_run(db_session, test_run)
+        db_session.commit()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_execute)
+
+    # 5 轮按每批 2 行写入：两个满批加一个剩余批次，结果与日志各 3 条语句
+    assert inserts.count("results") == 3
+    assert inserts.count("llm_usage_logs") == 3
+    assert sorted(result.run_index for result in test_run.results) == [1, 2, 3, 4, 5]
+    assert {result.output for result in test_run.results} == {"ok"}
+    usage_logs = db_session.scalars(select(LLMUsageLog)).all()
+    assert len(usage_logs) == 5
+    assert test_run.status == TestRunStatus.COMPLETED
+
+
+def test_execute_test_run_hedges_slow_rounds_to_backup_model(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider = provider_model.provider
+    backup = LLMModel(provider=provider, name="chat-backup")
+    db_session.add(backup)
+    db_session.commit()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        model_name = json.loads(request.content)["model"]
+        if model_name == "chat-mini":
+            time.sleep(0.3)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": model_name}}],
+                "usage": {"prompt_tokens": 4, "completion_tokens": 2},
+            },
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=1,
+        schema={
+            "llm_provider_id": provider.id,
+            "llm_model_id": provider_model.id,
+            "hedge": {"delay_seconds": 0.02, "backup_model_id": backup.id},
+        },
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert [result.output for result in executed.results] == ["chat-backup"]
+    assert executed.schema["hedge_stats"] == {"hedged_rounds": 1, "backup_wins": 1}
+    usage_logs = db_session.scalars(
+        select(LLMUsageLog).order_by(LLMUsageLog.hedge_won.desc())
+    ).all()
+    winner, loser = usage_logs
+    assert (winner.model_id, winner.hedge_role, winner.hedge_won) == (
+        backup.id,
+        "backup",
+        True,
+    )
+    assert winner.total_tokens == 6
+    # 被取消的原请求按输入预估计费，不含输出
+    assert (loser.model_id, loser.hedge_role, loser.hedge_won) == (
+        provider_model.id,
+        "primary",
+        False,
+    )
+    assert loser.prompt_tokens and loser.completion_tokens is None
+    assert loser.response_text is None
+
+
+def test_execute_test_run_keeps_hedge_loser_logged_after_last_round(
+    db_session, prompt_version, provider_model, llm_transport, monkeypatch
+):
+    # 每轮落库即写入，落败一路的日志在最后一轮写入之后才登记
+    monkeypatch.setattr(settings, "TEST_RUN_INSERT_BATCH_SIZE", 1)
+    provider = provider_model.provider
+    backup = LLMModel(provider=provider, name="chat-backup")
+    db_session.add(backup)
+    db_session.commit()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        model_name = json.loads(request.content)["model"]
+        if model_name == "chat-mini":
+            time.sleep(0.3)
+        return httpx.Response(
+            200, json={"choices": [{"message": {"content": model_name}}]}
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=1,
+        schema={
+            "llm_provider_id": provider.id,
+            "llm_model_id": provider_model.id,
+            "hedge": {"delay_seconds": 0.02, "backup_model_id": backup.id},
+        },
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert [result.output for result in executed.results] == ["chat-backup"]
+    usage_logs = db_session.scalars(select(LLMUsageLog)).all()
+    assert sorted((log.hedge_role, log.hedge_won) for log in usage_logs) == [
+        ("backup", True),
+        ("primary", False),
+    ]
+
+
+def test_execute_test_run_fails_over_when_circuit_is_open(
+    db_session, prompt_version, provider_model, llm_transport, monkeypatch
+):
+    provider = provider_model.provider
+    standby_provider = LLMProvider(
+        provider_name="Standby",
+        api_key="standby-key",
+        is_custom=True,
+        base_url="https://standby.example/api",
+    )
+    standby = LLMModel(provider=standby_provider, name="chat-standby")
+    db_session.add_all([standby_provider, standby])
+    db_session.flush()
+    provider_model.failover_model_id = standby.id
+    db_session.commit()
+
+    breaker = CircuitBreaker(window=1, min_calls=1, open_seconds=60)
+    monkeypatch.setattr(llm_gateway, "llm_circuit_breaker", breaker)
+    ticket = breaker.admit(f"{provider.id}:chat-mini")
+    breaker.record(ticket, failure=True, reason="HTTP 503")
+    hosts: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        hosts.append(request.url.host)
+        model_name = json.loads(request.content)["model"]
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": model_name}}],
+                "usage": {"prompt_tokens": 4, "completion_tokens": 2},
+            },
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=2,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.COMPLETED
+    assert hosts == ["standby.example", "standby.example"]
+    assert [result.output for result in executed.results] == ["chat-standby"] * 2
+    assert executed.schema["failover_stats"] == {"model_id": standby.id, "rounds": 2}
+    usage_logs = db_session.scalars(select(LLMUsageLog)).all()
+    assert {(log.provider_id, log.model_id) for log in usage_logs} == {
+        (standby_provider.id, standby.id)
+    }
+
+
+def test_execute_test_run_stops_dispatching_when_circuit_opens(
+    db_session, prompt_version, provider_model, llm_transport, monkeypatch
+):
+    provider = provider_model.provider
+    provider_model.concurrency_limit = 1
+    db_session.commit()
+    monkeypatch.setattr(settings, "LLM_RETRY_ENABLED", False)
+    breaker = CircuitBreaker(window=4, min_calls=2, open_seconds=60)
+    monkeypatch.setattr(llm_gateway, "llm_circuit_breaker", breaker)
+    attempts = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        return httpx.Response(503, json={"error": {"message": "overloaded"}})
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=6,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    # 熔断后剩余轮次直接失败，不再发往上游
+    assert attempts == 2
+    assert executed.status == TestRunStatus.FAILED
+    assert executed.results == []
+    [status] = breaker.status()
+    assert status.state == "open"
+    assert status.rejected_total >= 1
+
+
+def test_execute_test_run_applies_model_timeouts(
+    db_session, prompt_version, provider_model, llm_transport, monkeypatch
+):
+    provider = provider_model.provider
+    provider_model.timeout_connect_seconds = 3
+    provider_model.timeout_total_seconds = 12
+    db_session.commit()
+    monkeypatch.setattr(settings, "LLM_RETRY_ENABLED", False)
+    timeouts: list[dict[str, float]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        timeouts.append(request.extensions["timeout"])
+        raise httpx.ReadTimeout("upstream stalled", request=request)
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=2,
+        schema={"llm_provider_id": provider.id, "llm_model_id": provider_model.id},
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.FAILED
+    assert "超时" in executed.last_error
+    assert timeouts[0]["connect"] == 3
+    assert timeouts[0]["read"] == 12
+    assert executed.schema["timeout_stats"]["timed_out_rounds"] == 2
+
+
+def test_execute_test_run_skips_rounds_past_deadline(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider = provider_model.provider
+    provider_model.concurrency_limit = 1
+    db_session.commit()
+    attempts = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal attempts
+        attempts += 1
+        time.sleep(0.2)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"prompt_tokens": 4, "completion_tokens": 2},
+            },
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.7,
+        repetitions=5,
+        schema={
+            "llm_provider_id": provider.id,
+            "llm_model_id": provider_model.id,
+            "deadline_seconds": 0.3,
+        },
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    # 剩余时间不足以完成一轮时不再发出请求
+    assert attempts <= 2
+    assert executed.status == TestRunStatus.FAILED
+    assert len(executed.results) == attempts
+    stats = executed.schema["timeout_stats"]
+    assert stats["deadline_skipped_rounds"] == 5 - attempts
+    assert stats["deadline_seconds"] == 0.3
+
+
+def _create_batched_run(db_session, prompt_version, provider_model, repetitions):
+    provider = provider_model.provider
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.9,
+        repetitions=repetitions,
+        schema={
+            "llm_provider_id": provider.id,
+            "llm_model_id": provider_model.id,
+            "conversation": [{"role": "user", "content": "写一句口号"}],
+        },
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+    return test_run
+
+
+def test_execute_test_run_batches_identical_rounds_with_n(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider_model.max_choices_per_request = 3
+    db_session.commit()
+    requested: list[int | None] = []
+    lock = threading.Lock()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        count = json.loads(request.content).get("n", 1)
+        with lock:
+            requested.append(count)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [
+                    {"index": index, "message": {"content": "口号" * (index + 1)}}
+                    for index in range(count)
+                ],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 6 * count},
+            },
+        )
+
+    llm_transport(handler)
+    test_run = _create_batched_run(db_session, prompt_version, provider_model, 5)
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.COMPLETED
+    assert sorted(requested) == [2, 3]
+    results = sorted(executed.results, key=lambda result: result.run_index)
+    assert [result.run_index for result in results] == [1, 2, 3, 4, 5]
+    assert [result.output for result in results] == [
+        "口号",
+        "口号口号",
+        "口号口号口号",
+        "口号",
+        "口号口号",
+    ]
+    assert executed.schema["batch_stats"] == {
+        "batched_requests": 2,
+        "batched_rounds": 5,
+        "fallback_rounds": 0,
+    }
+
+    # 提示词只计费一次，补全按输出长度分摊，各轮之和等于响应中的用量
+    usage_logs = db_session.scalars(select(LLMUsageLog)).all()
+    assert len(usage_logs) == 5
+    assert sum(log.prompt_tokens for log in usage_logs) == 20
+    assert sum(log.completion_tokens for log in usage_logs) == 30
+    first_batch = sorted(
+        (log for log in usage_logs if log.parameters.get("n") == 3),
+        key=lambda log: len(log.response_text),
+    )
+    assert [log.completion_tokens for log in first_batch] == [3, 6, 9]
+
+
+def test_execute_test_run_falls_back_when_provider_ignores_n(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider_model.max_choices_per_request = 4
+    provider_model.concurrency_limit = 1
+    db_session.commit()
+    requested: list[int | None] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(json.loads(request.content).get("n"))
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "单个候选"}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+            },
+        )
+
+    llm_transport(handler)
+    test_run = _create_batched_run(db_session, prompt_version, provider_model, 4)
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.COMPLETED
+    assert requested == [4, None, None, None]
+    assert len(executed.results) == 4
+    assert executed.schema["batch_stats"] == {
+        "batched_requests": 1,
+        "batched_rounds": 1,
+        "fallback_rounds": 3,
+    }
+
+
+def test_execute_test_run_falls_back_when_provider_rejects_n(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider_model.max_choices_per_request = 3
+    provider_model.concurrency_limit = 1
+    db_session.commit()
+    requested: list[int | None] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        choices = json.loads(request.content).get("n")
+        requested.append(choices)
+        if choices:
+            return httpx.Response(
+                400,
+                json={"error": {"message": "Unsupported value", "param": "n"}},
+            )
+        return httpx.Response(
+            200, json={"choices": [{"message": {"content": "单个候选"}}]}
+        )
+
+    llm_transport(handler)
+    test_run = _create_batched_run(db_session, prompt_version, provider_model, 3)
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.COMPLETED
+    assert requested == [3, None, None, None]
+    assert len(executed.results) == 3
+
+
+def test_execute_test_run_fails_batched_rounds_on_other_client_errors(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider_model.max_choices_per_request = 3
+    provider_model.concurrency_limit = 1
+    db_session.commit()
+    requested: list[int | None] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requested.append(json.loads(request.content).get("n"))
+        return httpx.Response(
+            400,
+            json={"error": {"message": "maximum context length exceeded"}},
+        )
+
+    llm_transport(handler)
+    test_run = _create_batched_run(db_session, prompt_version, provider_model, 3)
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    # 与 n 无关的 400 不应关闭合并请求并逐轮重发
+    assert executed.status == TestRunStatus.FAILED
+    assert "maximum context length" in executed.last_error
+    assert requested == [3]
+
+
+def test_execute_test_run_counts_every_round_of_timed_out_batch(
+    db_session, prompt_version, provider_model, llm_transport, monkeypatch
+):
+    monkeypatch.setattr(settings, "LLM_RETRY_ENABLED", False)
+    provider_model.max_choices_per_request = 3
+    provider_model.concurrency_limit = 1
+    db_session.commit()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ReadTimeout("upstream stalled", request=request)
+
+    llm_transport(handler)
+    test_run = _create_batched_run(db_session, prompt_version, provider_model, 3)
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.FAILED
+    # 一次合并请求超时涉及其全部候选轮次
+    assert executed.schema["timeout_stats"]["timed_out_rounds"] == 3
+
+
+def test_execute_test_run_streams_rounds_to_measure_ttft(
+    db_session, prompt_version, provider_model, llm_transport
+):
+    provider = provider_model.provider
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["stream"] is True
+        chunks = [
+            {"id": "c1", "choices": [{"index": 0, "delta": {"content": "流式"}}]},
+            {"choices": [{"index": 0, "delta": {"content": "响应"}}]},
+            {"choices": [], "usage": {"prompt_tokens": 4, "completion_tokens": 2}},
+        ]
+        body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks)
+        return httpx.Response(
+            200,
+            content=(body + "data: [DONE]\n\n").encode(),
+            headers={"Content-Type": "text/event-stream"},
+        )
+
+    llm_transport(handler)
+
+    test_run = TestRun(
+        prompt_version_id=prompt_version.id,
+        model_name=provider_model.name,
+        model_version=provider.provider_name,
+        temperature=0.2,
+        repetitions=2,
+        schema={
+            "llm_provider_id": provider.id,
+            "llm_model_id": provider_model.id,
+            "stream": True,
+        },
+    )
+    test_run.prompt_version = prompt_version
+    db_session.add(test_run)
+    db_session.commit()
+
+    executed = test_run_service.execute_test_run(db_session, test_run)
+    db_session.commit()
+
+    assert executed.status == TestRunStatus.COMPLETED
+    assert [result.output for result in executed.results] == ["流式响应"] * 2
+    assert {result.tokens_used for result in executed.results} == {6}
+    metrics = executed.schema["metrics"]
+    assert metrics["rounds"] == 2
+    assert metrics["p50_ttft_ms"] >= 0
+    usage_logs = db_session.scalars(select(LLMUsageLog)).all()
+    assert all(log.ttft_ms is not None for log in usage_logs)
+
+
 def test_execute_test_run_skips_completed(
-    monkeypatch, db_session, prompt_version, provider_model
+    llm_transport, db_session, prompt_version, provider_model
 ):
     called = False
 
-    def fake_post(*args, **kwargs):  # pragma: no cover - 不应被调用
+    def handler(request: httpx.Request) -> httpx.Response:  # pragma: no cover
         nonlocal called
         called = True
-        raise AssertionError("httpx.post should not be called")
+        raise AssertionError("LLM should not be called")
 
-    monkeypatch.setattr("app.services.test_run.httpx.post", fake_post)
+    llm_transport(handler)
 
     test_run = TestRun(
         prompt_version_id=prompt_version.id,
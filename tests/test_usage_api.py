@@ -5,8 +5,9 @@ from datetime import date, datetime, timezone
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app.models.llm_provider import LLMProvider
+from app.models.llm_provider import LLMModel, LLMProvider
 from app.models.usage import LLMUsageLog
+from app.services.budget import budget_tracker
 
 
 def _seed_usage_logs(db_session: Session) -> tuple[int, int | None]:
@@ -86,6 +87,8 @@ def test_usage_overview_and_models(client: TestClient, db_session: Session) -> N
         "input_tokens": 32,
         "output_tokens": 42,
         "call_count": 5,
+        "cached_tokens": 0,
+        "cached_call_count": 0,
     }
 
     models_resp = client.get("/api/v1/usage/models")
@@ -150,6 +153,8 @@ def test_usage_timeseries_and_filters(client: TestClient, db_session: Session) -
         "input_tokens": 29,
         "output_tokens": 40,
         "call_count": 4,
+        "cached_tokens": 0,
+        "cached_call_count": 0,
     }
 
 
@@ -162,3 +167,60 @@ def test_invalid_queries_return_errors(client: TestClient) -> None:
 
     invalid_key = client.get("/api/v1/usage/models/invalid/timeseries")
     assert invalid_key.status_code == 400
+
+
+def test_usage_budgets_report_remaining(
+    client: TestClient, db_session: Session
+) -> None:
+    provider = LLMProvider(provider_name="OpenAI", api_key="sk-test")
+    model = LLMModel(provider=provider, name="gpt-4", input_price_per_1k=1.0)
+    db_session.add_all([provider, model])
+    db_session.commit()
+
+    create_resp = client.put(
+        "/api/v1/usage/budgets",
+        json={
+            "scope": "model",
+            "target_id": model.id,
+            "period": "daily",
+            "token_limit": 1000,
+            "cost_limit": 2.0,
+        },
+    )
+    assert create_resp.status_code == 200
+    budget = create_resp.json()
+    assert budget["remaining_tokens"] == 1000
+    assert budget["period_start"] is not None
+
+    budget_tracker.record(model=model, prompt_tokens=600, completion_tokens=0)
+
+    listed = client.get("/api/v1/usage/budgets").json()
+    assert len(listed) == 1
+    assert listed[0]["used_tokens"] == 600
+    assert listed[0]["remaining_tokens"] == 400
+    assert listed[0]["remaining_cost"] == 1.4
+    assert listed[0]["exhausted"] is False
+
+    # 同一对象再次提交时更新额度，周期不变则保留已用量
+    update_resp = client.put(
+        "/api/v1/usage/budgets",
+        json={
+            "scope": "model",
+            "target_id": model.id,
+            "period": "daily",
+            "token_limit": 600,
+        },
+    )
+    assert update_resp.status_code == 200
+    assert update_resp.json()["id"] == budget["id"]
+    assert update_resp.json()["exhausted"] is True
+
+    missing_limit = client.put(
+        "/api/v1/usage/budgets", json={"scope": "owner", "target_id": 1}
+    )
+    assert missing_limit.status_code == 422
+
+    delete_resp = client.delete(f"/api/v1/usage/budgets/{budget['id']}")
+    assert delete_resp.status_code == 204
+    assert client.get("/api/v1/usage/budgets").json() == []
+    assert client.delete(f"/api/v1/usage/budgets/{budget['id']}").status_code == 404
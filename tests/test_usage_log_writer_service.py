@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.models.usage import LLMUsageLog
+from app.services.usage_log_writer import usage_log_writer
+
+
+@pytest.fixture()
+def buffered(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "USAGE_LOG_WRITE_MODE", "buffered")
+    monkeypatch.setattr(settings, "USAGE_LOG_FLUSH_ROWS", 3)
+    monkeypatch.setattr(settings, "USAGE_LOG_FLUSH_INTERVAL_SECONDS", 3600.0)
+    monkeypatch.setattr(settings, "USAGE_LOG_SPILL_PATH", str(tmp_path / "spill.jsonl"))
+    usage_log_writer.reset()
+    yield tmp_path / "spill.jsonl"
+    usage_log_writer.close()
+
+
+def _log(index: int) -> LLMUsageLog:
+    return LLMUsageLog(
+        model_name="chat-mini",
+        source="test_run",
+        messages=[{"role": "user", "content": f"第 {index} 轮"}],
+        total_tokens=index,
+    )
+
+
+def _count(db_session) -> int:
+    return db_session.scalar(select(func.count()).select_from(LLMUsageLog))
+
+
+def test_sync_mode_adds_log_to_caller_session(db_session):
+    log = _log(1)
+    usage_log_writer.write(db_session, log)
+
+    assert log in db_session
+    db_session.commit()
+    assert _count(db_session) == 1
+    assert usage_log_writer.stats().written_total == 0
+
+
+def test_buffered_mode_flushes_by_row_count(db_session, buffered):
+    usage_log_writer.write(db_session, _log(1))
+    usage_log_writer.write(db_session, _log(2))
+    assert _count(db_session) == 0
+    assert usage_log_writer.stats().backlog == 2
+
+    usage_log_writer.write(db_session, _log(3))
+
+    logs = db_session.scalars(select(LLMUsageLog).order_by(LLMUsageLog.id)).all()
+    assert [log.total_tokens for log in logs] == [1, 2, 3]
+    assert all(log.retry_count == 0 and log.created_at for log in logs)
+    assert logs[0].messages == [{"role": "user", "content": "第 1 轮"}]
+    stats = usage_log_writer.stats()
+    assert (stats.backlog, stats.written_total, stats.flushes_total) == (0, 3, 1)
+    assert stats.max_flush_ms is not None
+
+
+def test_full_buffer_applies_backpressure(db_session, buffered, monkeypatch):
+    monkeypatch.setattr(settings, "USAGE_LOG_FLUSH_ROWS", 100)
+    monkeypatch.setattr(settings, "USAGE_LOG_BUFFER_SIZE", 2)
+
+    usage_log_writer.write(db_session, _log(1))
+    assert _count(db_session) == 0
+    usage_log_writer.write(db_session, _log(2))
+    assert _count(db_session) == 2
+
+
+def test_spills_to_disk_and_replays_when_database_recovers(
+    db_session, buffered, monkeypatch
+):
+    spill_path = buffered
+
+    def fail(rows):
+        raise OperationalError("INSERT", {}, Exception("database is down"))
+
+    monkeypatch.setattr(usage_log_writer, "_insert", fail)
+    for index in range(1, 4):
+        usage_log_writer.write(db_session, _log(index))
+
+    assert spill_path.exists()
+    stats = usage_log_writer.stats()
+    assert (stats.spilled_rows, stats.failures_total, stats.dropped_total) == (3, 1, 0)
+    assert _count(db_session) == 0
+
+    monkeypatch.undo()
+    monkeypatch.setattr(settings, "USAGE_LOG_WRITE_MODE", "buffered")
+    monkeypatch.setattr(settings, "USAGE_LOG_SPILL_PATH", str(spill_path))
+    usage_log_writer.write(db_session, _log(4))
+    assert usage_log_writer.flush() == 4
+
+    assert not spill_path.exists()
+    assert _count(db_session) == 4
+    assert usage_log_writer.stats().spilled_rows == 0
+
+
+def test_background_thread_flushes_on_interval(db_session, buffered, monkeypatch):
+    monkeypatch.setattr(settings, "USAGE_LOG_FLUSH_INTERVAL_SECONDS", 0.05)
+    usage_log_writer.start()
+    assert usage_log_writer.running
+
+    usage_log_writer.write(db_session, _log(1))
+    deadline = time.monotonic() + 2.0
+    while usage_log_writer.stats().written_total < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    usage_log_writer.close()
+    assert not usage_log_writer.running
+    assert _count(db_session) == 1
+
+
+def test_usage_log_writer_stats_endpoint(client):
+    response = client.get("/api/v1/system/usage-log-writer")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["mode"] == "sync"
+    assert body["backlog"] == 0